@@ -13,6 +13,7 @@ import os
 from datetime import datetime
 import aiohttp
 from database.db import db
+from services.notifier import notifier
 from services.publisher import publisher
 
 logger = logging.getLogger(__name__)
@@ -318,10 +319,10 @@ class AutoPoster:
 🔗 ID поста: {post['id']}
             """
 
-            await self.bot.send_message(
-                chat_id=int(os.getenv("LEADS_GROUP_CHAT_ID", "-1003370698977")),
-                text=log_text.strip(),
-                message_thread_id=int(os.getenv("THREAD_ID_LOGS", "88"))
+            await notifier.send(
+                int(os.getenv("LEADS_GROUP_CHAT_ID", "-1003370698977")),
+                log_text.strip(),
+                thread_id=int(os.getenv("THREAD_ID_LOGS", "88")),
             )
 
         except Exception as e:
@@ -4,12 +4,22 @@
 import aiosqlite
 import os
 import logging
-from typing import Optional, Dict, List
+from typing import Any, Optional, Dict, List, Callable
 from datetime import datetime
 
+from database.migrations import SchemaCache, apply_migrations
+from monitoring.metrics import DB_SECONDS, instrument_methods
+
 logger = logging.getLogger(__name__)
 
+# Колонки target_resources, которые пишет планировщик сканирования
+_SCAN_STAT_COLUMNS = frozenset({
+    "next_scan_at", "scan_limit", "scan_count", "scan_errors", "msg_rate", "msgs_seen", "leads_seen",
+    "last_message_at", "last_scanned_at", "scan_tracked_since", "status", "is_active",
+})
+
 
+@instrument_methods(DB_SECONDS)
 class Database:
     """Класс для работы с SQLite базой данных"""
     
@@ -19,6 +29,9 @@ class Database:
             db_path = os.getenv("DATABASE_PATH", "parkhomenko_bot.db")
         self.db_path = db_path
         self.conn: Optional[aiosqlite.Connection] = None
+        self.schema = SchemaCache()
+        # Подписчики на изменения content_plan (services/publish_timer.py)
+        self._content_plan_listeners: List[Callable] = []
     
     async def connect(self):
         """Подключение к базе данных с режимом WAL для избежания ошибки 'database is locked'"""
@@ -51,327 +64,13 @@ class Database:
             await self.conn.close()
     
     async def _create_tables(self):
-        """Создание необходимых таблиц"""
-        async with self.conn.cursor() as cursor:
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    phone TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_interaction TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS user_states (
-                    user_id INTEGER PRIMARY KEY,
-                    mode TEXT,
-                    quiz_step INTEGER DEFAULT 0,
-                    name TEXT,
-                    phone TEXT,
-                    extra_contact TEXT,
-                    object_type TEXT,
-                    city TEXT,
-                    floor TEXT,
-                    total_floors TEXT,
-                    remodeling_status TEXT,
-                    change_plan TEXT,
-                    bti_status TEXT,
-                    consent_given BOOLEAN DEFAULT 0,
-                    contact_received BOOLEAN DEFAULT 0,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id)
-                )
-            """)
-            
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS dialog_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    role TEXT,
-                    message TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id)
-                )
-            """)
-            
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS leads (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    name TEXT,
-                    phone TEXT,
-                    extra_contact TEXT,
-                    object_type TEXT,
-                    city TEXT,
-                    floor TEXT,
-                    total_floors TEXT,
-                    area TEXT,
-                    remodeling_status TEXT,
-                    change_plan TEXT,
-                    bti_status TEXT,
-                    extra_questions TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    sent_to_group BOOLEAN DEFAULT 0,
-                    thread_id INTEGER,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id)
-                )
-            """)
-            for col, ctype in [("area", "TEXT"), ("extra_questions", "TEXT"), ("thread_id", "INTEGER")]:
-                try:
-                    await cursor.execute(f"ALTER TABLE leads ADD COLUMN {col} {ctype}")
-                except Exception:
-                    pass
-
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS content_plan (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    type TEXT NOT NULL,
-                    channel TEXT DEFAULT 'terion',
-                    title TEXT,
-                    body TEXT NOT NULL,
-                    cta TEXT,
-                    theme TEXT,
-                    publish_date TIMESTAMP,
-                    status TEXT DEFAULT 'draft',
-                    image_url TEXT,
-                    image_prompt TEXT,
-                    admin_id INTEGER DEFAULT NULL,
-                    published_at TIMESTAMP DEFAULT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            # Миграция: добавление поля image_prompt если его нет
-            try:
-                await cursor.execute("PRAGMA table_info(content_plan)")
-                columns = await cursor.fetchall()
-                column_names = [col_info[1] for col_info in columns]
-                if "image_prompt" not in column_names:
-                    await cursor.execute("ALTER TABLE content_plan ADD COLUMN image_prompt TEXT")
-                    await self.conn.commit()
-                    logger.debug("✅ Добавлена колонка image_prompt в content_plan")
-            except Exception as e:
-                logger.warning(f"⚠️ Ошибка при добавлении колонки image_prompt: {e}")
-            
-            # Таблица для дней рождения клиентов
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS clients_birthdays (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    name TEXT,
-                    birth_date DATE NOT NULL,
-                    channel TEXT DEFAULT 'telegram',
-                    greeting_sent BOOLEAN DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id)
-                )
-            """)
-            
-            # Таблица целевых ресурсов для мониторинга (TG чаты + VK группы)
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS target_resources (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    type TEXT NOT NULL CHECK(type IN ('telegram', 'vk')),
-                    link TEXT NOT NULL UNIQUE,
-                    title TEXT,
-                    is_active BOOLEAN DEFAULT 1,
-                    last_post_id INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Таблица ключевых слов для мониторинга
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS spy_keywords (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    keyword TEXT NOT NULL UNIQUE,
-                    is_active BOOLEAN DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Настройки бота (key-value для переключателей и т.п.)
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS bot_settings (
-                    key TEXT PRIMARY KEY,
-                    value TEXT NOT NULL,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            await cursor.execute(
-                "INSERT OR IGNORE INTO bot_settings (key, value) VALUES ('spy_notify_enabled', '1')"
-            )
-
-            # Таблица лидов от шпиона (TG/VK: автор, ссылка на профиль, текст)
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS spy_leads (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    source_type TEXT NOT NULL,
-                    source_name TEXT NOT NULL,
-                    author_id TEXT,
-                    username TEXT,
-                    profile_url TEXT,
-                    text TEXT,
-                    url TEXT NOT NULL,
-                    pain_stage TEXT,
-                    priority_score INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+        """Применить ожидающие миграции схемы (database/migrations.py)"""
+        await apply_migrations(self.conn, self.schema)
 
-            # Таблица истории контента (финансовый трекинг)
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS content_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    post_text TEXT,
-                    image_url TEXT,
-                    model_used VARCHAR(50),
-                    cost_rub DECIMAL(10, 2),
-                    platform VARCHAR(20),
-                    channel VARCHAR(50),
-                    post_id INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_archived BOOLEAN DEFAULT FALSE
-                )
-            """)
-            await self.conn.commit()
-
-<<<<<<< HEAD
-            # Миграция: колонка contacted_at для «Продавец» (первый диалог с лидом)
-=======
-            # Миграция: колонка contacted_at для «Продавца» (первый диалог с лидом)
->>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
-            try:
-                await cursor.execute("ALTER TABLE spy_leads ADD COLUMN contacted_at TIMESTAMP NULL")
-                await self.conn.commit()
-            except Exception:
-                pass  # колонка уже есть
-            # Миграция: колонка notes в target_resources («Обнаружен автоматически» и т.д.)
-            try:
-                await cursor.execute("ALTER TABLE target_resources ADD COLUMN notes TEXT NULL")
-                await self.conn.commit()
-            except Exception:
-                pass
-            # ── DB MIGRATION: Автоматическое добавление полей pain_stage и priority ───
-            # Проверяем наличие полей перед добавлением (избегаем ошибок при повторном запуске)
-            for col, ctype in [("pain_stage", "TEXT"), ("priority_score", "INTEGER")]:
-                try:
-                    # Проверяем, существует ли колонка
-                    await cursor.execute("PRAGMA table_info(spy_leads)")
-                    columns = await cursor.fetchall()
-                    column_names = [col_info[1] for col_info in columns]
-                    
-                    if col not in column_names:
-                        await cursor.execute(f"ALTER TABLE spy_leads ADD COLUMN {col} {ctype}")
-                        await self.conn.commit()
-                        logger.debug(f"✅ Добавлена колонка {col} в spy_leads")
-                    else:
-                        logger.debug(f"ℹ️ Колонка {col} уже существует в spy_leads")
-                except Exception as e:
-                    logger.warning(f"⚠️ Ошибка при добавлении колонки {col} в spy_leads: {e}")
-                    pass
-            # Data-Driven Scout: status (pending/active/archived), platform, geo_tag, participants_count
-            try:
-                await cursor.execute("ALTER TABLE target_resources ADD COLUMN status TEXT DEFAULT 'pending'")
-                await self.conn.commit()
-            except Exception:
-                pass
-            try:
-                await cursor.execute("ALTER TABLE target_resources ADD COLUMN platform TEXT NULL")
-                await self.conn.commit()
-            except Exception:
-                pass
-            try:
-                await cursor.execute("ALTER TABLE target_resources ADD COLUMN geo_tag TEXT NULL")
-                await self.conn.commit()
-            except Exception:
-                pass
-            try:
-                await cursor.execute("ALTER TABLE target_resources ADD COLUMN participants_count INTEGER NULL")
-                await self.conn.commit()
-            except Exception:
-                pass
-            # Привести старые записи: status='active' где is_active=1
-            try:
-                await cursor.execute("UPDATE target_resources SET status = 'active' WHERE is_active = 1 AND (status IS NULL OR status = '')")
-                await cursor.execute("UPDATE target_resources SET status = 'archived' WHERE (is_active = 0 OR is_active IS NULL) AND (status IS NULL OR status = '')")
-                await cursor.execute("UPDATE target_resources SET platform = type WHERE platform IS NULL OR platform = ''")
-                await self.conn.commit()
-            except Exception:
-                pass
-            # Снайпер v3.0: приоритетные ЖК (высотки)
-            try:
-                await cursor.execute("ALTER TABLE target_resources ADD COLUMN is_high_priority INTEGER DEFAULT 0")
-                await self.conn.commit()
-            except Exception:
-                pass
-            # Миграция: колонка priority для приоритета ресурса (1-10)
-            try:
-                await cursor.execute("ALTER TABLE target_resources ADD COLUMN priority INTEGER DEFAULT 5")
-                await self.conn.commit()
-            except Exception:
-                pass
-            # Миграция: колонка last_scanned_at для отслеживания последнего сканирования
-            try:
-                await cursor.execute("ALTER TABLE target_resources ADD COLUMN last_scanned_at TIMESTAMP NULL")
-                await self.conn.commit()
-            except Exception:
-                pass
-            # Миграция: колонка last_lead_at для отслеживания времени последнего найденного лида
-            try:
-                await cursor.execute("ALTER TABLE target_resources ADD COLUMN last_lead_at TIMESTAMP NULL")
-                await self.conn.commit()
-            except Exception:
-                pass
-            # Модуль «Ассистент Продаж»: скрипты подсказок для карточки лида
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS sales_templates (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    key TEXT NOT NULL UNIQUE,
-                    body TEXT NOT NULL,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            await self.conn.commit()
-            for key, body in [
-                ("mji_prescription", "Срочный выезд и аудит документов"),
-                ("keys_design", "Проверка проекта на реализуемость"),
-            ]:
-                await cursor.execute(
-                    "INSERT OR IGNORE INTO sales_templates (key, body) VALUES (?, ?)",
-                    (key, body),
-                )
-            await self.conn.commit()
-            
-            # Таблица продажных диалогов (5-шаговый скрипт)
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS sales_conversations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    source_type TEXT NOT NULL,
-                    source_id TEXT NOT NULL,
-                    post_id TEXT NOT NULL,
-                    keyword TEXT,
-                    context TEXT,
-                    object_type TEXT,
-                    sales_step INTEGER DEFAULT 1,
-                    document_received BOOLEAN DEFAULT FALSE,
-                    skipped_steps TEXT,
-                    reminder_attempts INTEGER DEFAULT 0,
-                    status TEXT DEFAULT 'active',
-                    sales_started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_interaction_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_reminder_at TIMESTAMP NULL,
-                    completed BOOLEAN DEFAULT FALSE,
-                    UNIQUE(user_id, source_type, source_id, post_id)
-                )
-            """)
-            await self.conn.commit()
+    async def table_columns(self, table: str) -> frozenset:
+        """Колонки таблицы (PRAGMA table_info кэшируется до следующей миграции)"""
+        async with self.conn.cursor() as cursor:
+            return await self.schema.columns(cursor, table)
 
     async def get_or_create_user(self, user_id: int, username: Optional[str] = None,
                                 first_name: Optional[str] = None, last_name: Optional[str] = None) -> Dict:
@@ -559,6 +258,52 @@ class Database:
             await self.conn.commit()
             return cursor.lastrowid
 
+    async def add_lead_fingerprint(self, lead_id: int, simhash: int) -> None:
+        """Сохранить SimHash-отпечаток лида (знаковое 64-бит целое)"""
+        async with self.conn.cursor() as cursor:
+            await cursor.execute(
+                "INSERT OR REPLACE INTO spy_lead_fingerprints (lead_id, simhash) VALUES (?, ?)",
+                (lead_id, simhash),
+            )
+            await self.conn.commit()
+
+    async def get_lead_fingerprints(self, since_days: int = 7) -> List[Dict]:
+        """Отпечатки лидов за окно: lead_id, simhash, added_ts (unix-время)"""
+        async with self.conn.cursor() as cursor:
+            await cursor.execute(
+                """SELECT lead_id, simhash, CAST(strftime('%s', created_at) AS REAL) AS added_ts
+                   FROM spy_lead_fingerprints WHERE created_at >= datetime('now', ?)""",
+                (f"-{int(since_days)} days",),
+            )
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def cleanup_lead_fingerprints(self, since_days: int = 7) -> None:
+        """Удалить отпечатки старше окна (привязки дублей остаются для истории)"""
+        async with self.conn.cursor() as cursor:
+            await cursor.execute(
+                "DELETE FROM spy_lead_fingerprints WHERE created_at < datetime('now', ?)",
+                (f"-{int(since_days)} days",),
+            )
+            await self.conn.commit()
+
+    async def add_lead_duplicate(self, lead_id: int, source_type: str = "", source_name: str = "", url: str = "") -> None:
+        """Привязать почти-дубль (кросспост) к исходному лиду"""
+        async with self.conn.cursor() as cursor:
+            await cursor.execute(
+                "INSERT INTO spy_lead_duplicates (lead_id, source_type, source_name, url) VALUES (?, ?, ?, ?)",
+                (lead_id, source_type, source_name, url),
+            )
+            await self.conn.commit()
+
+    async def get_lead_duplicates(self, lead_id: int) -> List[Dict]:
+        """Все кросспосты, привязанные к лиду"""
+        async with self.conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT source_type, source_name, url, created_at FROM spy_lead_duplicates WHERE lead_id = ? ORDER BY created_at",
+                (lead_id,),
+            )
+            return [dict(row) for row in await cursor.fetchall()]
+
     async def get_spy_leads_count_24h(self) -> int:
         """Количество лидов от шпиона за последние 24 часа."""
         async with self.conn.cursor() as cursor:
@@ -654,19 +399,6 @@ class Database:
             await self.connect()
         
         async with self.conn.cursor() as cursor:
-            # Проверяем наличие колонки sent_to_hot_leads
-            await cursor.execute("PRAGMA table_info(spy_leads)")
-            columns = await cursor.fetchall()
-            column_names = [col_info[1] for col_info in columns]
-            
-            if "sent_to_hot_leads" not in column_names:
-                try:
-                    await cursor.execute("ALTER TABLE spy_leads ADD COLUMN sent_to_hot_leads INTEGER DEFAULT 0")
-                    await self.conn.commit()
-                    logger.debug("✅ Добавлена колонка sent_to_hot_leads в spy_leads")
-                except Exception as e:
-                    logger.warning(f"⚠️ Ошибка при добавлении колонки sent_to_hot_leads: {e}")
-            
             await cursor.execute(
                 "UPDATE spy_leads SET sent_to_hot_leads = 1 WHERE id = ?",
                 (lead_id,),
@@ -740,19 +472,6 @@ class Database:
             await self.connect()
         
         async with self.conn.cursor() as cursor:
-            # Проверяем наличие колонки status
-            await cursor.execute("PRAGMA table_info(spy_leads)")
-            columns = await cursor.fetchall()
-            column_names = [col_info[1] for col_info in columns]
-            
-            if "status" not in column_names:
-                try:
-                    await cursor.execute("ALTER TABLE spy_leads ADD COLUMN status TEXT DEFAULT 'new'")
-                    await self.conn.commit()
-                    logger.debug("✅ Добавлена колонка status в spy_leads")
-                except Exception as e:
-                    logger.warning(f"⚠️ Ошибка при добавлении колонки status: {e}")
-            
             await cursor.execute(
                 "UPDATE spy_leads SET status = 'in_work', contacted_at = datetime('now') WHERE id = ?",
                 (lead_id,),
@@ -855,7 +574,25 @@ class Database:
                 (post_type, channel, title, body, cta, theme, publish_date, image_url, admin_id, status)
             )
             await self.conn.commit()
-            return cursor.lastrowid
+            post_id = cursor.lastrowid
+        self._notify_content_plan(post_id, publish_date=publish_date, status=status)
+        return post_id
+
+    def add_content_plan_listener(self, callback: Callable) -> None:
+        """Подписаться на изменения контент-плана: callback(post_id, publish_date=..., status=...)"""
+        if callback not in self._content_plan_listeners:
+            self._content_plan_listeners.append(callback)
+
+    def remove_content_plan_listener(self, callback: Callable) -> None:
+        if callback in self._content_plan_listeners:
+            self._content_plan_listeners.remove(callback)
+
+    def _notify_content_plan(self, post_id: int, publish_date=None, status: Optional[str] = None) -> None:
+        for callback in list(self._content_plan_listeners):
+            try:
+                callback(post_id, publish_date=publish_date, status=status)
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка подписчика content_plan: {e}")
 
     async def get_draft_posts(self) -> List[Dict]:
         async with self.conn.cursor() as cursor:
@@ -870,6 +607,14 @@ class Database:
             )
             return [dict(row) for row in await cursor.fetchall()]
 
+    async def get_upcoming_posts(self) -> List[Dict]:
+        """Все одобренные посты (id, publish_date) — для таймера публикаций"""
+        async with self.conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT id, publish_date FROM content_plan WHERE status = 'approved' AND publish_date IS NOT NULL ORDER BY publish_date ASC"
+            )
+            return [dict(row) for row in await cursor.fetchall()]
+
     async def mark_as_published(self, post_id: int):
         async with self.conn.cursor() as cursor:
             await cursor.execute("UPDATE content_plan SET status = 'published' WHERE id = ?", (post_id,))
@@ -894,6 +639,17 @@ class Database:
             values = list(filtered_kwargs.values()) + [post_id]
             await cursor.execute(f"UPDATE content_plan SET {set_clause} WHERE id = ?", values)
             await self.conn.commit()
+        if 'publish_date' in filtered_kwargs or 'status' in filtered_kwargs:
+            publish_date = filtered_kwargs.get('publish_date')
+            status = filtered_kwargs.get('status')
+            if publish_date is None or status is None:
+                # Частичное обновление — берём недостающее из записи
+                post = await self.get_content_post(post_id)
+                if not post:
+                    return
+                publish_date = publish_date if publish_date is not None else post.get('publish_date')
+                status = status if status is not None else post.get('status')
+            self._notify_content_plan(post_id, publish_date=publish_date, status=status)
 
     async def delete_post(self, post_id: int):
         async with self.conn.cursor() as cursor:
@@ -1041,7 +797,8 @@ class Database:
     async def get_active_targets_for_scout(self, platform: Optional[str] = None) -> List[Dict]:
         """
         Список целей для парсера/хантера. 
-        Поля: link, title, geo_tag, id, is_high_priority, last_lead_at, last_post_id.
+        Поля: link, title, geo_tag, id, is_high_priority, last_lead_at, last_post_id
+        и статистика расписания сканирования (next_scan_at, scan_limit, msg_rate, ...).
         
         Args:
             platform: Фильтр по платформе ('telegram' или 'vk'). Если None - возвращает все активные ресурсы.
@@ -1049,7 +806,10 @@ class Database:
         async with self.conn.cursor() as cursor:
             query = """SELECT id, link, title, COALESCE(geo_tag, '') AS geo_tag,
                           COALESCE(is_high_priority, 0) AS is_high_priority, last_lead_at, last_post_id,
-                          COALESCE(platform, type) as platform
+                          COALESCE(platform, type) as platform, created_at, last_scanned_at,
+                          participants_count, next_scan_at, scan_limit, COALESCE(scan_count, 0) AS scan_count,
+                          COALESCE(scan_errors, 0) AS scan_errors, msg_rate, COALESCE(msgs_seen, 0) AS msgs_seen,
+                          COALESCE(leads_seen, 0) AS leads_seen, last_message_at, scan_tracked_since
                        FROM target_resources
                        WHERE (status = 'active' OR (is_active = 1 AND (status IS NULL OR status = '')))"""
             params = []
@@ -1418,6 +1178,144 @@ class Database:
             )
             await self.conn.commit()
 
+    # === ИСТОРИЯ ЗАДАЧ ПЛАНИРОВЩИКА (job_runs) ===
+    async def add_job_run(self, job_name: str, started_at: datetime, duration_sec: float,
+                          outcome: str, error: Optional[str] = None) -> None:
+        """Записать запуск задачи (ok / error / over_budget / skipped / cancelled)"""
+        async with self.conn.cursor() as cursor:
+            await cursor.execute(
+                """INSERT INTO job_runs (job_name, started_at, finished_at, duration_sec, outcome, error)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (job_name, started_at, datetime.now(), duration_sec, outcome, (error or "")[:1000] or None),
+            )
+            await self.conn.commit()
+
+    async def get_job_runs(self, limit: int = 20, job_name: Optional[str] = None) -> List[Dict]:
+        """Последние запуски задач"""
+        async with self.conn.cursor() as cursor:
+            if job_name:
+                await cursor.execute(
+                    "SELECT * FROM job_runs WHERE job_name = ? ORDER BY id DESC LIMIT ?", (job_name, limit)
+                )
+            else:
+                await cursor.execute("SELECT * FROM job_runs ORDER BY id DESC LIMIT ?", (limit,))
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def get_job_stats(self, since_hours: int = 24) -> List[Dict]:
+        """Сводка по задачам за период: запуски, средняя/макс. длительность, ошибки, медленные, пропуски"""
+        async with self.conn.cursor() as cursor:
+            await cursor.execute(
+                """SELECT job_name,
+                          SUM(CASE WHEN outcome != 'skipped' THEN 1 ELSE 0 END) AS runs,
+                          AVG(CASE WHEN outcome != 'skipped' THEN duration_sec END) AS avg_duration,
+                          MAX(duration_sec) AS max_duration,
+                          SUM(CASE WHEN outcome = 'error' THEN 1 ELSE 0 END) AS errors,
+                          SUM(CASE WHEN outcome = 'over_budget' THEN 1 ELSE 0 END) AS slow,
+                          SUM(CASE WHEN outcome = 'skipped' THEN 1 ELSE 0 END) AS skipped
+                   FROM job_runs
+                   WHERE started_at >= datetime('now', 'localtime', ?)
+                   GROUP BY job_name
+                   ORDER BY job_name""",
+                (f"-{int(since_hours)} hours",),
+            )
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def cleanup_job_runs(self, days: int = 30) -> None:
+        """Удалить историю запусков старше N дней"""
+        async with self.conn.cursor() as cursor:
+            await cursor.execute(
+                "DELETE FROM job_runs WHERE started_at < datetime('now', 'localtime', ?)", (f"-{int(days)} days",)
+            )
+            await self.conn.commit()
+
+    # === СИСТЕМНЫЕ ЛОГИ (system_logs) ===
+
+    async def add_system_logs(self, rows: List[tuple]) -> None:
+        """Пакетная запись логов: (level, module, message, stack_trace, repeat_count, first_seen, last_seen)"""
+        if not rows:
+            return
+        async with self.conn.cursor() as cursor:
+            await cursor.executemany(
+                """INSERT INTO system_logs
+                   (level, module, message, stack_trace, repeat_count, first_seen, last_seen)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                rows,
+            )
+            await self.conn.commit()
+
+    async def get_system_logs(self, limit: int = 50, level: Optional[str] = None) -> List[Dict]:
+        """Последние системные логи (по last_seen)"""
+        async with self.conn.cursor() as cursor:
+            if level:
+                await cursor.execute(
+                    "SELECT * FROM system_logs WHERE level = ? ORDER BY last_seen DESC LIMIT ?", (level, limit)
+                )
+            else:
+                await cursor.execute("SELECT * FROM system_logs ORDER BY last_seen DESC LIMIT ?", (limit,))
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def cleanup_system_logs(self, days: int = 14) -> None:
+        """Удалить системные логи старше N дней"""
+        async with self.conn.cursor() as cursor:
+            await cursor.execute(
+                "DELETE FROM system_logs WHERE last_seen < datetime('now', 'localtime', ?)", (f"-{int(days)} days",)
+            )
+            await self.conn.commit()
+
+    # === КЭШ ОТВЕТОВ КОНСУЛЬТАНТА (answer_cache) ===
+
+    async def get_answer_cache(self, kb_version: str, since: datetime) -> List[Dict]:
+        """Записи кэша ответов для текущей версии базы знаний, не старше since"""
+        async with self.conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT * FROM answer_cache WHERE kb_version = ? AND created_at >= ? ORDER BY created_at",
+                (kb_version, since),
+            )
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def save_answer_cache(self, cache_key: str, kb_version: str, prompt_version: str, question: str,
+                                normalized: str, context_hash: str, answer: str) -> None:
+        async with self.conn.cursor() as cursor:
+            await cursor.execute(
+                """INSERT OR REPLACE INTO answer_cache
+                   (cache_key, kb_version, prompt_version, question, normalized, context_hash, answer, hits, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?)""",
+                (cache_key, kb_version, prompt_version, question, normalized, context_hash, answer, datetime.now()),
+            )
+            await self.conn.commit()
+
+    async def add_answer_cache_hits(self, hits: Dict[str, int]) -> None:
+        """Счётчики попаданий пачкой (cache_key → +N)"""
+        async with self.conn.cursor() as cursor:
+            await cursor.executemany(
+                "UPDATE answer_cache SET hits = hits + ? WHERE cache_key = ?",
+                [(count, key) for key, count in hits.items()],
+            )
+            await self.conn.commit()
+
+    async def cleanup_answer_cache(self, kb_version: str, before: datetime) -> None:
+        """Удалить ответы по другим версиям базы знаний и просроченные"""
+        async with self.conn.cursor() as cursor:
+            await cursor.execute(
+                "DELETE FROM answer_cache WHERE kb_version != ? OR created_at < ?", (kb_version, before)
+            )
+            await self.conn.commit()
+
+    # === РАСПИСАНИЕ СКАНИРОВАНИЯ ИСТОЧНИКОВ (services/scan_scheduler.py) ===
+
+    async def update_target_scan_stats(self, target_id: int, stats: Dict[str, Any]) -> None:
+        """Записать статистику скана источника (только колонки расписания из migrations 006)"""
+        fields = {k: v for k, v in stats.items() if k in _SCAN_STAT_COLUMNS}
+        if not fields:
+            return
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        async with self.conn.cursor() as cursor:
+            await cursor.execute(
+                f"UPDATE target_resources SET {assignments}, updated_at = ? WHERE id = ?",
+                (*fields.values(), datetime.now(), target_id),
+            )
+            await self.conn.commit()
+
 <<<<<<< HEAD
     async def add_system_log(self, level: str, module: str, message: str, stack_trace: str = None):
         """Добавить системный лог в базу данных (для watchdog.py)"""
@@ -0,0 +1,547 @@
+"""
+Версионные миграции схемы SQLite.
+
+Каждая миграция — async-функция (cursor, schema) с номером и именем, выполняется
+ровно один раз; применённые версии пишутся в таблицу schema_version. При connect()
+читается только MAX(version): если схема актуальна, ни CREATE, ни ALTER, ни
+PRAGMA table_info не выполняются — время подключения не зависит от числа миграций.
+
+Все ожидающие миграции идут в одной транзакции BEGIN IMMEDIATE: второй процесс
+(бот, охотник, шпион стартуют почти одновременно) ждёт блокировку, перечитывает
+версию и ничего не применяет повторно. Ошибка — откат целиком, версия не меняется.
+
+Новая миграция: функция с декоратором @migration(<следующий номер>, "<имя>") в конце
+файла. Уже применённые миграции не редактируются.
+
+Ручной запуск / статус:  python -m database.migrations [--db-path parkhomenko_bot.db] [--status]
+
+Первые миграции воспроизводят прежний _create_tables (CREATE IF NOT EXISTS и
+проверки колонок), поэтому на существующей базе они безопасны.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+MigrationFunc = Callable[[aiosqlite.Cursor, "SchemaCache"], Awaitable[None]]
+MIGRATIONS: List[Tuple[int, str, MigrationFunc]] = []
+
+
+def migration(version: int, name: str):
+    """Регистрация миграции; номера строго возрастают."""
+    def decorator(func: MigrationFunc) -> MigrationFunc:
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"Миграция {version} ({name}) должна идти после {MIGRATIONS[-1][0]}")
+        MIGRATIONS.append((version, name, func))
+        return func
+    return decorator
+
+
+class SchemaCache:
+    """Кэш колонок таблиц: PRAGMA table_info — один раз на таблицу, сброс после миграций."""
+
+    def __init__(self):
+        self._columns: Dict[str, FrozenSet[str]] = {}
+
+    async def columns(self, cursor: aiosqlite.Cursor, table: str) -> FrozenSet[str]:
+        cached = self._columns.get(table)
+        if cached is None:
+            await cursor.execute(f"PRAGMA table_info({table})")
+            cached = frozenset(row[1] for row in await cursor.fetchall())
+            self._columns[table] = cached
+        return cached
+
+    def invalidate(self, table: Optional[str] = None) -> None:
+        if table is None:
+            self._columns.clear()
+        else:
+            self._columns.pop(table, None)
+
+
+async def add_columns(
+    cursor: aiosqlite.Cursor, schema: SchemaCache, table: str, columns: Sequence[Tuple[str, str]]
+) -> None:
+    """ALTER TABLE ADD COLUMN только для отсутствующих колонок (для баз, созданных старым кодом)."""
+    existing = await schema.columns(cursor, table)
+    added = False
+    for name, ddl in columns:
+        if name not in existing:
+            await cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+            logger.debug(f"✅ Добавлена колонка {name} в {table}")
+            added = True
+    if added:
+        schema.invalidate(table)
+
+
+async def current_version(conn: aiosqlite.Connection) -> int:
+    async with conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version") as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else 0
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+async def apply_migrations(conn: aiosqlite.Connection, schema: SchemaCache) -> List[int]:
+    """Применить ожидающие миграции. Возвращает номера применённых (пусто — схема актуальна)."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await conn.commit()
+    if await current_version(conn) >= latest_version():
+        return []
+
+    applied: List[int] = []
+    await conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Пока ждали блокировку, другой процесс мог уже всё применить
+        version_before = await current_version(conn)
+        async with conn.cursor() as cursor:
+            for version, name, func in MIGRATIONS:
+                if version <= version_before:
+                    continue
+                t0 = time.monotonic()
+                await func(cursor, schema)
+                await cursor.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+                applied.append(version)
+                logger.info(f"🗄️ Миграция {version:03d} {name}: {time.monotonic() - t0:.2f} с")
+        await conn.commit()
+    except Exception:
+        await conn.rollback()
+        schema.invalidate()
+        raise
+    schema.invalidate()
+    return applied
+
+
+# ── Миграции ──────────────────────────────────────────────────────────────────
+
+@migration(1, "baseline")
+async def _baseline(cursor: aiosqlite.Cursor, schema: SchemaCache) -> None:
+    """Таблицы прежнего _create_tables (CREATE IF NOT EXISTS — безопасно на старой базе)."""
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            phone TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_interaction TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_states (
+            user_id INTEGER PRIMARY KEY,
+            mode TEXT,
+            quiz_step INTEGER DEFAULT 0,
+            name TEXT,
+            phone TEXT,
+            extra_contact TEXT,
+            object_type TEXT,
+            city TEXT,
+            floor TEXT,
+            total_floors TEXT,
+            remodeling_status TEXT,
+            change_plan TEXT,
+            bti_status TEXT,
+            consent_given BOOLEAN DEFAULT 0,
+            contact_received BOOLEAN DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS dialog_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            role TEXT,
+            message TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS leads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            name TEXT,
+            phone TEXT,
+            extra_contact TEXT,
+            object_type TEXT,
+            city TEXT,
+            floor TEXT,
+            total_floors TEXT,
+            area TEXT,
+            remodeling_status TEXT,
+            change_plan TEXT,
+            bti_status TEXT,
+            extra_questions TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_to_group BOOLEAN DEFAULT 0,
+            thread_id INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS content_plan (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            channel TEXT DEFAULT 'terion',
+            title TEXT,
+            body TEXT NOT NULL,
+            cta TEXT,
+            theme TEXT,
+            publish_date TIMESTAMP,
+            status TEXT DEFAULT 'draft',
+            image_url TEXT,
+            image_prompt TEXT,
+            admin_id INTEGER DEFAULT NULL,
+            published_at TIMESTAMP DEFAULT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Дни рождения клиентов
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS clients_birthdays (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT,
+            birth_date DATE NOT NULL,
+            channel TEXT DEFAULT 'telegram',
+            greeting_sent BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+    # Целевые ресурсы для мониторинга (TG чаты + VK группы)
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS target_resources (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL CHECK(type IN ('telegram', 'vk')),
+            link TEXT NOT NULL UNIQUE,
+            title TEXT,
+            is_active BOOLEAN DEFAULT 1,
+            last_post_id INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Ключевые слова для мониторинга
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS spy_keywords (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            keyword TEXT NOT NULL UNIQUE,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Настройки бота (key-value для переключателей и т.п.)
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS bot_settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await cursor.execute(
+        "INSERT OR IGNORE INTO bot_settings (key, value) VALUES ('spy_notify_enabled', '1')"
+    )
+    # Лиды от шпиона (TG/VK: автор, ссылка на профиль, текст)
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS spy_leads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source_type TEXT NOT NULL,
+            source_name TEXT NOT NULL,
+            author_id TEXT,
+            username TEXT,
+            profile_url TEXT,
+            text TEXT,
+            url TEXT NOT NULL,
+            pain_stage TEXT,
+            priority_score INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # История контента (финансовый трекинг)
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS content_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_text TEXT,
+            image_url TEXT,
+            model_used VARCHAR(50),
+            cost_rub DECIMAL(10, 2),
+            platform VARCHAR(20),
+            channel VARCHAR(50),
+            post_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_archived BOOLEAN DEFAULT FALSE
+        )
+    """)
+    # «Ассистент Продаж»: скрипты подсказок для карточки лида
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sales_templates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT NOT NULL UNIQUE,
+            body TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    for key, body in [
+        ("mji_prescription", "Срочный выезд и аудит документов"),
+        ("keys_design", "Проверка проекта на реализуемость"),
+    ]:
+        await cursor.execute(
+            "INSERT OR IGNORE INTO sales_templates (key, body) VALUES (?, ?)",
+            (key, body),
+        )
+    # Продажные диалоги (5-шаговый скрипт)
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sales_conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            source_type TEXT NOT NULL,
+            source_id TEXT NOT NULL,
+            post_id TEXT NOT NULL,
+            keyword TEXT,
+            context TEXT,
+            object_type TEXT,
+            sales_step INTEGER DEFAULT 1,
+            document_received BOOLEAN DEFAULT FALSE,
+            skipped_steps TEXT,
+            reminder_attempts INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'active',
+            sales_started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_interaction_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_reminder_at TIMESTAMP NULL,
+            completed BOOLEAN DEFAULT FALSE,
+            UNIQUE(user_id, source_type, source_id, post_id)
+        )
+    """)
+    # Почти-дубликаты лидов (services/lead_hunter/near_duplicates.py)
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS spy_lead_fingerprints (
+            lead_id INTEGER PRIMARY KEY,
+            simhash INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS spy_lead_duplicates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lead_id INTEGER NOT NULL,
+            source_type TEXT,
+            source_name TEXT,
+            url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_spy_lead_duplicates_lead ON spy_lead_duplicates(lead_id)"
+    )
+    # История запусков задач планировщика (services/job_coordinator.py)
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS job_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_name TEXT NOT NULL,
+            started_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP,
+            duration_sec REAL,
+            outcome TEXT NOT NULL,
+            error TEXT
+        )
+    """)
+    await cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_job_runs_name_time ON job_runs(job_name, started_at)"
+    )
+    # Системные логи (monitoring/log_sink.py)
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS system_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            level TEXT NOT NULL,
+            module TEXT,
+            message TEXT NOT NULL,
+            stack_trace TEXT,
+            repeat_count INTEGER DEFAULT 1,
+            first_seen TIMESTAMP NOT NULL,
+            last_seen TIMESTAMP NOT NULL
+        )
+    """)
+    await cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_system_logs_last_seen ON system_logs(last_seen)"
+    )
+
+
+@migration(2, "legacy_columns")
+async def _legacy_columns(cursor: aiosqlite.Cursor, schema: SchemaCache) -> None:
+    """Колонки, которые раньше добавлялись try/except ALTER TABLE на каждом connect()."""
+    await add_columns(cursor, schema, "leads", [
+        ("area", "TEXT"), ("extra_questions", "TEXT"), ("thread_id", "INTEGER"),
+    ])
+    await add_columns(cursor, schema, "content_plan", [("image_prompt", "TEXT")])
+    await add_columns(cursor, schema, "spy_leads", [
+        ("contacted_at", "TIMESTAMP NULL"), ("pain_stage", "TEXT"), ("priority_score", "INTEGER"),
+    ])
+    await add_columns(cursor, schema, "target_resources", [
+        ("notes", "TEXT NULL"),
+        # Data-Driven Scout
+        ("status", "TEXT DEFAULT 'pending'"),
+        ("platform", "TEXT NULL"),
+        ("geo_tag", "TEXT NULL"),
+        ("participants_count", "INTEGER NULL"),
+        # Снайпер v3.0: приоритетные ЖК (высотки)
+        ("is_high_priority", "INTEGER DEFAULT 0"),
+        ("priority", "INTEGER DEFAULT 5"),
+        ("last_scanned_at", "TIMESTAMP NULL"),
+        ("last_lead_at", "TIMESTAMP NULL"),
+    ])
+    # Привести старые записи: status из is_active, platform из type
+    await cursor.execute("UPDATE target_resources SET status = 'active' WHERE is_active = 1 AND (status IS NULL OR status = '')")
+    await cursor.execute("UPDATE target_resources SET status = 'archived' WHERE (is_active = 0 OR is_active IS NULL) AND (status IS NULL OR status = '')")
+    await cursor.execute("UPDATE target_resources SET platform = type WHERE platform IS NULL OR platform = ''")
+
+
+@migration(3, "spy_leads_workflow")
+async def _spy_leads_workflow(cursor: aiosqlite.Cursor, schema: SchemaCache) -> None:
+    """
+    Колонки, которые mark_lead_sent_to_hot_leads / mark_lead_in_work проверяли PRAGMA
+    на каждом вызове, и поля карточки лида, которые читает get_spy_lead.
+    """
+    await add_columns(cursor, schema, "spy_leads", [
+        ("sent_to_hot_leads", "INTEGER DEFAULT 0"),
+        ("status", "TEXT DEFAULT 'new'"),
+        ("intent", "TEXT"),
+        ("context_summary", "TEXT"),
+        ("geo_tag", "TEXT"),
+    ])
+
+
+@migration(4, "loose_scripts")
+async def _loose_scripts(cursor: aiosqlite.Cursor, schema: SchemaCache) -> None:
+    """Разовые скрипты из migrations/ (без порядка и учёта применения) — теперь по порядку."""
+    # add_lead_source.py, add_house_material_commercial_purpose.py
+    await add_columns(cursor, schema, "leads", [
+        ("source", "TEXT"), ("house_material", "TEXT"), ("commercial_purpose", "TEXT"),
+    ])
+    # add_published_at.py / sync_production_schema.py (для баз со старым content_plan)
+    await add_columns(cursor, schema, "content_plan", [
+        ("channel", "TEXT DEFAULT 'terion'"),
+        ("theme", "TEXT"),
+        ("image_url", "TEXT"),
+        ("admin_id", "INTEGER DEFAULT NULL"),
+        ("published_at", "TIMESTAMP DEFAULT NULL"),
+    ])
+    # 20260121_add_holidays_table.py (таблица без демо-праздников: их заводят вручную)
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS holidays (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            name TEXT NOT NULL,
+            message_template TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await cursor.execute("CREATE INDEX IF NOT EXISTS idx_holidays_date ON holidays(date)")
+    # 20260123_add_scheduled_posts_table.py
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scheduled_posts (
+            id           INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id   TEXT NOT NULL,
+            text         TEXT NOT NULL,
+            image_path   TEXT,
+            scheduled_at TEXT NOT NULL,
+            status       TEXT NOT NULL,
+            created_at   TEXT NOT NULL,
+            sent_at      TEXT
+        )
+    """)
+    await cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_scheduled_posts_scheduled_at_status ON scheduled_posts(scheduled_at, status)"
+    )
+
+
+@migration(5, "answer_cache")
+async def _answer_cache(cursor: aiosqlite.Cursor, schema: SchemaCache) -> None:
+    """Кэш ответов консультанта (utils/answer_cache.py)."""
+    await cursor.execute("""
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            cache_key TEXT PRIMARY KEY,
+            kb_version TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            question TEXT NOT NULL,
+            normalized TEXT NOT NULL,
+            context_hash TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            hits INTEGER DEFAULT 0,
+            created_at TIMESTAMP NOT NULL
+        )
+    """)
+    await cursor.execute("CREATE INDEX IF NOT EXISTS idx_answer_cache_kb ON answer_cache(kb_version, created_at)")
+
+
+
+@migration(6, "scan_schedule")
+async def _scan_schedule(cursor: aiosqlite.Cursor, schema: SchemaCache) -> None:
+    """Статистика и расписание сканирования источников (services/scan_scheduler.py)."""
+    await add_columns(cursor, schema, "target_resources", [
+        ("next_scan_at", "TIMESTAMP NULL"),
+        ("scan_limit", "INTEGER NULL"),
+        ("scan_count", "INTEGER DEFAULT 0"),
+        ("scan_errors", "INTEGER DEFAULT 0"),
+        ("msg_rate", "REAL NULL"),
+        ("msgs_seen", "REAL DEFAULT 0"),
+        ("leads_seen", "REAL DEFAULT 0"),
+        ("last_message_at", "TIMESTAMP NULL"),
+    ])
+    await cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_target_resources_next_scan ON target_resources(status, next_scan_at)"
+    )
+
+
+@migration(7, "scan_tracked_since")
+async def _scan_tracked_since(cursor: aiosqlite.Cursor, schema: SchemaCache) -> None:
+    """Начало адаптивного учёта источника: от него считается молчание, пока сообщений не видели."""
+    await add_columns(cursor, schema, "target_resources", [
+        ("scan_tracked_since", "TIMESTAMP NULL"),
+    ])
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+
+async def _cli(db_path: str, status_only: bool) -> None:
+    async with aiosqlite.connect(db_path, timeout=30.0) as conn:
+        await conn.execute("PRAGMA busy_timeout=5000")
+        if not status_only:
+            applied = await apply_migrations(conn, SchemaCache())
+            print(f"Применено миграций: {len(applied)}")
+        try:
+            async with conn.execute("SELECT version, name, applied_at FROM schema_version ORDER BY version") as cursor:
+                rows = await cursor.fetchall()
+        except aiosqlite.OperationalError:
+            rows = []
+        done = {row[0] for row in rows}
+        for version, name, applied_at in rows:
+            print(f"  ✅ {version:03d} {name}  ({applied_at})")
+        for version, name, _ in MIGRATIONS:
+            if version not in done:
+                print(f"  ⏳ {version:03d} {name}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Миграции схемы SQLite")
+    parser.add_argument("--db-path", default=os.getenv("DATABASE_PATH", "parkhomenko_bot.db"))
+    parser.add_argument("--status", action="store_true", help="только показать применённые и ожидающие")
+    args = parser.parse_args()
+    asyncio.run(_cli(args.db_path, args.status))
@@ -25,6 +25,7 @@ logger = logging.getLogger(__name__)
 admin_router = Router()
 =======
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+import asyncio
 import logging
 
 from database import db
@@ -119,8 +120,13 @@ async def admin_run_spy(callback: CallbackQuery):
         # В ScoutParser обычно есть метод для запуска сканирования, например run_scan или аналогичный
         # Предположим, что мы запускаем его через hunter или напрямую если есть метод
         from services.lead_hunter.hunter import LeadHunter
+        from services.job_coordinator import job_coordinator
+        from services.workers import workers
+        if "hunt" in job_coordinator.running():
+            await callback.message.answer("⏳ Охота уже идёт по расписанию — дождитесь завершения (/jobs).")
+            return
         hunter = LeadHunter()
-        await hunter.hunt()
+        await job_coordinator.run("hunt", workers.route("hunt", hunter.hunt))
         await callback.message.answer("✅ Scout-Parser (LeadHunter) завершил поиск лидов.")
         
     except Exception as e:
@@ -137,8 +143,11 @@ def get_admin_keyboard() -> InlineKeyboardMarkup:
     builder.button(text="📋 Список ресурсов", callback_data="admin_list_resources")
     builder.button(text="🔑 Ключевые слова", callback_data="admin_keywords")
     builder.button(text="🕵️ Управление Шпионом", callback_data="admin_spy_panel")
+    builder.button(text="🧭 Задачи планировщика", callback_data="admin_jobs")
+    builder.button(text="📡 Сессии Telethon", callback_data="admin_sessions")
+    builder.button(text="🐢 Блокировки цикла", callback_data="admin_loop")
     builder.button(text="◀️ Назад", callback_data="admin_back")
-    builder.adjust(1, 1, 1, 1, 1)
+    builder.adjust(1, 1, 1, 1, 1, 1, 1, 1)
     return builder.as_markup()
 
 
@@ -1021,7 +1030,9 @@ async def cmd_spy_report(message: Message):
     if not check_admin(message.from_user.id):
         await message.answer("⛔ У вас нет доступа")
         return
-    report = scout_parser.get_last_scan_report()
+    from services.workers import workers
+    # Отчёт живёт в процессе сканера: при WORKER_MODE=process — запрос в scan-воркер
+    report = await workers.call("scan_report", timeout=30)
     await message.answer(report)
 
 
@@ -1032,7 +1043,9 @@ async def cmd_stats(message: Message):
     if not check_admin(message.from_user.id):
         await message.answer("⛔ У вас нет доступа")
         return
-    report = scout_parser.get_last_scan_report()
+    from services.workers import workers
+    # Отчёт живёт в процессе сканера: при WORKER_MODE=process — запрос в scan-воркер
+    report = await workers.call("scan_report", timeout=30)
     await message.answer(report)
 
 
@@ -1046,14 +1059,113 @@ async def cmd_hunt(message: Message):
     await message.answer("🏹 Запускаю охоту за лидами...")
     try:
         from services.lead_hunter import LeadHunter
+        from services.job_coordinator import job_coordinator
+        if "hunt" in job_coordinator.running():
+            await message.answer("⏳ Охота уже идёт по расписанию — дождитесь завершения (/jobs).")
+            return
+        from services.workers import workers
         hunter = LeadHunter()
-        await hunter.hunt()
+        await job_coordinator.run("hunt", workers.route("hunt", hunter.hunt))
         await message.answer("✅ Охота завершена. Отчёт — в топике «Логи».")
     except Exception as e:
         logger.exception("hunt")
         await message.answer(f"❌ Ошибка охоты: {e}")
 
 
+# === КОМАНДА /JOBS (задачи планировщика) ===
+@router.message(Command("jobs"))
+async def cmd_jobs(message: Message):
+    """Что сейчас выполняется, сводка за 24 ч и последние запуски задач (только для админа)."""
+    if not check_admin(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа")
+        return
+    from services.job_coordinator import job_coordinator
+    report = await job_coordinator.format_report()
+    await message.answer(report, parse_mode="HTML", reply_markup=get_back_to_admin())
+
+
+@router.callback_query(F.data == "admin_jobs")
+async def admin_jobs(callback: CallbackQuery):
+    """Кнопка «Задачи планировщика» в админ-панели"""
+    if not check_admin(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа")
+        return
+    from services.job_coordinator import job_coordinator
+    report = await job_coordinator.format_report()
+    await callback.message.edit_text(report, parse_mode="HTML", reply_markup=get_back_to_admin())
+    await callback.answer()
+
+
+# === КОМАНДА /SESSIONS (пул Telethon-сессий) ===
+@router.message(Command("sessions"))
+async def cmd_sessions(message: Message):
+    """Состояние и нагрузка Telethon-сессий сканера (только для админа)."""
+    if not check_admin(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа")
+        return
+    from services.workers import workers
+    # Пул сессий живёт в процессе сканера: при WORKER_MODE=process — запрос в scan-воркер
+    report = await workers.call("session_report", timeout=30)
+    await message.answer(report, parse_mode="HTML", reply_markup=get_back_to_admin())
+
+
+@router.callback_query(F.data == "admin_sessions")
+async def admin_sessions(callback: CallbackQuery):
+    """Кнопка «Сессии Telethon» в админ-панели"""
+    if not check_admin(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа")
+        return
+    from services.workers import workers
+    report = await workers.call("session_report", timeout=30)
+    await callback.message.edit_text(report, parse_mode="HTML", reply_markup=get_back_to_admin())
+    await callback.answer()
+
+
+# === КОМАНДА /LOOP (блокировки цикла событий) ===
+@router.message(Command("loop"))
+async def cmd_loop(message: Message):
+    """Лаг цикла событий и места синхронных вызовов, которые его блокируют (только для админа)."""
+    if not check_admin(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа")
+        return
+    from monitoring.loop_monitor import loop_monitor
+    await message.answer(loop_monitor.format_report(), parse_mode="HTML", reply_markup=get_back_to_admin())
+
+
+@router.callback_query(F.data == "admin_loop")
+async def admin_loop(callback: CallbackQuery):
+    """Кнопка «Блокировки цикла» в админ-панели"""
+    if not check_admin(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа")
+        return
+    from monitoring.loop_monitor import loop_monitor
+    await callback.message.edit_text(loop_monitor.format_report(), parse_mode="HTML",
+                                     reply_markup=get_back_to_admin())
+    await callback.answer()
+
+
+# === КОМАНДА /PROFILE (сэмплирующий профайлер) ===
+@router.message(Command("profile"))
+async def cmd_profile(message: Message):
+    """Снять профиль работающего процесса: /profile [секунды]. Отчёт — в топик «Логи» (только для админа)."""
+    if not check_admin(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа")
+        return
+    from monitoring.profiler import profiler, PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS
+    parts = (message.text or "").split()
+    seconds = PROFILE_DEFAULT_SECONDS
+    if len(parts) > 1:
+        if not parts[1].isdigit():
+            await message.answer(f"Использование: /profile [секунды], максимум {PROFILE_MAX_SECONDS}")
+            return
+        seconds = min(int(parts[1]), PROFILE_MAX_SECONDS)
+    # start() занимает профайлер до первого await и держит ссылку на фоновую задачу
+    if not profiler.start(seconds, reason=f"/profile от {message.from_user.id}"):
+        await message.answer("⏳ Профайлер уже запущен — дождитесь отчёта в топике «Логи».")
+        return
+    await message.answer(f"🔬 Профайлер запущен на {seconds} с. Сводка и flamegraph-файл придут в топик «Логи».")
+
+
 # === КОМАНДА /SPY_DISCOVER (ручная разведка / добавление новых целей) ===
 @router.message(Command("spy_discover"))
 async def cmd_spy_discover(message: Message):
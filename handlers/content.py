@@ -28,7 +28,6 @@ from typing import Optional
 # Кэш шаблонов: 5 минут, чтобы не читать диск при каждом сообщении
 _TEMPLATE_CACHE_TTL = 300  # секунд
 _template_cache: dict = {}
-from PIL import Image
 import io
 
 <<<<<<< HEAD
@@ -52,6 +51,7 @@ from config import (
     THREAD_ID_TRENDS_SEASON,
     THREAD_ID_LOGS,
     ROUTER_AI_KEY,
+    ROUTER_AI_ENDPOINT,
     YANDEX_API_KEY,
     FOLDER_ID,
     MAX_API_KEY,
@@ -70,6 +70,9 @@ from config import (
 logger = logging.getLogger(__name__)
 content_router = Router()
 
+# Хост Yandex Foundation Models (локальный мок: scripts/ai_mock_server.py)
+YANDEX_LLM_URL = os.getenv("YANDEX_LLM_URL", "https://llm.api.cloud.yandex.net").rstrip("/")
+
 # Папка шаблонов контента (редактируемые Юлией без правки кода)
 _TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates", "content")
 
@@ -189,8 +192,9 @@ from services.image_generator import image_generator
 from utils.router_ai import router_ai
 
 async def _auto_generate_image(prompt: str) -> Optional[bytes]:
-    """Автоматический выбор модели генерации изображения."""
-    return await image_generator.generate_image(prompt)
+    """Автоматический выбор модели генерации изображения (WORKER_MODE=process — в media-воркере)."""
+    from services.workers import workers
+    return await workers.route("generate_image", image_generator.generate_image)(prompt)
 =======
 
 
@@ -217,7 +221,7 @@ class YandexArtClient:
                 "aspectRatio": {"widthRatio": 16, "heightRatio": 9}
             }
         }
-        op_base = "https://llm.api.cloud.yandex.net"
+        op_base = YANDEX_LLM_URL
         try:
             async with aiohttp.ClientSession() as session:
                 async with session.post(
@@ -294,7 +298,7 @@ class RouterAIClient:
         try:
             async with aiohttp.ClientSession() as session:
                 async with session.post(
-                    "https://routerai.ru/api/v1/chat/completions",
+                    ROUTER_AI_ENDPOINT,
                     headers=self.headers,
                     json=payload
                 ) as resp:
@@ -343,7 +347,7 @@ class RouterAIClient:
         try:
             async with aiohttp.ClientSession() as session:
                 async with session.post(
-                    "https://routerai.ru/api/v1/chat/completions",
+                    ROUTER_AI_ENDPOINT,
                     headers=self.headers,
                     json=payload
                 ) as resp:
@@ -368,7 +372,7 @@ class RouterAIClient:
         try:
             async with aiohttp.ClientSession() as session:
                 async with session.post(
-                    "https://routerai.ru/api/v1/chat/completions",
+                    ROUTER_AI_ENDPOINT,
                     headers=self.headers,
                     json=payload
                 ) as resp:
@@ -683,6 +687,11 @@ async def _photo_input_for_send(bot: Bot, image_url: str):
 
 >>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
 async def compress_image(image_bytes: bytes, max_size: int = 1024, quality: int = 85) -> bytes:
+    from services.workers import workers
+    if workers.enabled:  # Pillow не занимает цикл событий ботов: сжатие в media-воркере
+        return await workers.call("compress_image", image_bytes, max_size, quality)
+    from PIL import Image  # Pillow грузим при первом сжатии, а не при старте бота
+
     try:
         img = Image.open(io.BytesIO(image_bytes))
         if img.mode in ('RGBA', 'P'):
@@ -927,7 +936,7 @@ async def visual_select_model(message: Message, state: FSMContext):
     await message.answer("🎨 <b>Введите описание сцены:</b>", reply_markup=get_back_btn(), parse_mode="HTML")
     await state.set_state(ContentStates.ai_visual_prompt)
 
-@content_router.message(ContentStates.ai_visual_prompt)
+@content_router.message(ContentStates.ai_visual_prompt, flags={"llm": True})
 async def ai_visual_handler(message: Message, state: FSMContext):
     await message.answer("⏳ <b>Генерирую...</b>", parse_mode="HTML")
     image_b64 = await _auto_generate_image(message.text)
@@ -962,7 +971,7 @@ async def series_start(message: Message, state: FSMContext):
     await message.answer("✨ <b>Введите: дней, тема</b> (напр. 7, студия):", reply_markup=get_back_btn(), parse_mode="HTML")
     await state.set_state(ContentStates.ai_series)
 
-@content_router.message(ContentStates.ai_series)
+@content_router.message(ContentStates.ai_series, flags={"llm": True})
 async def ai_series_handler(message: Message, state: FSMContext):
     try:
         days, topic = [p.strip() for p in message.text.split(',', 1)]
@@ -980,7 +989,7 @@ async def news_start(message: Message, state: FSMContext):
     await message.answer("📰 <b>Введите тему новости:</b>", reply_markup=get_back_btn(), parse_mode="HTML")
     await state.set_state(ContentStates.ai_news)
 
-@content_router.message(ContentStates.ai_news)
+@content_router.message(ContentStates.ai_news, flags={"llm": True})
 async def ai_news_handler(message: Message, state: FSMContext):
     await message.answer("🔍 <b>Пишу новость...</b>", parse_mode="HTML")
     prompt = f"Напиши новостной пост TERION на тему: {message.text}."
@@ -992,7 +1001,7 @@ async def plan_start(message: Message, state: FSMContext):
     await message.answer("📋 <b>Введите: дней, тема:</b>", reply_markup=get_back_btn(), parse_mode="HTML")
     await state.set_state(ContentStates.ai_plan)
 
-@content_router.message(ContentStates.ai_plan)
+@content_router.message(ContentStates.ai_plan, flags={"llm": True})
 async def ai_plan_handler(message: Message, state: FSMContext):
     try:
         days, topic = [p.strip() for p in message.text.split(',', 1)]
@@ -1008,7 +1017,7 @@ async def quick_start(message: Message, state: FSMContext):
     await message.answer("📝 <b>Введите тему:</b>", reply_markup=get_back_btn(), parse_mode="HTML")
     await state.set_state(ContentStates.ai_text)
 
-@content_router.message(ContentStates.ai_text)
+@content_router.message(ContentStates.ai_text, flags={"llm": True})
 async def ai_text_handler(message: Message, state: FSMContext):
     await message.answer("⏳ <b>Пишу...</b>", parse_mode="HTML")
     prompt = f"Напиши экспертный пост TERION на тему: {message.text}."
@@ -1024,7 +1033,7 @@ async def holiday_rf_start(message: Message, state: FSMContext):
     await message.answer("🎉 <b>Введите название праздника:</b>", reply_markup=get_back_btn(), parse_mode="HTML")
     await state.set_state(ContentStates.holiday_rf)
 
-@content_router.message(ContentStates.holiday_rf)
+@content_router.message(ContentStates.holiday_rf, flags={"llm": True})
 async def holiday_rf_handler(message: Message, state: FSMContext):
     await message.answer("⏳ <b>Пишу поздравление...</b>", parse_mode="HTML")
     prompt = f"Напиши праздничный пост TERION: {message.text}."
@@ -1129,7 +1138,7 @@ async def visual_model_selected(callback: CallbackQuery, state: FSMContext):
     await state.set_state(ContentStates.ai_visual_prompt)
 
 
-@content_router.message(ContentStates.ai_visual_prompt)
+@content_router.message(ContentStates.ai_visual_prompt, flags={"llm": True})
 async def ai_visual_handler(message: Message, state: FSMContext):
     user_prompt = message.text or ""
 
@@ -1277,7 +1286,7 @@ async def series_start(message: Message, state: FSMContext):
     await state.set_state(ContentStates.ai_series)
 
 
-@content_router.message(ContentStates.ai_series)
+@content_router.message(ContentStates.ai_series, flags={"llm": True})
 async def ai_series_handler(message: Message, state: FSMContext):
     text = message.text.strip()
     
@@ -1457,7 +1466,7 @@ async def plan_start(message: Message, state: FSMContext):
     await state.set_state(ContentStates.ai_plan)
 
 
-@content_router.message(ContentStates.ai_plan)
+@content_router.message(ContentStates.ai_plan, flags={"llm": True})
 async def ai_plan_handler(message: Message, state: FSMContext):
     text = message.text.strip()
 
@@ -1706,7 +1715,7 @@ async def news_topic_selected(callback: CallbackQuery, state: FSMContext):
     await _generate_news_by_topic(callback, state, label.split(" ", 1)[-1], hint=hint, is_callback=True)
 
 
-@content_router.message(ContentStates.ai_news)
+@content_router.message(ContentStates.ai_news, flags={"llm": True})
 async def ai_news_handler(message: Message, state: FSMContext):
     topic = (message.text or "").strip()
     if not topic:
@@ -1955,7 +1964,7 @@ async def fact_category_selected(callback: CallbackQuery, state: FSMContext):
     await state.update_data(post_id=post_id)
 
 
-@content_router.message(ContentStates.ai_text)
+@content_router.message(ContentStates.ai_text, flags={"llm": True})
 async def ai_text_handler(message: Message, state: FSMContext):
     topic = message.text
     data = await state.get_data()
@@ -27,6 +27,22 @@ from database.db import db
 dialog_router = Router()
 
 
+async def in_dialog_mode(message: Message):
+    """
+    Фильтр: пользователь в режиме диалога (состояние передаётся хендлеру как user_state).
+
+    Проверка в фильтре, а не в теле хендлера: middleware throttling (флаги llm/coalesce)
+    срабатывает только после фильтров, иначе любой текст вне диалога ждал бы склейки,
+    занимал токены бакета и получал «много обращений».
+    """
+    if message.from_user is None:
+        return False
+    user_state = await db.get_user_state(message.from_user.id)
+    if not user_state or user_state.get("mode") != "dialog":
+        return False
+    return {"user_state": user_state}
+
+
 <<<<<<< HEAD
 @dialog_router.callback_query(F.data == "mode:dialog")
 async def start_dialog_mode(callback: CallbackQuery, state: FSMContext):
@@ -61,28 +77,18 @@ async def start_dialog(callback: CallbackQuery):
 
 
 <<<<<<< HEAD
-@dialog_router.message()
-async def dialog_handler(message: Message, state: FSMContext):
+@dialog_router.message(in_dialog_mode, flags={"llm": True, "coalesce": True})
+async def dialog_handler(message: Message, state: FSMContext, user_state: dict):
     """Обработчик диалогового режима"""
     user_id = message.from_user.id
-    user_state = await db.get_user_state(user_id)
-    
-    if not user_state or user_state.get("mode") != "dialog":
-        return
     
     context = await kb.get_context(message.text)
     history = await db.get_dialog_history(user_id)
 =======
-@router.message(F.text, ~StateFilter(QuizStates))
-async def dialog_message_handler(message: Message, state: FSMContext):
+@router.message(F.text, ~StateFilter(QuizStates), in_dialog_mode, flags={"llm": True, "coalesce": True})
+async def dialog_message_handler(message: Message, state: FSMContext, user_state: dict):
     """Обработка сообщений в диалоговом режиме. Не срабатывает в состоянии квиза — тогда отвечает quiz."""
     user_id = message.from_user.id
-    user_state = await db.get_user_state(user_id)
-    
-    # Проверяем, что пользователь в режиме диалога
-    if not user_state or user_state.get('mode') != 'dialog':
-        print(f"DEBUG: User {user_id} not in dialog mode, ignoring")
-        return
     
     user_query = message.text.strip()
     name = user_state.get('name', '')
@@ -114,7 +120,8 @@ def register_handlers(dp: Dispatcher):
     for msg in dialog_history:
         history_for_prompt.append({
             'role': msg['role'],
-            'text': msg['message']
+            'text': msg['message'],
+            'created_at': msg.get('created_at'),
         })
     
     # Проверка на триггер-слова (связь со специалистом)
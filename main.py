@@ -16,7 +16,6 @@ import sys
 from pathlib import Path
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
@@ -31,41 +30,57 @@ from handlers.creator import creator_router
 from database import db
 from utils import kb
 from middleware.logging import UnhandledCallbackMiddleware
-from services.scout_parser import ScoutParser
-from agents.creative_agent import creative_agent
-<<<<<<< HEAD
-from services.lead_hunter.hunter import LeadHunter
-=======
-from services.lead_hunter import LeadHunter
->>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
-from services.competitor_spy import competitor_spy
+from middleware.throttling import throttling
 from services.publisher import publisher
-from services.image_generator import image_generator
+from services.publish_timer import publish_timer
+from services.job_coordinator import job_coordinator
+from services.fsm_storage import fsm_storage
+from services.webhook import UPDATES_MODE, WEBHOOK_PORT, webhook_server
+from monitoring.metrics import start_metrics_server, stop_metrics_server
+from monitoring.log_sink import log_sink
+from monitoring.heartbeat import heartbeat
+from monitoring.loop_monitor import loop_monitor
+from monitoring.startup import startup, FirstUpdateMiddleware
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+startup.mark("imports")
 
-<<<<<<< HEAD
-class DbLogHandler(logging.Handler):
-    """Кастомный обработчик логов для записи в БД."""
-    def emit(self, record):
-        if record.levelno >= logging.ERROR:
-            try:
-                msg = self.format(record)
-                stack = record.exc_text if record.exc_info else None
-                asyncio.create_task(db.add_system_log(record.levelname, record.name, msg, stack))
-            except:
-                pass
-
-# Добавляем обработчик в корневой логгер
-logging.getLogger().addHandler(DbLogHandler())
+# Ошибки — в system_logs через пакетный приёмник (буфер + executemany, повторы схлопываются)
+logging.getLogger().addHandler(log_sink)
 
-=======
->>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
 # Аудит: видим PID, чтобы убедиться, что процесс не запускается дважды
 print(f"DEBUG: Started process with PID {os.getpid()}")
 
-LOCK_FILE = Path(__file__).resolve().parent / "bot.lock"
+LOCK_FILE = Path(os.getenv("BOT_LOCK_FILE") or Path(__file__).resolve().parent / "bot.lock")
+
+# Бюджет одного цикла hunt: меньше интервала (30 мин), превышение видно в /jobs
+HUNT_BUDGET_SECONDS = int(os.getenv("HUNT_BUDGET_SECONDS", "1500"))
+
+# SERVICES_ENABLED=0 — дополнительный процесс webhook за прокси: только апдейты,
+# без планировщика, воркеров и регистрации webhook (их держит основной процесс)
+SERVICES_ENABLED = os.getenv("SERVICES_ENABLED", "1") != "0"
+
+# Свой адрес Bot API (локальный telegram-bot-api или фейковый сервер бенчмарка)
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "")
+
+# Тяжёлые модули фоновых сервисов: в режиме fast грузятся в потоке уже после старта polling
+HEAVY_MODULES = [
+    "services.scout_parser",
+    "services.lead_hunter",
+    "services.competitor_spy",
+    "agents.creative_agent",
+    "services.image_generator",
+]
+
+
+def _bot_session():
+    """Сессия aiogram с TELEGRAM_API_BASE (None — стандартный api.telegram.org)."""
+    if not TELEGRAM_API_BASE:
+        return None
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    return AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_BASE))
 
 
 def _acquire_lock() -> None:
@@ -101,18 +116,104 @@ def _release_lock() -> None:
         logger.warning("Не удалось удалить bot.lock: %s", e)
 
 
+async def check_connections(main_bot: Bot, content_bot: Bot) -> None:
+    """Проверка связей (каналы, рабочая группа, VK, топики) — все запросы параллельно."""
+    logger.info("🔍 Проверка связей...")
+    from config import CHANNEL_ID_TERION, CHANNEL_ID_DOM_GRAD
+    from config import THREAD_ID_DRAFTS, THREAD_ID_CONTENT_PLAN, THREAD_ID_TRENDS_SEASON, THREAD_ID_LOGS
+    from config import VK_TOKEN, VK_GROUP_ID
+
+    async def check_chat(bot: Bot, chat_id, name: str) -> None:
+        try:
+            await bot.get_chat(chat_id)
+            logger.info(f"✅ {name}: OK")
+        except Exception as e:
+            logger.error(f"❌ {name}: {e}")
+
+    async def check_vk() -> None:
+        if not (VK_TOKEN and VK_GROUP_ID):
+            logger.warning("⚠️ Интеграция VK: токен или group_id не настроены")
+            return
+        try:
+            import aiohttp
+            async with aiohttp.ClientSession() as session:
+                async with session.get(
+                    "https://api.vk.com/method/groups.getById",
+                    params={"access_token": VK_TOKEN, "v": "5.199", "group_ids": VK_GROUP_ID}
+                ) as resp:
+                    data = await resp.json()
+                    if "response" in data and data["response"]:
+                        group_name = data["response"][0].get("name", "VK")
+                        logger.info(f"✅ Интеграция VK ({group_name}): OK")
+                    else:
+                        logger.warning("⚠️ Интеграция VK: группа не найдена")
+        except Exception as e:
+            logger.warning(f"⚠️ Интеграция VK: {e}")
+
+    checks = [
+        check_chat(main_bot, CHANNEL_ID_TERION, "Канал TG"),
+        check_chat(content_bot, CHANNEL_ID_DOM_GRAD, "Канал ДОМ ГРАНД"),
+        check_chat(main_bot, LEADS_GROUP_CHAT_ID, "Рабочая группа"),
+        check_vk(),
+    ]
+    for thread_id, name in [
+        (THREAD_ID_DRAFTS, "Черновики"),
+        (THREAD_ID_CONTENT_PLAN, "Контент-план"),
+        (THREAD_ID_TRENDS_SEASON, "Тренды/Сезон"),
+        (THREAD_ID_LOGS, "Логи")
+    ]:
+        checks.append(check_chat(main_bot, LEADS_GROUP_CHAT_ID, f"Топик {name}"))
+    await asyncio.gather(*checks)
+
+
+def build_dispatchers():
+    """
+    Единственные экземпляры Dispatcher в проекте (main_bot, content_bot) со всеми роутерами
+    и middleware. Отдельной функцией — чтобы scripts/bench_updates.py гонял нагрузку
+    через тот же Dispatcher, что и прод.
+    """
+    dp_main = Dispatcher(storage=fsm_storage())
+    dp_main.callback_query.middleware(UnhandledCallbackMiddleware())
+<<<<<<< HEAD
+    
+    # Регистрация всех обработчиков через единую функцию
+    register_all_handlers(dp_main)
+=======
+    # Системные команды (admin) — приоритет, первыми в списке роутеров
+    dp_main.include_router(admin_router)
+    dp_main.include_router(creator_router)
+    dp_main.include_router(quiz_router)   # раньше start: квиз по ссылке из поста обрабатывается первым
+    dp_main.include_router(start_router)
+    dp_main.include_router(dialog_router)
+>>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
+
+    dp_content = Dispatcher(storage=fsm_storage())
+    dp_content.callback_query.middleware(UnhandledCallbackMiddleware())
+    dp_content.include_routers(content_router)
+    # Хендлеры с флагом llm: токен-бакеты (пользователь + общий на оба бота) и склейка сообщений
+    dp_main.message.middleware(throttling)
+    dp_content.message.middleware(throttling)
+    # Время до первого апдейта — для логов и scripts/bench_startup.py
+    dp_main.update.outer_middleware(FirstUpdateMiddleware(startup))
+    dp_content.update.outer_middleware(FirstUpdateMiddleware(startup))
+    return dp_main, dp_content
+
+
 async def main():
     logger.info("🎯 Запуск ЭКОСИСТЕМЫ TERION...")
     _acquire_lock()
+    startup.mark("main")
     # Один Dispatcher на токен, один start_polling на токен — только здесь
 
     # 1. Единая инициализация ресурсов
     await db.connect()
-    await kb.index_documents()
+    await log_sink.start(db)
+    # Лаг цикла и стеки синхронных вызовов, которые его держат (/loop в админке)
+    await loop_monitor.start()
 
     # 2. Один раз создаём экземпляры ботов (далее используем их везде, включая проверку связей)
-    main_bot = Bot(token=BOT_TOKEN or "", default=DefaultBotProperties(parse_mode="HTML"))
-    content_bot = Bot(token=CONTENT_BOT_TOKEN or "", default=DefaultBotProperties(parse_mode="HTML"))
+    main_bot = Bot(token=BOT_TOKEN or "", session=_bot_session(), default=DefaultBotProperties(parse_mode="HTML"))
+    content_bot = Bot(token=CONTENT_BOT_TOKEN or "", session=_bot_session(), default=DefaultBotProperties(parse_mode="HTML"))
 <<<<<<< HEAD
     from utils.bot_config import set_main_bot, set_content_bot
     set_main_bot(main_bot)
@@ -123,235 +224,209 @@ async def main():
 >>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
     publisher.bot = main_bot
 
-    # 3. Проверка связей (те же экземпляры main_bot, content_bot — сессии не закрываем)
-    logger.info("🔍 Проверка связей...")
-    try:
-        from config import CHANNEL_ID_TERION, CHANNEL_ID_DOM_GRAD, LEADS_GROUP_CHAT_ID
-        from config import THREAD_ID_DRAFTS, THREAD_ID_CONTENT_PLAN, THREAD_ID_TRENDS_SEASON, THREAD_ID_LOGS
-        try:
-            await main_bot.get_chat(CHANNEL_ID_TERION)
-            logger.info("✅ Канал TG: OK")
-        except Exception as e:
-            logger.error(f"❌ Канал TG: {e}")
-        try:
-            await content_bot.get_chat(CHANNEL_ID_DOM_GRAD)
-            logger.info("✅ Канал ДОМ ГРАНД: OK")
-        except Exception as e:
-            logger.error(f"❌ Канал ДОМ ГРАНД: {e}")
-        try:
-            await main_bot.get_chat(LEADS_GROUP_CHAT_ID)
-            logger.info("✅ Рабочая группа: OK")
-        except Exception as e:
-            logger.error(f"❌ Рабочая группа: {e}")
-        from config import VK_TOKEN, VK_GROUP_ID
-        if VK_TOKEN and VK_GROUP_ID:
-            try:
-                import aiohttp
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(
-                        "https://api.vk.com/method/groups.getById",
-                        params={"access_token": VK_TOKEN, "v": "5.199", "group_ids": VK_GROUP_ID}
-                    ) as resp:
-                        data = await resp.json()
-                        if "response" in data and data["response"]:
-                            group_name = data["response"][0].get("name", "VK")
-                            logger.info(f"✅ Интеграция VK ({group_name}): OK")
-                        else:
-                            logger.warning("⚠️ Интеграция VK: группа не найдена")
-            except Exception as e:
-                logger.warning(f"⚠️ Интеграция VK: {e}")
-        else:
-            logger.warning("⚠️ Интеграция VK: токен или group_id не настроены")
-        for thread_id, name in [
-            (THREAD_ID_DRAFTS, "Черновики"),
-            (THREAD_ID_CONTENT_PLAN, "Контент-план"),
-            (THREAD_ID_TRENDS_SEASON, "Тренды/Сезон"),
-            (THREAD_ID_LOGS, "Логи")
-        ]:
-            try:
-                await main_bot.get_chat(LEADS_GROUP_CHAT_ID)
-                logger.info(f"✅ Топик {name}: OK")
-            except Exception as e:
-                logger.error(f"❌ Топик {name}: {e}")
-    except Exception as e:
-        logger.error(f"Ошибка проверки связей: {e}")
+    # start_polling вызывается только ниже, по одному разу на каждый Dispatcher
+    dp_main, dp_content = build_dispatchers()
+    startup.mark("dispatchers")
+    
+    async def start_services():
+        """Фоновые сервисы и планировщик: тяжёлые импорты, hunter, задачи, команды группы."""
+        if startup.fast:
+            await startup.preload(HEAVY_MODULES)
+        from agents.creative_agent import creative_agent
+<<<<<<< HEAD
+        from services.lead_hunter.hunter import LeadHunter
+=======
+        from services.lead_hunter import LeadHunter
+>>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
+        from services.competitor_spy import competitor_spy
 
-    scheduler = AsyncIOScheduler()
+        # Prometheus /metrics (METRICS_HOST:METRICS_PORT, выключается METRICS_ENABLED=0)
+        await start_metrics_server()
 
-<<<<<<< HEAD
-    from services.publisher import Publisher
-    poster = Publisher(main_bot)
+        # Heartbeat для watchdog: лаг цикла, очереди и текущие задачи в logs/heartbeat/<имя>.json
+        heartbeat.set_job_provider(
+            lambda: {name: round(info["elapsed"], 1) for name, info in job_coordinator.running().items()}
+        )
+        await heartbeat.start()
 
-    # Проверка и публикация по расписанию
-    scheduler.add_job(poster.check_and_publish, "interval", minutes=10)
-    scheduler.add_job(poster.check_and_publish, "cron", hour=12, minute=0)  # явно в 12:00
-=======
-    async def check_and_publish_scheduled_posts():
-        """Публикация постов из контент-плана (status=approved, publish_date <= сейчас)."""
-        try:
-            posts = await db.get_posts_to_publish()
-            if not posts:
-                return
-            for post in posts:
-                try:
-                    title = (post.get("title") or "").strip()
-                    body = (post.get("body") or "").strip()
-                    text = f"📌 <b>{title}</b>\n\n{body}\n\n#перепланировка #согласование #терион" if title else body + "\n\n#перепланировка #согласование #терион"
-                    image_bytes = None  # TODO: загрузка по image_url при наличии
-                    await publisher.publish_all(text, image_bytes)
-                    await db.mark_as_published(post["id"])
-                    logger.info("✅ Опубликован пост #%s из контент-плана", post["id"])
-                except Exception as e:
-                    logger.error("Ошибка публикации поста #%s: %s", post.get("id"), e)
-        except Exception as e:
-            logger.error("Ошибка check_and_publish_scheduled_posts: %s", e)
+        # Очередь исходящих уведомлений (лимиты Telegram, сводки): досылает сохранённое до перезапуска
+        from services.notifier import notifier
+        await notifier.start()
 
-    # Проверка и публикация по расписанию: каждый час (посты с publish_date в прошлом и status=approved)
-    scheduler.add_job(check_and_publish_scheduled_posts, "interval", hours=1)
-    scheduler.add_job(check_and_publish_scheduled_posts, "cron", hour=12, minute=0)  # явно в 12:00
->>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
+        # WORKER_MODE=process: скан/анализ и медиа — в отдельных процессах (services/workers.py),
+        # цикл событий ботов занят только апдейтами; inline — всё здесь, как раньше
+        from services.workers import workers
+        await workers.start()
 
-    # Lead Hunter & Creative Agent Integration
-    hunter = LeadHunter()
-    
-    # Поиск клиентов каждые 30 минут (каналы TG + VK)
-<<<<<<< HEAD
-    scheduler.add_job(hunter.hunt, 'interval', minutes=30)
+        # Все задачи регистрируются через job_coordinator: single-flight, coalesce, бюджеты, история в job_runs
+        scheduler = AsyncIOScheduler()
 
-    # Инсайт недели: воскресенье, 18:00
-    scheduler.add_job(hunter.generate_weekly_insight, 'cron', day_of_week='sun', hour=18, minute=0)
-    
-    # Поиск новых VK групп раз в сутки через Discovery
-    scheduler.add_job(
-        hunter.run_discovery,
-        'interval',
-        hours=24,
-        id='vk_discovery',
-        max_instances=1
-    )
+        # Публикация по расписанию: таймер спит до ближайшего publish_date из контент-плана
+        # и подхватывает новые/перенесённые посты по уведомлениям из БД (без опроса)
+        await publish_timer.start()
 
-=======
-    # Использует обновленный ScoutParser с фильтрами анти-спама и режимом модерации
-    # Все найденные лиды отправляются в админ-канал (топик THREAD_ID_HOT_LEADS) для модерации
-    scheduler.add_job(hunter.hunt, 'interval', minutes=30)
+        # Lead Hunter & Creative Agent Integration
+        hunter = LeadHunter()
 
->>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
-    # Гео-шпион 24/7: чаты ЖК (Перекрёсток, Самолёт, ПИК и т.д.) — каждые 5 мин
-    async def run_geo_spy_job():
-        if not competitor_spy.geo_monitoring_enabled:
-            return
-        try:
-            leads = await competitor_spy.scan_geo_chats()
-            if leads:
-                logger.info("🎯 GEO-Spy: найдено %s лидов", len(leads))
-        except Exception as e:
-            logger.error("GEO-Spy: %s", e)
-    scheduler.add_job(run_geo_spy_job, "interval", seconds=competitor_spy.geo_check_interval)
+        # Потоковый режим (LEAD_STREAM_ENABLED=1): Telegram-лиды за секунды, hunt() остаётся запасным
+        from services.lead_hunter.stream import lead_stream, LEAD_STREAM_ENABLED
+        if LEAD_STREAM_ENABLED and not workers.enabled:  # в режиме process поток живёт в scan-воркере
+            lead_stream.start_background(hunter)
 
-    # Поиск идей для контента раз в 6 часов (темы ещё отправляются в группу после создания content_bot)
-    scheduler.add_job(creative_agent.scout_topics, 'interval', hours=6)
-    
+        # Поиск клиентов каждые 30 минут (каналы TG + VK)
 <<<<<<< HEAD
+        job_coordinator.add_job(scheduler, workers.route("hunt", hunter.hunt), 'interval', name='hunt', budget_seconds=HUNT_BUDGET_SECONDS, minutes=30)
+
+        # Инсайт недели: воскресенье, 18:00
+        job_coordinator.add_job(scheduler, hunter.generate_weekly_insight, 'cron', name='weekly_insight', day_of_week='sun', hour=18, minute=0)
+
+        # Поиск новых VK групп раз в сутки через Discovery
+        job_coordinator.add_job(
+            scheduler,
+            workers.route("vk_discovery", hunter.run_discovery),
+            'interval',
+            name='vk_discovery',
+            hours=24,
+            id='vk_discovery',
+        )
+
 =======
-    # Автоматические напоминания для продажных диалогов (дожим)
-    from services.sales_reminders import send_sales_reminders
-    scheduler.add_job(send_sales_reminders, 'interval', hours=6)
-    
-    # ── ПЛАНИРОВЩИК СВОДОК ЛИДОВ ────────────────────────────────────────────────────
-    # Отправка сводок обычных лидов (priority < 3) трижды в день: 9:00, 14:00, 19:00 МСК
-    # Фильтр "Живой человек": только лиды от пользователей (не от каналов) попадают в сводки
-    async def send_regular_leads_summary_job():
-        """Задача для отправки сводки обычных лидов по расписанию.
-        
-        Фильтр "Живой человек" применяется в БД: get_regular_leads_for_summary()
-        исключает лиды от каналов (sender_type == 'channel' или author_id отсутствует).
-        """
-        try:
-            await hunter.send_regular_leads_summary()
-        except Exception as e:
-            logger.error(f"Ошибка отправки сводки обычных лидов: {e}")
-    
-    # Добавляем задачи на отправку сводок в 9:00, 14:00, 19:00 МСК
-    # Используем UTC: МСК = UTC+3, поэтому 9:00 МСК = 06:00 UTC, 14:00 МСК = 11:00 UTC, 19:00 МСК = 16:00 UTC
-    try:
-        from pytz import timezone
-        moscow_tz = timezone('Europe/Moscow')
-        scheduler.add_job(send_regular_leads_summary_job, 'cron', hour=9, minute=0, timezone=moscow_tz)
-        scheduler.add_job(send_regular_leads_summary_job, 'cron', hour=14, minute=0, timezone=moscow_tz)
-        scheduler.add_job(send_regular_leads_summary_job, 'cron', hour=19, minute=0, timezone=moscow_tz)
-    except ImportError:
-        # Если pytz не установлен, используем UTC с учетом смещения
-        logger.warning("⚠️ pytz не установлен, используем UTC с учетом МСК (UTC+3)")
-        scheduler.add_job(send_regular_leads_summary_job, 'cron', hour=6, minute=0)  # 9:00 МСК
-        scheduler.add_job(send_regular_leads_summary_job, 'cron', hour=11, minute=0)  # 14:00 МСК
-        scheduler.add_job(send_regular_leads_summary_job, 'cron', hour=16, minute=0)  # 19:00 МСК
-    
-    # Проверка горячих лидов для немедленной отправки (каждые 15 минут)
-    async def check_and_send_hot_leads_job():
-        """Задача для проверки и отправки горячих лидов в топик 'Горячие лиды'."""
-        try:
-            await hunter.send_hot_leads_immediate()
-        except Exception as e:
-            logger.error(f"Ошибка отправки горячих лидов: {e}")
-    
-    scheduler.add_job(check_and_send_hot_leads_job, 'interval', minutes=15)
-    
+        # Использует обновленный ScoutParser с фильтрами анти-спама и режимом модерации
+        # Все найденные лиды отправляются в админ-канал (топик THREAD_ID_HOT_LEADS) для модерации
+        job_coordinator.add_job(scheduler, workers.route("hunt", hunter.hunt), 'interval', name='hunt', budget_seconds=HUNT_BUDGET_SECONDS, minutes=30)
+
 >>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
-    scheduler.start()
-    # Задачи планировщика получают main_bot/content_bot аргументом, своих Bot() не создают
-    from services.birthday_greetings import send_birthday_greetings
-    scheduler.add_job(send_birthday_greetings, 'cron', hour=9, minute=0, args=[main_bot])
+        # Гео-шпион 24/7: чаты ЖК (Перекрёсток, Самолёт, ПИК и т.д.) — каждые 5 мин
+        scan_geo_chats = workers.route("geo_spy", competitor_spy.scan_geo_chats)
+
+        async def run_geo_spy_job():
+            if not competitor_spy.geo_monitoring_enabled:
+                return
+            try:
+                leads = await scan_geo_chats()
+                if leads:
+                    logger.info("🎯 GEO-Spy: найдено %s лидов", len(leads))
+            except Exception as e:
+                logger.error("GEO-Spy: %s", e)
+        job_coordinator.add_job(
+            scheduler, run_geo_spy_job, "interval", name="geo_spy",
+            budget_seconds=competitor_spy.geo_check_interval, seconds=competitor_spy.geo_check_interval,
+        )
+
+        # Поиск идей для контента раз в 6 часов (темы ещё отправляются в группу после создания content_bot)
+        scout_topics = workers.route("scout_topics", creative_agent.scout_topics)
+        job_coordinator.add_job(scheduler, scout_topics, 'interval', name='scout_topics', hours=6)
 
-    # Единственные экземпляры Dispatcher в проекте; start_polling вызывается только ниже, по одному разу на каждый
-    dp_main = Dispatcher(storage=MemoryStorage())
-    dp_main.callback_query.middleware(UnhandledCallbackMiddleware())
 <<<<<<< HEAD
-    
-    # Регистрация всех обработчиков через единую функцию
-    register_all_handlers(dp_main)
 =======
-    # Системные команды (admin) — приоритет, первыми в списке роутеров
-    dp_main.include_router(admin_router)
-    dp_main.include_router(creator_router)
-    dp_main.include_router(quiz_router)   # раньше start: квиз по ссылке из поста обрабатывается первым
-    dp_main.include_router(start_router)
-    dp_main.include_router(dialog_router)
->>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
+        # Автоматические напоминания для продажных диалогов (дожим)
+        from services.sales_reminders import send_sales_reminders
+        job_coordinator.add_job(scheduler, send_sales_reminders, 'interval', name='sales_reminders', hours=6)
+
+        # ── ПЛАНИРОВЩИК СВОДОК ЛИДОВ ────────────────────────────────────────────────────
+        # Отправка сводок обычных лидов (priority < 3) трижды в день: 9:00, 14:00, 19:00 МСК
+        # Фильтр "Живой человек": только лиды от пользователей (не от каналов) попадают в сводки
+        async def send_regular_leads_summary_job():
+            """Задача для отправки сводки обычных лидов по расписанию.
+
+            Фильтр "Живой человек" применяется в БД: get_regular_leads_for_summary()
+            исключает лиды от каналов (sender_type == 'channel' или author_id отсутствует).
+            """
+            try:
+                await hunter.send_regular_leads_summary()
+            except Exception as e:
+                logger.error(f"Ошибка отправки сводки обычных лидов: {e}")
 
-    # Темы от креативщика в рабочую группу (топик Тренды/Сезон) раз в 6 ч
-    async def post_creative_topics_to_group(bot):
-        from config import LEADS_GROUP_CHAT_ID, THREAD_ID_TRENDS_SEASON
+        # Добавляем задачи на отправку сводок в 9:00, 14:00, 19:00 МСК
+        # Используем UTC: МСК = UTC+3, поэтому 9:00 МСК = 06:00 UTC, 14:00 МСК = 11:00 UTC, 19:00 МСК = 16:00 UTC
         try:
-            topics = await creative_agent.scout_topics(3)
-            text = "🕵️‍♂️ <b>Темы от креативщика</b> (актуальные)\n\n"
-            for i, t in enumerate(topics, 1):
-                text += f"{i}. <b>{t.get('title', '')}</b>\n   💡 {t.get('insight', '')}\n\n"
-            await bot.send_message(LEADS_GROUP_CHAT_ID, text, message_thread_id=THREAD_ID_TRENDS_SEASON, parse_mode="HTML")
+            from pytz import timezone
+            moscow_tz = timezone('Europe/Moscow')
+            job_coordinator.add_job(scheduler, send_regular_leads_summary_job, 'cron', name='leads_summary', hour=9, minute=0, timezone=moscow_tz)
+            job_coordinator.add_job(scheduler, send_regular_leads_summary_job, 'cron', name='leads_summary', hour=14, minute=0, timezone=moscow_tz)
+            job_coordinator.add_job(scheduler, send_regular_leads_summary_job, 'cron', name='leads_summary', hour=19, minute=0, timezone=moscow_tz)
+        except ImportError:
+            # Если pytz не установлен, используем UTC с учетом смещения
+            logger.warning("⚠️ pytz не установлен, используем UTC с учетом МСК (UTC+3)")
+            job_coordinator.add_job(scheduler, send_regular_leads_summary_job, 'cron', name='leads_summary', hour=6, minute=0)  # 9:00 МСК
+            job_coordinator.add_job(scheduler, send_regular_leads_summary_job, 'cron', name='leads_summary', hour=11, minute=0)  # 14:00 МСК
+            job_coordinator.add_job(scheduler, send_regular_leads_summary_job, 'cron', name='leads_summary', hour=16, minute=0)  # 19:00 МСК
+
+        # Проверка горячих лидов для немедленной отправки (каждые 15 минут)
+        async def check_and_send_hot_leads_job():
+            """Задача для проверки и отправки горячих лидов в топик 'Горячие лиды'."""
+            try:
+                await hunter.send_hot_leads_immediate()
+            except Exception as e:
+                logger.error(f"Ошибка отправки горячих лидов: {e}")
+
+        job_coordinator.add_job(scheduler, check_and_send_hot_leads_job, 'interval', name='hot_leads', minutes=15)
+
+>>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
+        scheduler.start()
+        # Задачи планировщика получают main_bot/content_bot аргументом, своих Bot() не создают
+        from services.birthday_greetings import send_birthday_greetings
+        job_coordinator.add_job(scheduler, send_birthday_greetings, 'cron', name='birthday_greetings', hour=9, minute=0, args=[main_bot])
+        # История запусков задач храним 30 дней
+        job_coordinator.add_job(scheduler, db.cleanup_job_runs, 'cron', name='cleanup_job_runs', hour=4, minute=0)
+        # Системные логи (system_logs) — 14 дней
+        job_coordinator.add_job(scheduler, db.cleanup_system_logs, 'cron', name='cleanup_system_logs', hour=4, minute=10)
+
+        # Темы от креативщика в рабочую группу (топик Тренды/Сезон) раз в 6 ч
+        async def post_creative_topics_to_group(bot):
+            from config import LEADS_GROUP_CHAT_ID, THREAD_ID_TRENDS_SEASON
+            try:
+                topics = await scout_topics(3)
+                text = "🕵️‍♂️ <b>Темы от креативщика</b> (актуальные)\n\n"
+                for i, t in enumerate(topics, 1):
+                    text += f"{i}. <b>{t.get('title', '')}</b>\n   💡 {t.get('insight', '')}\n\n"
+                await bot.send_message(LEADS_GROUP_CHAT_ID, text, message_thread_id=THREAD_ID_TRENDS_SEASON, parse_mode="HTML")
+            except Exception as e:
+                logger.warning(f"Ошибка отправки тем в группу: {e}")
+        job_coordinator.add_job(scheduler, post_creative_topics_to_group, 'interval', name='creative_topics', hours=6, args=[content_bot])
+        from services.scheduler_ref import set_scheduler
+        set_scheduler(scheduler)
+        # 4. Команды для рабочей группы (всплывают как подсказки при /)
+        from aiogram.types import BotCommand, BotCommandScopeChat
+        try:
+            await main_bot.set_my_commands(
+                commands=[
+                    BotCommand(command="stats", description="Статистика скана"),
+                    BotCommand(command="hunt", description="Охота за лидами"),
+                    BotCommand(command="spy_status", description="Статус шпиона: чаты и лиды за 24 ч"),
+                    BotCommand(command="leads_review", description="Ревизия лидов за 12 ч: кто попался, какие боли"),
+                    BotCommand(command="scan_chats", description="Сканер чатов: ID, название, участники (для добычи ID)"),
+                    BotCommand(command="jobs", description="Задачи планировщика: что выполняется, история запусков"),
+                    BotCommand(command="profile", description="Профайлер: /profile [сек] — сводка и flamegraph в «Логи»"),
+                    BotCommand(command="loop", description="Блокировки цикла событий: лаг, места и стеки"),
+                ],
+                scope=BotCommandScopeChat(chat_id=LEADS_GROUP_CHAT_ID),
+            )
+            logger.info("✅ Команды для рабочей группы заданы (stats, hunt, spy_status, leads_review)")
         except Exception as e:
-            logger.warning(f"Ошибка отправки тем в группу: {e}")
-    scheduler.add_job(post_creative_topics_to_group, 'interval', hours=6, args=[content_bot])
-    from services.scheduler_ref import set_scheduler
-    set_scheduler(scheduler)
-    dp_content = Dispatcher(storage=MemoryStorage())
-    dp_content.callback_query.middleware(UnhandledCallbackMiddleware())
-    dp_content.include_routers(content_router)
-    
-    # 4. Команды для рабочей группы (всплывают как подсказки при /)
-    from aiogram.types import BotCommand, BotCommandScopeChat
-    try:
-        await main_bot.set_my_commands(
-            commands=[
-                BotCommand(command="stats", description="Статистика скана"),
-                BotCommand(command="hunt", description="Охота за лидами"),
-                BotCommand(command="spy_status", description="Статус шпиона: чаты и лиды за 24 ч"),
-                BotCommand(command="leads_review", description="Ревизия лидов за 12 ч: кто попался, какие боли"),
-                BotCommand(command="scan_chats", description="Сканер чатов: ID, название, участники (для добычи ID)"),
-            ],
-            scope=BotCommandScopeChat(chat_id=LEADS_GROUP_CHAT_ID),
-        )
-        logger.info("✅ Команды для рабочей группы заданы (stats, hunt, spy_status, leads_review)")
-    except Exception as e:
-        logger.warning("set_my_commands для группы: %s", e)
+            logger.warning("set_my_commands для группы: %s", e)
+
+    # 3. Прогрев: fast — параллельно в фоне, polling стартует сразу; eager — до polling, как раньше
+    # База знаний нужна консультанту и в процессах только с апдейтами (SERVICES_ENABLED=0);
+    # одновременная индексация безопасна — временные файлы индекса у каждого процесса свои
+    warmups = [("kb_index", kb.index_documents())]
+    if SERVICES_ENABLED:
+        warmups += [
+            ("connections", check_connections(main_bot, content_bot)),
+            ("services", start_services()),
+        ]
+    else:
+        # Своя очередь уведомлений у каждого процесса, иначе неотправленное досылалось бы дважды
+        from services.notifier import notifier
+        notifier.namespace = f"web_{WEBHOOK_PORT}"
+    if startup.fast:
+        for name, coro in warmups:
+            startup.background(name, coro)
+        startup.report_in_background()
+    else:
+        for name, coro in warmups:
+            await startup.run(name, coro)
+        await startup.wait_background()
 
     # 5. Параллельный запуск (Force Webhook Clear + Conflict Retry + Graceful Shutdown)
     async def close_bot_sessions():
@@ -368,18 +443,47 @@ async def main():
                 logger.warning("Ошибка закрытия сессии %s: %s", name, e)
         _release_lock()
 
-    logger.info("🚀 Очистка webhook и запуск polling...")
-    await main_bot.delete_webhook(drop_pending_updates=True)
-    await content_bot.delete_webhook(drop_pending_updates=True)
+    # UPDATES_MODE=webhook: оба бота на одном aiohttp-сервере (services/webhook.py);
+    # polling — по умолчанию и запасной, если webhook не поднялся
+    use_webhook = UPDATES_MODE == "webhook" and await webhook_server.start(
+        {"main": (main_bot, dp_main), "content": (content_bot, dp_content)}, register=SERVICES_ENABLED,
+    )
+    if not use_webhook:
+        if not SERVICES_ENABLED:
+            logger.error("❌ SERVICES_ENABLED=0 работает только с webhook — polling конфликтовал бы с основным процессом")
+            await close_bot_sessions()
+            return
+        logger.info("🚀 Очистка webhook и запуск polling...")
+        await main_bot.delete_webhook(drop_pending_updates=True)
+        await content_bot.delete_webhook(drop_pending_updates=True)
+    startup.mark("polling")
 
     try:
-        await asyncio.gather(
-            dp_main.start_polling(main_bot, skip_updates=True),
-            dp_content.start_polling(content_bot, skip_updates=True),
-        )
+        if use_webhook:
+            await webhook_server.wait()
+        else:
+            await asyncio.gather(
+                dp_main.start_polling(main_bot, skip_updates=True),
+                dp_content.start_polling(content_bot, skip_updates=True),
+            )
     except asyncio.CancelledError:
-        logger.info("Polling остановлен")
+        logger.info("Приём апдейтов остановлен")
     finally:
+        await webhook_server.stop()
+        await startup.stop()
+        from services.lead_hunter.stream import lead_stream
+        from services.session_pool import session_pool
+        from services.workers import workers
+        await publish_timer.stop()
+        await workers.stop()
+        await lead_stream.stop()
+        await session_pool.stop()
+        await stop_metrics_server()
+        await log_sink.stop()
+        await heartbeat.stop()
+        await loop_monitor.stop()
+        from services.notifier import notifier
+        await notifier.stop()
         await close_bot_sessions()
 
 
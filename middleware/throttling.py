@@ -0,0 +1,209 @@
+"""
+Ограничение частоты для хендлеров, которые ходят в LLM (YandexGPT / Router AI).
+
+Хендлер помечается флагом aiogram: @router.message(..., flags={"llm": True}).
+Для консультанта добавляется "coalesce": True — тогда несколько сообщений подряд
+от одного пользователя (пачка пересланных, мысль частями) склеиваются в один ход LLM.
+
+  - токен-бакет на пользователя (THROTTLE_USER_RATE в минуту, запас THROTTLE_USER_BURST)
+    и общий (THROTTLE_GLOBAL_RATE в секунду, запас THROTTLE_GLOBAL_BURST);
+  - нет токена — ход ждёт своей очереди; если ждать дольше THROTTLE_NOTICE_AFTER,
+    пользователь получает вежливое «отвечу чуть позже»;
+  - очередь длиннее THROTTLE_MAX_QUEUE — новый ход не ставится, пользователю «сейчас
+    много обращений»;
+  - ходы одного пользователя выполняются по очереди, сообщения во время ответа
+    склеиваются в следующий ход;
+  - метрики: terion_throttle_events_total{result=served|coalesced|queued|rejected},
+    terion_throttle_wait_seconds, terion_queue_depth{queue="throttle"}.
+
+Админы (config.is_admin) не ограничиваются персональным бакетом, общий действует для всех.
+
+Бакеты и очереди живут в памяти процесса: при нескольких процессах webhook
+(SERVICES_ENABLED=0, services/webhook.py) лимиты действуют в каждом отдельно — общий
+предел провайдера делите на число процессов, а сообщения пользователя склеиваются,
+только если пришли в один процесс.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message, TelegramObject
+
+from config import is_admin
+from monitoring.metrics import QUEUE_DEPTH, counter, histogram, registry
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "1") != "0"
+THROTTLE_USER_RATE = float(os.getenv("THROTTLE_USER_RATE", "6"))  # ходов в минуту
+THROTTLE_USER_BURST = float(os.getenv("THROTTLE_USER_BURST", "3"))
+THROTTLE_GLOBAL_RATE = float(os.getenv("THROTTLE_GLOBAL_RATE", "2"))  # ходов в секунду
+THROTTLE_GLOBAL_BURST = float(os.getenv("THROTTLE_GLOBAL_BURST", "10"))
+THROTTLE_COALESCE_WINDOW = float(os.getenv("THROTTLE_COALESCE_WINDOW", "1.5"))
+THROTTLE_COALESCE_MAX = float(os.getenv("THROTTLE_COALESCE_MAX", "6"))
+THROTTLE_MAX_QUEUE = int(os.getenv("THROTTLE_MAX_QUEUE", "50"))
+THROTTLE_NOTICE_AFTER = float(os.getenv("THROTTLE_NOTICE_AFTER", "3"))
+
+BUSY_NOTICE = "⏳ Получил ваш вопрос — сейчас много обращений, отвечу примерно через {seconds} сек."
+BUSY_REJECT = "🙏 Сейчас очень много обращений. Пожалуйста, повторите вопрос через минуту — я обязательно отвечу."
+
+THROTTLE_EVENTS = counter(
+    "terion_throttle_events_total", "LLM-хендлеры: served / coalesced / queued / rejected", ("result",),
+)
+THROTTLE_WAIT = histogram(
+    "terion_throttle_wait_seconds", "Ожидание токена перед ходом LLM", buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+
+class TokenBucket:
+    """Бакет с резервированием: take() сразу списывает токен и возвращает, сколько ждать."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class _Turn:
+    """Будущий ход LLM пользователя: первое сообщение + приклеенные тексты."""
+
+    __slots__ = ("texts", "last_at", "started_at")
+
+    def __init__(self, text: str):
+        self.texts: List[str] = [text]
+        self.started_at = self.last_at = time.monotonic()
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Inner-middleware на dp.message: действует только на хендлеры с флагом llm."""
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(THROTTLE_GLOBAL_RATE, THROTTLE_GLOBAL_BURST)
+        self.user_buckets: Dict[int, TokenBucket] = {}
+        self.collecting: Dict[int, _Turn] = {}
+        self.user_locks: Dict[int, asyncio.Lock] = {}
+        self.active: Dict[int, int] = {}
+        self.waiting = 0
+        registry.add_collector(lambda: QUEUE_DEPTH.set(self.waiting, queue="throttle"))
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not THROTTLE_ENABLED or not isinstance(event, Message) or not get_flag(data, "llm"):
+            return await handler(event, data)
+        user_id = event.from_user.id if event.from_user else event.chat.id
+
+        turn: Optional[_Turn] = None
+        if get_flag(data, "coalesce") and event.text:
+            turn = self.collecting.get(user_id)
+            if turn is not None:
+                turn.texts.append(event.text)
+                turn.last_at = time.monotonic()
+                THROTTLE_EVENTS.inc(result="coalesced")
+                return None
+            turn = self.collecting[user_id] = _Turn(event.text)
+
+        if self.waiting >= THROTTLE_MAX_QUEUE:
+            if turn is not None:
+                self.collecting.pop(user_id, None)
+            THROTTLE_EVENTS.inc(result="rejected")
+            logger.warning(f"⚠️ Очередь LLM переполнена ({self.waiting}), отказ пользователю {user_id}")
+            await self._reply(event, BUSY_REJECT)
+            return None
+
+        self.waiting += 1
+        self.active[user_id] = self.active.get(user_id, 0) + 1
+        queued = True
+        try:
+            if turn is not None:
+                await self._collect(turn)
+            # Ходы одного пользователя — по очереди; пока ждём предыдущий, новые сообщения приклеиваются к этому
+            async with self.user_locks.setdefault(user_id, asyncio.Lock()):
+                if turn is not None:
+                    self.collecting.pop(user_id, None)
+                    if len(turn.texts) > 1:
+                        event = event.model_copy(update={"text": "\n".join(turn.texts)})
+                        logger.debug(f"🧵 Склеено {len(turn.texts)} сообщений пользователя {user_id} в один ход")
+                await self._wait_tokens(user_id, event)
+                self.waiting -= 1
+                queued = False
+                THROTTLE_EVENTS.inc(result="served")
+                return await handler(event, data)
+        finally:
+            if queued:
+                self.waiting -= 1
+                if turn is not None and self.collecting.get(user_id) is turn:
+                    self.collecting.pop(user_id, None)
+            self.active[user_id] -= 1
+            if not self.active[user_id]:
+                del self.active[user_id]
+                self.user_locks.pop(user_id, None)
+            self._prune()
+
+    async def _collect(self, turn: _Turn) -> None:
+        """Ждать, пока пользователь «допишет»: тишина THROTTLE_COALESCE_WINDOW, но не дольше COALESCE_MAX."""
+        while True:
+            now = time.monotonic()
+            quiet_left = turn.last_at + THROTTLE_COALESCE_WINDOW - now
+            cap_left = turn.started_at + THROTTLE_COALESCE_MAX - now
+            delay = min(quiet_left, cap_left)
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def _wait_tokens(self, user_id: int, event: Message) -> None:
+        delay = 0.0
+        if not is_admin(user_id):
+            bucket = self.user_buckets.get(user_id)
+            if bucket is None:
+                bucket = self.user_buckets[user_id] = TokenBucket(THROTTLE_USER_RATE / 60.0, THROTTLE_USER_BURST)
+            delay = bucket.take()
+        # Общий токен резервируем с учётом персонального ожидания: очередь не обгоняет сама себя
+        delay = max(delay, self.global_bucket.take())
+        THROTTLE_WAIT.observe(delay)
+        if delay <= 0:
+            return
+        THROTTLE_EVENTS.inc(result="queued")
+        if delay >= THROTTLE_NOTICE_AFTER:
+            await self._reply(event, BUSY_NOTICE.format(seconds=max(1, round(delay))))
+        await asyncio.sleep(delay)
+
+    async def _reply(self, event: Message, text: str) -> None:
+        try:
+            await event.answer(text)
+        except Exception as e:
+            logger.debug(f"Троттлинг: не удалось ответить пользователю: {e}")
+
+    def _prune(self) -> None:
+        """Забыть полные бакеты неактивных пользователей, чтобы словарь не рос бесконечно."""
+        if len(self.user_buckets) <= 10000:
+            return
+        for user_id in [uid for uid, bucket in self.user_buckets.items() if bucket.full()]:
+            del self.user_buckets[user_id]
+
+
+throttling = ThrottlingMiddleware()
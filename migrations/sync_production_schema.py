@@ -15,6 +15,11 @@ It will:
 4. Verify schema integrity
 
 Safe to run multiple times - checks before altering.
+
+NOTE: schema changes are now versioned in database/migrations.py and applied
+automatically on Database.connect(); to check or apply them manually use
+    python database/migrations.py --db-path <path> [--status]
+This script is kept for servers that predate the schema_version table.
 """
 import sqlite3
 import logging
@@ -0,0 +1,120 @@
+"""
+Heartbeat-канал здоровья процессов для watchdog.py.
+
+Каждый управляемый процесс раз в HEARTBEAT_INTERVAL секунд атомарно перезаписывает
+JSON-файл HEARTBEAT_DIR/<name>.json: pid, время, лаг цикла событий, глубины очередей
+(terion_queue_depth), текущие задачи планировщика. Пишет корутина внутри цикла
+событий — если цикл завис (блокирующий Telethon/Pillow), файл перестаёт обновляться,
+и watchdog видит это без разбора логов.
+
+Имя процесса и каталог watchdog передаёт в окружении (HEARTBEAT_NAME, HEARTBEAT_DIR).
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, Optional
+
+from monitoring.metrics import QUEUE_DEPTH, gauge, registry
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_DIR = os.getenv("HEARTBEAT_DIR", os.path.join("logs", "heartbeat"))
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "5"))
+HEARTBEAT_ENABLED = os.getenv("HEARTBEAT_ENABLED", "1") != "0"
+
+LOOP_LAG = gauge("terion_event_loop_lag_seconds", "Лаг цикла событий по последнему heartbeat")
+
+
+def heartbeat_path(name: str, directory: str = None) -> str:
+    return os.path.join(directory or HEARTBEAT_DIR, f"{name}.json")
+
+
+def read_heartbeat(name: str, directory: str = None) -> Optional[Dict]:
+    """Прочитать последний heartbeat процесса (None — файла нет или он повреждён)."""
+    try:
+        with open(heartbeat_path(name, directory), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json_atomic(path: str, data: Dict) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, default=str)
+    os.replace(tmp, path)
+
+
+class HeartbeatPublisher:
+    """Периодическая запись heartbeat-файла из цикла событий."""
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name or os.getenv("HEARTBEAT_NAME") or os.path.splitext(os.path.basename(sys.argv[0] or "main"))[0]
+        self._task: Optional[asyncio.Task] = None
+        self._job_provider: Optional[Callable[[], Any]] = None
+        self.max_lag = 0.0
+
+    def set_job_provider(self, provider: Callable[[], Any]) -> None:
+        """Источник «текущих задач» (JSON-сериализуемый, например имя → секунды выполнения)."""
+        self._job_provider = provider
+
+    async def start(self) -> None:
+        if not HEARTBEAT_ENABLED or self._task is not None:
+            return
+        os.makedirs(HEARTBEAT_DIR, exist_ok=True)
+        self._task = asyncio.create_task(self._run(), name="heartbeat")
+        logger.info(f"💓 Heartbeat: {heartbeat_path(self.name)} каждые {HEARTBEAT_INTERVAL:.0f} с")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._write(lag=0.0, status="stopped")
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        lag = 0.0
+        while True:
+            self._write(lag)
+            expected = loop.time() + HEARTBEAT_INTERVAL
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            # Насколько позже запланированного проснулись — это и есть лаг цикла
+            lag = max(0.0, loop.time() - expected)
+
+    def _write(self, lag: float, status: str = "running") -> None:
+        self.max_lag = max(self.max_lag, lag)
+        LOOP_LAG.set(lag)
+        registry.collect()
+        queues = {key[0]: value for key, value in QUEUE_DEPTH.items().items()}
+        jobs: Any = {}
+        if self._job_provider:
+            try:
+                jobs = self._job_provider()
+            except Exception:
+                pass
+        data = {
+            "name": self.name,
+            "pid": os.getpid(),
+            "ts": time.time(),
+            "interval": HEARTBEAT_INTERVAL,
+            "status": status,
+            "loop_lag": round(lag, 3),
+            "max_loop_lag": round(self.max_lag, 3),
+            "queues": queues,
+            "jobs": jobs,
+        }
+        try:
+            write_json_atomic(heartbeat_path(self.name), data)
+        except OSError as e:
+            logger.debug(f"Heartbeat: не удалось записать файл: {e}")
+
+
+heartbeat = HeartbeatPublisher()
@@ -0,0 +1,200 @@
+"""
+Пакетный асинхронный приёмник логов в SQLite (system_logs).
+
+Заменяет DbLogHandler из main.py (create_task + INSERT + commit на каждую запись)
+и log_to_db из watchdog.py (то же на каждую строку stderr с «Error»).
+
+  - emit() ничего не пишет в БД: запись кладётся в ограниченный буфер (без задач и await);
+  - повторы (тот же уровень, модуль и текст без метки времени) схлопываются в одну
+    строку со счётчиком repeat_count и first_seen/last_seen;
+  - отдельный флашер пишет буфер одним executemany + commit по размеру
+    (LOG_SINK_BATCH_SIZE) или по таймеру (LOG_SINK_FLUSH_INTERVAL);
+  - при переполнении (LOG_SINK_MAX_PENDING уникальных сообщений) новые сообщения
+    отбрасываются, повторы уже известных продолжают считаться;
+    всё видно в метриках terion_log_sink_records_total{result=...}.
+"""
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from monitoring.metrics import QUEUE_DEPTH, counter, registry
+
+logger = logging.getLogger(__name__)
+
+LOG_SINK_LEVEL = getattr(logging, os.getenv("LOG_SINK_LEVEL", "ERROR").upper(), logging.ERROR)
+LOG_SINK_BATCH_SIZE = int(os.getenv("LOG_SINK_BATCH_SIZE", "100"))
+LOG_SINK_FLUSH_INTERVAL = float(os.getenv("LOG_SINK_FLUSH_INTERVAL", "2"))
+LOG_SINK_MAX_PENDING = int(os.getenv("LOG_SINK_MAX_PENDING", "1000"))
+MAX_MESSAGE_LENGTH = 4000
+MAX_STACK_LENGTH = 8000
+
+LOG_SINK_RECORDS = counter(
+    "terion_log_sink_records_total", "Записи приёмника логов: accepted / deduplicated / dropped / written",
+    ("result",),
+)
+
+# Метка времени в начале строки stderr дочернего процесса: «2026-02-17 12:00:01,123 - ...»
+_TIMESTAMP_RE = re.compile(r"^\[?\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?\]?\s*[-|]?\s*")
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class _Entry:
+    __slots__ = ("level", "module", "message", "stack", "count", "first_seen", "last_seen")
+
+    def __init__(self, level: str, module: str, message: str, stack: Optional[str]):
+        self.level = level
+        self.module = module
+        self.message = message
+        self.stack = stack
+        self.count = 1
+        self.first_seen = self.last_seen = _now()
+
+    def as_row(self) -> tuple:
+        return (self.level, self.module, self.message, self.stack, self.count, self.first_seen, self.last_seen)
+
+
+class DbLogSink(logging.Handler):
+    """logging.Handler + submit() для watchdog; флашер запускается start(db)."""
+
+    def __init__(self, level: int = LOG_SINK_LEVEL):
+        super().__init__(level)
+        self._pending: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._pending_lock = threading.Lock()
+        self._db = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        registry.add_collector(lambda: QUEUE_DEPTH.set(len(self._pending), queue="log_sink"))
+
+    # ── Приём ──────────────────────────────────────────────────────────────────
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.name == __name__:
+            return  # собственные предупреждения приёмника в БД не пишем
+        try:
+            message = record.getMessage()
+            stack = None
+            if record.exc_info:
+                stack = logging.Formatter().formatException(record.exc_info)
+            elif record.exc_text:
+                stack = record.exc_text
+            self.submit(record.levelname, record.name, message, stack)
+        except Exception:
+            self.handleError(record)
+
+    def submit(self, level: str, module: str, message: str, stack_trace: Optional[str] = None) -> bool:
+        """Положить запись в буфер (потокобезопасно, без await). False — если отброшена."""
+        message = _TIMESTAMP_RE.sub("", (message or "").strip())[:MAX_MESSAGE_LENGTH]
+        if stack_trace:
+            stack_trace = stack_trace[-MAX_STACK_LENGTH:]
+        key = (level, module, message)
+        with self._pending_lock:
+            entry = self._pending.get(key)
+            if entry is not None:
+                entry.count += 1
+                entry.last_seen = _now()
+                if stack_trace and not entry.stack:
+                    entry.stack = stack_trace
+                LOG_SINK_RECORDS.inc(result="deduplicated")
+                return True
+            if len(self._pending) >= LOG_SINK_MAX_PENDING:
+                self.dropped += 1
+                LOG_SINK_RECORDS.inc(result="dropped")
+                return False
+            self._pending[key] = _Entry(level, module, message, stack_trace)
+            size = len(self._pending)
+        LOG_SINK_RECORDS.inc(result="accepted")
+        if size >= LOG_SINK_BATCH_SIZE:
+            self._wake()
+        return True
+
+    def _wake(self) -> None:
+        if self._loop is None or self._wakeup is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            pass  # цикл уже закрыт
+
+    # ── Флашер ─────────────────────────────────────────────────────────────────
+
+    async def start(self, db) -> None:
+        if self._task is not None:
+            return
+        self._db = db
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="log_sink_flusher")
+        logger.info(f"🗄️ Приёмник логов: пакет {LOG_SINK_BATCH_SIZE}, интервал {LOG_SINK_FLUSH_INTERVAL} с, "
+                    f"буфер {LOG_SINK_MAX_PENDING}")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush_now()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=LOG_SINK_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush_now()
+
+    async def flush_now(self) -> int:
+        """Записать буфер одним executemany. Возвращает число строк."""
+        with self._pending_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, OrderedDict()
+        if self._db is None or getattr(self._db, "conn", None) is None:
+            self._requeue(batch)
+            return 0
+        rows = [entry.as_row() for entry in batch.values()]
+        t0 = time.monotonic()
+        try:
+            await self._db.add_system_logs(rows)
+        except Exception as e:
+            logger.warning(f"⚠️ Приёмник логов: не удалось записать {len(rows)} строк: {e}")
+            self._requeue(batch)
+            return 0
+        LOG_SINK_RECORDS.inc(len(rows), result="written")
+        if self.dropped:
+            logger.warning(f"⚠️ Приёмник логов: отброшено {self.dropped} записей при переполнении буфера")
+            self.dropped = 0
+        logger.debug(f"Приёмник логов: {len(rows)} строк за {time.monotonic() - t0:.3f} с")
+        return len(rows)
+
+    def _requeue(self, batch: "OrderedDict[tuple, _Entry]") -> None:
+        """Вернуть неудачный пакет в буфер (в пределах лимита), слив счётчики повторов."""
+        with self._pending_lock:
+            for key, entry in batch.items():
+                current = self._pending.get(key)
+                if current is not None:
+                    current.count += entry.count
+                    current.first_seen = entry.first_seen
+                elif len(self._pending) < LOG_SINK_MAX_PENDING:
+                    self._pending[key] = entry
+                else:
+                    self.dropped += entry.count
+                    LOG_SINK_RECORDS.inc(entry.count, result="dropped")
+
+
+log_sink = DbLogSink()
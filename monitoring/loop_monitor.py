@@ -0,0 +1,233 @@
+"""
+Детектор блокировок цикла событий: постоянный замер лага и стеки виновников.
+
+Heartbeat видит лаг раз в HEARTBEAT_INTERVAL и не знает, кто его вызвал; профайлер
+(/profile) надо запускать вручную в нужный момент. Этот монитор работает всё время:
+
+  - проба внутри цикла спит LOOP_MONITOR_INTERVAL и меряет, насколько позже проснулась —
+    распределение лага в terion_loop_lag_seconds;
+  - поток-сторож следит за отметкой пробы: если цикл не отвечает дольше
+    LOOP_BLOCK_THRESHOLD, снимает стек главного потока (sys._current_frames) — это и
+    есть синхронный вызов, который держит цикл (Pillow, чтение файлов, json.dump…);
+  - когда цикл оживает, блокировка засчитывается месту в коде проекта (самый глубокий
+    кадр не из библиотек): число, худшая и суммарная длительность, последний стек.
+
+Новое место или заметно худшая блокировка — предупреждение в лог сразу, сводка — раз в
+LOOP_REPORT_INTERVAL; в админке — /loop и кнопка «Блокировки цикла».
+Метрики: terion_loop_lag_seconds, terion_loop_blocks_total.
+"""
+import asyncio
+import html
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from monitoring.metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "1") != "0"
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.05"))
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD", "0.1"))
+LOOP_REPORT_INTERVAL = float(os.getenv("LOOP_REPORT_INTERVAL", "900"))
+LOOP_MAX_OFFENDERS = int(os.getenv("LOOP_MAX_OFFENDERS", "200"))
+STACK_DEPTH = 12
+TOP_N = 10
+
+LOOP_LAG_SECONDS = histogram(
+    "terion_loop_lag_seconds", "Опоздание пробы цикла событий (непрерывный замер)",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+LOOP_BLOCKS = counter("terion_loop_blocks_total", "Блокировки цикла событий дольше LOOP_BLOCK_THRESHOLD")
+
+_OWN_FILE = os.path.abspath(__file__)
+
+
+def _location(frame) -> Tuple[str, bool]:
+    """('функция (файл:строка)', проектный ли файл)."""
+    filename = frame.f_code.co_filename
+    cwd = os.getcwd()
+    own = filename.startswith(cwd) and "site-packages" not in filename
+    if own:
+        filename = os.path.relpath(filename, cwd)
+    elif "site-packages" in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[-1]
+    else:
+        filename = os.path.basename(filename)
+    return f"{frame.f_code.co_name} ({filename}:{frame.f_lineno})", own
+
+
+def _capture(frame) -> Tuple[str, List[str]]:
+    """Место блокировки (самый глубокий кадр проекта) и стек снаружи внутрь."""
+    stack: List[str] = []
+    site = None
+    while frame is not None:
+        if os.path.abspath(frame.f_code.co_filename) != _OWN_FILE:
+            label, own = _location(frame)
+            stack.append(label)
+            if own and site is None:
+                site = label
+        frame = frame.f_back
+    stack.reverse()
+    return site or (stack[-1] if stack else "?"), stack[-STACK_DEPTH:]
+
+
+class Offender:
+    __slots__ = ("site", "count", "worst", "total", "last_at", "stack")
+
+    def __init__(self, site: str):
+        self.site = site
+        self.count = 0
+        self.worst = 0.0
+        self.total = 0.0
+        self.last_at = 0.0
+        self.stack: List[str] = []
+
+
+class LoopMonitor:
+    """Проба в цикле + поток-сторож; копит места блокировок процесса."""
+
+    def __init__(self, threshold: float = LOOP_BLOCK_THRESHOLD, interval: float = LOOP_MONITOR_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.offenders: Dict[str, Offender] = {}
+        self.blocks = 0
+        self.blocked_seconds = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.started_at: Optional[datetime] = None
+        self._beat = time.monotonic()
+        self._pending: Optional[Tuple[float, str, List[str]]] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._reported_blocks = 0
+
+    async def start(self) -> None:
+        if not LOOP_MONITOR_ENABLED or self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self.started_at = datetime.now()
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="loop_monitor", daemon=True)
+        self._watcher.start()
+        self._task = asyncio.create_task(self._probe(), name="loop_monitor")
+        logger.info(f"🐢 Монитор цикла событий: порог блокировки {self.threshold * 1000:.0f} мс")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await asyncio.to_thread(self._watcher.join, 1)
+        self._watcher = None
+
+    # ── Замер ──────────────────────────────────────────────────────────────────
+
+    async def _probe(self) -> None:
+        loop = asyncio.get_running_loop()
+        last_report = loop.time()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            previous_beat, self._beat = self._beat, time.monotonic()
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG_SECONDS.observe(lag)
+            if lag >= self.threshold:
+                pending, self._pending = self._pending, None
+                # Стек засчитываем, только если сторож снял его во время именно этой блокировки
+                if pending is not None and pending[0] == previous_beat:
+                    self._record(lag, pending[1], pending[2])
+                else:
+                    self._record(lag, "? (стек не снят)", [])
+            if loop.time() - last_report >= LOOP_REPORT_INTERVAL:
+                last_report = loop.time()
+                self._log_summary()
+
+    def _watch(self) -> None:
+        check = max(0.01, self.threshold / 2)
+        while not self._stop.wait(check):
+            beat = self._beat
+            if time.monotonic() - beat < self.interval + self.threshold:
+                continue
+            if self._pending is not None and self._pending[0] == beat:
+                continue  # эту блокировку уже сняли
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                site, stack = _capture(frame)
+                self._pending = (beat, site, stack)
+
+    def _record(self, lag: float, site: str, stack: List[str]) -> None:
+        self.blocks += 1
+        self.blocked_seconds += lag
+        LOOP_BLOCKS.inc()
+        offender = self.offenders.get(site)
+        if offender is None:
+            if len(self.offenders) >= LOOP_MAX_OFFENDERS:
+                # Вытесняем самое безобидное место, чтобы не расти бесконечно
+                del self.offenders[min(self.offenders.values(), key=lambda o: o.total).site]
+            offender = self.offenders[site] = Offender(site)
+        # В лог — новое место или заметно худшая блокировка; остальное попадёт в сводку
+        notable = offender.count == 0 or lag > offender.worst * 1.5
+        offender.count += 1
+        offender.total += lag
+        offender.worst = max(offender.worst, lag)
+        offender.last_at = time.time()
+        if stack:
+            offender.stack = stack
+        if notable:
+            tail = " ← ".join(reversed(stack[-4:])) if stack else site
+            logger.warning(f"🐢 Цикл событий заблокирован на {lag * 1000:.0f} мс: {tail}")
+
+    # ── Отчёты ─────────────────────────────────────────────────────────────────
+
+    def top(self, n: int = TOP_N) -> List[Offender]:
+        return sorted(self.offenders.values(), key=lambda o: o.total, reverse=True)[:n]
+
+    def _log_summary(self) -> None:
+        if self.blocks == self._reported_blocks:
+            return
+        fresh = self.blocks - self._reported_blocks
+        self._reported_blocks = self.blocks
+        top = "; ".join(f"{o.site} {o.count}× до {o.worst * 1000:.0f} мс" for o in self.top(3))
+        logger.info(f"🐢 Блокировок цикла за {LOOP_REPORT_INTERVAL / 60:.0f} мин: {fresh}. Худшие места: {top}")
+
+    def format_report(self) -> str:
+        """HTML для админки: лаг, топ мест по суммарному времени блокировки, стек главного виновника."""
+        if self._task is None:
+            return "🐢 <b>Цикл событий</b>\n\nМонитор выключен (LOOP_MONITOR_ENABLED=0) или ещё не запущен."
+        lines = [
+            f"🐢 <b>Цикл событий</b> (PID {os.getpid()}, с {self.started_at:%d.%m %H:%M})",
+            f"Лаг: сейчас {self.last_lag * 1000:.0f} мс, максимум {self.max_lag * 1000:.0f} мс",
+            f"Блокировок ≥ {self.threshold * 1000:.0f} мс: {self.blocks}, всего {self.blocked_seconds:.1f} с",
+        ]
+        top = self.top()
+        if not top:
+            lines.append("\nБлокировок не было ✅")
+            return "\n".join(lines)
+        lines.append("\n<b>Места (по суммарному времени):</b>")
+        for i, o in enumerate(top, 1):
+            lines.append(
+                f"{i}. <code>{html.escape(o.site)}</code> — {o.count}×, худшая {o.worst * 1000:.0f} мс, "
+                f"всего {o.total:.1f} с"
+            )
+        if top[0].stack:
+            stack = "\n".join(html.escape(frame) for frame in top[0].stack)
+            lines.append(f"\n<b>Стек №1:</b>\n<pre>{stack}</pre>")
+        return "\n".join(lines)
+
+
+loop_monitor = LoopMonitor()
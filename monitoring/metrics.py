@@ -0,0 +1,361 @@
+"""
+Метрики в формате Prometheus: счётчики, gauge и гистограммы задержек.
+
+Без внешних зависимостей (prometheus_client в проекте нет): запись — это поиск
+в dict + bisect по границам корзин, текст экспозиции собирается только при scrape.
+Эндпоинт /metrics поднимается из main.py на METRICS_HOST:METRICS_PORT
+(по умолчанию 127.0.0.1:9108), отключается METRICS_ENABLED=0.
+
+p50/p99 по стадиям и провайдерам считаются на стороне Prometheus:
+  histogram_quantile(0.99, sum by (le, stage) (rate(terion_stage_seconds_bucket[5m])))
+"""
+import asyncio
+import bisect
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# 5 мс … 2 мин: покрывает и SQLite, и LLM, и генерацию картинок
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self) -> str:
+        return f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n" + self._render_samples()
+
+    def _render_samples(self) -> str:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _render_samples(self) -> str:
+        return "".join(
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}\n"
+            for key, value in sorted(self._values.items())
+        )
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def items(self) -> Dict[Tuple, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def _render_samples(self) -> str:
+        return "".join(
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}\n"
+            for key, value in sorted(self._values.items())
+        )
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [counts per bucket..., +Inf count], sum
+        self._counts: Dict[Tuple, list] = {}
+        self._sums: Dict[Tuple, float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def snapshot(self) -> Dict[Tuple, Tuple[int, float]]:
+        """labels -> (count, sum): для бенчмарков и отчётов без scrape."""
+        with self._lock:
+            return {key: (sum(counts), self._sums[key]) for key, counts in self._counts.items()}
+
+    def time(self, **labels) -> "_Timer":
+        return _Timer(self, labels)
+
+    def _render_samples(self) -> str:
+        out = []
+        for key in sorted(self._counts):
+            counts = self._counts[key]
+            cumulative = 0
+            labels = _format_labels(self.labelnames, key)
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                out.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}\n")
+            cumulative += counts[-1]
+            le = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}\n")
+            out.append(f"{self.name}_sum{labels} {self._sums[key]}\n")
+            out.append(f"{self.name}_count{labels} {cumulative}\n")
+        return "".join(out)
+
+
+class _Timer:
+    """Контекстный менеджер (sync и async) для Histogram.time(); исключения считаются в ERRORS_TOTAL."""
+
+    def __init__(self, histogram: Histogram, labels: Dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self._t0, **self.labels)
+        if exc_type is not None and exc_type is not asyncio.CancelledError:
+            ERRORS_TOTAL.inc(component=self.histogram.name, name=next(iter(self.labels.values()), ""))
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        # Колбэки, обновляющие gauge непосредственно перед scrape (глубина очередей и т.п.)
+        self._collectors: list = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, callback) -> None:
+        if callback not in self._collectors:
+            self._collectors.append(callback)
+
+    def collect(self) -> None:
+        """Обновить gauge из коллекторов (перед scrape или heartbeat)."""
+        for callback in self._collectors:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"Метрики: ошибка коллектора {callback}: {e}")
+
+    def render(self) -> str:
+        self.collect()
+        return "".join(m.render() for m in self._metrics.values())
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+    return registry.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# ── Метрики проекта ───────────────────────────────────────────────────────────
+
+STAGE_SECONDS = histogram(
+    "terion_stage_seconds", "Время стадий пайплайна лидов (scan_fetch, filter, analyze_post, analyze_intent)",
+    ("stage", "source"),
+)
+STAGE_ITEMS = counter(
+    "terion_stage_items_total", "Сообщения, прошедшие через стадию, по итогу (pass/drop)",
+    ("stage", "source", "result"),
+)
+LLM_SECONDS = histogram(
+    "terion_llm_seconds", "Задержка запросов к LLM-провайдерам", ("provider", "operation"),
+)
+DB_SECONDS = histogram(
+    "terion_db_seconds", "Время методов Database", ("method",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+PUBLISHER_SECONDS = histogram("terion_publisher_seconds", "Время вызовов Publisher", ("method",))
+IMAGE_SECONDS = histogram("terion_image_seconds", "Время генерации изображений", ("provider", "method"))
+ERRORS_TOTAL = counter("terion_errors_total", "Исключения в инструментированных вызовах", ("component", "name"))
+LEADS_TOTAL = counter("terion_leads_total", "Сохранённые лиды", ("source",))
+QUEUE_DEPTH = gauge("terion_queue_depth", "Глубина внутренних очередей", ("queue",))
+PROCESS_START_TIME = gauge("terion_process_start_time_seconds", "Время старта процесса (unix)")
+PROCESS_START_TIME.set(time.time())
+
+
+# ── Декораторы ────────────────────────────────────────────────────────────────
+
+def timed(metric: Histogram, **labels):
+    """Декоратор для sync/async функций и async-генераторов (время до исчерпания): время вызова в metric с labels."""
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def agen_wrapper(*args, **kwargs):
+                with metric.time(**labels):
+                    async for item in func(*args, **kwargs):
+                        yield item
+            return agen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with metric.time(**labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metric.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def counted(metric: Counter, **labels):
+    """Декоратор для фильтров: result=pass, если функция вернула истину, иначе drop."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                result = await func(*args, **kwargs)
+                metric.inc(result="pass" if result else "drop", **labels)
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            result = func(*args, **kwargs)
+            metric.inc(result="pass" if result else "drop", **labels)
+            return result
+        return wrapper
+    return decorator
+
+
+def instrument_methods(metric: Histogram, label: str = "method", include_private: bool = False, **static_labels):
+    """
+    Декоратор класса: все публичные async-методы пишут время в metric с {label}=имя метода
+    (+ static_labels, например provider="yandexgpt").
+    Используется для Database, Publisher, LLM-клиентов и генераторов изображений.
+    """
+    def decorator(cls):
+        for attr, func in list(vars(cls).items()):
+            if not inspect.iscoroutinefunction(func):
+                continue
+            if attr.startswith("__") or (attr.startswith("_") and not include_private):
+                continue
+            setattr(cls, attr, timed(metric, **{label: attr}, **static_labels)(func))
+        return cls
+    return decorator
+
+
+# ── HTTP-эндпоинт ─────────────────────────────────────────────────────────────
+
+_runner = None
+
+
+async def start_metrics_server(host: str = None, port: int = None) -> bool:
+    """Поднять /metrics (aiohttp.web). Повторный вызов ничего не делает."""
+    global _runner
+    if not METRICS_ENABLED or _runner is not None:
+        return False
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(body=registry.render().encode("utf-8"),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    host = host or METRICS_HOST
+    port = port or METRICS_PORT
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        logger.warning(f"⚠️ Метрики: не удалось занять {host}:{port}: {e}")
+        await runner.cleanup()
+        return False
+    _runner = runner
+    logger.info(f"📈 Метрики Prometheus: http://{host}:{port}/metrics")
+    return True
+
+
+async def stop_metrics_server() -> None:
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,281 @@
+"""
+Сэмплирующий профайлер «по запросу» внутри работающего процесса.
+
+Запуск — из админки (/profile [секунды]) или автоматически, когда hunt выходит
+за бюджет времени (см. services/job_coordinator.py). Перезапускать бота под
+py-spy/cProfile не нужно.
+
+Что снимаем:
+  - потоки: отдельный поток-сэмплер раз в PROFILE_INTERVAL_MS читает
+    sys._current_frames() — видно, где реально тратится CPU (и блокирующие
+    вызовы в цикле событий);
+  - задачи asyncio: раз в PROFILE_TASK_INTERVAL_MS внутри цикла обходим цепочку
+    cr_await каждой задачи — видно, чего ждут корутины (сеть, LLM, БД).
+
+Результат: файл collapsed stacks (формат flamegraph.pl / speedscope / inferno)
+в PROFILE_DIR и сводка топ-функций в топик «Логи» (THREAD_ID_LOGS).
+
+Ограничители: одновременно только один профиль, длительность не больше
+PROFILE_MAX_SECONDS, авто-запуск не чаще PROFILE_AUTO_COOLDOWN секунд.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("logs", "profiles"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_TASK_INTERVAL_MS = float(os.getenv("PROFILE_TASK_INTERVAL_MS", "100"))
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "300"))
+PROFILE_DEFAULT_SECONDS = int(os.getenv("PROFILE_DEFAULT_SECONDS", "30"))
+PROFILE_AUTO_ENABLED = os.getenv("PROFILE_AUTO_ENABLED", "1") == "1"
+PROFILE_AUTO_SECONDS = int(os.getenv("PROFILE_AUTO_SECONDS", "60"))
+PROFILE_AUTO_COOLDOWN = int(os.getenv("PROFILE_AUTO_COOLDOWN", "3600"))
+MAX_STACK_DEPTH = 64
+TOP_N = 15
+
+# Фоновые профили: ссылка держит задачу, иначе цикл может собрать её сборщиком мусора посреди замера
+_tasks: Set[asyncio.Task] = set()
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    # Сокращаем пути: проектные файлы — относительно cwd, библиотеки — по имени пакета
+    cwd = os.getcwd()
+    if filename.startswith(cwd):
+        filename = os.path.relpath(filename, cwd)
+    elif "site-packages" in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[-1]
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def _thread_stack(frame) -> List[str]:
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        stack.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _task_stack(task: asyncio.Task) -> List[str]:
+    """Цепочка await от корутины задачи вглубь (внешняя → внутренняя)."""
+    stack = []
+    coro = task.get_coro()
+    while coro is not None and len(stack) < MAX_STACK_DEPTH:
+        code = getattr(coro, "cr_code", None) or getattr(coro, "gi_code", None)
+        if code is None:
+            # Future / нативный awaitable — на нём цепочка заканчивается
+            stack.append(f"<{type(coro).__name__}>")
+            break
+        stack.append(_frame_label(code))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return stack
+
+
+class ProfileResult:
+    """Собранные сэмплы: collapsed stacks + счётчики self/total по функциям."""
+
+    def __init__(self, reason: str, seconds: float):
+        self.reason = reason
+        self.seconds = seconds
+        self.started_at = datetime.now()
+        self.stacks: Counter = Counter()
+        self.thread_samples = 0
+        self.task_samples = 0
+
+    def add(self, prefix: str, stack: List[str]) -> None:
+        if stack:
+            self.stacks[";".join([prefix] + stack)] += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def top_functions(self, kind: str, n: int = TOP_N) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+        """(топ по self, топ по total) для сэмплов вида kind ('thread' или 'task')."""
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in self.stacks.items():
+            parts = stack.split(";")
+            if not parts[0].startswith(kind):
+                continue
+            frames = parts[1:]
+            if not frames:
+                continue
+            self_counts[frames[-1]] += count
+            for frame in set(frames):
+                total_counts[frame] += count
+        return self_counts.most_common(n), total_counts.most_common(n)
+
+    def summary(self) -> str:
+        lines = [
+            f"🔬 <b>Профиль: {self.reason}</b>",
+            f"{self.started_at:%d.%m %H:%M:%S}, {self.seconds:.0f} с, "
+            f"сэмплов потоков {self.thread_samples}, задач {self.task_samples}",
+        ]
+        for kind, title, total in (
+            ("thread", "CPU (потоки)", self.thread_samples),
+            ("task", "Ожидание (задачи asyncio)", self.task_samples),
+        ):
+            self_top, total_top = self.top_functions(kind, n=8)
+            if not self_top:
+                continue
+            lines.append("")
+            lines.append(f"<b>{title} — self:</b>")
+            for name, count in self_top:
+                lines.append(f"• {count * 100 / max(total, 1):.1f}% {_html(name)}")
+            lines.append(f"<b>{title} — total:</b>")
+            for name, count in total_top:
+                lines.append(f"• {count * 100 / max(total, 1):.1f}% {_html(name)}")
+        return "\n".join(lines)
+
+
+def _html(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+class SamplingProfiler:
+    """Один активный профиль за раз; сэмплер потоков + сэмплер задач цикла."""
+
+    def __init__(self):
+        self._active: Optional[ProfileResult] = None
+        self._last_auto = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._active is not None
+
+    def _claim(self, seconds: float, reason: str) -> Optional[ProfileResult]:
+        """Занять профайлер синхронно, до первого await: два запуска подряд не пройдут оба."""
+        if self._active is not None:
+            return None
+        self._active = ProfileResult(reason, max(1.0, min(float(seconds), PROFILE_MAX_SECONDS)))
+        return self._active
+
+    def _release(self, result: ProfileResult) -> None:
+        if self._active is result:
+            self._active = None
+
+    def start(self, seconds: float, reason: str = "manual") -> bool:
+        """Запустить profile_and_report в фоне. False — уже идёт другой профиль."""
+        result = self._claim(seconds, reason)
+        if result is None:
+            return False
+        task = asyncio.create_task(self.profile_and_report(seconds, reason, claimed=result), name="profiler")
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+        # Задачу отменили до старта замера — профайлер не должен остаться занятым
+        task.add_done_callback(lambda _: self._release(result))
+        return True
+
+    async def profile(self, seconds: float, reason: str = "manual",
+                      claimed: Optional[ProfileResult] = None) -> Optional[ProfileResult]:
+        """Снять профиль за seconds секунд. None — если уже идёт другой профиль."""
+        result = claimed or self._claim(seconds, reason)
+        if result is None:
+            return None
+        seconds = result.seconds
+        stop = threading.Event()
+        sampler = threading.Thread(
+            target=self._sample_threads, args=(result, stop), name="profiler_sampler", daemon=True
+        )
+        logger.info(f"🔬 Профайлер: старт на {seconds:.0f} с ({reason})")
+        sampler.start()
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + seconds
+            current = asyncio.current_task()
+            while loop.time() < deadline:
+                for task in asyncio.all_tasks(loop):
+                    if task is current or task.done():
+                        continue
+                    result.add(f"task:{task.get_name()}", _task_stack(task))
+                result.task_samples += 1
+                await asyncio.sleep(PROFILE_TASK_INTERVAL_MS / 1000)
+        finally:
+            stop.set()
+            await asyncio.to_thread(sampler.join, 5)
+            self._release(result)
+        logger.info(f"🔬 Профайлер: готово, {len(result.stacks)} уникальных стеков")
+        return result
+
+    def _sample_threads(self, result: ProfileResult, stop: threading.Event) -> None:
+        interval = PROFILE_INTERVAL_MS / 1000
+        own_id = threading.get_ident()
+        names = {}
+        while not stop.wait(interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                result.add(f"thread:{names.get(thread_id, thread_id)}", _thread_stack(frame))
+            result.thread_samples += 1
+
+    def save(self, result: ProfileResult) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"profile_{result.started_at:%Y%m%d_%H%M%S}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(result.collapsed())
+        return path
+
+    async def profile_and_report(self, seconds: float, reason: str = "manual",
+                                 claimed: Optional[ProfileResult] = None) -> Optional[str]:
+        """Профиль → файл в PROFILE_DIR → сводка и файл в топик «Логи». Возвращает путь к файлу."""
+        result = await self.profile(seconds, reason, claimed)
+        if result is None:
+            logger.info("🔬 Профайлер уже запущен — новый профиль не стартует")
+            return None
+        path = await asyncio.to_thread(self.save, result)
+        await self._send_report(result, path)
+        return path
+
+    def auto_trigger(self, reason: str) -> bool:
+        """Авто-запуск (медленный hunt): с кулдауном и только если профайлер свободен."""
+        if not PROFILE_AUTO_ENABLED or self._active is not None:
+            return False
+        now = time.monotonic()
+        if self._last_auto and now - self._last_auto < PROFILE_AUTO_COOLDOWN:
+            return False
+        self._last_auto = now
+        return self.start(PROFILE_AUTO_SECONDS, reason)
+
+    async def _send_report(self, result: ProfileResult, path: str) -> None:
+        try:
+            from aiogram.types import BufferedInputFile
+            from config import LEADS_GROUP_CHAT_ID, THREAD_ID_LOGS
+            from utils.bot_config import get_main_bot
+        except Exception as e:
+            logger.warning(f"⚠️ Профайлер: отчёт не отправлен ({e}), файл: {path}")
+            return
+        bot = get_main_bot()
+        if bot is None or not LEADS_GROUP_CHAT_ID:
+            logger.info(f"🔬 Профайлер: бот недоступен, профиль сохранён в {path}")
+            return
+        summary = result.summary()
+        if len(summary) > 4000:
+            summary = summary[:4000] + "…"
+        try:
+            await bot.send_message(LEADS_GROUP_CHAT_ID, summary, parse_mode="HTML", message_thread_id=THREAD_ID_LOGS)
+            with open(path, "rb") as f:
+                data = f.read()
+            await bot.send_document(
+                LEADS_GROUP_CHAT_ID,
+                BufferedInputFile(data, filename=os.path.basename(path)),
+                caption="🔥 Collapsed stacks: flamegraph.pl / speedscope.app",
+                message_thread_id=THREAD_ID_LOGS,
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Профайлер: не удалось отправить отчёт в группу: {e}")
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,153 @@
+"""
+Таймлайн запуска процесса: от старта интерпретатора до первого апдейта.
+
+main.py отмечает этапы (startup.mark), фоновые задачи прогрева идут через
+startup.background(), первый апдейт ловит FirstUpdateMiddleware. Итог —
+строка в логе и, если задан STARTUP_REPORT_FILE, JSON для scripts/bench_startup.py.
+
+Режим запуска: STARTUP_MODE=fast (по умолчанию) — polling стартует сразу,
+индексация базы знаний, проверка связей, тяжёлые импорты и планировщик — в фоне;
+STARTUP_MODE=eager — всё как раньше, последовательно до polling.
+"""
+import asyncio
+import importlib
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STARTUP_MODE = os.getenv("STARTUP_MODE", "fast").lower()
+STARTUP_REPORT_FILE = os.getenv("STARTUP_REPORT_FILE", "")
+
+
+def _process_start() -> float:
+    """Время старта процесса (monotonic), чтобы учесть импорты до main()."""
+    try:
+        with open(f"/proc/{os.getpid()}/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        started_ago = uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+        return time.monotonic() - max(0.0, started_ago)
+    except (OSError, ValueError, IndexError):
+        return time.monotonic()
+
+
+class StartupTimeline:
+    """Отметки этапов запуска (секунды от старта процесса) и фоновые задачи прогрева."""
+
+    def __init__(self):
+        self.t0 = _process_start()
+        self.marks: Dict[str, float] = {}
+        self.background_seconds: Dict[str, float] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._report_task: Optional[asyncio.Task] = None
+
+    @property
+    def fast(self) -> bool:
+        return STARTUP_MODE != "eager"
+
+    def mark(self, name: str) -> float:
+        elapsed = time.monotonic() - self.t0
+        self.marks.setdefault(name, round(elapsed, 3))
+        logger.debug(f"⏱️ Старт: {name} через {elapsed:.2f} с")
+        return elapsed
+
+    async def run(self, name: str, coro: Awaitable[Any]) -> Any:
+        """Выполнить этап прогрева с замером; ошибка логируется, но не роняет запуск."""
+        t = time.monotonic()
+        try:
+            return await coro
+        except Exception as e:
+            logger.error(f"❌ Прогрев «{name}»: {e}", exc_info=True)
+            return None
+        finally:
+            self.background_seconds[name] = round(time.monotonic() - t, 3)
+
+    async def preload(self, modules: List[str]) -> None:
+        """
+        Импортировать тяжёлые модули в потоке: цикл событий (и polling) продолжает
+        обслуживать апдейты, пока грузятся Telethon, Pillow, агенты и т.п.
+        """
+        for module in modules:
+            t = time.monotonic()
+            try:
+                await asyncio.to_thread(importlib.import_module, module)
+            except Exception as e:
+                logger.warning(f"⚠️ Предзагрузка {module}: {e}")
+            self.background_seconds[f"import:{module}"] = round(time.monotonic() - t, 3)
+
+    def background(self, name: str, coro: Awaitable[Any]) -> asyncio.Task:
+        """Запустить этап прогрева в фоне (fast) — polling его не ждёт."""
+        task = asyncio.create_task(self.run(name, coro), name=f"warmup_{name}")
+        self._tasks.append(task)
+        return task
+
+    async def wait_background(self, timeout: Optional[float] = None) -> None:
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        elapsed = self.mark("warmup_done")
+        steps = ", ".join(f"{name} {seconds:.1f} с" for name, seconds in self.background_seconds.items())
+        logger.info(f"⏱️ Прогрев завершён через {elapsed:.2f} с после старта: {steps}")
+        self.report()
+
+    def report_in_background(self) -> asyncio.Task:
+        """Итог прогрева (fast) — когда фоновые этапы закончатся; задача хранится до stop()."""
+        if self._report_task is None:
+            self._report_task = asyncio.create_task(self.wait_background(), name="warmup_report")
+        return self._report_task
+
+    async def stop(self) -> None:
+        """Остановка процесса: отменить незаконченный прогрев и ожидание его итога."""
+        tasks = [task for task in (*self._tasks, self._report_task) if task is not None and not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def first_update(self) -> None:
+        if "first_update" in self.marks:
+            return
+        elapsed = self.mark("first_update")
+        logger.info(f"⏱️ Первый апдейт через {elapsed:.2f} с после старта процесса ({STARTUP_MODE})")
+        self.report()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "mode": STARTUP_MODE,
+            "pid": os.getpid(),
+            "marks": dict(self.marks),
+            "background": dict(self.background_seconds),
+        }
+
+    def report(self) -> None:
+        if not STARTUP_REPORT_FILE:
+            return
+        try:
+            tmp = f"{STARTUP_REPORT_FILE}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.as_dict(), f, ensure_ascii=False)
+            os.replace(tmp, STARTUP_REPORT_FILE)
+        except OSError as e:
+            logger.debug(f"Старт: не удалось записать отчёт: {e}")
+
+
+class FirstUpdateMiddleware:
+    """Outer-middleware на dp.update: отмечает первый полученный апдейт и дальше не мешает."""
+
+    def __init__(self, timeline: "StartupTimeline"):
+        self.timeline = timeline
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        self.timeline.first_update()
+        return await handler(event, data)
+
+
+startup = StartupTimeline()
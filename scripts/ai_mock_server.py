@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Локальный мок ИИ-сервисов: YandexGPT, Router AI (чат и картинки), Yandex Art, SpeechKit STT.
+
+Говорит теми же HTTP-контрактами, что и облако, поэтому клиенты проекта работают
+без изменений — достаточно переопределить хосты (см. .env.example):
+  YANDEX_LLM_URL=http://127.0.0.1:8085        # completion, imageGenerationAsync, operations
+  YANDEX_STT_URL=http://127.0.0.1:8085        # speech/v1/stt:recognize
+  ROUTER_AI_ENDPOINT=http://127.0.0.1:8085/api/v1/chat/completions
+  ROUTER_AI_IMAGE_ENDPOINT=http://127.0.0.1:8085/api/v1/images/generations
+  ROUTER_AI_IMAGE_BASE_URL=http://127.0.0.1:8085/api/v1
+  YANDEX_ART_POLL_INTERVAL=0.2
+
+Возможности:
+  - задержки по сервисам: --latency yandexgpt=lognormal:0.8,0.4 (распределения как в bench_replay.py);
+  - лимиты: --rate-limit routerai=5/s → 429 + Retry-After при превышении (token bucket);
+  - ошибки: --error-rate 0.05 (случайные 500/503), --error-rate yandexgpt=0.2;
+  - Yandex Art: операция «готова» через --art-delay секунд, GET /operations/{id} до этого done=false;
+  - стриминг: completionOptions.stream (YandexGPT, NDJSON) и "stream": true (Router AI, SSE);
+  - сценарии: --script rules.json — список правил
+      {"service": "yandexgpt", "match": "регулярка по промпту", "response": "текст",
+       "status": 429, "latency": "fixed:3", "times": 2}
+    правило срабатывает для первых times совпадающих запросов (без times — всегда);
+  - /_mock/stats — счётчики запросов, 429 и ошибок; POST /_mock/reset — сброс.
+
+Запуск: python scripts/ai_mock_server.py --port 8085 --seed 1
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import random
+import re
+import struct
+import time
+import uuid
+import zlib
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from bench_replay import Latency
+
+logger = logging.getLogger("ai_mock")
+
+SERVICES = ("yandexgpt", "routerai", "art", "stt")
+
+
+def _tiny_png(color=(30, 90, 160)) -> bytes:
+    """PNG 8×8 одного цвета — достаточно, чтобы клиенты декодировали «картинку»."""
+    width = height = 8
+    raw = b"".join(b"\x00" + bytes(color) * width for _ in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+
+PNG = _tiny_png()
+PNG_B64 = base64.b64encode(PNG).decode()
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """0 — разрешено, иначе через сколько секунд появится токен."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Rule:
+    def __init__(self, spec: dict, time_scale: float, seed: int):
+        self.service = spec.get("service", "*")
+        self.pattern = re.compile(spec["match"], re.I | re.S) if spec.get("match") else None
+        self.response = spec.get("response")
+        self.status = int(spec.get("status", 200))
+        self.latency = Latency(spec["latency"], time_scale, seed) if spec.get("latency") else None
+        self.remaining = spec.get("times")
+
+    def matches(self, service: str, prompt: str) -> bool:
+        if self.remaining is not None and self.remaining <= 0:
+            return False
+        if self.service not in ("*", service):
+            return False
+        return not self.pattern or bool(self.pattern.search(prompt))
+
+
+class MockState:
+    def __init__(self, args):
+        self.rng = random.Random(args.seed)
+        self.latency: Dict[str, Latency] = {
+            s: Latency(args.default_latency, args.time_scale, args.seed + i) for i, s in enumerate(SERVICES)
+        }
+        for item in args.latency:
+            service, _, spec = item.partition("=")
+            self.latency[service] = Latency(spec, args.time_scale, args.seed)
+        self.buckets: Dict[str, TokenBucket] = {}
+        for item in args.rate_limit:
+            service, _, spec = item.partition("=")
+            self.buckets[service] = TokenBucket(float(spec.rstrip("/s")))
+        self.error_rates: Dict[str, float] = {s: 0.0 for s in SERVICES}
+        for item in args.error_rate:
+            if "=" in item:
+                service, _, rate = item.partition("=")
+                self.error_rates[service] = float(rate)
+            else:
+                self.error_rates = {s: float(item) for s in SERVICES}
+        self.rules: List[Rule] = []
+        if args.script:
+            with open(args.script, encoding="utf-8") as f:
+                self.rules = [Rule(spec, args.time_scale, args.seed) for spec in json.load(f)]
+        self.art_delay = args.art_delay * args.time_scale
+        self.stream_chunks = args.stream_chunks
+        self.operations: Dict[str, float] = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.stats = {s: {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "scripted": 0} for s in SERVICES}
+
+    async def gate(self, service: str, prompt: str = ""):
+        """Общий вход: статистика, сценарий, лимит, задержка, ошибки. Возвращает (Rule|None, Response|None)."""
+        stats = self.stats[service]
+        stats["requests"] += 1
+        rule = next((r for r in self.rules if r.matches(service, prompt)), None)
+        if rule:
+            stats["scripted"] += 1
+            if rule.remaining is not None:
+                rule.remaining -= 1
+        bucket = self.buckets.get(service)
+        if bucket:
+            wait = bucket.take()
+            if wait:
+                stats["rate_limited"] += 1
+                return rule, web.json_response(
+                    {"error": {"code": 429, "message": "Too Many Requests (mock)"}},
+                    status=429, headers={"Retry-After": str(max(1, round(wait)))},
+                )
+        await (rule.latency if rule and rule.latency else self.latency[service]).wait()
+        if rule and rule.status != 200:
+            stats["errors"] += 1
+            return rule, web.json_response({"error": {"code": rule.status, "message": "scripted error (mock)"}},
+                                           status=rule.status)
+        if self.rng.random() < self.error_rates.get(service, 0.0):
+            stats["errors"] += 1
+            status = self.rng.choice((500, 503))
+            return rule, web.json_response({"error": {"code": status, "message": "injected error (mock)"}},
+                                           status=status)
+        stats["ok"] += 1
+        return rule, None
+
+
+def _default_text(prompt: str) -> str:
+    if "priority_score" in prompt:
+        return json.dumps({"priority_score": 5, "pain_stage": "ST-2", "justification": "mock", "is_lead": True})
+    if "is_lead" in prompt:
+        return json.dumps({"is_lead": True, "intent": "перепланировка", "hotness": 3, "context_summary": "mock",
+                           "recommendation": "", "pain_level": 3}, ensure_ascii=False)
+    return "Здравствуйте! Это ответ локального мока. Уточните, пожалуйста, тип дома и что планируете менять."
+
+
+def _split(text: str, parts: int) -> List[str]:
+    step = max(1, len(text) // max(parts, 1))
+    return [text[i:i + step] for i in range(0, len(text), step)] or [""]
+
+
+# ── YandexGPT ─────────────────────────────────────────────────────────────────
+
+async def yandex_completion(request: web.Request):
+    state: MockState = request.app["state"]
+    body = await request.json()
+    prompt = "\n".join(m.get("text", "") for m in body.get("messages", []))
+    rule, error = await state.gate("yandexgpt", prompt)
+    if error:
+        return error
+    text = rule.response if rule and rule.response is not None else _default_text(prompt)
+    usage = {"inputTextTokens": str(len(prompt) // 4), "completionTokens": str(len(text) // 4),
+             "totalTokens": str((len(prompt) + len(text)) // 4)}
+
+    def payload(partial: str, status: str) -> dict:
+        return {"result": {"alternatives": [{"message": {"role": "assistant", "text": partial}, "status": status}],
+                           "usage": usage, "modelVersion": "mock"}}
+
+    if not body.get("completionOptions", {}).get("stream"):
+        return web.json_response(payload(text, "ALTERNATIVE_STATUS_FINAL"))
+
+    # Стрим YandexGPT: NDJSON, каждый объект содержит накопленный текст
+    resp = web.StreamResponse(headers={"Content-Type": "application/json"})
+    await resp.prepare(request)
+    acc = ""
+    pieces = _split(text, state.stream_chunks)
+    for i, piece in enumerate(pieces):
+        acc += piece
+        status = "ALTERNATIVE_STATUS_FINAL" if i == len(pieces) - 1 else "ALTERNATIVE_STATUS_PARTIAL"
+        await resp.write((json.dumps(payload(acc, status), ensure_ascii=False) + "\n").encode())
+        await asyncio.sleep(0)
+    await resp.write_eof()
+    return resp
+
+
+# ── Yandex Art (асинхронная операция) ─────────────────────────────────────────
+
+async def art_generate(request: web.Request):
+    state: MockState = request.app["state"]
+    body = await request.json()
+    prompt = " ".join(m.get("text", "") for m in body.get("messages", []))
+    _, error = await state.gate("art", prompt)
+    if error:
+        return error
+    op_id = uuid.uuid4().hex
+    state.operations[op_id] = time.monotonic() + state.art_delay
+    return web.json_response({"id": op_id, "description": "Image generation (mock)", "done": False})
+
+
+async def get_operation(request: web.Request):
+    state: MockState = request.app["state"]
+    op_id = request.match_info["op_id"]
+    ready_at = state.operations.get(op_id)
+    if ready_at is None:
+        return web.json_response({"code": 5, "message": "Operation not found (mock)"}, status=404)
+    if time.monotonic() < ready_at:
+        return web.json_response({"id": op_id, "done": False})
+    state.operations.pop(op_id, None)
+    return web.json_response({"id": op_id, "done": True, "response": {"image": PNG_B64, "modelVersion": "mock"}})
+
+
+# ── Router AI (OpenAI-совместимый) ────────────────────────────────────────────
+
+async def router_chat(request: web.Request):
+    state: MockState = request.app["state"]
+    body = await request.json()
+    prompt = "\n".join(
+        m["content"] if isinstance(m.get("content"), str) else json.dumps(m.get("content"), ensure_ascii=False)
+        for m in body.get("messages", [])
+    )
+    rule, error = await state.gate("routerai", prompt)
+    if error:
+        return error
+    text = rule.response if rule and rule.response is not None else _default_text(prompt)
+    model = body.get("model", "mock")
+    chat_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+    if not body.get("stream"):
+        return web.json_response({
+            "id": chat_id, "object": "chat.completion", "model": model, "created": int(time.time()),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4,
+                      "total_tokens": (len(prompt) + len(text)) // 4},
+        })
+
+    # SSE-стрим в формате OpenAI: data: {...delta...}\n\n ... data: [DONE]
+    resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await resp.prepare(request)
+    for piece in _split(text, state.stream_chunks):
+        chunk = {"id": chat_id, "object": "chat.completion.chunk", "model": model,
+                 "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+        await resp.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+        await asyncio.sleep(0)
+    done = {"id": chat_id, "object": "chat.completion.chunk", "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+    await resp.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode())
+    await resp.write_eof()
+    return resp
+
+
+async def router_images(request: web.Request):
+    state: MockState = request.app["state"]
+    body = await request.json()
+    _, error = await state.gate("routerai", body.get("prompt", ""))
+    if error:
+        return error
+    file_url = f"{request.scheme}://{request.host}/_mock/files/image.png"
+    return web.json_response({"created": int(time.time()), "data": [{"b64_json": PNG_B64, "url": file_url}]})
+
+
+async def mock_file(request: web.Request):
+    return web.Response(body=PNG, content_type="image/png")
+
+
+# ── SpeechKit STT ─────────────────────────────────────────────────────────────
+
+async def stt_recognize(request: web.Request):
+    state: MockState = request.app["state"]
+    audio = await request.read()
+    rule, error = await state.gate("stt", request.query.get("lang", ""))
+    if error:
+        return error
+    text = rule.response if rule and rule.response is not None else f"тестовая расшифровка {len(audio)} байт"
+    return web.json_response({"result": text})
+
+
+# ── Служебное ─────────────────────────────────────────────────────────────────
+
+async def mock_stats(request: web.Request):
+    state: MockState = request.app["state"]
+    return web.json_response({"services": state.stats, "pending_operations": len(state.operations)})
+
+
+async def mock_reset(request: web.Request):
+    request.app["state"].reset_stats()
+    return web.json_response({"ok": True})
+
+
+def build_app(args) -> web.Application:
+    app = web.Application(client_max_size=32 * 1024 * 1024)
+    app["state"] = MockState(args)
+    app.router.add_post("/foundationModels/v1/completion", yandex_completion)
+    app.router.add_post("/foundationModels/v1/imageGenerationAsync", art_generate)
+    app.router.add_get("/operations/{op_id}", get_operation)
+    for prefix in ("/api/v1", "/v1", "/api"):
+        app.router.add_post(f"{prefix}/chat/completions", router_chat)
+        app.router.add_post(f"{prefix}/images/generations", router_images)
+    app.router.add_post("/speech/v1/stt:recognize", stt_recognize)
+    app.router.add_get("/_mock/files/image.png", mock_file)
+    app.router.add_get("/_mock/stats", mock_stats)
+    app.router.add_post("/_mock/reset", mock_reset)
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный мок YandexGPT / Router AI / Yandex Art / SpeechKit")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8085)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--default-latency", default="lognormal:0.6,0.4")
+    parser.add_argument("--latency", action="append", default=[], help="service=spec, напр. yandexgpt=fixed:0.5")
+    parser.add_argument("--rate-limit", action="append", default=[], help="service=N/s")
+    parser.add_argument("--error-rate", action="append", default=[], help="0.05 или service=0.05")
+    parser.add_argument("--art-delay", type=float, default=6.0, help="секунд до готовности операции Yandex Art")
+    parser.add_argument("--stream-chunks", type=int, default=8)
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    parser.add_argument("--script", default="", help="JSON со сценарием ответов")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    base = f"http://{args.host}:{args.port}"
+    logger.info(f"🧪 AI mock: {base}")
+    logger.info(
+        "Переменные для клиентов:\n"
+        f"  YANDEX_LLM_URL={base}\n  YANDEX_STT_URL={base}\n"
+        f"  ROUTER_AI_ENDPOINT={base}/api/v1/chat/completions\n"
+        f"  ROUTER_AI_IMAGE_ENDPOINT={base}/api/v1/images/generations\n"
+        f"  ROUTER_AI_IMAGE_BASE_URL={base}/api/v1\n  YANDEX_ART_POLL_INTERVAL=0.2"
+    )
+    web.run_app(build_app(args), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    main()
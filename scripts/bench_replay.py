@@ -0,0 +1,550 @@
+#!/usr/bin/env python3
+"""
+Офлайн-бенчмарк пайплайна лидов: прогон записанного корпуса сообщений без живых чатов.
+
+Корпус — JSONL, по сообщению в строке:
+  {"source_type": "telegram"|"vk", "source_name": "...", "source_id": "...", "post_id": "...",
+   "text": "...", "author_id": 123, "url": "...", "is_lead": true|false (опционально, разметка)}
+
+Telethon/VK (iter_telegram, iter_vk, parse_*, scan_vk_groups), YandexGPT/Router AI и Telegram-бот
+подменяются внутрипроцессными фейками с настраиваемой задержкой; БД — временная SQLite, как и
+очередь уведомлений, seen-хранилища и кэш сущностей (рабочие файлы прогон не трогает).
+Очередь уведомлений без лимитов частоты и досылается до отчёта — bot_sends полные.
+Фильтр ScoutParser.detect_lead, LeadAnalyzer.analyze_post и LeadHunter.hunt — настоящие.
+
+Использование (из корня проекта):
+  # выгрузить размеченный корпус: лиды из spy_leads + сырые сообщения источников без лида
+  python scripts/bench_replay.py export --out bench/corpus.jsonl --limit 2000 --raw-per-chat 200
+  # прогон: пакетный hunt() или потоковый process_stream_post
+  python scripts/bench_replay.py run bench/corpus.jsonl --mode hunt --llm-latency lognormal:0.8,0.5
+  # сохранить как базовую линию / сравнить с ней
+  python scripts/bench_replay.py run bench/corpus.jsonl --save-baseline
+  python scripts/bench_replay.py run bench/corpus.jsonl --compare bench/results/baseline.json
+
+Задержки: fixed:0.2 | uniform:0.1,1.5 | lognormal:<медиана>,<sigma>; --time-scale 0.1 ускоряет
+все фейковые ожидания в 10 раз (для быстрых прогонов, относительные сравнения сохраняются).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
+
+RESULTS_DIR = os.path.join("bench", "results")
+
+
+# ── Распределения задержек ─────────────────────────────────────────────────────
+
+class Latency:
+    """Задержка фейка: fixed:a | uniform:a,b | lognormal:median,sigma (секунды)."""
+
+    def __init__(self, spec: str, time_scale: float = 1.0, seed: int = 0):
+        self.spec = spec
+        self.time_scale = time_scale
+        self.rng = random.Random(seed)
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(a) for a in args.split(",") if a]
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            value = self.args[0] if self.args else 0.0
+        elif self.kind == "uniform":
+            value = self.rng.uniform(self.args[0], self.args[1])
+        else:
+            median, sigma = self.args[0], (self.args[1] if len(self.args) > 1 else 0.5)
+            value = self.rng.lognormvariate(math.log(median), sigma)
+        return value * self.time_scale
+
+    async def wait(self) -> None:
+        delay = self.sample()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# ── Фейки ─────────────────────────────────────────────────────────────────────
+
+_LEAD_HINTS = ("перепланиров", "узакон", "снос", "снести", "мжи", "бти", "мокр", "объедин", "согласова", "штраф")
+
+
+class FakeLLM:
+    """
+    Подменяет router_ai.generate_response и utils.yandex_gpt.generate.
+
+    Ответ определяется по типу промпта (оценка поста / интент / проект ответа) и
+    разметке корпуса (is_lead), при её отсутствии — по ключевым словам.
+    """
+
+    def __init__(self, latency: Latency, labels: Dict[str, bool]):
+        self.latency = latency
+        self.labels = labels
+        self.calls: Dict[str, int] = {}
+
+    def _is_lead(self, prompt: str) -> bool:
+        for text, is_lead in self.labels.items():
+            if text and text[:200] in prompt:
+                return is_lead
+        low = prompt.lower()
+        return sum(1 for h in _LEAD_HINTS if h in low) >= 2
+
+    async def respond(self, provider: str, prompt: str) -> str:
+        await self.latency.wait()
+        if "priority_score" in prompt:
+            kind = "analyze_post"
+            lead = self._is_lead(prompt)
+            reply = json.dumps({
+                "priority_score": 7 if lead else 1, "pain_stage": "ST-3" if lead else "ST-1",
+                "justification": "bench", "is_lead": lead,
+            })
+        elif "is_lead (true/false)" in prompt or "is_lead" in prompt:
+            kind = "analyze_intent"
+            lead = self._is_lead(prompt)
+            reply = json.dumps({
+                "is_lead": lead, "intent": "перепланировка" if lead else "", "hotness": 4 if lead else 0,
+                "context_summary": "bench", "recommendation": "", "pain_level": 3 if lead else 0,
+            }, ensure_ascii=False)
+        else:
+            kind = "reply"
+            reply = "Здравствуйте! Поможем с проектом и согласованием перепланировки."
+        key = f"{provider}:{kind}"
+        self.calls[key] = self.calls.get(key, 0) + 1
+        return reply
+
+    async def router_generate_response(self, user_prompt: str = "", system_prompt: Optional[str] = None, *args, **kwargs):
+        return await self.respond("routerai", f"{system_prompt or ''}\n{user_prompt}")
+
+    async def yandex_generate(self, system_prompt: str = "", user_message: str = "", max_tokens: int = 500):
+        return await self.respond("yandexgpt", f"{system_prompt}\n{user_message}")
+
+    async def yandex_generate_response(self, user_prompt: str = "", system_prompt: Optional[str] = None, *args, **kwargs):
+        return await self.respond("yandexgpt", f"{system_prompt or ''}\n{user_prompt}")
+
+
+class FakeBot:
+    """Минимальный aiogram.Bot: считает отправленные сообщения и документы."""
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.session = None
+        self.sent: Dict[str, int] = {}
+
+    def __getattr__(self, name):
+        if not name.startswith("send_") and name not in ("edit_message_text", "forward_message", "copy_message"):
+            raise AttributeError(name)
+
+        async def method(*args, **kwargs):
+            await self.latency.wait()
+            self.sent[name] = self.sent.get(name, 0) + 1
+            return None
+        return method
+
+
+def load_corpus(path: str) -> List[dict]:
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                items.append(json.loads(line))
+    return items
+
+
+def _to_posts(items: List[dict]):
+    from services.scout_parser import ScoutPost
+
+    posts = []
+    for i, item in enumerate(items):
+        source_type = item.get("source_type", "telegram")
+        posts.append(ScoutPost(
+            source_type=source_type,
+            source_name=item.get("source_name", "bench"),
+            source_id=str(item.get("source_id", "bench")),
+            post_id=str(item.get("post_id", i)),
+            text=item.get("text", ""),
+            author_id=item.get("author_id"),
+            url=item.get("url") or f"https://bench.local/{source_type}/{i}",
+            source_link=item.get("source_link"),
+        ))
+    return posts
+
+
+# ── Прогон ────────────────────────────────────────────────────────────────────
+
+async def run_benchmark(args) -> dict:
+    tmp = tempfile.mkdtemp(prefix="bench_")
+    # Все SQLite-файлы сервисов — во временный каталог до их импорта: иначе карточки прогона
+    # остались бы в рабочей notify_queue.db и ушли бы в группу лидов при следующем старте main.py
+    os.environ["DATABASE_PATH"] = os.path.join(tmp, "bench.db")
+    os.environ["POTENTIAL_LEADS_DB"] = os.path.join(tmp, "potential_leads.db")
+    os.environ["NOTIFY_DB_PATH"] = os.path.join(tmp, "notify_queue.db")
+    os.environ["SEEN_DB_PATH"] = os.path.join(tmp, "seen_ids.db")
+    os.environ["ENTITY_CACHE_DB_PATH"] = os.path.join(tmp, "entity_cache.db")
+    # Фейковому боту лимиты Telegram не нужны — очередь не должна растягивать прогон
+    for name in ("NOTIFY_GLOBAL_RATE", "NOTIFY_GROUP_PER_MIN", "NOTIFY_GROUP_BURST", "NOTIFY_PRIVATE_RATE"):
+        os.environ[name] = "1000000"
+    # Клиенты LLM требуют ключи при импорте; реальные запросы не уходят — методы подменены ниже
+    os.environ.setdefault("YANDEX_API_KEY", "bench")
+    os.environ.setdefault("FOLDER_ID", "bench")
+    os.environ["LEAD_STREAM_ENABLED"] = "0"
+    os.environ["METRICS_ENABLED"] = "0"
+
+    from database import db
+    from monitoring.metrics import DB_SECONDS, STAGE_SECONDS
+    import services.lead_hunter.hunter as hunter_module
+    import utils.yandex_gpt as yandex_module
+    from services.lead_hunter import LeadHunter
+    from services.notifier import notifier
+    from services.scout_parser import scout_parser
+    from utils.bot_config import set_main_bot
+    from utils.router_ai import router_ai
+
+    items = load_corpus(args.corpus)
+    labels = {item.get("text", ""): bool(item["is_lead"]) for item in items if "is_lead" in item}
+    llm = FakeLLM(Latency(args.llm_latency, args.time_scale, seed=1), labels)
+    fetch_latency = Latency(args.fetch_latency, args.time_scale, seed=2)
+    bot = FakeBot(Latency(args.bot_latency, args.time_scale, seed=3))
+
+    router_ai.generate_response = llm.router_generate_response
+    yandex_module.generate = llm.yandex_generate
+    yandex_module.yandex_gpt.generate_response = llm.yandex_generate_response
+    set_main_bot(bot)
+    hunter_module.POTENTIAL_LEADS_DB = os.path.join(tmp, "potential_leads.db")
+
+    posts = _to_posts(items)
+    filter_passed = []
+
+    async def fake_fetch(source_type: str):
+        """Фейковый Telethon/VK: задержка на «чат» + настоящий фильтр detect_lead."""
+        await fetch_latency.wait()
+        result = []
+        for post in posts:
+            if post.source_type != source_type:
+                continue
+            if scout_parser.detect_lead(post.text):
+                result.append(post)
+        filter_passed.extend(result)
+        return result
+
+    async def fake_parse_telegram(*a, **kw):
+        return await fake_fetch("telegram")
+
+    async def fake_parse_vk(*a, **kw):
+        return await fake_fetch("vk")
+
+    async def fake_iter_telegram(*a, **kw):
+        for post in await fake_fetch("telegram"):
+            yield post
+
+    async def fake_iter_vk(*a, **kw):
+        for post in await fake_fetch("vk"):
+            yield post
+
+    scout_parser.parse_telegram = fake_parse_telegram
+    scout_parser.parse_vk = fake_parse_vk
+    scout_parser.iter_telegram = fake_iter_telegram
+    scout_parser.iter_vk = fake_iter_vk
+    scout_parser.scan_vk_groups = fake_parse_vk
+    try:
+        from services.scout_discovery import ScoutDiscovery
+
+        async def _noop(*a, **kw):
+            return []
+        ScoutDiscovery.start = ScoutDiscovery.stop = ScoutDiscovery.discover_new_groups = _noop
+    except Exception:
+        pass
+
+    await db.connect()
+    hunter = LeadHunter()
+
+    async def _no_sources(*a, **kw):
+        return []
+    hunter.discovery.find_new_sources = _no_sources
+    hunter.discovery.scout_vk_resources = _no_sources
+
+    stages_before = STAGE_SECONDS.snapshot()
+    db_before = DB_SECONDS.snapshot()
+    t0 = time.perf_counter()
+    if args.mode == "hunt":
+        await hunter.hunt()
+    else:
+        sem = asyncio.Semaphore(args.concurrency)
+        candidates = [p for p in posts if scout_parser.detect_lead(p.text)]
+        filter_passed.extend(candidates)
+
+        async def one(post):
+            async with sem:
+                return await hunter.process_stream_post(post)
+        await asyncio.gather(*(one(p) for p in candidates))
+    wall = time.perf_counter() - t0
+    # Карточки уходят через очередь уведомлений в фоне — дослать их до подсчёта bot_sends
+    await notifier.stop(drain_timeout=max(30.0, 600 * args.time_scale))
+    notify_pending = len(notifier)
+
+    leads = 0
+    try:
+        async with db.conn.cursor() as cursor:
+            await cursor.execute("SELECT COUNT(*) FROM spy_leads")
+            leads = (await cursor.fetchone())[0]
+    except Exception:
+        pass
+    await db.close()
+
+    def delta(after: dict, before: dict) -> Dict[str, dict]:
+        out = {}
+        for key, (count, total) in after.items():
+            c0, s0 = before.get(key, (0, 0.0))
+            if count - c0:
+                out["/".join(str(k) for k in key)] = {"count": count - c0, "seconds": round(total - s0, 4)}
+        return out
+
+    db_delta = delta(DB_SECONDS.snapshot(), db_before)
+    return {
+        "name": args.name or os.path.splitext(os.path.basename(args.corpus))[0],
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "mode": args.mode,
+        "corpus": args.corpus,
+        "messages": len(posts),
+        "filter_passed": len({p.url for p in filter_passed}),
+        "leads": leads,
+        "wall_seconds": round(wall, 3),
+        "throughput_msg_per_s": round(len(posts) / wall, 2) if wall else 0,
+        "stages": delta(STAGE_SECONDS.snapshot(), stages_before),
+        "db": {"calls": sum(v["count"] for v in db_delta.values()),
+               "seconds": round(sum(v["seconds"] for v in db_delta.values()), 4)},
+        "llm_calls": llm.calls,
+        "llm_calls_total": sum(llm.calls.values()),
+        "bot_sends": bot.sent,
+        "notify_pending": notify_pending,
+        "latency": {"llm": args.llm_latency, "fetch": args.fetch_latency, "bot": args.bot_latency,
+                    "time_scale": args.time_scale},
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return ""
+
+
+# ── Отчёт и сравнение ─────────────────────────────────────────────────────────
+
+def format_report(result: dict, baseline: Optional[dict] = None) -> str:
+    def cmp(key: str, better_lower: bool = False) -> str:
+        if not baseline or key not in baseline or not baseline[key]:
+            return ""
+        change = (result[key] - baseline[key]) * 100 / baseline[key]
+        good = change < 0 if better_lower else change > 0
+        return f"  ({change:+.1f}% {'✅' if good or abs(change) < 1 else '⚠️'})"
+
+    lines = [
+        f"📊 Бенчмарк {result['name']} [{result['mode']}] @ {result['commit'] or '—'}",
+        f"Сообщений: {result['messages']}, прошли фильтр: {result['filter_passed']}, лидов: {result['leads']}{cmp('leads')}",
+        f"Время: {result['wall_seconds']} с{cmp('wall_seconds', True)}, "
+        f"пропускная способность: {result['throughput_msg_per_s']} сообщ./с{cmp('throughput_msg_per_s')}",
+        f"LLM-вызовов: {result['llm_calls_total']}{cmp('llm_calls_total', True)}  {result['llm_calls']}",
+        f"БД: {result['db']['calls']} вызовов, {result['db']['seconds']} с",
+        "Стадии:",
+    ]
+    for stage, data in sorted(result["stages"].items()):
+        avg = data["seconds"] / data["count"] * 1000 if data["count"] else 0
+        lines.append(f"  • {stage}: {data['count']} × {avg:.2f} мс = {data['seconds']} с")
+    if result["bot_sends"]:
+        lines.append(f"Отправки бота: {result['bot_sends']}")
+    if result.get("notify_pending"):
+        lines.append(f"⚠️ Не досланы за время прогона: {result['notify_pending']} уведомлений")
+    return "\n".join(lines)
+
+
+def save_result(result: dict, baseline: bool = False) -> str:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    if baseline:
+        path = os.path.join(RESULTS_DIR, "baseline.json")
+    else:
+        path = os.path.join(RESULTS_DIR, f"{result['name']}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return path
+
+
+# ── Экспорт корпуса ───────────────────────────────────────────────────────────
+
+_PHONE_RE = re.compile(r"(?:\+7|8)[\s\-()]*\d{3}[\s\-()]*\d{3}[\s\-]*\d{2}[\s\-]*\d{2}")
+_MENTION_RE = re.compile(r"@\w+")
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+
+
+def anonymize(text: str) -> str:
+    text = _EMAIL_RE.sub("<email>", text or "")
+    text = _PHONE_RE.sub("<phone>", text)
+    return _MENTION_RE.sub("@user", text)
+
+
+def _stable_id(*parts) -> str:
+    """Id записи корпуса из исходной строки: повторная выгрузка (--append) даёт те же id."""
+    return hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:16]
+
+
+def _corpus_item(source_type: str, source_name: str, url: str, text: str, author, is_lead: bool) -> dict:
+    post_id = _stable_id(source_type, url or text)
+    return {
+        "source_type": source_type,
+        "source_name": source_name,
+        "source_id": hashlib.sha1(source_name.encode()).hexdigest()[:10],
+        "post_id": post_id,
+        "text": anonymize(text),
+        "author_id": int(hashlib.sha1(str(author).encode()).hexdigest()[:8], 16) if author else None,
+        "url": f"https://bench.local/{source_type}/{post_id}",
+        "is_lead": is_lead,
+    }
+
+
+async def _raw_scan(db, per_chat: int):
+    """
+    Сырые сообщения активных источников (последние per_chat на чат/группу) — только чтение:
+    last_post_id, seen-хранилища и расписание сканирования не меняются.
+    """
+    from services.scout_parser import scout_parser
+
+    targets = await db.get_active_targets_for_scout(platform="telegram")
+    if targets:
+        from services.session_pool import session_pool
+
+        if await session_pool.start():
+            try:
+                for target in targets:
+                    link = target.get("link")
+                    if not link:
+                        continue
+                    try:
+                        messages = await session_pool.fetch_messages(link, limit=per_chat)
+                    except Exception as e:
+                        print(f"⚠️ {link}: {e}")
+                        continue
+                    for msg in messages:
+                        if msg.text:
+                            author = getattr(getattr(msg, "from_id", None), "user_id", None)
+                            yield ("telegram", target.get("title") or "", f"https://t.me/{link}/{msg.id}",
+                                   msg.text, author)
+            finally:
+                await session_pool.stop()
+        else:
+            print("⚠️ Нет авторизованных Telethon-сессий — Telegram пропущен")
+
+    for target in await db.get_active_targets_for_scout(platform="vk"):
+        link = str(target.get("link") or "")
+        group_id = link.replace("https://vk.com/public", "").replace("https://vk.com/", "").lstrip("-")
+        if not group_id:
+            continue
+        for item in await scout_parser._get_vk_posts(group_id, count=per_chat):
+            if item.get("text"):
+                author = item.get("from_id") if (item.get("from_id") or 0) > 0 else None
+                yield ("vk", target.get("title") or "", f"https://vk.com/wall-{group_id}_{item['id']}",
+                       item["text"], author)
+
+
+async def export_corpus(args) -> None:
+    """
+    Размеченный корпус в JSONL: spy_leads — is_lead=true; с --raw-per-chat ещё сырые сообщения
+    активных источников, не ставшие лидами, — is_lead=false. Id записей — от исходного url,
+    с --append уже выгруженное не дублируется. Автор — только хэш, телефоны/почта/@ скрыты.
+    """
+    from database import db
+
+    await db.connect()
+    try:
+        async with db.conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT id, source_type, source_name, url, text, author_id FROM spy_leads ORDER BY id DESC LIMIT ?",
+                (args.limit,),
+            )
+            rows = [dict(r) for r in await cursor.fetchall()]
+        items = [
+            _corpus_item(row.get("source_type") or "telegram", row.get("source_name") or "",
+                         row.get("url") or f"spy_leads/{row['id']}", row.get("text") or "",
+                         row.get("author_id"), True)
+            for row in reversed(rows)
+        ]
+        lead_urls = {row.get("url") for row in rows if row.get("url")}
+        if args.raw_per_chat > 0:
+            async with db.conn.cursor() as cursor:
+                await cursor.execute("SELECT url FROM spy_leads")
+                lead_urls.update(r[0] for r in await cursor.fetchall())
+            async for source_type, source_name, url, text, author in _raw_scan(db, args.raw_per_chat):
+                if url not in lead_urls:
+                    items.append(_corpus_item(source_type, source_name, url, text, author, False))
+    finally:
+        await db.close()
+
+    known = set()
+    if args.append and os.path.exists(args.out):
+        known = {item.get("url") for item in load_corpus(args.out)}
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    written = {True: 0, False: 0}
+    with open(args.out, "a" if args.append else "w", encoding="utf-8") as f:
+        for item in items:
+            if item["url"] in known:
+                continue
+            known.add(item["url"])
+            written[item["is_lead"]] += 1
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    print(f"✅ Экспортировано {written[True]} лидов и {written[False]} сообщений без лида → {args.out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк пайплайна лидов")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="прогнать корпус через пайплайн")
+    run.add_argument("corpus")
+    run.add_argument("--mode", choices=("hunt", "stream"), default="hunt")
+    run.add_argument("--name", default="")
+    run.add_argument("--concurrency", type=int, default=2, help="воркеров в режиме stream")
+    run.add_argument("--llm-latency", default="lognormal:0.8,0.5")
+    run.add_argument("--fetch-latency", default="uniform:0.2,1.0")
+    run.add_argument("--bot-latency", default="fixed:0.05")
+    run.add_argument("--time-scale", type=float, default=1.0)
+    run.add_argument("--save-baseline", action="store_true")
+    run.add_argument("--compare", default="", help="JSON базовой линии")
+
+    export = sub.add_parser("export", help="выгрузить анонимизированный размеченный корпус")
+    export.add_argument("--out", default=os.path.join("bench", "corpus.jsonl"))
+    export.add_argument("--limit", type=int, default=2000, help="лидов из spy_leads")
+    export.add_argument("--raw-per-chat", type=int, default=0,
+                        help="добавить последние N сырых сообщений каждого активного источника (is_lead=false)")
+    export.add_argument("--append", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        asyncio.run(export_corpus(args))
+        return
+
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    result = asyncio.run(run_benchmark(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(format_report(result, baseline))
+    print(f"💾 {save_result(result, baseline=args.save_baseline)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк запуска main.py: время до первого апдейта и разбивка времени импортов.
+
+  time-to-first-update — main.py запускается подпроцессом против локального фейкового
+  Bot API (TELEGRAM_API_BASE): первый getUpdates отдаёт /start, таймлайн процесса
+  (monitoring/startup.py) пишется в STARTUP_REPORT_FILE. Меряем для режимов
+  STARTUP_MODE=fast и eager; БД и lock-файл — временные, живой бот не трогается.
+
+  imports — `python -X importtime -c "import main"`: суммарное время по пакетам
+  (self и cumulative) и самые тяжёлые отдельные модули.
+
+Использование (из корня проекта):
+  python scripts/bench_startup.py ttfu --modes fast,eager --runs 3
+  python scripts/bench_startup.py imports --top 25
+  python scripts/bench_startup.py ttfu --save-baseline
+  python scripts/bench_startup.py ttfu --compare bench/results/startup_baseline.json
+
+Сетевые запросы вне Telegram (VK, YandexGPT при прогреве) не подменяются — задайте
+пустые VK_TOKEN/VK_GROUP_ID в окружении, если нужен чистый замер без внешней сети.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
+
+RESULTS_DIR = os.path.join("bench", "results")
+FAKE_TOKENS = ("1000001:BENCH_MAIN_TOKEN", "1000002:BENCH_CONTENT_TOKEN")
+BENCH_CHAT_ID = 777000
+
+
+# ── Фейковый Bot API ──────────────────────────────────────────────────────────
+
+class FakeBotAPI:
+    """Минимальный Bot API: getMe/getUpdates/sendMessage/getChat…; первый getUpdates — /start."""
+
+    def __init__(self):
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._delivered = set()
+        self._message_id = 0
+
+    def _user(self, token: str) -> dict:
+        bot_id = int(token.split(":", 1)[0])
+        return {"id": bot_id, "is_bot": True, "first_name": f"bench{bot_id}", "username": f"bench{bot_id}_bot"}
+
+    def _message(self, text: str, from_bot: Optional[dict] = None) -> dict:
+        self._message_id += 1
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": BENCH_CHAT_ID, "type": "private", "first_name": "Bench"},
+            "from": from_bot or {"id": BENCH_CHAT_ID, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+        }
+
+    async def handle(self, request):
+        from aiohttp import web
+
+        token = request.match_info["token"]
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        result = True
+        if method == "getme":
+            result = self._user(token)
+        elif method == "getupdates":
+            if token not in self._delivered:
+                self._delivered.add(token)
+                result = [{"update_id": 1, "message": self._message("/start")}]
+            else:
+                await asyncio.sleep(1)
+                result = []
+        elif method in ("sendmessage", "editmessagetext", "sendphoto", "senddocument"):
+            result = self._message("ok", from_bot=self._user(token))
+        elif method == "getchat":
+            result = {"id": BENCH_CHAT_ID, "type": "supergroup", "title": "Bench"}
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, port: int):
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", port)
+        await site.start()
+        return runner
+
+
+# ── Время до первого апдейта ──────────────────────────────────────────────────
+
+def _child_env(mode: str, tmp: str, port: int) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "STARTUP_MODE": mode,
+        "STARTUP_REPORT_FILE": os.path.join(tmp, "startup.json"),
+        "TELEGRAM_API_BASE": f"http://127.0.0.1:{port}",
+        "BOT_TOKEN": FAKE_TOKENS[0],
+        "CONTENT_BOT_TOKEN": FAKE_TOKENS[1],
+        "BOT_LOCK_FILE": os.path.join(tmp, "bot.lock"),
+        "DATABASE_PATH": os.path.join(tmp, "bench.db"),
+        "METRICS_ENABLED": "0",
+        "HEARTBEAT_ENABLED": "0",
+        "LEAD_STREAM_ENABLED": "0",
+        "PROFILE_AUTO_ENABLED": "0",
+    })
+    env.setdefault("YANDEX_API_KEY", "bench")
+    env.setdefault("FOLDER_ID", "bench")
+    env.setdefault("LEADS_GROUP_CHAT_ID", str(BENCH_CHAT_ID))
+    return env
+
+
+async def measure_once(mode: str, port: int, timeout: float) -> dict:
+    """Один запуск main.py: таймлайн этапов из STARTUP_REPORT_FILE."""
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as tmp:
+        report_path = os.path.join(tmp, "startup.json")
+        t0 = time.monotonic()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "main.py",
+            env=_child_env(mode, tmp, port),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        report: dict = {}
+        try:
+            while time.monotonic() - t0 < timeout and process.returncode is None:
+                await asyncio.sleep(0.05)
+                try:
+                    with open(report_path, encoding="utf-8") as f:
+                        report = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                marks = report.get("marks", {})
+                # fast: ждём и первый апдейт, и конец прогрева; eager — прогрев раньше апдейта
+                if "first_update" in marks and "warmup_done" in marks:
+                    break
+        finally:
+            if process.returncode is None:
+                process.terminate()
+                try:
+                    await asyncio.wait_for(process.wait(), timeout=10)
+                except asyncio.TimeoutError:
+                    process.kill()
+        report["wall_seconds"] = round(time.monotonic() - t0, 3)
+        report["returncode"] = process.returncode
+        return report
+
+
+async def run_ttfu(args) -> dict:
+    api = FakeBotAPI()
+    runner = await api.start(args.port)
+    results: Dict[str, List[dict]] = {}
+    try:
+        for mode in args.modes.split(","):
+            results[mode] = []
+            for i in range(args.runs):
+                report = await measure_once(mode, args.port, args.timeout)
+                results[mode].append(report)
+                marks = report.get("marks", {})
+                print(f"  {mode} #{i + 1}: первый апдейт {marks.get('first_update', '—')} с, "
+                      f"прогрев {marks.get('warmup_done', '—')} с")
+    finally:
+        await runner.cleanup()
+
+    summary = {}
+    for mode, reports in results.items():
+        summary[mode] = {}
+        for mark in ("imports", "main", "dispatchers", "polling", "first_update", "warmup_done"):
+            values = [r["marks"][mark] for r in reports if mark in r.get("marks", {})]
+            if values:
+                summary[mode][mark] = round(statistics.median(values), 3)
+        steps = defaultdict(list)
+        for r in reports:
+            for name, seconds in r.get("background", {}).items():
+                steps[name].append(seconds)
+        summary[mode]["background"] = {name: round(statistics.median(v), 3) for name, v in steps.items()}
+    return {"name": "startup", "created_at": datetime.now().isoformat(timespec="seconds"),
+            "runs": args.runs, "summary": summary}
+
+
+def format_ttfu(result: dict, baseline: Optional[dict] = None) -> str:
+    lines = [f"⏱️ Запуск main.py (медиана из {result['runs']}), секунды от старта процесса:"]
+    for mode, data in result["summary"].items():
+        lines.append(f"\n[{mode}]")
+        for mark in ("imports", "main", "dispatchers", "polling", "first_update", "warmup_done"):
+            if mark not in data:
+                continue
+            line = f"  {mark:<13} {data[mark]:>7.2f}"
+            base = (baseline or {}).get("summary", {}).get(mode, {}).get(mark)
+            if base:
+                line += f"   (база {base:.2f}, {(data[mark] - base) / base * 100:+.0f}%)"
+            lines.append(line)
+        for name, seconds in sorted(data.get("background", {}).items(), key=lambda x: -x[1]):
+            lines.append(f"    · {name}: {seconds:.2f}")
+    return "\n".join(lines)
+
+
+# ── Разбивка импортов ─────────────────────────────────────────────────────────
+
+def run_imports(args) -> dict:
+    """python -X importtime: self/cumulative по пакетам верхнего уровня и топ модулей."""
+    with tempfile.TemporaryDirectory(prefix="bench_imports_") as tmp:
+        env = _child_env("fast", tmp, args.port)
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import main"],
+            env=env, capture_output=True, text=True, timeout=args.timeout,
+        )
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, name = parts
+        try:
+            modules.append({"module": name.strip(), "self": int(self_us) / 1e6,
+                            "cumulative": int(cumulative_us) / 1e6})
+        except ValueError:
+            continue
+    if not modules:
+        print(proc.stderr[-2000:])
+        raise SystemExit("❌ importtime не дал данных (main.py не импортируется?)")
+
+    packages: Dict[str, float] = defaultdict(float)
+    for m in modules:
+        packages[m["module"].split(".")[0]] += m["self"]
+    total = max(m["cumulative"] for m in modules)
+    return {
+        "name": "imports",
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "total": round(total, 3),
+        "packages": sorted(((p, round(s, 3)) for p, s in packages.items()), key=lambda x: -x[1])[:args.top],
+        "modules": sorted(
+            ({"module": m["module"], "cumulative": round(m["cumulative"], 3), "self": round(m["self"], 3)}
+             for m in modules),
+            key=lambda m: -m["cumulative"],
+        )[:args.top],
+    }
+
+
+def format_imports(result: dict) -> str:
+    lines = [f"📦 import main: {result['total']:.2f} с", "", "Пакеты (self, сумма по модулям пакета):"]
+    for package, seconds in result["packages"]:
+        lines.append(f"  {seconds:>7.3f}  {package}")
+    lines.append("")
+    lines.append("Модули (cumulative / self):")
+    for m in result["modules"]:
+        lines.append(f"  {m['cumulative']:>7.3f} / {m['self']:.3f}  {m['module']}")
+    return "\n".join(lines)
+
+
+def save_result(result: dict, baseline: bool = False) -> str:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    if baseline:
+        path = os.path.join(RESULTS_DIR, f"{result['name']}_baseline.json")
+    else:
+        path = os.path.join(RESULTS_DIR, f"{result['name']}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк запуска main.py")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ttfu = sub.add_parser("ttfu", help="время до первого апдейта (fast / eager)")
+    ttfu.add_argument("--modes", default="fast,eager")
+    ttfu.add_argument("--runs", type=int, default=3)
+    ttfu.add_argument("--port", type=int, default=8086)
+    ttfu.add_argument("--timeout", type=float, default=120)
+    ttfu.add_argument("--save-baseline", action="store_true")
+    ttfu.add_argument("--compare", default="", help="JSON базовой линии")
+
+    imports = sub.add_parser("imports", help="разбивка времени импортов (python -X importtime)")
+    imports.add_argument("--top", type=int, default=25)
+    imports.add_argument("--port", type=int, default=8086)
+    imports.add_argument("--timeout", type=float, default=120)
+
+    args = parser.parse_args()
+    if args.command == "imports":
+        result = run_imports(args)
+        print(format_imports(result))
+        print(f"💾 {save_result(result)}")
+        return
+
+    result = asyncio.run(run_ttfu(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(format_ttfu(result, baseline))
+    print(f"💾 {save_result(result, baseline=args.save_baseline)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный стенд: «шторм» синтетических апдейтов через настоящие Dispatcher из main.py.
+
+Сколько одновременных пользователей квиза и консультанта выдерживает main_bot, пока
+задержка хендлеров не поползла вверх? Стенд запускает N виртуальных пользователей,
+каждый проходит сценарий (консультация, квиз, контент-завод) с паузами «на подумать»
+и кормит апдейты в dp.feed_update — тот же путь, что у polling, без Telegram:
+
+  - Dispatcher — main.build_dispatchers() (quiz/dialog/start/admin/creator + content_router);
+  - Bot API — фейковый сервер из bench_startup.py (TELEGRAM_API_BASE) с задержкой --api-latency;
+  - YandexGPT / Router AI — мок из ai_mock_server.py (настоящие HTTP-клиенты, задержка --llm-latency);
+  - БД — временная SQLite с настоящими миграциями, база знаний — настоящая.
+
+Отчёт: перцентили задержки по хендлерам и шагам сценариев, лаг цикла событий,
+конкуренция за SQLite (очередь aiosqlite: ожидание и выполнение, пик параллельных
+запросов, «database is locked»), необработанные апдейты. Сиды фиксированы —
+одинаковые аргументы дают одинаковую последовательность апдейтов и задержек,
+результат сохраняется в bench/results/ для сравнения «до/после».
+
+Использование (из корня проекта):
+  python scripts/bench_updates.py --users 50 --think uniform:1,4 --llm-latency lognormal:1.2,0.4
+  python scripts/bench_updates.py --users 200 --mix consult:0.6,quiz:0.4 --time-scale 0.2
+  python scripts/bench_updates.py --users 50 --save-baseline
+  python scripts/bench_updates.py --users 50 --compare bench/results/updates_baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
+
+from bench_replay import Latency, _git_commit  # noqa: E402
+from bench_startup import FAKE_TOKENS, FakeBotAPI  # noqa: E402
+
+RESULTS_DIR = os.path.join("bench", "results")
+USER_ID_BASE = 10_000_000
+BENCH_ADMIN_ID = 9_000_001
+LAG_SAMPLE_INTERVAL = 0.05
+
+QUESTIONS = [
+    "Можно ли снести стену между кухней и комнатой в панельном доме?",
+    "Сколько стоит согласование перепланировки в Москве?",
+    "Нужно ли согласовывать перенос дверного проёма?",
+    "Какой штраф за незаконную перепланировку?",
+    "Хочу объединить санузел, что для этого нужно?",
+    "Можно ли перенести кухню в жилую комнату?",
+    "Какие документы нужны для МЖИ?",
+    "Сколько по времени занимает узаконивание перепланировки?",
+    "Можно ли утеплить балкон и присоединить его к комнате?",
+    "Продаю квартиру с перепланировкой, что делать?",
+]
+
+QUIZ_ANSWERS = [
+    "Москва", "Квартира", "Монолит", "5/17", "54", "⚡ Электрическая плита", "🔜 Планируется",
+    "Снос стены между кухней и гостиной, расширение санузла", "нет плана",
+]
+
+CONTENT_TOPICS = [
+    "Как согласовать перенос кухни", "Мокрые зоны над жилыми комнатами", "Штрафы за перепланировку в 2026",
+]
+
+
+# ── Сценарии ──────────────────────────────────────────────────────────────────
+# Шаг: (бот, метка, тип апдейта, данные); бот — "main" или "content"
+
+Step = Tuple[str, str, str, str]
+
+
+def scenario_consult(rng: random.Random, args) -> List[Step]:
+    steps = [("main", "start", "text", "/start"), ("main", "mode_dialog", "callback", "mode:dialog")]
+    for question in rng.sample(QUESTIONS, min(args.questions, len(QUESTIONS))):
+        steps.append(("main", "question", "text", question))
+    return steps
+
+
+def scenario_quiz(rng: random.Random, args) -> List[Step]:
+    steps = [("main", "start", "text", "/start"), ("main", "mode_quiz", "callback", "mode:quiz"),
+             ("main", "contact", "contact", "+79990000000")]
+    steps += [("main", f"quiz_{i + 1}", "text", answer) for i, answer in enumerate(QUIZ_ANSWERS)]
+    return steps
+
+
+def scenario_content(rng: random.Random, args) -> List[Step]:
+    """Контент-завод (admin-only): все сессии идут от BENCH_ADMIN_ID, как один занятый админ."""
+    return [("content", "start", "text", "/start"), ("content", "menu_text", "text", "📝 Быстрый текст"),
+            ("content", "topic", "text", rng.choice(CONTENT_TOPICS))]
+
+
+SCENARIOS = {"consult": scenario_consult, "quiz": scenario_quiz, "content": scenario_content}
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition(":")
+        if name not in SCENARIOS:
+            raise SystemExit(f"❌ Неизвестный сценарий: {name} (есть: {', '.join(SCENARIOS)})")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+# ── Синтетические апдейты ─────────────────────────────────────────────────────
+
+class UpdateFactory:
+    """Update-словари Bot API: текст, нажатие inline-кнопки, контакт."""
+
+    def __init__(self):
+        self.update_id = 0
+        self.message_id = 0
+
+    def _next(self) -> Tuple[int, int]:
+        self.update_id += 1
+        self.message_id += 1
+        return self.update_id, self.message_id
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id % 10000}",
+                "username": f"bench_{user_id}", "language_code": "ru"}
+
+    def build(self, user_id: int, kind: str, payload: str) -> dict:
+        update_id, message_id = self._next()
+        user = self._user(user_id)
+        chat = {"id": user_id, "type": "private", "first_name": user["first_name"]}
+        message = {"message_id": message_id, "date": int(time.time()), "chat": chat, "from": user}
+        if kind == "callback":
+            message["from"] = {"id": int(FAKE_TOKENS[0].split(":")[0]), "is_bot": True, "first_name": "bench"}
+            message["text"] = "Меню"
+            return {"update_id": update_id, "callback_query": {
+                "id": str(update_id), "from": user, "chat_instance": str(user_id), "data": payload,
+                "message": message,
+            }}
+        if kind == "contact":
+            message["contact"] = {"phone_number": payload, "first_name": user["first_name"], "user_id": user_id}
+        else:
+            message["text"] = payload
+            if payload.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(payload.split()[0])}]
+        return {"update_id": update_id, "message": message}
+
+
+# ── Измерители ────────────────────────────────────────────────────────────────
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {"count": len(ordered), "p50": round(pick(0.50), 4), "p90": round(pick(0.90), 4),
+            "p95": round(pick(0.95), 4), "p99": round(pick(0.99), 4), "max": round(ordered[-1], 4)}
+
+
+class HandlerTimer:
+    """Inner-middleware на dp.message / dp.callback_query: длительность каждого хендлера по имени."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def __call__(self, handler, event, data):
+        callback = getattr(data.get("handler"), "callback", None)
+        name = f"{getattr(callback, '__module__', '?')}.{getattr(callback, '__qualname__', '?')}"
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors[name] += 1
+            raise
+        finally:
+            self.samples[name].append(time.perf_counter() - t0)
+
+
+class LoopLagSampler:
+    """Насколько позже запланированного просыпается корутина-сэмплер (лаг цикла событий)."""
+
+    def __init__(self, interval: float = LAG_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="bench_loop_lag")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+class DbProbe:
+    """
+    Обёртка над очередью aiosqlite (Connection._execute): все запросы одного соединения
+    выполняются по очереди в его потоке, поэтому конкуренция видна как ожидание в очереди.
+    """
+
+    def __init__(self):
+        self.wait: List[float] = []
+        self.execute: List[float] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.locked = 0
+
+    def install(self, conn) -> None:
+        original = conn._execute
+
+        async def probed(fn, *args, **kwargs):
+            started: List[float] = []
+
+            def timed():
+                started.append(time.perf_counter())
+                return fn(*args, **kwargs)
+
+            enqueued = time.perf_counter()
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                return await original(timed)
+            except sqlite3.OperationalError as e:
+                if "locked" in str(e):
+                    self.locked += 1
+                raise
+            finally:
+                done = time.perf_counter()
+                self.in_flight -= 1
+                begin = started[0] if started else done
+                self.wait.append(begin - enqueued)
+                self.execute.append(done - begin)
+
+        conn._execute = probed
+
+    def as_dict(self) -> dict:
+        return {"queries": len(self.execute), "max_in_flight": self.max_in_flight, "locked_errors": self.locked,
+                "wait": percentiles(self.wait), "execute": percentiles(self.execute),
+                "wait_total_seconds": round(sum(self.wait), 3), "execute_total_seconds": round(sum(self.execute), 3)}
+
+
+# ── Прогон ────────────────────────────────────────────────────────────────────
+
+def _setup_env(tmp: str, api_port: int, ai_port: int) -> None:
+    """Окружение до импорта main: все внешние адреса — на локальные фейки, БД — временная."""
+    ai_base = f"http://127.0.0.1:{ai_port}"
+    os.environ.update({
+        "TELEGRAM_API_BASE": f"http://127.0.0.1:{api_port}",
+        "BOT_TOKEN": FAKE_TOKENS[0],
+        "CONTENT_BOT_TOKEN": FAKE_TOKENS[1],
+        "BOT_LOCK_FILE": os.path.join(tmp, "bot.lock"),
+        "DATABASE_PATH": os.path.join(tmp, "bench.db"),
+        "ADMIN_ID": str(BENCH_ADMIN_ID),
+        "YANDEX_LLM_URL": ai_base,
+        "YANDEX_STT_URL": ai_base,
+        "ROUTER_AI_ENDPOINT": f"{ai_base}/api/v1/chat/completions",
+        "ROUTER_AI_IMAGE_ENDPOINT": f"{ai_base}/api/v1/images/generations",
+        "ROUTER_AI_IMAGE_BASE_URL": f"{ai_base}/api/v1",
+        "METRICS_ENABLED": "0",
+        "HEARTBEAT_ENABLED": "0",
+        "LEAD_STREAM_ENABLED": "0",
+    })
+    os.environ.setdefault("YANDEX_API_KEY", "bench")
+    os.environ.setdefault("FOLDER_ID", "bench")
+    os.environ.setdefault("ROUTER_AI_KEY", "bench")
+    os.environ.setdefault("LEADS_GROUP_CHAT_ID", "-1000000000001")
+    # Семантический индекс на n-граммах: без загрузки модели, одинаково на любой машине
+    os.environ.setdefault("KB_EMBED_MODEL", "hashing")
+
+
+class LatencyBotAPI(FakeBotAPI):
+    """Фейковый Bot API с задержкой ответа (сеть + Telegram)."""
+
+    def __init__(self, latency: Latency):
+        super().__init__()
+        self.latency = latency
+
+    async def handle(self, request):
+        await self.latency.wait()
+        return await super().handle(request)
+
+
+async def run_load(args) -> dict:
+    from aiohttp import web
+
+    import ai_mock_server
+
+    tmp = tempfile.mkdtemp(prefix="bench_updates_")
+    _setup_env(tmp, args.api_port, args.ai_port)
+
+    api = LatencyBotAPI(Latency(args.api_latency, args.time_scale, seed=args.seed + 1))
+    api_runner = await api.start(args.api_port)
+    ai_args = ai_mock_server.parse_args([
+        "--seed", str(args.seed + 2), "--default-latency", args.llm_latency, "--time-scale", str(args.time_scale),
+    ])
+    ai_app = ai_mock_server.build_app(ai_args)
+    ai_runner = web.AppRunner(ai_app)
+    await ai_runner.setup()
+    await web.TCPSite(ai_runner, "127.0.0.1", args.ai_port).start()
+
+    import main as app
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.dispatcher.event.bases import UNHANDLED
+    from aiogram.types import Update
+    from database import db
+    from utils import kb
+    from utils.bot_config import set_main_bot
+
+    await db.connect()
+    await kb.index_documents()
+    probe = DbProbe()
+    probe.install(db.conn)
+
+    bots = {
+        "main": Bot(token=FAKE_TOKENS[0], session=app._bot_session(), default=DefaultBotProperties(parse_mode="HTML")),
+        "content": Bot(token=FAKE_TOKENS[1], session=app._bot_session(), default=DefaultBotProperties(parse_mode="HTML")),
+    }
+    set_main_bot(bots["main"])
+    dp_main, dp_content = app.build_dispatchers()
+    dispatchers = {"main": dp_main, "content": dp_content}
+    timer = HandlerTimer()
+    for dp in dispatchers.values():
+        dp.message.middleware(timer)
+        dp.callback_query.middleware(timer)
+
+    factory = UpdateFactory()
+    mix = parse_mix(args.mix)
+    step_samples: Dict[str, List[float]] = defaultdict(list)
+    sessions: Dict[str, int] = defaultdict(int)
+    unhandled: Dict[str, int] = defaultdict(int)
+    failed: Dict[str, int] = defaultdict(int)
+
+    async def virtual_user(index: int) -> None:
+        rng = random.Random(args.seed * 100_003 + index)
+        think = Latency(args.think, args.time_scale, seed=args.seed * 100_003 + index)
+        await asyncio.sleep(args.ramp * args.time_scale * index / max(1, args.users))
+        for _ in range(args.sessions):
+            name = rng.choices([m[0] for m in mix], weights=[m[1] for m in mix])[0]
+            sessions[name] += 1
+            user_id = BENCH_ADMIN_ID if name == "content" else USER_ID_BASE + index
+            for bot_name, label, kind, payload in SCENARIOS[name](rng, args):
+                await think.wait()
+                bot = bots[bot_name]
+                update = Update.model_validate(factory.build(user_id, kind, payload), context={"bot": bot})
+                key = f"{name}:{label}"
+                t0 = time.perf_counter()
+                try:
+                    result = await dispatchers[bot_name].feed_update(bot, update)
+                    if result is UNHANDLED:
+                        unhandled[key] += 1
+                except Exception:
+                    failed[key] += 1
+                step_samples[key].append(time.perf_counter() - t0)
+
+    lag = LoopLagSampler()
+    lag.start()
+    t0 = time.perf_counter()
+    try:
+        await asyncio.gather(*(virtual_user(i) for i in range(args.users)))
+        wall = time.perf_counter() - t0
+    finally:
+        await lag.stop()
+        for bot in bots.values():
+            await bot.session.close()
+        await db.close()
+        await api_runner.cleanup()
+        await ai_runner.cleanup()
+
+    updates = sum(len(v) for v in step_samples.values())
+    return {
+        "name": args.name or "updates",
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "config": {"users": args.users, "sessions": args.sessions, "mix": args.mix, "questions": args.questions,
+                   "think": args.think, "ramp": args.ramp, "llm_latency": args.llm_latency,
+                   "api_latency": args.api_latency, "time_scale": args.time_scale, "seed": args.seed},
+        "wall_seconds": round(wall, 3),
+        "updates": updates,
+        "updates_per_second": round(updates / wall, 2) if wall else 0,
+        "sessions": dict(sessions),
+        "update_latency": percentiles([s for v in step_samples.values() for s in v]),
+        "steps": {key: percentiles(v) for key, v in sorted(step_samples.items())},
+        "handlers": {name: percentiles(v) for name, v in sorted(timer.samples.items())},
+        "handler_errors": dict(timer.errors),
+        "unhandled": dict(unhandled),
+        "failed": dict(failed),
+        "loop_lag": percentiles(lag.samples),
+        "db": probe.as_dict(),
+        "bot_api_calls": dict(api.calls),
+        "llm_requests": {s: v["requests"] for s, v in ai_app["state"].stats.items() if v["requests"]},
+    }
+
+
+# ── Отчёт и сравнение ─────────────────────────────────────────────────────────
+
+def _fmt(p: dict, baseline: Optional[dict] = None) -> str:
+    if not p.get("count"):
+        return "—"
+    line = f"n={p['count']:<5} p50 {p['p50'] * 1000:7.1f}  p95 {p['p95'] * 1000:7.1f}  p99 {p['p99'] * 1000:7.1f}  " \
+           f"max {p['max'] * 1000:7.1f} мс"
+    if baseline and baseline.get("p95"):
+        change = (p["p95"] - baseline["p95"]) * 100 / baseline["p95"]
+        line += f"  (p95 {change:+.0f}% {'✅' if change <= 5 else '⚠️'})"
+    return line
+
+
+def format_report(result: dict, baseline: Optional[dict] = None) -> str:
+    base = baseline or {}
+    cfg = result["config"]
+    lines = [
+        f"📊 Шторм апдейтов {result['name']} @ {result['commit'] or '—'}: {cfg['users']} польз. × "
+        f"{cfg['sessions']} сесс. ({cfg['mix']}), пауза {cfg['think']}, LLM {cfg['llm_latency']}, "
+        f"масштаб времени {cfg['time_scale']}",
+        f"Апдейтов: {result['updates']} за {result['wall_seconds']} с ({result['updates_per_second']}/с), "
+        f"сессии: {result['sessions']}",
+        f"Апдейт целиком:  {_fmt(result['update_latency'], base.get('update_latency'))}",
+        f"Лаг цикла:       {_fmt(result['loop_lag'], base.get('loop_lag'))}",
+        f"SQLite: {result['db']['queries']} запросов, пик в очереди {result['db']['max_in_flight']}, "
+        f"locked {result['db']['locked_errors']}",
+        f"  ожидание:      {_fmt(result['db']['wait'], base.get('db', {}).get('wait'))}",
+        f"  выполнение:    {_fmt(result['db']['execute'], base.get('db', {}).get('execute'))}",
+        "Хендлеры:",
+    ]
+    for name, p in sorted(result["handlers"].items(), key=lambda x: -x[1].get("p95", 0)):
+        lines.append(f"  {name}\n      {_fmt(p, base.get('handlers', {}).get(name))}")
+    lines.append("Шаги сценариев:")
+    for key, p in result["steps"].items():
+        lines.append(f"  {key:<22} {_fmt(p, base.get('steps', {}).get(key))}")
+    if result["unhandled"]:
+        lines.append(f"Без обработчика: {result['unhandled']}")
+    if result["failed"] or result["handler_errors"]:
+        lines.append(f"⚠️ Ошибки: шаги {result['failed']}, хендлеры {result['handler_errors']}")
+    lines.append(f"Bot API: {result['bot_api_calls']}, LLM: {result['llm_requests']}")
+    return "\n".join(lines)
+
+
+def save_result(result: dict, baseline: bool = False) -> str:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    if baseline:
+        path = os.path.join(RESULTS_DIR, f"{result['name']}_baseline.json")
+    else:
+        path = os.path.join(RESULTS_DIR, f"{result['name']}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный стенд: синтетические апдейты через Dispatcher")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=1, help="сценариев подряд на пользователя")
+    parser.add_argument("--mix", default="consult:0.7,quiz:0.3", help=f"доли сценариев: {', '.join(SCENARIOS)}")
+    parser.add_argument("--questions", type=int, default=3, help="вопросов консультанту за сессию")
+    parser.add_argument("--think", default="uniform:1,4", help="пауза пользователя перед каждым шагом")
+    parser.add_argument("--ramp", type=float, default=10.0, help="секунд на подключение всех пользователей")
+    parser.add_argument("--llm-latency", default="lognormal:1.2,0.4")
+    parser.add_argument("--api-latency", default="fixed:0.05", help="задержка ответа Bot API")
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--api-port", type=int, default=8087)
+    parser.add_argument("--ai-port", type=int, default=8088)
+    parser.add_argument("--name", default="")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", default="", help="JSON базовой линии")
+    args = parser.parse_args()
+
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    result = asyncio.run(run_load(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(format_report(result, baseline))
+    print(f"💾 {save_result(result, baseline=args.save_baseline)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+services/entity_cache.py — персистентный кэш разрешения сущностей Telethon.
+
+client.get_entity("username") на строке каждый раз делает ResolveUsername — именно эти
+запросы и ловят FloodWait при сканировании и поиске. Кэш хранит
+username/ссылку → (peer id, access_hash, тип, заголовок, участники) в SQLite:
+
+  - ключ — (сессия, нормализованная ссылка): access_hash действует только в том
+    аккаунте, который его получил, поэтому у каждой сессии пула свои записи;
+  - запись живёт ENTITY_CACHE_TTL_HOURS, потом разрешается заново; если повторное
+    разрешение упало не из-за самой ссылки (сеть, таймаут) — отдаём старую запись;
+  - несуществующие/приватные ссылки кэшируются отрицательно на
+    ENTITY_CACHE_NEGATIVE_HOURS — повторно их не разрешаем, сразу EntityNotFound;
+  - FloodWait не кэшируется и пробрасывается (пул сессий переведёт запрос на другую).
+
+В установившемся режиме сканы делают ноль resolve-запросов: по кэшу строится
+InputPeer, который Telethon принимает без обращения к серверу.
+Метрика: terion_entity_cache_total{result=hit|negative|miss|refresh|stale|invalid}.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, Optional, Tuple
+
+from monitoring.metrics import counter
+
+logger = logging.getLogger(__name__)
+
+ENTITY_CACHE_DB_PATH = os.getenv("ENTITY_CACHE_DB_PATH", "entity_cache.db")
+ENTITY_CACHE_TTL_HOURS = float(os.getenv("ENTITY_CACHE_TTL_HOURS", "168"))
+ENTITY_CACHE_NEGATIVE_HOURS = float(os.getenv("ENTITY_CACHE_NEGATIVE_HOURS", "24"))
+
+ENTITY_CACHE_EVENTS = counter(
+    "terion_entity_cache_total", "Кэш сущностей Telethon: hit / negative / miss / refresh / stale / invalid",
+    ("result",),
+)
+
+_LINK_PREFIX_RE = re.compile(r"^(?:https?://)?(?:www\.)?(?:t\.me|telegram\.me|telegram\.dog)/", re.IGNORECASE)
+
+KIND_CHANNEL = "channel"
+KIND_MEGAGROUP = "megagroup"
+KIND_CHAT = "chat"
+KIND_USER = "user"
+
+
+class EntityNotFound(ValueError):
+    """Ссылка не разрешается (нет такого username, приватный канал, битый инвайт) — закэшировано."""
+
+
+def normalize_link(link: str) -> str:
+    """«https://t.me/Name/123», «@name», «t.me/name» → «name»; инвайты → «+hash»."""
+    key = _LINK_PREFIX_RE.sub("", (link or "").strip()).strip("/")
+    if key.startswith("@"):
+        key = key[1:]
+    if key.lower().startswith("joinchat/"):
+        return "+" + key.split("/")[1]
+    if key.startswith("+"):
+        return key.split("/")[0]
+    if key.lower().startswith("c/"):
+        return "/".join(key.split("/")[:2]).lower()
+    return key.split("/")[0].split("?")[0].lower()
+
+
+class CachedEntity:
+    __slots__ = ("key", "entity_id", "access_hash", "kind", "title", "username", "participants", "resolved_at",
+                 "error")
+
+    def __init__(self, key: str, entity_id: int = 0, access_hash: int = 0, kind: str = "", title: str = "",
+                 username: str = "", participants: int = 0, resolved_at: float = 0.0, error: str = ""):
+        self.key = key
+        self.entity_id = entity_id
+        self.access_hash = access_hash
+        self.kind = kind
+        self.title = title
+        self.username = username
+        self.participants = participants
+        self.resolved_at = resolved_at
+        self.error = error
+
+    @property
+    def is_channel(self) -> bool:
+        """Канал или супергруппа (в Telethon — тип Channel)."""
+        return self.kind in (KIND_CHANNEL, KIND_MEGAGROUP)
+
+    @property
+    def peer_id(self) -> int:
+        """Маркированный id, как telethon.utils.get_peer_id: каналы -100…, группы -…, пользователи как есть."""
+        if self.is_channel:
+            return -(10 ** 12 + self.entity_id)
+        if self.kind == KIND_CHAT:
+            return -self.entity_id
+        return self.entity_id
+
+    @property
+    def input_peer(self):
+        from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser
+
+        if self.is_channel:
+            return InputPeerChannel(self.entity_id, self.access_hash)
+        if self.kind == KIND_CHAT:
+            return InputPeerChat(self.entity_id)
+        return InputPeerUser(self.entity_id, self.access_hash)
+
+
+def _describe(entity) -> Tuple[str, str]:
+    """(тип, заголовок) для Channel / Chat / User."""
+    from telethon.tl.types import Channel, Chat
+
+    if isinstance(entity, Channel):
+        return (KIND_MEGAGROUP if getattr(entity, "megagroup", False) else KIND_CHANNEL), entity.title or ""
+    if isinstance(entity, Chat):
+        return KIND_CHAT, entity.title or ""
+    name = " ".join(filter(None, [getattr(entity, "first_name", None), getattr(entity, "last_name", None)]))
+    return KIND_USER, name
+
+
+class EntityCache:
+    """SQLite-кэш username/ссылка → сущность Telethon, с TTL и отрицательным кэшированием."""
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or ENTITY_CACHE_DB_PATH
+        self._entries: Dict[Tuple[str, str], CachedEntity] = {}
+        self.conn: Optional[sqlite3.Connection] = None
+
+    def _open(self) -> sqlite3.Connection:
+        if self.conn is not None:
+            return self.conn
+        dir_name = os.path.dirname(self.db_path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=30.0)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entity_cache (
+                account TEXT NOT NULL,
+                key TEXT NOT NULL,
+                entity_id INTEGER NOT NULL DEFAULT 0,
+                access_hash INTEGER NOT NULL DEFAULT 0,
+                kind TEXT NOT NULL DEFAULT '',
+                title TEXT NOT NULL DEFAULT '',
+                username TEXT NOT NULL DEFAULT '',
+                participants INTEGER NOT NULL DEFAULT 0,
+                resolved_at REAL NOT NULL,
+                error TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (account, key)
+            ) WITHOUT ROWID
+        """)
+        # Давно не обновлявшиеся записи не нужны даже как запасные
+        horizon = time.time() - max(ENTITY_CACHE_TTL_HOURS, ENTITY_CACHE_NEGATIVE_HOURS) * 3600 * 4
+        self.conn.execute("DELETE FROM entity_cache WHERE resolved_at < ?", (horizon,))
+        self.conn.commit()
+        for row in self.conn.execute(
+            "SELECT account, key, entity_id, access_hash, kind, title, username, participants, resolved_at, error "
+            "FROM entity_cache"
+        ):
+            self._entries[(row[0], row[1])] = CachedEntity(*row[1:])
+        if self._entries:
+            logger.info(f"🗂 Кэш сущностей Telethon: загружено {len(self._entries)} записей")
+        return self.conn
+
+    # ── Чтение ─────────────────────────────────────────────────────────────────
+
+    def peek(self, account: str, link: str) -> Optional[CachedEntity]:
+        """Запись как есть (может быть устаревшей); None — не разрешали."""
+        self._open()
+        return self._entries.get((account, normalize_link(link)))
+
+    def get(self, account: str, link: str) -> Optional[CachedEntity]:
+        """Свежая запись (положительная или отрицательная) либо None."""
+        entry = self.peek(account, link)
+        return entry if entry is not None and not self._expired(entry) else None
+
+    @staticmethod
+    def _expired(entry: CachedEntity) -> bool:
+        ttl = ENTITY_CACHE_NEGATIVE_HOURS if entry.error else ENTITY_CACHE_TTL_HOURS
+        return time.time() - entry.resolved_at > ttl * 3600
+
+    async def resolve(self, client, link: str, account: str) -> CachedEntity:
+        """
+        Разрешить ссылку через кэш; в сеть — только при промахе или истёкшем TTL.
+
+        Отрицательная запись → EntityNotFound; FloodWait и прочие ошибки сети пробрасываются
+        (при истёкшем TTL вместо них возвращается старая положительная запись).
+        """
+        from telethon import errors
+
+        not_found_errors = (
+            errors.UsernameInvalidError, errors.UsernameNotOccupiedError, errors.ChannelPrivateError,
+            errors.ChannelInvalidError, errors.InviteHashInvalidError, errors.InviteHashExpiredError,
+        )
+        key = normalize_link(link)
+        entry = self.peek(account, key)
+        if entry is not None and not self._expired(entry):
+            if entry.error:
+                ENTITY_CACHE_EVENTS.inc(result="negative")
+                raise EntityNotFound(f"{link}: {entry.error}")
+            ENTITY_CACHE_EVENTS.inc(result="hit")
+            return entry
+
+        stale = entry if entry is not None and not entry.error else None
+        try:
+            entity = await client.get_entity(key if not key.startswith("+") else f"https://t.me/{key}")
+        except errors.FloodWaitError:
+            raise
+        except not_found_errors as e:
+            return self._store_negative(account, key, link, type(e).__name__)
+        except ValueError as e:
+            # Telethon: «No user has "x" as username», «Cannot find any entity corresponding to…»
+            return self._store_negative(account, key, link, str(e)[:200])
+        except Exception:
+            if stale is not None:
+                ENTITY_CACHE_EVENTS.inc(result="stale")
+                return stale
+            raise
+        ENTITY_CACHE_EVENTS.inc(result="refresh" if entry is not None else "miss")
+        return self.remember(account, entity, key)
+
+    # ── Запись ─────────────────────────────────────────────────────────────────
+
+    def remember(self, account: str, entity, link: str = None) -> CachedEntity:
+        """Положить сущность в кэш (после get_entity или из готового ответа API, например поиска)."""
+        kind, title = _describe(entity)
+        username = getattr(entity, "username", None) or ""
+        key = normalize_link(link) if link else username.lower()
+        entry = CachedEntity(
+            key, entity.id, getattr(entity, "access_hash", None) or 0, kind, title, username,
+            getattr(entity, "participants_count", None) or 0, time.time(),
+        )
+        if key:
+            self._save(account, entry)
+        return entry
+
+    def _store_negative(self, account: str, key: str, link: str, error: str) -> CachedEntity:
+        ENTITY_CACHE_EVENTS.inc(result="miss")
+        self._save(account, CachedEntity(key, resolved_at=time.time(), error=error or "not found"))
+        logger.debug(f"🗂 Кэш сущностей: {link} не разрешается ({error}), запомнил на {ENTITY_CACHE_NEGATIVE_HOURS:g} ч")
+        raise EntityNotFound(f"{link}: {error}")
+
+    def invalidate(self, account: str, link: str) -> None:
+        """Сбросить запись, если сервер отверг построенный по ней InputPeer."""
+        self._open()
+        key = normalize_link(link)
+        if self._entries.pop((account, key), None) is None:
+            return
+        ENTITY_CACHE_EVENTS.inc(result="invalid")
+        try:
+            self.conn.execute("DELETE FROM entity_cache WHERE account = ? AND key = ?", (account, key))
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Кэш сущностей: не удалось удалить {key}: {e}")
+
+    def _save(self, account: str, entry: CachedEntity) -> None:
+        conn = self._open()
+        self._entries[(account, entry.key)] = entry
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO entity_cache (account, key, entity_id, access_hash, kind, title, username, "
+                "participants, resolved_at, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (account, entry.key, entry.entity_id, entry.access_hash, entry.kind, entry.title, entry.username,
+                 entry.participants, entry.resolved_at, entry.error),
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Кэш сущностей: не удалось сохранить {entry.key}: {e}")
+
+
+entity_cache = EntityCache()
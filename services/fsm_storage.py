@@ -0,0 +1,126 @@
+"""
+services/fsm_storage.py — хранилище состояний FSM aiogram в SQLite.
+
+MemoryStorage живёт в памяти одного процесса: при нескольких процессах webhook
+(services/webhook.py) следующий апдейт диалога может попасть в другой процесс и не
+увидеть состояние, а при перезапуске все незаконченные диалоги теряются.
+FSM_STORAGE=sqlite хранит состояние и данные в FSM_DB_PATH (WAL), общем для всех
+процессов; записи, не менявшиеся FSM_TTL_DAYS, удаляются при старте. Запросы идут через
+asyncio.to_thread: при записи другого процесса SQLite ждёт блокировку до 30 с, и цикл
+событий в это время не стоит.
+FSM_STORAGE=memory (по умолчанию) — MemoryStorage, как раньше.
+"""
+import asyncio
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+
+logger = logging.getLogger(__name__)
+
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory").lower()
+FSM_DB_PATH = os.getenv("FSM_DB_PATH", "fsm_storage.db")
+FSM_TTL_DAYS = float(os.getenv("FSM_TTL_DAYS", "7"))
+
+
+def _key(key: StorageKey) -> str:
+    parts = [key.bot_id, key.chat_id, key.user_id, key.thread_id or "",
+             getattr(key, "business_connection_id", None) or "", key.destiny]
+    return ":".join(str(part) for part in parts)
+
+
+class SqliteStorage(BaseStorage):
+    """
+    Состояние — строкой, данные — pickle (в FSM кладут и не-JSON значения).
+
+    Соединение общее для потоков to_thread, запросы по очереди под _lock.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or FSM_DB_PATH
+        self.conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        if self.conn is not None:
+            return self.conn
+        dir_name = os.path.dirname(self.db_path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS fsm (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data BLOB,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        expired = self.conn.execute(
+            "DELETE FROM fsm WHERE updated_at < ?", (time.time() - FSM_TTL_DAYS * 86400,),
+        ).rowcount
+        if expired:
+            logger.info(f"🗂 FSM: удалено {expired} устаревших состояний")
+        return self.conn
+
+    def _write(self, sql: str, params: tuple) -> None:
+        with self._lock:
+            self._open().execute(sql, params)
+
+    def _read(self, sql: str, params: tuple) -> Optional[tuple]:
+        with self._lock:
+            return self._open().execute(sql, params).fetchone()
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await asyncio.to_thread(
+            self._write,
+            "INSERT INTO fsm (key, state, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+            (_key(key), value, time.time()),
+        )
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await asyncio.to_thread(self._read, "SELECT state FROM fsm WHERE key = ?", (_key(key),))
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        blob = pickle.dumps(dict(data), protocol=pickle.HIGHEST_PROTOCOL) if data else None
+        await asyncio.to_thread(
+            self._write,
+            "INSERT INTO fsm (key, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (_key(key), blob, time.time()),
+        )
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await asyncio.to_thread(self._read, "SELECT data FROM fsm WHERE key = ?", (_key(key),))
+        if not row or row[0] is None:
+            return {}
+        try:
+            return pickle.loads(row[0])
+        except Exception as e:
+            logger.warning(f"⚠️ FSM: не удалось прочитать данные {_key(key)}: {e}")
+            return {}
+
+    async def close(self) -> None:
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+def fsm_storage() -> BaseStorage:
+    """Хранилище FSM для Dispatcher по FSM_STORAGE."""
+    if FSM_STORAGE == "sqlite":
+        return SqliteStorage()
+    from aiogram.fsm.storage.memory import MemoryStorage
+    return MemoryStorage()
@@ -6,8 +6,14 @@ import asyncio
 import base64
 from typing import Optional, Dict, Any
 
+from monitoring.metrics import IMAGE_SECONDS, instrument_methods
+
 logger = logging.getLogger(__name__)
 
+# Интервал опроса асинхронной операции Yandex Art (для мока можно уменьшить)
+YANDEX_ART_POLL_INTERVAL = float(os.getenv("YANDEX_ART_POLL_INTERVAL", "2"))
+
+@instrument_methods(IMAGE_SECONDS, provider="yandex_art")
 class YandexArtClient:
     """Яндекс АРТ для генерации изображений"""
     def __init__(self, api_key: str, folder_id: str):
@@ -20,7 +26,8 @@ class YandexArtClient:
 
     async def generate(self, prompt: str) -> Optional[str]:
         """Генерация изображения, возвращает base64"""
-        url = "https://llm.api.cloud.yandex.net/foundationModels/v1/imageGenerationAsync"
+        op_base = os.getenv("YANDEX_LLM_URL", "https://llm.api.cloud.yandex.net").rstrip("/")
+        url = f"{op_base}/foundationModels/v1/imageGenerationAsync"
         payload = {
             "modelUri": f"art://{self.folder_id}/yandex-art/latest",
             "generationOptions": {
@@ -42,9 +49,8 @@ class YandexArtClient:
                     if not op_id: return None
                     
                     # Ожидание результата
-                    op_base = "https://llm.api.cloud.yandex.net"
                     for _ in range(30):
-                        await asyncio.sleep(2)
+                        await asyncio.sleep(YANDEX_ART_POLL_INTERVAL)
                         async with session.get(f"{op_base}/operations/{op_id}", headers=self.headers) as check:
                             res = await check.json()
                             if res.get("done"):
@@ -54,11 +60,12 @@ class YandexArtClient:
             logger.error(f"YandexArt exception: {e}")
             return None
 
+@instrument_methods(IMAGE_SECONDS, provider="routerai")
 class RouterAIClient:
     """RouterAI для текстов и изображений (Gemini/Claude)"""
     def __init__(self, api_key: str):
         self.api_key = api_key
-        self.base_url = "https://router.ai/api/v1" # Пример URL, уточнить если другой
+        self.base_url = os.getenv("ROUTER_AI_IMAGE_BASE_URL", "https://router.ai/api/v1")  # Пример URL, уточнить если другой
         self.headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
@@ -86,6 +93,7 @@ class RouterAIClient:
             logger.error(f"RouterAI Image exception: {e}")
             return None
 
+@instrument_methods(IMAGE_SECONDS, provider="agent")
 class ImageAgent:
     """Централизованный агент генерации изображений"""
     def __init__(self):
@@ -149,8 +157,17 @@ import base64
 import asyncio
 from typing import Optional
 
+from monitoring.metrics import IMAGE_SECONDS, instrument_methods
+
 logger = logging.getLogger(__name__)
 
+# Хосты переопределяются для локального мока (scripts/ai_mock_server.py)
+YANDEX_LLM_URL = os.getenv("YANDEX_LLM_URL", "https://llm.api.cloud.yandex.net").rstrip("/")
+ROUTER_AI_IMAGE_ENDPOINT = os.getenv("ROUTER_AI_IMAGE_ENDPOINT", "https://openrouter.ai/api/v1/images/generations")
+YANDEX_ART_POLL_INTERVAL = float(os.getenv("YANDEX_ART_POLL_INTERVAL", "2"))
+
+# _generate_yandex / _generate_router тоже меряем — это и есть разбивка по провайдерам
+@instrument_methods(IMAGE_SECONDS, include_private=True, provider="image_generator")
 class ImageGenerator:
     """Генерация обложек через Yandex Art или Router AI (fallback)"""
     
@@ -208,7 +225,7 @@ class ImageGenerator:
     async def _generate_yandex(self, prompt: str) -> Optional[bytes]:
         """Генерация через Yandex Art"""
         try:
-            url = "https://llm.api.cloud.yandex.net/foundationModels/v1/imageGenerationAsync"
+            url = f"{YANDEX_LLM_URL}/foundationModels/v1/imageGenerationAsync"
             
             headers = {
                 "Authorization": f"Api-Key {self.yandex_key}",
@@ -260,7 +277,7 @@ class ImageGenerator:
     
     async def _get_yandex_result(self, session, operation_id: str, headers: dict, max_attempts: int = 30) -> Optional[bytes]:
         """Получение результата генерации"""
-        url = f"https://llm.api.cloud.yandex.net/operations/{operation_id}"
+        url = f"{YANDEX_LLM_URL}/operations/{operation_id}"
         
         for attempt in range(max_attempts):
             try:
@@ -278,11 +295,11 @@ class ImageGenerator:
                             return None
                     
                     # Ждем перед следующей попыткой
-                    await asyncio.sleep(2)
+                    await asyncio.sleep(YANDEX_ART_POLL_INTERVAL)
                     
             except Exception as e:
                 logger.error(f"Yandex Art polling error: {e}")
-                await asyncio.sleep(2)
+                await asyncio.sleep(YANDEX_ART_POLL_INTERVAL)
         
         logger.error("Yandex Art: timeout waiting for result")
         return None
@@ -294,7 +311,7 @@ class ImageGenerator:
         """
         try:
             # OpenRouter / Router AI images endpoint
-            url = "https://openrouter.ai/api/v1/images/generations"
+            url = ROUTER_AI_IMAGE_ENDPOINT
             
             headers = {
                 "Authorization": f"Bearer {self.router_key}",
@@ -0,0 +1,185 @@
+"""
+Координатор задач APScheduler: single-flight, коалесцирование, бюджеты времени, история запусков.
+
+Все периодические задачи main.py регистрируются через job_coordinator.add_job():
+  - single-flight: задача с тем же name не стартует, пока идёт предыдущий запуск
+    (даже если одна и та же функция зарегистрирована несколькими триггерами);
+  - пропущенные запуски схлопываются (coalesce=True, max_instances=1, misfire_grace_time);
+  - бюджет времени: при превышении — предупреждение в лог ещё во время работы,
+    итог запуска помечается over_budget (задачу не прерываем — hunt может быть посреди записи в БД);
+    для задач из PROFILE_ON_BUDGET_JOBS автоматически снимается профиль;
+  - история (старт, конец, длительность, итог, ошибка) пишется в SQLite (job_runs)
+    и видна в админ-панели (/jobs).
+"""
+import asyncio
+import logging
+import os
+import time
+import traceback
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд APScheduler ещё может запустить опоздавшую задачу (дальше — схлопывается)
+DEFAULT_MISFIRE_GRACE = 300
+# Задачи, для которых при выходе за бюджет автоматически снимается профиль (monitoring/profiler.py)
+PROFILE_ON_BUDGET_JOBS = {n.strip() for n in os.getenv("PROFILE_ON_BUDGET_JOBS", "hunt").split(",") if n.strip()}
+
+
+class JobCoordinator:
+    """Обёртка над задачами планировщика с блокировками и историей запусков."""
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._budgets: Dict[str, Optional[float]] = {}
+        # name -> время старта текущего запуска (monotonic) и datetime для отображения
+        self._running: Dict[str, tuple] = {}
+        self.skipped: Dict[str, int] = {}
+        self._job_counts: Dict[str, int] = {}
+
+    def _lock(self, name: str) -> asyncio.Lock:
+        if name not in self._locks:
+            self._locks[name] = asyncio.Lock()
+        return self._locks[name]
+
+    def running(self) -> Dict[str, Dict[str, Any]]:
+        """Текущие запуски: name -> {started_at, elapsed, budget}."""
+        now = time.monotonic()
+        return {
+            name: {"started_at": started_at, "elapsed": now - t0, "budget": self._budgets.get(name)}
+            for name, (t0, started_at) in self._running.items()
+        }
+
+    def wrap(
+        self,
+        name: str,
+        func: Callable[..., Awaitable[Any]],
+        budget_seconds: Optional[float] = None,
+    ) -> Callable[..., Awaitable[Any]]:
+        """Вернуть корутину-обёртку с single-flight блокировкой, бюджетом и записью в job_runs."""
+        self._budgets[name] = budget_seconds
+
+        async def runner(*args, **kwargs):
+            return await self.run(name, func, *args, **kwargs)
+
+        runner.__name__ = f"coordinated_{name}"
+        return runner
+
+    async def run(self, name: str, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Выполнить задачу под координатором (можно вызывать и вручную, например из /hunt)."""
+        lock = self._lock(name)
+        if lock.locked():
+            self.skipped[name] = self.skipped.get(name, 0) + 1
+            elapsed = time.monotonic() - self._running[name][0] if name in self._running else 0
+            logger.warning(f"⏭️ Задача {name} уже выполняется ({elapsed:.0f} с) — запуск пропущен")
+            await self._record(name, datetime.now(), 0.0, "skipped", None)
+            return None
+
+        async with lock:
+            started_at = datetime.now()
+            t0 = time.monotonic()
+            self._running[name] = (t0, started_at)
+            budget = self._budgets.get(name)
+            watchdog = asyncio.create_task(self._watch_budget(name, budget)) if budget else None
+            outcome, error, result = "ok", None, None
+            try:
+                result = await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            except Exception as e:
+                outcome = "error"
+                error = f"{type(e).__name__}: {e}"
+                logger.error(f"❌ Задача {name} завершилась с ошибкой: {e}\n{traceback.format_exc()}")
+            finally:
+                if watchdog:
+                    watchdog.cancel()
+                duration = time.monotonic() - t0
+                self._running.pop(name, None)
+                if outcome == "ok" and budget and duration > budget:
+                    outcome = "over_budget"
+                await self._record(name, started_at, duration, outcome, error)
+                logger.info(f"🧭 Задача {name}: {outcome} за {duration:.1f} с")
+            return result
+
+    async def _watch_budget(self, name: str, budget: float) -> None:
+        await asyncio.sleep(budget)
+        logger.warning(f"🐢 Задача {name} превысила бюджет {budget:.0f} с и всё ещё выполняется")
+        if name in PROFILE_ON_BUDGET_JOBS:
+            from monitoring.profiler import profiler
+            if profiler.auto_trigger(f"{name} дольше {budget:.0f} с"):
+                logger.info(f"🔬 Задача {name}: снимаю профиль, отчёт — в топик «Логи»")
+
+    async def _record(self, name: str, started_at: datetime, duration: float, outcome: str, error: Optional[str]) -> None:
+        try:
+            await db.add_job_run(name, started_at, duration, outcome, error)
+        except Exception as e:
+            logger.debug(f"Не удалось записать историю задачи {name}: {e}")
+
+    def add_job(
+        self,
+        scheduler,
+        func: Callable[..., Awaitable[Any]],
+        trigger: str,
+        name: Optional[str] = None,
+        budget_seconds: Optional[float] = None,
+        **trigger_args,
+    ):
+        """
+        scheduler.add_job() с координатором: single-flight по name, coalesce, max_instances=1.
+
+        Несколько триггеров одной задачи (interval + cron) регистрируются с одним name —
+        блокировка общая, у каждого триггера свой id.
+        """
+        name = name or getattr(func, "__name__", "job")
+        trigger_args.setdefault("coalesce", True)
+        trigger_args.setdefault("max_instances", 1)
+        trigger_args.setdefault("misfire_grace_time", DEFAULT_MISFIRE_GRACE)
+        trigger_args.setdefault("replace_existing", True)
+        if "id" not in trigger_args:
+            index = self._job_counts.get(name, 0)
+            self._job_counts[name] = index + 1
+            trigger_args["id"] = f"{name}:{trigger}:{index}"
+        return scheduler.add_job(self.wrap(name, func, budget_seconds), trigger, **trigger_args)
+
+    async def format_report(self, limit: int = 15) -> str:
+        """Текст для админ-панели: что выполняется сейчас, сводка и последние запуски."""
+        lines = ["🧭 <b>Задачи планировщика</b>", ""]
+        running = self.running()
+        if running:
+            lines.append("▶️ <b>Сейчас выполняются:</b>")
+            for name, info in running.items():
+                budget = info["budget"]
+                slow = " 🐢" if budget and info["elapsed"] > budget else ""
+                lines.append(f"• {name}: {info['elapsed']:.0f} с{f' / бюджет {budget:.0f} с' if budget else ''}{slow}")
+            lines.append("")
+
+        stats = await db.get_job_stats(since_hours=24)
+        if stats:
+            lines.append("📊 <b>За 24 часа:</b>")
+            for row in stats:
+                lines.append(
+                    f"• {row['job_name']}: {row['runs']} зап., ср. {row['avg_duration'] or 0:.1f} с, "
+                    f"макс. {row['max_duration'] or 0:.1f} с, ошибок {row['errors']}, "
+                    f"медленных {row['slow']}, пропущено {row['skipped']}"
+                )
+            lines.append("")
+
+        runs = await db.get_job_runs(limit=limit)
+        if runs:
+            lines.append("🕘 <b>Последние запуски:</b>")
+            icons = {"ok": "✅", "error": "❌", "over_budget": "🐢", "skipped": "⏭️", "cancelled": "⛔"}
+            for run in runs:
+                started = str(run.get("started_at") or "")[:19]
+                lines.append(
+                    f"{icons.get(run['outcome'], '•')} {started} {run['job_name']} — {run['duration_sec'] or 0:.1f} с"
+                )
+        if len(lines) == 2:
+            lines.append("Запусков пока не было.")
+        return "\n".join(lines)
+
+
+job_coordinator = JobCoordinator()
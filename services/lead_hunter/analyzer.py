@@ -2,6 +2,7 @@ import logging
 import os
 import re
 from utils import router_ai
+from monitoring.metrics import STAGE_SECONDS, timed
 
 logger = logging.getLogger(__name__)
 
@@ -182,6 +183,7 @@ class LeadAnalyzer:
     def __init__(self):
         self.kb_path = "knowledge_base/sales/hunter_manual.md"
 
+    @timed(STAGE_SECONDS, stage="analyze_post", source="all")
     async def analyze_post(self, text: str, source_name: str = "") -> dict:
         """
         Анализирует пост, сверяясь с базой знаний продаж.
@@ -303,11 +303,10 @@ class Discovery:
         Returns:
             Список словарей с полями: link, title, type='telegram', participants_count
         """
-        from telethon import TelegramClient
         from telethon.tl.types import Channel, Chat
         from telethon.tl.functions.messages import SearchGlobalRequest
         from telethon.tl.types import InputMessagesFilterEmpty
-        from config import API_ID, API_HASH
+        from services.session_pool import session_pool
         
         kws = keywords or self.keywords[:10]  # Ограничиваем до 10 запросов за раз
         found_channels = []
@@ -327,16 +326,12 @@ class Discovery:
         search_keywords.extend([kw for kw in kws if kw not in search_keywords])
         search_keywords = search_keywords[:10]  # Максимум 10 запросов
         
-        # ── ИСПРАВЛЕНИЕ: Используем тот же session name, что и в scout_parser ──────
-        # Это позволяет использовать существующий файл сессии 'anton_parser.session'
-        # вместо создания нового клиента, который не видит сессию
-        client = TelegramClient('anton_parser', API_ID, API_HASH)
-        
+        # Запросы идут через пул Telethon-сессий (services/session_pool.py): каждое ключевое
+        # слово — на свою сессию по хэшу, при FloodWait запрос уходит на следующую
         try:
-            await client.connect()
-            if not await client.is_user_authorized():
-                logger.warning("⚠️ Telethon не авторизован (файл сессии 'anton_parser.session' не найден или устарел)")
-                logger.info("💡 Убедитесь, что scout_parser.py успешно авторизован в Telethon")
+            if not await session_pool.start():
+                logger.warning("⚠️ Нет авторизованных Telethon-сессий (TELETHON_SESSIONS) для глобального поиска")
+                logger.info("💡 Авторизуйте сессию: python session_manager.py")
                 return []
             
             for keyword in search_keywords:
@@ -344,7 +339,7 @@ class Discovery:
                     # Глобальный поиск по ключевому слову
                     results = None
                     try:
-                        results = await client(SearchGlobalRequest(
+                        request = SearchGlobalRequest(
                             q=keyword,
                             filter=InputMessagesFilterEmpty(),
                             min_date=None,
@@ -353,7 +348,8 @@ class Discovery:
                             offset_peer=None,
                             offset_id=0,
                             limit=20  # Максимум 20 результатов на запрос
-                        ))
+                        )
+                        results = await session_pool.run(f"search:{keyword}", lambda client: client(request))
                     except TypeError as te:
                         # Обработка ошибки "Cannot cast NoneType"
                         if "NoneType" in str(te) or "cast" in str(te).lower():
@@ -440,11 +436,6 @@ class Discovery:
             
         except Exception as e:
             logger.error(f"❌ Ошибка при подключении к Telethon для global_telegram_search: {e}")
-        finally:
-            try:
-                await client.disconnect()
-            except Exception:
-                pass
         
         logger.info(f"🔍 Global Telegram Search: найдено {len(found_channels)} новых каналов")
         
@@ -469,19 +460,15 @@ class Discovery:
         Returns:
             Список словарей с полями: link, title, type='telegram', participants_count
         """
-        from telethon import TelegramClient
         from telethon.tl.functions.messages import SearchRequest
         from telethon.tl.types import MessageEntityUrl, MessageEntityTextUrl
-        from telethon.tl.types import Channel, Chat
-        from config import API_ID, API_HASH
+        from services.session_pool import session_pool
         import re
         
         found_channels = []
-        client = TelegramClient('anton_parser', API_ID, API_HASH)
         
         try:
-            await client.connect()
-            if not await client.is_user_authorized():
+            if not await session_pool.start():
                 logger.warning("⚠️ Telethon не авторизован для поиска в сообщениях")
                 return []
             
@@ -495,15 +482,17 @@ class Discovery:
             
             for channel_username in known_channels:
                 try:
-                    entity = await client.get_entity(channel_username)
-                    if not isinstance(entity, Channel):
+                    # access_hash сущности действует только в своей сессии — канал и поиск по нему
+                    # идут через одну и ту же закреплённую сессию; сущность берётся из кэша
+                    entity = await session_pool.resolve(channel_username)
+                    if not entity.is_channel:
                         continue
                     
                     # Ищем сообщения с ключевыми словами в этом канале
                     for keyword in keywords[:3]:  # Ограничиваем до 3 ключевых слов на канал
                         try:
-                            messages = await client(SearchRequest(
-                                peer=entity,
+                            request = SearchRequest(
+                                peer=entity.input_peer,
                                 q=keyword,
                                 filter=None,
                                 min_date=None,
@@ -514,7 +503,8 @@ class Discovery:
                                 max_id=0,
                                 min_id=0,
                                 hash=0
-                            ))
+                            )
+                            messages = await session_pool.run(channel_username, lambda client: client(request))
                             
                             if not messages or not hasattr(messages, "messages"):
                                 continue
@@ -535,15 +525,16 @@ class Discovery:
                                     
                                     try:
                                         # Пробуем получить информацию о канале по ссылке
-                                        link_entity = await client.get_entity(f"t.me/{link_username}")
+                                        # Кэш сущностей: несуществующие ссылки не разрешаются повторно
+                                        link_entity = await session_pool.resolve(link_username)
                                         
-                                        if isinstance(link_entity, Channel):
-                                            if hasattr(link_entity, "access_hash") and link_entity.access_hash:
-                                                username = getattr(link_entity, "username", None)
+                                        if link_entity.is_channel:
+                                            if link_entity.access_hash:
+                                                username = link_entity.username
                                                 if username:
                                                     link = f"https://t.me/{username}"
-                                                    title = getattr(link_entity, "title", "") or username
-                                                    participants_count = getattr(link_entity, "participants_count", 0)
+                                                    title = link_entity.title or username
+                                                    participants_count = link_entity.participants
                                                     
                                                     # Проверяем на дубликаты
                                                     if not any(c.get("link") == link for c in found_channels):
@@ -572,11 +563,6 @@ class Discovery:
             
         except Exception as e:
             logger.warning(f"⚠️ Ошибка при поиске каналов в сообщениях: {e}")
-        finally:
-            try:
-                await client.disconnect()
-            except Exception:
-                pass
         
         return found_channels
 
@@ -1,10 +1,18 @@
+import contextlib
 import io
 import logging
 import os
 from datetime import datetime
+from typing import Optional
 from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
-from aiogram.types import BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from services.lead_hunter.near_duplicates import near_dup_index, simhash
+from services.lead_hunter.pipeline import PostStream, RawLeadsFile
+from services.lead_hunter.stream import lead_stream
+from services.notifier import PRIORITY_HOT, PRIORITY_LOW, notifier
+from monitoring.metrics import LEADS_TOTAL, STAGE_SECONDS, timed
 
 <<<<<<< HEAD
 from services.lead_hunter.discovery import Discovery
@@ -83,6 +91,9 @@ POTENTIAL_LEADS_DB = os.path.join(os.path.dirname(__file__), "..", "..", "databa
 class LeadHunter:
     """Автономный поиск и привлечение клиентов (Lead Hunter)"""
 
+    # Сколько постов дала прошлая охота (None — ещё не охотились); общий для всех экземпляров
+    last_hunt_posts: Optional[int] = None
+
     def __init__(self):
 <<<<<<< HEAD
         from config import VK_TOKEN
@@ -432,6 +443,7 @@ class LeadHunter:
             }
             return fallbacks.get(pain_stage, fallbacks["ST-2"])
 
+    @timed(STAGE_SECONDS, stage="analyze_intent", source="all")
     async def _analyze_intent(self, text: str) -> dict:
         """Анализ намерения через Yandex GPT агент — возвращает структуру:
         {is_lead: bool, intent: str, hotness: int(1-5), context_summary: str, recommendation: str, pain_level: int}
@@ -694,26 +706,15 @@ class LeadHunter:
         keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_rows)
         
         try:
-            bot = _bot_for_send()
-            if bot is None:
-                bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-            try:
-                thread_id = THREAD_ID_HOT_LEADS if THREAD_ID_HOT_LEADS else None
-                await bot.send_message(
-                    LEADS_GROUP_CHAT_ID,
-                    text,
-                    reply_markup=keyboard,
-                    message_thread_id=thread_id,
-                    disable_notification=False,  # Всегда обычное уведомление для модерации
-                )
-                logger.info(f"📋 Карточка лида #{lead_id} отправлена на модерацию в админ-канал")
-                return True
-            finally:
-                if _bot_for_send() is None and getattr(bot, "session", None):
-                    try:
-                        await bot.session.close()
-                    except Exception:
-                        pass
+            await notifier.send(
+                LEADS_GROUP_CHAT_ID,
+                text,
+                reply_markup=keyboard,
+                thread_id=THREAD_ID_HOT_LEADS or None,
+                disable_notification=False,  # Всегда обычное уведомление для модерации
+            )
+            logger.info(f"📋 Карточка лида #{lead_id} поставлена в очередь на модерацию в админ-канал")
+            return True
         except Exception as e:
             logger.error(f"❌ Не удалось отправить карточку лида на модерацию: {e}")
             return False
@@ -767,27 +768,19 @@ class LeadHunter:
         
         keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_rows) if keyboard_rows else None
         try:
-            bot = _bot_for_send()
-            if bot is None:
-                bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-            try:
-                thread_id = THREAD_ID_HOT_LEADS if THREAD_ID_HOT_LEADS else None
-                await bot.send_message(
-                    LEADS_GROUP_CHAT_ID,
-                    text,
-                    reply_markup=keyboard,
-                    message_thread_id=thread_id,
-                    disable_notification=disable_notification,  # Тихие уведомления для priority_score < 8
-                )
-                if disable_notification:
-                    logger.debug(f"🔇 Тихое уведомление отправлено для лида #{lead_id} (priority_score={priority_score})")
-                return True
-            finally:
-                if _bot_for_send() is None and getattr(bot, "session", None):
-                    try:
-                        await bot.session.close()
-                    except Exception:
-                        pass
+            # Тихие карточки — низкий приоритет: при очереди склеиваются в сводку
+            await notifier.send(
+                LEADS_GROUP_CHAT_ID,
+                text,
+                reply_markup=keyboard,
+                thread_id=THREAD_ID_HOT_LEADS or None,
+                disable_notification=disable_notification,  # Тихие уведомления для priority_score < 8
+                priority=PRIORITY_LOW if disable_notification else PRIORITY_HOT,
+                digest=disable_notification,
+            )
+            if disable_notification:
+                logger.debug(f"🔇 Тихое уведомление поставлено в очередь для лида #{lead_id} (priority_score={priority_score})")
+            return True
         except Exception as e:
             logger.error("❌ Не удалось отправить карточку лида в группу: %s", e)
             return False
@@ -805,55 +798,23 @@ class LeadHunter:
             return body or "Проверка проекта на реализуемость"
         return ""
 
-    def _build_raw_leads_file(self, all_posts: list, max_entries: int = 1000) -> bytes:
-        """Собирает текстовый файл со списком лидов: источник | превью текста | ссылка."""
-        lines = [
-            "Лиды шпиона (последний скан)",
-            f"Дата: {datetime.now().strftime('%d.%m.%Y %H:%M')}",
-            f"Всего постов с ключевыми словами: {len(all_posts)}",
-            "",
-            "---",
-            "",
-        ]
-        for i, post in enumerate(all_posts[:max_entries], 1):
-            source = getattr(post, "source_name", post.source_id) if hasattr(post, "source_name") else post.source_id
-            text_preview = (post.text or "").replace("\n", " ").strip()[:400]
-            url = getattr(post, "url", "") or f"{post.source_type}/{post.source_id}/{post.post_id}"
-            lines.append(f"[{i}] {source}")
-            lines.append(f"Текст: {text_preview}")
-            lines.append(f"Ссылка: {url}")
-            lines.append("")
-        if len(all_posts) > max_entries:
-            lines.append(f"... и ещё {len(all_posts) - max_entries} лидов (обрезано).")
-        return "\n".join(lines).encode("utf-8")
-
-    async def _send_raw_leads_file_to_group(self, all_posts: list) -> bool:
+    async def _send_raw_leads_file_to_group(self, raw_file: RawLeadsFile) -> bool:
         """Отправляет в рабочую группу файл со списком всех лидов (источник, превью, ссылка)."""
         from config import BOT_TOKEN, LEADS_GROUP_CHAT_ID, THREAD_ID_LOGS
         if not BOT_TOKEN or not LEADS_GROUP_CHAT_ID:
             return False
         try:
-            file_bytes = self._build_raw_leads_file(all_posts)
+            file_bytes = raw_file.render()
             filename = f"scout_leads_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.txt"
-            doc = BufferedInputFile(file_bytes, filename=filename)
-            bot = _bot_for_send()
-            if bot is None:
-                bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-            try:
-                await bot.send_document(
-                    LEADS_GROUP_CHAT_ID,
-                    doc,
-                    caption=f"📎 Список лидов по скану ({len(all_posts)} постов с ключевыми словами). Источник, превью текста, ссылка.",
-                    message_thread_id=THREAD_ID_LOGS,
-                )
-                logger.info("📎 Файл со списком лидов отправлен в группу (топик Логи)")
-                return True
-            finally:
-                if _bot_for_send() is None and getattr(bot, "session", None):
-                    try:
-                        await bot.session.close()
-                    except Exception:
-                        pass
+            await notifier.send(
+                LEADS_GROUP_CHAT_ID,
+                f"📎 Список лидов по скану ({raw_file.total} постов с ключевыми словами). Источник, превью текста, ссылка.",
+                thread_id=THREAD_ID_LOGS,
+                document=file_bytes,
+                filename=filename,
+            )
+            logger.info("📎 Файл со списком лидов поставлен в очередь (топик Логи)")
+            return True
         except Exception as e:
             logger.warning("Не удалось отправить файл лидов в группу: %s", e)
             return False
@@ -875,17 +836,7 @@ class LeadHunter:
         else:
             text += f"🔗 {lead.get('url', '')}\n"
         try:
-            bot = _bot_for_send()
-            if bot is None:
-                bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-            try:
-                await bot.send_message(ADMIN_ID, text)
-            finally:
-                if _bot_for_send() is None and getattr(bot, "session", None):
-                    try:
-                        await bot.session.close()
-                    except Exception:
-                        pass
+            await notifier.send(ADMIN_ID, text)
         except Exception as e:
             logger.debug("Уведомление админу о лиде: %s", e)
 
@@ -906,17 +857,7 @@ class LeadHunter:
             f"🔗 {lead.get('url', '')}"
         )
         try:
-            bot = _bot_for_send()
-            if bot is None:
-                bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-            try:
-                await bot.send_message(ADMIN_ID, text)
-            finally:
-                if _bot_for_send() is None and getattr(bot, "session", None):
-                    try:
-                        await bot.session.close()
-                    except Exception:
-                        pass
+            await notifier.send(ADMIN_ID, text, priority=PRIORITY_HOT)
         except Exception as e:
             logger.error(f"❌ Не удалось отправить горячий лид админу: {e}")
 
@@ -946,10 +887,16 @@ class LeadHunter:
         main_db = await self._ensure_db_connected()
         
 <<<<<<< HEAD
-        # tg_posts = await self.parser.parse_telegram(db=main_db)  # Закомментировано: метод не реализован в ScoutParser
-        tg_posts = []  # Пустой список вместо Telegram постов
-        vk_posts = await self.parser.scan_vk_groups()  # Используем правильный метод без db
-        all_posts = tg_posts + vk_posts
+        # Скан идёт потоком (services/lead_hunter/pipeline.py): Telegram и VK читаются параллельно
+        # в ограниченный буфер, анализ и карточки начинаются с первых найденных постов.
+        # Чаты, на которые подписан потоковый режим, уже обрабатываются в реальном времени
+        streamed = lead_stream.subscribed_target_ids()
+        if streamed:
+            logger.info(f"⚡ Потоковый режим: {len(streamed)} чатов пропущено в пакетном опросе Telegram")
+        posts = PostStream(
+            self.parser.iter_telegram(db=main_db, skip_ids=streamed),
+            self.parser.iter_vk(db=main_db),  # БД — для загрузки групп из target_resources
+        )
 
         # Запуск Discovery для поиска новых VK групп
         try:
@@ -978,17 +925,10 @@ class LeadHunter:
         except Exception as e:
             logger.warning(f"Scout Discovery error: {e}")
 
-        # Дополнительная проверка на DIY-фразы (фрагмент из hunter_standalone)
-        for post in all_posts:
-            t_lower = (post.text or "").lower()
-            if any(p in t_lower for p in LEAD_PHRASES):
-                # Если найдена DIY-фраза, помечаем пост как потенциально горячий для анализатора
-                if not hasattr(post, "_diy_boost"):
-                    setattr(post, "_diy_boost", True)
-
-        # Если лидов не найдено, пробуем найти новые источники через Discovery
-        if not all_posts:
-            logger.info("🔎 Лидов не найдено. Запуск Discovery для поиска новых источников...")
+        # Прошлая охота ничего не нашла — до скана ищем новые источники через Discovery
+        # (скан ещё не начат, поэтому добавленные ресурсы войдут уже в эту охоту)
+        if LeadHunter.last_hunt_posts == 0:
+            logger.info("🔎 В прошлой охоте лидов не найдено. Запуск Discovery для поиска новых источников...")
             # Поиск новых Telegram каналов (или любых строковых источников)
             raw_sources = await self.discovery.find_new_sources()
             # Преобразуем возвращённый список строк в словари, чтобы цикл ниже работал с единым форматом
@@ -999,13 +939,22 @@ class LeadHunter:
                 else:
                     new_sources.append(item)
 =======
-        tg_posts = await self.parser.parse_telegram(db=main_db)
-        vk_posts = await self.parser.parse_vk(db=main_db)  # Передаём БД для загрузки групп из target_resources
-        all_posts = tg_posts + vk_posts
+        # Скан идёт потоком (services/lead_hunter/pipeline.py): Telegram и VK читаются параллельно
+        # в ограниченный буфер, анализ и карточки начинаются с первых найденных постов
+        # Чаты, на которые подписан потоковый режим, уже обрабатываются в реальном времени;
+        # остальные (сущность не получена, поток не запущен) читаем пакетно
+        streamed = lead_stream.subscribed_target_ids()
+        if streamed:
+            logger.info(f"⚡ Потоковый режим: {len(streamed)} чатов пропущено в пакетном опросе Telegram")
+        posts = PostStream(
+            self.parser.iter_telegram(db=main_db, skip_ids=streamed),
+            self.parser.iter_vk(db=main_db),  # БД — для загрузки групп из target_resources
+        )
 
-        # Если лидов не найдено, пробуем найти новые источники через Discovery
-        if not all_posts:
-            logger.info("🔎 Лидов не найдено. Запуск Discovery для поиска новых источников...")
+        # Прошлая охота ничего не нашла — до скана ищем новые источники через Discovery
+        # (скан ещё не начат, поэтому добавленные ресурсы войдут уже в эту охоту)
+        if LeadHunter.last_hunt_posts == 0:
+            logger.info("🔎 В прошлой охоте лидов не найдено. Запуск Discovery для поиска новых источников...")
             # Поиск новых Telegram каналов
             new_sources = await self.discovery.find_new_sources()
 >>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
@@ -1081,23 +1030,11 @@ class LeadHunter:
         # ── ИНКРЕМЕНТАЛЬНЫЙ ПОИСК: Используем last_post_id из БД ────────────────────
         # Логика skip_count удалена — теперь используется инкрементальный поиск через last_post_id
         # в scout_parser.py. SPY_SKIP_OLD_MESSAGES используется только для первого запуска.
-        remaining = all_posts
-
-        # Переключиться на приоритетные чаты (ЖК Династия, Зиларт) — перемещаем их в начало
-        preferred_names = [n.lower() for n in os.getenv("SPY_PREFERRED_CHATS", "Династия,Зиларт").split(",") if n.strip()]
-        def is_preferred(p):
-            name = (getattr(p, "source_name", "") or "").lower()
-            return any(pref in name for pref in preferred_names)
-        preferred = [p for p in remaining if is_preferred(p)]
-        others = [p for p in remaining if not is_preferred(p)]
-        all_posts = preferred + others
-
-        tg_ok = [r for r in (self.parser.last_scan_report or []) if r.get("type") == "telegram" and r.get("status") == "ok"]
-        vk_ok = [r for r in (self.parser.last_scan_report or []) if r.get("type") == "vk" and r.get("status") == "ok"]
-        logger.info(
-            "🔍 ScoutParser: просканировано TG каналов=%s, VK групп=%s, постов с ключевыми словами=%s",
-            len(tg_ok), len(vk_ok), len(all_posts)
-        )
+
+        # Приоритетные чаты (ЖК Династия, Зиларт) обгоняют остальные в буфере потока
+        posts.preferred = [n.strip().lower() for n in os.getenv("SPY_PREFERRED_CHATS", "Династия,Зиларт").split(",") if n.strip()]
+        raw_file = RawLeadsFile()
+        logger.info("🔍 ScoutParser: потоковое сканирование запущено")
 
 <<<<<<< HEAD
 =======
@@ -1105,550 +1042,576 @@ class LeadHunter:
 >>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
         # Анти-дубль: в рамках одного запуска не обрабатываем один и тот же post_id дважды
         _seen_post_keys: set[str] = set()
+        # Почти-дубли (один вопрос в нескольких ЖК, зеркало TG↔VK): SimHash до ИИ-анализа
+        await near_dup_index.load(main_db)
+        near_dup_index.prune()
+        _post_fingerprints: dict[str, Optional[int]] = {}
+        _near_dup_skipped = 0
         _business_hours = self._is_business_hours_msk()
         logger.info("🕐 Бизнес-часы МСК: %s", "да (09:00–20:00)" if _business_hours else "нет — горячие лиды не отправляются")
 
-        for post in all_posts:
-            _post_key = f"{getattr(post, 'source_type', '')}:{getattr(post, 'source_id', '')}:{getattr(post, 'post_id', '')}"
-            if _post_key in _seen_post_keys:
-                logger.debug("⏭️ Анти-дубль: post %s уже обработан в этом цикле", _post_key)
-                continue
-            _seen_post_keys.add(_post_key)
-
-            # Быстрая оценка через LeadAnalyzer (существующая ранняя логика) — ТЕПЕРЬ ВОЗВРАЩАЕТ DICT
-            # Гео-фильтрация: передаём source_name для проверки Москвы/МО
-            source_name = getattr(post, "source_name", "") or ""
-            analysis_data = await self.analyzer.analyze_post(post.text, source_name=source_name)
-            
-            # Если пост отфильтрован по гео — пропускаем
-            if analysis_data.get("geo_filtered"):
-                logger.debug("🚫 Пост отфильтрован по гео (не Москва/МО) — пропущен")
-                continue
-            
-            score = analysis_data.get("priority_score", 0) / 10.0 # Приводим к 0.0 - 1.0 для совместимости
-            pain_stage = analysis_data.get("pain_stage", "ST-1")
+        # Обработка пачками по мере сканирования: первые карточки уходят, пока дальние чаты ещё читаются.
+        # aclosing — если тело охоты упадёт, задачи-сканеры отменяются сразу, а не висят на queue.put до GC
+        async with contextlib.aclosing(posts.batches()) as batches:
+            async for batch in batches:
+                _batch_lead_ids: list = []  # лиды, сохранённые в этой пачке — для карточек и сводки
+                for post in batch:
+                    raw_file.add(post)
+                    _post_key = f"{getattr(post, 'source_type', '')}:{getattr(post, 'source_id', '')}:{getattr(post, 'post_id', '')}"
+                    if _post_key in _seen_post_keys:
+                        logger.debug("⏭️ Анти-дубль: post %s уже обработан в этом цикле", _post_key)
+                        continue
+                    _seen_post_keys.add(_post_key)
+
+                    _fp = simhash(getattr(post, "text", "") or "")
+                    _near = near_dup_index.find(_fp)
+                    if _near:
+                        _orig_lead_id = _near[1]
+                        if _orig_lead_id:
+                            await near_dup_index.link_duplicate(main_db, _orig_lead_id, post)
+                        _near_dup_skipped += 1
+                        logger.debug("⏭️ Почти-дубль: %s → лид #%s", _post_key, _orig_lead_id or "—")
+                        continue
+                    near_dup_index.remember(_fp)
+                    _post_fingerprints[getattr(post, "url", "") or _post_key] = _fp
+
+                    # Быстрая оценка через LeadAnalyzer (существующая ранняя логика) — ТЕПЕРЬ ВОЗВРАЩАЕТ DICT
+                    # Гео-фильтрация: передаём source_name для проверки Москвы/МО
+                    source_name = getattr(post, "source_name", "") or ""
+                    analysis_data = await self.analyzer.analyze_post(post.text, source_name=source_name)
+
+                    # Если пост отфильтрован по гео — пропускаем
+                    if analysis_data.get("geo_filtered"):
+                        logger.debug("🚫 Пост отфильтрован по гео (не Москва/МО) — пропущен")
+                        continue
+
+                    score = analysis_data.get("priority_score", 0) / 10.0 # Приводим к 0.0 - 1.0 для совместимости
+                    pain_stage = analysis_data.get("pain_stage", "ST-1")
 <<<<<<< HEAD
-            
-            # Boost по DIY-фразам
-            if getattr(post, "_diy_boost", False):
-                pain_stage = "ST-3"
-                analysis_data["priority_score"] = max(analysis_data.get("priority_score", 0), 7)
-                analysis_data["pain_stage"] = "ST-3"
+
+                    # Boost по DIY-фразам (фрагмент из hunter_standalone)
+                    if any(p in (post.text or "").lower() for p in LEAD_PHRASES):
+                        pain_stage = "ST-3"
+                        analysis_data["priority_score"] = max(analysis_data.get("priority_score", 0), 7)
+                        analysis_data["pain_stage"] = "ST-3"
 =======
 >>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
 
-            # Глубокий анализ намерения через Yandex GPT агент (новая логика)
-            try:
-                analysis = await self._analyze_intent(post.text)
-            except Exception as e:
-                logger.debug("🔎 Анализ намерения не удался: %s", e)
-                analysis = {"is_lead": False, "intent": "", "hotness": 0, "context_summary": ""}
+                    # Глубокий анализ намерения через Yandex GPT агент (новая логика)
+                    try:
+                        analysis = await self._analyze_intent(post.text)
+                    except Exception as e:
+                        logger.debug("🔎 Анализ намерения не удался: %s", e)
+                        analysis = {"is_lead": False, "intent": "", "hotness": 0, "context_summary": ""}
 
-            # Если модель пометила как лид — сохраняем в локальную HunterDatabase, чтобы избежать дублей
-            if analysis.get("is_lead"):
+                    # Если модель пометила как лид — сохраняем в локальную HunterDatabase, чтобы избежать дублей
+                    if analysis.get("is_lead"):
 <<<<<<< HEAD
-                saved = False
-                try:
-                    lead_data = {
-                        "source_type": getattr(post, "source_type", "telegram"),
-                        "source_name": getattr(post, "source_name", ""),
-                        "url": getattr(post, "url", "") or f"{getattr(post, 'source_type', '')}/{getattr(post, 'source_id', '')}/{getattr(post, 'post_id', '')}",
-                        "text": (getattr(post, "text", "") or "")[:2000],
-                        "author_id": str(getattr(post, "author_id", "")) if getattr(post, "author_id", None) else None,
-                        "username": getattr(post, "author_name", None),
-                        "pain_stage": pain_stage,
-                        "priority_score": analysis_data.get("priority_score", 0),
-                    }
-                    
-                    # Проверяем дубликат в основной БД
-                    async with main_db.conn.cursor() as cursor:
-                        await cursor.execute("SELECT id FROM spy_leads WHERE url = ?", (lead_data["url"],))
-                        if not await cursor.fetchone():
-                            await main_db.add_spy_lead(**lead_data)
-                            saved = True
-                except Exception as e:
-                    logger.debug("Ошибка сохранения в spy_leads: %s", e)
-                    saved = False
-                    
+                        saved = False
+                        try:
+                            lead_data = {
+                                "source_type": getattr(post, "source_type", "telegram"),
+                                "source_name": getattr(post, "source_name", ""),
+                                "url": getattr(post, "url", "") or f"{getattr(post, 'source_type', '')}/{getattr(post, 'source_id', '')}/{getattr(post, 'post_id', '')}",
+                                "text": (getattr(post, "text", "") or "")[:2000],
+                                "author_id": str(getattr(post, "author_id", "")) if getattr(post, "author_id", None) else None,
+                                "username": getattr(post, "author_name", None),
+                                "pain_stage": pain_stage,
+                                "priority_score": analysis_data.get("priority_score", 0),
+                            }
+
+                            # Проверяем дубликат в основной БД
+                            async with main_db.conn.cursor() as cursor:
+                                await cursor.execute("SELECT id FROM spy_leads WHERE url = ?", (lead_data["url"],))
+                                if not await cursor.fetchone():
+                                    new_lead_id = await main_db.add_spy_lead(**lead_data)
+                                    _batch_lead_ids.append(new_lead_id)
+                                    await near_dup_index.register_lead(main_db, _fp, new_lead_id)
+                                    LEADS_TOTAL.inc(source=lead_data.get("source_type") or "unknown")
+                                    saved = True
+                        except Exception as e:
+                            logger.debug("Ошибка сохранения в spy_leads: %s", e)
+                            saved = False
+
 =======
-                try:
-                    db_path = os.path.abspath(POTENTIAL_LEADS_DB)
-                    hd = LocalHunterDatabase(db_path)
-                    await hd.connect()
-                    lead_data = {
-                        "url": getattr(post, "url", "") or f"{getattr(post, 'source_type', '')}/{getattr(post, 'source_id', '')}/{getattr(post, 'post_id', '')}",
-                        "content": (getattr(post, "text", "") or "")[:2000],
-                        "intent": analysis.get("intent", "") or "",
-                        "hotness": analysis.get("hotness", 3),
-                        "geo": analysis.get("geo", "Не указано"),
-                        "context_summary": analysis.get("context_summary", "") or "",
-                        "pain_stage": pain_stage,
-                        "priority_score": analysis_data.get("priority_score", 0),
-                    }
-                    saved = await hd.save_lead(lead_data)
-                    try:
-                        if hd.conn:
-                            await hd.conn.close()
-                    except Exception:
-                        pass
-                except Exception as e:
-                    logger.debug("Ошибка сохранения в HunterDatabase: %s", e)
-                    saved = False
+                        try:
+                            db_path = os.path.abspath(POTENTIAL_LEADS_DB)
+                            hd = LocalHunterDatabase(db_path)
+                            await hd.connect()
+                            lead_data = {
+                                "url": getattr(post, "url", "") or f"{getattr(post, 'source_type', '')}/{getattr(post, 'source_id', '')}/{getattr(post, 'post_id', '')}",
+                                "content": (getattr(post, "text", "") or "")[:2000],
+                                "intent": analysis.get("intent", "") or "",
+                                "hotness": analysis.get("hotness", 3),
+                                "geo": analysis.get("geo", "Не указано"),
+                                "context_summary": analysis.get("context_summary", "") or "",
+                                "pain_stage": pain_stage,
+                                "priority_score": analysis_data.get("priority_score", 0),
+                            }
+                            saved = await hd.save_lead(lead_data)
+                            try:
+                                if hd.conn:
+                                    await hd.conn.close()
+                            except Exception:
+                                pass
+                        except Exception as e:
+                            logger.debug("Ошибка сохранения в HunterDatabase: %s", e)
+                            saved = False
 >>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
-                # Если новый лид (сохранён) — немедленно уведомляем Юлию (Anton -> Julia)
-                if saved:
-                    try:
-                        from config import JULIA_USER_ID, BOT_TOKEN
-                        from services.lead_hunter.analyzer import _detect_priority_zhk_hot
-
-                        # ── Профиль автора ───────────────────────────────────
-                        author_id = getattr(post, "author_id", None)
-                        author_name = getattr(post, "author_name", None)
-                        src_type = getattr(post, "source_type", "telegram")
-                        if src_type == "vk" and author_id:
-                            author_link = f"https://vk.com/id{author_id}"
-                        elif author_id:
-                            author_link = f"tg://user?id={author_id}"
-                        else:
-                            author_link = None
-
-                        # ── Приоритетный ЖК ──────────────────────────────────
-                        is_zhk_hot, zhk_name = _detect_priority_zhk_hot(post.text or "")
-                        zhk_name = zhk_name or analysis_data.get("zhk_name") or analysis.get("zhk_name") or ""
-
-                        # ── Стадия боли ───────────────────────────────────────
-                        pain_stage = analysis_data.get("pain_stage") or ""
-                        pain_label = {
-                            "ST-4": "⛔ Критично",
-                            "ST-3": "🔴 Активная боль",
-                            "ST-2": "🟡 Планирование",
-                            "ST-1": "🟢 Интерес",
-                        }.get(pain_stage, "")
-
-                        # ── Генерируем проект ответа через Yandex GPT (с fallback на Router AI) ─────────
-                        sales_draft = ""
+                        # Если новый лид (сохранён) — немедленно уведомляем Юлию (Anton -> Julia)
+                        if saved:
+                            try:
+                                from config import JULIA_USER_ID, BOT_TOKEN
+                                from services.lead_hunter.analyzer import _detect_priority_zhk_hot
+
+                                # ── Профиль автора ───────────────────────────────────
+                                author_id = getattr(post, "author_id", None)
+                                author_name = getattr(post, "author_name", None)
+                                src_type = getattr(post, "source_type", "telegram")
+                                if src_type == "vk" and author_id:
+                                    author_link = f"https://vk.com/id{author_id}"
+                                elif author_id:
+                                    author_link = f"tg://user?id={author_id}"
+                                else:
+                                    author_link = None
+
+                                # ── Приоритетный ЖК ──────────────────────────────────
+                                is_zhk_hot, zhk_name = _detect_priority_zhk_hot(post.text or "")
+                                zhk_name = zhk_name or analysis_data.get("zhk_name") or analysis.get("zhk_name") or ""
+
+                                # ── Стадия боли ───────────────────────────────────────
+                                pain_stage = analysis_data.get("pain_stage") or ""
+                                pain_label = {
+                                    "ST-4": "⛔ Критично",
+                                    "ST-3": "🔴 Активная боль",
+                                    "ST-2": "🟡 Планирование",
+                                    "ST-1": "🟢 Интерес",
+                                }.get(pain_stage, "")
+
+                                # ── Генерируем проект ответа через Yandex GPT (с fallback на Router AI) ─────────
+                                sales_draft = ""
 <<<<<<< HEAD
-                        res = None  # инициализация до try/except
+                                res = None  # инициализация до try/except
 =======
 >>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
-                        try:
-                            # Получаем данные о приоритете и платформе из target ресурса
-                            is_priority_zhk = False
-                            source_platform = "telegram"
-                            if res:
-                                is_priority_zhk = res.get("is_high_priority", 0) == 1
-                                source_platform = res.get("platform") or res.get("type") or "telegram"
-                            
-                            sales_draft = await self._generate_sales_reply(
-                                post_text=post.text or "",
-                                pain_stage=pain_stage or "ST-2",
-                                zhk_name=zhk_name,
-                                intent=analysis.get("intent", ""),
-                                context_summary=analysis.get("context_summary", ""),
-                                platform=source_platform,
-                                is_priority_zhk=is_priority_zhk,
-                            )
-                        except Exception as draft_err:
-                            logger.debug("Не удалось сгенерировать проект ответа: %s", draft_err)
-
-                        # ── Строим карточку лида ──────────────────────────────
-                        if is_zhk_hot or zhk_name:
-                            header = f"🚨 <b>ГОРЯЧИЙ ЛИД — ЖК {zhk_name.title()}</b>"
-                        else:
-                            header = "🔥 <b>Новый лид</b>"
-
-                        lines = [
-                            header,
-                            "",
-                            f"🎯 {analysis.get('intent', '—')}",
-                            f"📍 ЖК/Гео: {analysis.get('geo', getattr(post, 'source_name', '—'))}",
-                            f"📝 Суть: {analysis.get('context_summary', '—')}",
-                        ]
-                        if pain_label:
-                            lines.append(f"🩺 Стадия: {pain_label} ({pain_stage})")
-                        if author_link:
-                            if src_type == "telegram":
-                                lines.append(f"👤 Автор: <code>{author_link}</code>")
-                            else:
-                                lines.append(f'👤 Автор: <a href="{author_link}">{author_name or "профиль"}</a>')
-                        elif author_name:
-                            lines.append(f"👤 Автор: @{author_name}")
-                        lines.append(f"🔗 Пост: {lead_data.get('url', '—')}")
-
-                        # ── Блок с проектом ответа (жмёшь → копируешь) ───────
-                        if sales_draft:
-                            lines += [
-                                "",
-                                "─" * 22,
-                                "✍️ <b>Проект ответа (Антон):</b>",
-                                f"<code>{sales_draft}</code>",
-                                "─" * 22,
-                            ]
-
-                        card_text = "\n".join(lines)
-
-                        # ── Кнопки: Написать автору + Открыть пост ────────────
-                        buttons_row = []
-                        if author_link:
-                            buttons_row.append(
-                                InlineKeyboardButton(
-                                    text="👤 Написать автору",
-                                    url=author_link,
+                                try:
+                                    # Получаем данные о приоритете и платформе из target ресурса
+                                    is_priority_zhk = False
+                                    source_platform = "telegram"
+                                    if res:
+                                        is_priority_zhk = res.get("is_high_priority", 0) == 1
+                                        source_platform = res.get("platform") or res.get("type") or "telegram"
+
+                                    sales_draft = await self._generate_sales_reply(
+                                        post_text=post.text or "",
+                                        pain_stage=pain_stage or "ST-2",
+                                        zhk_name=zhk_name,
+                                        intent=analysis.get("intent", ""),
+                                        context_summary=analysis.get("context_summary", ""),
+                                        platform=source_platform,
+                                        is_priority_zhk=is_priority_zhk,
+                                    )
+                                except Exception as draft_err:
+                                    logger.debug("Не удалось сгенерировать проект ответа: %s", draft_err)
+
+                                # ── Строим карточку лида ──────────────────────────────
+                                if is_zhk_hot or zhk_name:
+                                    header = f"🚨 <b>ГОРЯЧИЙ ЛИД — ЖК {zhk_name.title()}</b>"
+                                else:
+                                    header = "🔥 <b>Новый лид</b>"
+
+                                lines = [
+                                    header,
+                                    "",
+                                    f"🎯 {analysis.get('intent', '—')}",
+                                    f"📍 ЖК/Гео: {analysis.get('geo', getattr(post, 'source_name', '—'))}",
+                                    f"📝 Суть: {analysis.get('context_summary', '—')}",
+                                ]
+                                if pain_label:
+                                    lines.append(f"🩺 Стадия: {pain_label} ({pain_stage})")
+                                if author_link:
+                                    if src_type == "telegram":
+                                        lines.append(f"👤 Автор: <code>{author_link}</code>")
+                                    else:
+                                        lines.append(f'👤 Автор: <a href="{author_link}">{author_name or "профиль"}</a>')
+                                elif author_name:
+                                    lines.append(f"👤 Автор: @{author_name}")
+                                lines.append(f"🔗 Пост: {lead_data.get('url', '—')}")
+
+                                # ── Блок с проектом ответа (жмёшь → копируешь) ───────
+                                if sales_draft:
+                                    lines += [
+                                        "",
+                                        "─" * 22,
+                                        "✍️ <b>Проект ответа (Антон):</b>",
+                                        f"<code>{sales_draft}</code>",
+                                        "─" * 22,
+                                    ]
+
+                                card_text = "\n".join(lines)
+
+                                # ── Кнопки: Написать автору + Открыть пост ────────────
+                                buttons_row = []
+                                if author_link:
+                                    buttons_row.append(
+                                        InlineKeyboardButton(
+                                            text="👤 Написать автору",
+                                            url=author_link,
+                                        )
+                                    )
+                                post_url = lead_data.get("url") or ""
+                                if post_url and post_url.startswith("http"):
+                                    buttons_row.append(
+                                        InlineKeyboardButton(text="🔗 Открыть пост", url=post_url[:500])
+                                    )
+                                keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons_row]) if buttons_row else None
+
+                                await notifier.send(
+                                    int(JULIA_USER_ID),
+                                    card_text,
+                                    parse_mode="HTML",
+                                    disable_preview=True,
+                                    reply_markup=keyboard,
+                                    priority=PRIORITY_HOT,
                                 )
-                            )
-                        post_url = lead_data.get("url") or ""
-                        if post_url and post_url.startswith("http"):
-                            buttons_row.append(
-                                InlineKeyboardButton(text="🔗 Открыть пост", url=post_url[:500])
-                            )
-                        keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons_row]) if buttons_row else None
+                            except Exception as e:
+                                logger.debug("Не удалось отправить уведомление Юлии: %s", e)
 
-                        bot = _bot_for_send()
-                        if bot is None:
-                            bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-                        try:
-                            await bot.send_message(
-                                int(JULIA_USER_ID),
-                                card_text,
-                                parse_mode="HTML",
-                                disable_web_page_preview=True,
-                                reply_markup=keyboard,
-                            )
-                        finally:
-                            if _bot_for_send() is None and getattr(bot, "session", None):
+                    # ⚠️ АВТОМАТИЧЕСКАЯ ОТПРАВКА ОТКЛЮЧЕНА (Режим Модерации)
+                    # Вместо автоматической отправки все лиды отправляются в админ-канал для модерации
+                    # if score > 0.7:
+                    #     logger.info(f"🎯 Найден горячий лид! Score: {score}")
+                    #     message = self.parser.generate_outreach_message(post.source_type)
+                    #     await self.outreach.send_offer(post.source_type, post.source_id, message)
+
+                if batch:
+<<<<<<< HEAD
+                    try:
+                        # В новом LeadHunter логика standalone.hunt() объединена с основным циклом.
+                        # Анализируем результаты из БД для отправки карточек.
+                        main_db = await self._ensure_db_connected()
+                        # Только лиды, сохранённые в этой пачке (окно по времени пересчитывало бы соседние)
+                        recent_leads = []
+                        if _batch_lead_ids:
+                            async with main_db.conn.cursor() as cursor:
+                                await cursor.execute(
+                                    f"SELECT * FROM spy_leads WHERE id IN ({','.join('?' * len(_batch_lead_ids))}) "
+                                    "ORDER BY priority_score DESC",
+                                    _batch_lead_ids,
+                                )
+                                recent_leads = [dict(row) for row in await cursor.fetchall()]
+
+                        # Максимум карточек в группу за один запуск (чтобы не флудить)
+                        MAX_CARDS_PER_RUN = 30
+                        cards_sent = 0
+
+                        for lead in recent_leads:
+                            if (lead.get("priority_score") or 0) < 5:
+                                continue
+
+                            if (lead.get("priority_score") or 0) >= 8:
+                                logger.info(f"🔥 Горячий лид (score={lead.get('priority_score')}) → пересылка админу")
+                                # Формируем структуру как у standalone для совместимости с _send_hot_lead_to_admin
+                                compat_lead = {
+                                    "content": lead.get("text"),
+                                    "intent": lead.get("intent", "—"),
+                                    "hotness": (lead.get("priority_score", 0) + 1) // 2,
+                                    "geo": lead.get("geo_tag", "—"),
+                                    "context_summary": lead.get("context_summary", "—"),
+                                    "url": lead.get("url")
+                                }
+                                await self._send_hot_lead_to_admin(compat_lead)
+
+                            # Данные берем из лида (из БД spy_leads)
+                            author_id = lead.get("author_id")
+                            author_name = lead.get("username")
+                            source_name = lead.get("source_name", "—")
+                            source_type = lead.get("source_type", "telegram")
+                            post_text = lead.get("text", "")
+
+                            # Заголовок карточки: приоритетный ЖК (Высотка) или geo_tag / title (Управление географией)
+                            card_header = source_name
+                            is_priority_value = False
+                            geo_tag_value = lead.get("geo_tag", "")
+
+                            # Пытаемся найти source_link для получения детальной инфы о ресурсе
+                            # В текущем цикле у нас нет прямого доступа к post, но мы можем найти его в текущей пачке
+                            target_post = next((p for p in batch if (p.url == lead.get("url") or lead.get("url") in (p.url or ""))), None)
+
+                            if target_post and hasattr(target_post, "source_link") and target_post.source_link:
                                 try:
-                                    await bot.session.close()
+                                    main_db = await self._ensure_db_connected()
+                                    res = await main_db.get_target_resource_by_link(target_post.source_link)
+                                    if res:
+                                        is_high = res.get("is_high_priority") or 0
+                                        is_priority_value = (is_high == 1)
+                                        name_part = (res.get("geo_tag") or "").strip() or res.get("title") or self.parser.extract_geo_header(post_text, source_name) or source_name
+                                        geo_tag_value = res.get("geo_tag", "")
+                                        if is_high:
+                                            card_header = f"🏙 ПРИОРИТЕТНЫЙ ЖК (Высотка)\n{name_part}" if name_part else "🏙 ПРИОРИТЕТНЫЙ ЖК (Высотка)"
+                                        else:
+                                            card_header = name_part
+                                    else:
+                                        card_header = self.parser.extract_geo_header(lead.get("text", ""), source_name)
                                 except Exception:
-                                    pass
-                    except Exception as e:
-                        logger.debug("Не удалось отправить уведомление Юлии: %s", e)
-
-            # ⚠️ АВТОМАТИЧЕСКАЯ ОТПРАВКА ОТКЛЮЧЕНА (Режим Модерации)
-            # Вместо автоматической отправки все лиды отправляются в админ-канал для модерации
-            # if score > 0.7:
-            #     logger.info(f"🎯 Найден горячий лид! Score: {score}")
-            #     message = self.parser.generate_outreach_message(post.source_type)
-            #     await self.outreach.send_offer(post.source_type, post.source_id, message)
+                                    card_header = self.parser.extract_geo_header(lead.get("text", ""), source_name)
+                            else:
+                                card_header = self.parser.extract_geo_header(post_text, source_name)
 
-        if all_posts:
-<<<<<<< HEAD
-            try:
-                # В новом LeadHunter логика standalone.hunt() объединена с основным циклом.
-                # Анализируем результаты из БД для отправки карточек.
-                main_db = await self._ensure_db_connected()
-                async with main_db.conn.cursor() as cursor:
-                    # Берем лиды, добавленные в текущем запуске (или недавно)
-                    await cursor.execute(
-                        "SELECT * FROM spy_leads WHERE created_at >= datetime('now', '-5 minutes') ORDER BY priority_score DESC"
-                    )
-                    recent_leads = [dict(row) for row in await cursor.fetchall()]
+                            # Лидогенерация
+                            profile_url = lead.get("profile_url") or ""
+                            if not profile_url and author_id:
+                                if source_type == "vk":
+                                    profile_url = f"https://vk.com/id{author_id}"
+                                else:
+                                    profile_url = f"tg://user?id={author_id}"
 
-                # Максимум карточек в группу за один запуск (чтобы не флудить)
-                MAX_CARDS_PER_RUN = 30
-                cards_sent = 0
+                            post_url = lead.get("url", "") or ""
+                            lead_id = lead.get("id")
 
-                for lead in recent_leads:
-                    if (lead.get("priority_score") or 0) < 5:
-                        continue
-                    
-                    if (lead.get("priority_score") or 0) >= 8:
-                        logger.info(f"🔥 Горячий лид (score={lead.get('priority_score')}) → пересылка админу")
-                        # Формируем структуру как у standalone для совместимости с _send_hot_lead_to_admin
-                        compat_lead = {
-                            "content": lead.get("text"),
-                            "intent": lead.get("intent", "—"),
-                            "hotness": (lead.get("priority_score", 0) + 1) // 2,
-                            "geo": lead.get("geo_tag", "—"),
-                            "context_summary": lead.get("context_summary", "—"),
-                            "url": lead.get("url")
-                        }
-                        await self._send_hot_lead_to_admin(compat_lead)
-                    
-                    # Данные берем из лида (из БД spy_leads)
-                    author_id = lead.get("author_id")
-                    author_name = lead.get("username")
-                    source_name = lead.get("source_name", "—")
-                    source_type = lead.get("source_type", "telegram")
-                    post_text = lead.get("text", "")
-                    
-                    # Заголовок карточки: приоритетный ЖК (Высотка) или geo_tag / title (Управление географией)
-                    card_header = source_name
-                    is_priority_value = False
-                    geo_tag_value = lead.get("geo_tag", "")
-                    
-                    # Пытаемся найти source_link для получения детальной инфы о ресурсе
-                    # В текущем цикле у нас нет прямого доступа к post, но мы можем найти его в all_posts
-                    target_post = next((p for p in all_posts if (p.url == lead.get("url") or lead.get("url") in (p.url or ""))), None)
-                    
-                    if target_post and hasattr(target_post, "source_link") and target_post.source_link:
-                        try:
-                            main_db = await self._ensure_db_connected()
-                            res = await main_db.get_target_resource_by_link(target_post.source_link)
-                            if res:
-                                is_high = res.get("is_high_priority") or 0
-                                is_priority_value = (is_high == 1)
-                                name_part = (res.get("geo_tag") or "").strip() or res.get("title") or self.parser.extract_geo_header(post_text, source_name) or source_name
-                                geo_tag_value = res.get("geo_tag", "")
-                                if is_high:
-                                    card_header = f"🏙 ПРИОРИТЕТНЫЙ ЖК (Высотка)\n{name_part}" if name_part else "🏙 ПРИОРИТЕТНЫЙ ЖК (Высотка)"
+=======
+                    messages = [
+                        {"text": p.text, "url": p.url or f"{p.source_type}/{p.source_id}/{p.post_id}"}
+                        for p in batch
+                    ]
+                    db_path = os.path.abspath(POTENTIAL_LEADS_DB)
+                    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+                    try:
+                        db = HunterDatabase(db_path)
+                        await db.connect()
+                        standalone = StandaloneLeadHunter(db)
+                        hot_leads = await standalone.hunt(messages)
+                        if db.conn:
+                            await db.conn.close()
+                        # Максимум карточек в группу за один запуск (чтобы не флудить)
+                        MAX_CARDS_PER_RUN = 30
+                        cards_sent = 0
+                        # Сопоставление hot_lead с постом по url для author_id/username/profile_url
+                        def find_post_by_url(url: str):
+                            for p in batch:
+                                post_url = getattr(p, "url", "") or f"{p.source_type}/{p.source_id}/{p.post_id}"
+                                if post_url == url or url in post_url:
+                                    return p
+                            return None
+
+                        for lead in hot_leads:
+                            if lead.get("hotness", 0) < 3:
+                                continue
+                            if lead.get("hotness", 0) > 4:
+                                logger.info(f"🔥 Горячий лид (Жюль, hotness={lead.get('hotness')}) → пересылка админу")
+                                await self._send_hot_lead_to_admin(lead)
+                            # Сопоставляем с постом для author_id / username
+                            post = find_post_by_url(lead.get("url", ""))
+                            author_id = getattr(post, "author_id", None) if post else None
+                            author_name = getattr(post, "author_name", None) if post else None
+                            source_name = getattr(post, "source_name", "") if post else "—"
+                            source_type = getattr(post, "source_type", "telegram") if post else "telegram"
+                            post_text = getattr(post, "text", "") if post else ""
+                            # Заголовок карточки: приоритетный ЖК (Высотка) или geo_tag / title (Управление географией)
+                            card_header = source_name
+                            res = None
+                            if post:
+                                source_link = getattr(post, "source_link", None)
+                                if source_link:
+                                    try:
+                                        main_db = await self._ensure_db_connected()
+                                        res = await main_db.get_target_resource_by_link(source_link)
+                                        if res:
+                                            is_high = res.get("is_high_priority") or 0
+                                            name_part = (res.get("geo_tag") or "").strip() or res.get("title") or self.parser.extract_geo_header(post_text, source_name) or source_name
+                                            if is_high:
+                                                card_header = f"🏙 ПРИОРИТЕТНЫЙ ЖК (Высотка)\n{name_part}" if name_part else "🏙 ПРИОРИТЕТНЫЙ ЖК (Высотка)"
+                                            else:
+                                                card_header = name_part
+                                        else:
+                                            card_header = self.parser.extract_geo_header(post_text, source_name)
+                                    except Exception:
+                                        card_header = self.parser.extract_geo_header(post_text, source_name)
                                 else:
-                                    card_header = name_part
+                                    card_header = self.parser.extract_geo_header(post_text, source_name)
+                            # Лидогенерация: если нет username — вытягиваем ID для прямой ссылки tg://user?id=...
+                            profile_url = ""
+                            if author_id is not None and source_type == "vk":
+                                aid = int(author_id) if isinstance(author_id, (int, str)) and str(author_id).lstrip("-").isdigit() else 0
+                                if aid > 0:
+                                    profile_url = f"https://vk.com/id{aid}"
+                            elif author_id is not None and source_type == "telegram":
+                                profile_url = f"tg://user?id={author_id}"
+                            post_url = lead.get("url", "") or ""
+                            # Почти-дубль уже сохранённого лида — привязываем, новую карточку не шлём
+                            lead_fp = _post_fingerprints.get(post_url)
+                            if lead_fp is None:
+                                lead_fp = simhash(post_text or lead.get("content") or "")
+                            near = near_dup_index.find(lead_fp)
+                            if near and near[1]:
+                                main_db = await self._ensure_db_connected()
+                                await near_dup_index.link_duplicate(main_db, near[1], post)
+                                logger.info("🧬 Лид %s — почти-дубль лида #%s, карточка не отправлена", post_url, near[1])
+                                continue
+                            try:
+                                main_db = await self._ensure_db_connected()
+                                lead_id = await main_db.add_spy_lead(
+                                    source_type=source_type,
+                                    source_name=source_name,
+                                    url=post_url,
+                                    text=(lead.get("content") or lead.get("intent") or "")[:2000],
+                                    author_id=str(author_id) if author_id else None,
+                                    username=author_name,
+                                    profile_url=profile_url or None,
+                                    pain_stage=lead.get("pain_stage"),
+                                    priority_score=lead.get("priority_score"),
+                                )
+                                LEADS_TOTAL.inc(source=source_type or "unknown")
+                            except Exception as e:
+                                logger.warning("Не удалось сохранить spy_lead: %s", e)
+                                lead_id = 0
+                            if not lead_id:
+                                lead_id = 0
                             else:
-                                card_header = self.parser.extract_geo_header(lead.get("text", ""), source_name)
-                        except Exception:
-                            card_header = self.parser.extract_geo_header(lead.get("text", ""), source_name)
-                    else:
-                        card_header = self.parser.extract_geo_header(post_text, source_name)
-                    
-                    # Лидогенерация
-                    profile_url = lead.get("profile_url") or ""
-                    if not profile_url and author_id:
-                        if source_type == "vk":
-                            profile_url = f"https://vk.com/id{author_id}"
-                        else:
-                            profile_url = f"tg://user?id={author_id}"
-                    
-                    post_url = lead.get("url", "") or ""
-                    lead_id = lead.get("id")
-                    
-=======
-            messages = [
-                {"text": p.text, "url": p.url or f"{p.source_type}/{p.source_id}/{p.post_id}"}
-                for p in all_posts
-            ]
-            db_path = os.path.abspath(POTENTIAL_LEADS_DB)
-            os.makedirs(os.path.dirname(db_path), exist_ok=True)
-            try:
-                db = HunterDatabase(db_path)
-                await db.connect()
-                standalone = StandaloneLeadHunter(db)
-                hot_leads = await standalone.hunt(messages)
-                if db.conn:
-                    await db.conn.close()
-                # Максимум карточек в группу за один запуск (чтобы не флудить)
-                MAX_CARDS_PER_RUN = 30
-                cards_sent = 0
-                # Сопоставление hot_lead с постом по url для author_id/username/profile_url
-                def find_post_by_url(url: str):
-                    for p in all_posts:
-                        post_url = getattr(p, "url", "") or f"{p.source_type}/{p.source_id}/{p.post_id}"
-                        if post_url == url or url in post_url:
-                            return p
-                    return None
-
-                for lead in hot_leads:
-                    if lead.get("hotness", 0) < 3:
-                        continue
-                    if lead.get("hotness", 0) > 4:
-                        logger.info(f"🔥 Горячий лид (Жюль, hotness={lead.get('hotness')}) → пересылка админу")
-                        await self._send_hot_lead_to_admin(lead)
-                    # Сопоставляем с постом для author_id / username
-                    post = find_post_by_url(lead.get("url", ""))
-                    author_id = getattr(post, "author_id", None) if post else None
-                    author_name = getattr(post, "author_name", None) if post else None
-                    source_name = getattr(post, "source_name", "") if post else "—"
-                    source_type = getattr(post, "source_type", "telegram") if post else "telegram"
-                    post_text = getattr(post, "text", "") if post else ""
-                    # Заголовок карточки: приоритетный ЖК (Высотка) или geo_tag / title (Управление географией)
-                    card_header = source_name
-                    res = None
-                    if post:
-                        source_link = getattr(post, "source_link", None)
-                        if source_link:
+                                await near_dup_index.register_lead(main_db, lead_fp, lead_id)
+>>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
+                            # Уведомление в личку админу при каждом лиде (если включено в пульте)
                             try:
                                 main_db = await self._ensure_db_connected()
-                                res = await main_db.get_target_resource_by_link(source_link)
-                                if res:
-                                    is_high = res.get("is_high_priority") or 0
-                                    name_part = (res.get("geo_tag") or "").strip() or res.get("title") or self.parser.extract_geo_header(post_text, source_name) or source_name
-                                    if is_high:
-                                        card_header = f"🏙 ПРИОРИТЕТНЫЙ ЖК (Высотка)\n{name_part}" if name_part else "🏙 ПРИОРИТЕТНЫЙ ЖК (Высотка)"
-                                    else:
-                                        card_header = name_part
-                                else:
-                                    card_header = self.parser.extract_geo_header(post_text, source_name)
+                                notify_enabled = await main_db.get_setting("spy_notify_enabled", "1")
+                                if notify_enabled == "1":
+                                    await self._send_lead_notify_to_admin(lead, source_name, profile_url or post_url)
                             except Exception:
-                                card_header = self.parser.extract_geo_header(post_text, source_name)
-                        else:
-                            card_header = self.parser.extract_geo_header(post_text, source_name)
-                    # Лидогенерация: если нет username — вытягиваем ID для прямой ссылки tg://user?id=...
-                    profile_url = ""
-                    if author_id is not None and source_type == "vk":
-                        aid = int(author_id) if isinstance(author_id, (int, str)) and str(author_id).lstrip("-").isdigit() else 0
-                        if aid > 0:
-                            profile_url = f"https://vk.com/id{aid}"
-                    elif author_id is not None and source_type == "telegram":
-                        profile_url = f"tg://user?id={author_id}"
-                    post_url = lead.get("url", "") or ""
-                    try:
-                        main_db = await self._ensure_db_connected()
-                        lead_id = await main_db.add_spy_lead(
-                            source_type=source_type,
-                            source_name=source_name,
-                            url=post_url,
-                            text=(lead.get("content") or lead.get("intent") or "")[:2000],
-                            author_id=str(author_id) if author_id else None,
-                            username=author_name,
-                            profile_url=profile_url or None,
-                            pain_stage=lead.get("pain_stage"),
-                            priority_score=lead.get("priority_score"),
-                        )
-                    except Exception as e:
-                        logger.warning("Не удалось сохранить spy_lead: %s", e)
-                        lead_id = 0
-                    if not lead_id:
-                        lead_id = 0
->>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
-                    # Уведомление в личку админу при каждом лиде (если включено в пульте)
-                    try:
-                        main_db = await self._ensure_db_connected()
-                        notify_enabled = await main_db.get_setting("spy_notify_enabled", "1")
-                        if notify_enabled == "1":
-                            await self._send_lead_notify_to_admin(lead, source_name, profile_url or post_url)
-                    except Exception:
-                        pass
-                    # Рекомендация Антона (Ассистент Продаж): по тексту подбираем скрипт из sales_templates
-                    anton_recommendation = ""
-                    try:
-                        main_db = await self._ensure_db_connected()
+                                pass
+                            # Рекомендация Антона (Ассистент Продаж): по тексту подбираем скрипт из sales_templates
+                            anton_recommendation = ""
+                            try:
+                                main_db = await self._ensure_db_connected()
 <<<<<<< HEAD
-                        anton_recommendation = await self._get_anton_recommendation(lead.get("text", ""), main_db)
+                                anton_recommendation = await self._get_anton_recommendation(lead.get("text", ""), main_db)
 =======
-                        anton_recommendation = await self._get_anton_recommendation(post_text, main_db)
+                                anton_recommendation = await self._get_anton_recommendation(post_text, main_db)
 >>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
-                    except Exception:
-                        pass
-                    # ⚠️ АВТОМАТИЧЕСКАЯ ОТПРАВКА ЛС ОТКЛЮЧЕНА (Режим Модерации)
-                    # Вместо автоматической отправки ЛС все лиды отправляются в админ-канал для модерации
-                    # if author_id and author_id > 0:
-                    #     lead_content = lead.get("content") or lead.get("intent") or post_text[:200]
-                    #     await self._send_dm_to_user(author_id, post_url, lead_content)
-                    
-                    # ── ОБНОВЛЕННАЯ ЛОГИКА: Различение типов лидов для отправки ────────────
-                    _lead_stage = lead.get("pain_stage") or ""
-                    priority_score = lead.get("priority_score", 0)
-                    
-                    # Проверка на HOT_TRIGGERS в тексте поста
-                    has_hot_trigger = False
-                    if post_text:
-                        from services.scout_parser import ScoutParser
-                        hot_triggers = ScoutParser.HOT_TRIGGERS
-                        import re
-                        text_lower = post_text.lower()
-                        for hot_trigger in hot_triggers:
-                            if re.search(hot_trigger, text_lower):
-                                has_hot_trigger = True
-                                break
-                    
-                    # Горячий лид: HOT_TRIGGERS, ST-1/ST-2, или priority_score >= 3
-                    _is_hot_lead = (
-                        has_hot_trigger 
-                        or _lead_stage in ("ST-1", "ST-2", "ST-3", "ST-4")
-                        or priority_score >= 3
-                        or lead.get("hotness", 0) >= 4
-                    )
-                    
-                    # Обычный лид: priority_score < 3 и нет HOT_TRIGGERS
-                    _is_regular_lead = (
-                        not has_hot_trigger 
-                        and priority_score < 3 
-                        and _lead_stage not in ("ST-3", "ST-4")
-                        and lead.get("hotness", 0) < 3
-                    )
-                    
-                    # ── РЕЖИМ МОДЕРАЦИИ: Все лиды отправляются в админ-канал для модерации ────────
-                    # Вместо автоматической отправки все лиды проходят через модерацию
-                    
-                    # Получаем данные о target из БД, если есть source_link
-                    geo_tag_value = ""
-                    is_priority_value = False
-                    if post and hasattr(post, 'source_link') and post.source_link:
-                        try:
-                            main_db = await self._ensure_db_connected()
-                            target_res = await main_db.get_target_resource_by_link(post.source_link)
-                            if target_res:
-                                geo_tag_value = target_res.get("geo_tag", "") or ""
-                                is_priority_value = target_res.get("is_high_priority", 0) == 1
-                        except Exception as e:
-                            logger.debug(f"Не удалось получить данные target для source_link: {e}")
-                    
-                    # Если geo_tag не найден, используем card_header или извлекаем из текста
-                    if not geo_tag_value:
-                        geo_tag_value = card_header or ""
-                        if post_text and hasattr(self, 'parser') and self.parser:
-                            try:
-                                extracted = self.parser.extract_geo_header(post_text, geo_tag_value)
-                                if extracted and extracted != geo_tag_value:
-                                    geo_tag_value = extracted
                             except Exception:
                                 pass
-                    
-                    if await self._send_lead_card_for_moderation(
-                        lead=lead,
-                        lead_id=lead_id,
-                        profile_url=profile_url,
-                        post_url=post_url,
-                        card_header=card_header,
-                        post_text=post_text,
+                            # ⚠️ АВТОМАТИЧЕСКАЯ ОТПРАВКА ЛС ОТКЛЮЧЕНА (Режим Модерации)
+                            # Вместо автоматической отправки ЛС все лиды отправляются в админ-канал для модерации
+                            # if author_id and author_id > 0:
+                            #     lead_content = lead.get("content") or lead.get("intent") or post_text[:200]
+                            #     await self._send_dm_to_user(author_id, post_url, lead_content)
+
+                            # ── ОБНОВЛЕННАЯ ЛОГИКА: Различение типов лидов для отправки ────────────
+                            _lead_stage = lead.get("pain_stage") or ""
+                            priority_score = lead.get("priority_score", 0)
+
+                            # Проверка на HOT_TRIGGERS в тексте поста
+                            has_hot_trigger = False
+                            if post_text:
+                                from services.scout_parser import ScoutParser
+                                hot_triggers = ScoutParser.HOT_TRIGGERS
+                                import re
+                                text_lower = post_text.lower()
+                                for hot_trigger in hot_triggers:
+                                    if re.search(hot_trigger, text_lower):
+                                        has_hot_trigger = True
+                                        break
+
+                            # Горячий лид: HOT_TRIGGERS, ST-1/ST-2, или priority_score >= 3
+                            _is_hot_lead = (
+                                has_hot_trigger 
+                                or _lead_stage in ("ST-1", "ST-2", "ST-3", "ST-4")
+                                or priority_score >= 3
+                                or lead.get("hotness", 0) >= 4
+                            )
+
+                            # Обычный лид: priority_score < 3 и нет HOT_TRIGGERS
+                            _is_regular_lead = (
+                                not has_hot_trigger 
+                                and priority_score < 3 
+                                and _lead_stage not in ("ST-3", "ST-4")
+                                and lead.get("hotness", 0) < 3
+                            )
+
+                            # ── РЕЖИМ МОДЕРАЦИИ: Все лиды отправляются в админ-канал для модерации ────────
+                            # Вместо автоматической отправки все лиды проходят через модерацию
+
+                            # Получаем данные о target из БД, если есть source_link
+                            geo_tag_value = ""
+                            is_priority_value = False
+                            if post and hasattr(post, 'source_link') and post.source_link:
+                                try:
+                                    main_db = await self._ensure_db_connected()
+                                    target_res = await main_db.get_target_resource_by_link(post.source_link)
+                                    if target_res:
+                                        geo_tag_value = target_res.get("geo_tag", "") or ""
+                                        is_priority_value = target_res.get("is_high_priority", 0) == 1
+                                except Exception as e:
+                                    logger.debug(f"Не удалось получить данные target для source_link: {e}")
+
+                            # Если geo_tag не найден, используем card_header или извлекаем из текста
+                            if not geo_tag_value:
+                                geo_tag_value = card_header or ""
+                                if post_text and hasattr(self, 'parser') and self.parser:
+                                    try:
+                                        extracted = self.parser.extract_geo_header(post_text, geo_tag_value)
+                                        if extracted and extracted != geo_tag_value:
+                                            geo_tag_value = extracted
+                                    except Exception:
+                                        pass
+
+                            if await self._send_lead_card_for_moderation(
+                                lead=lead,
+                                lead_id=lead_id,
+                                profile_url=profile_url,
+                                post_url=post_url,
+                                card_header=card_header,
+                                post_text=post_text,
 <<<<<<< HEAD
-                        source_type=source_type,
-                        source_link=getattr(target_post, "source_link", "") if target_post else "",
+                                source_type=source_type,
+                                source_link=getattr(target_post, "source_link", "") if target_post else "",
 =======
-                        source_type=post.source_type if hasattr(post, 'source_type') else "telegram",
-                        source_link=post.source_link if hasattr(post, 'source_link') else "",
+                                source_type=post.source_type if hasattr(post, 'source_type') else "telegram",
+                                source_link=post.source_link if hasattr(post, 'source_link') else "",
 >>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
-                        geo_tag=geo_tag_value,
-                        is_priority=is_priority_value,
-                        anton_recommendation=anton_recommendation
-                    ):
-                        cards_sent += 1
-                        logger.info(f"📋 Карточка лида #{lead_id} отправлена на модерацию")
-                if cards_sent:
-                    logger.info("📋 В рабочую группу отправлено карточек лидов: %s", cards_sent)
-                # Дублирование в рабочую группу: краткий отчёт о сохранённых лидах
+                                geo_tag=geo_tag_value,
+                                is_priority=is_priority_value,
+                                anton_recommendation=anton_recommendation
+                            ):
+                                cards_sent += 1
+                                logger.info(f"📋 Карточка лида #{lead_id} отправлена на модерацию")
+                        if cards_sent:
+                            logger.info("📋 В рабочую группу отправлено карточек лидов: %s", cards_sent)
+                        # Дублирование в рабочую группу: краткий отчёт о сохранённых лидах
 <<<<<<< HEAD
-                if recent_leads:
+                        if recent_leads:
 =======
-                if hot_leads:
+                        if hot_leads:
 >>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
-                    from config import BOT_TOKEN, LEADS_GROUP_CHAT_ID, THREAD_ID_LOGS
-                    if BOT_TOKEN and LEADS_GROUP_CHAT_ID:
-                        try:
-                            bot = _bot_for_send()
-                            if bot is None:
-                                bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-                            try:
+                            from config import BOT_TOKEN, LEADS_GROUP_CHAT_ID, THREAD_ID_LOGS
+                            if BOT_TOKEN and LEADS_GROUP_CHAT_ID:
+                                try:
 <<<<<<< HEAD
-                                summary = f"🕵️ <b>Охота: в spy_leads сохранено {len(recent_leads)} лидов</b>"
-                                if cards_sent:
-                                    summary += f", в топик «Горячие лиды» отправлено карточек: {cards_sent}"
-                                summary += "\n\n"
-                                for i, lead in enumerate(recent_leads[:3], 1):
-                                    content = (lead.get("text") or lead.get("intent") or "")[:80]
+                                    summary = f"🕵️ <b>Охота: в spy_leads сохранено {len(recent_leads)} лидов</b>"
+                                    if cards_sent:
+                                        summary += f", в топик «Горячие лиды» отправлено карточек: {cards_sent}"
+                                    summary += "\n\n"
+                                    for i, lead in enumerate(recent_leads[:3], 1):
+                                        content = (lead.get("text") or lead.get("intent") or "")[:80]
 =======
-                                summary = f"🕵️ <b>Охота: в potential_leads сохранено {len(hot_leads)} лидов</b>"
-                                if cards_sent:
-                                    summary += f", в топик «Горячие лиды» отправлено карточек: {cards_sent}"
-                                summary += "\n\n"
-                                for i, lead in enumerate(hot_leads[:3], 1):
-                                    content = (lead.get("content") or lead.get("intent") or "")[:80]
+                                    summary = f"🕵️ <b>Охота: в potential_leads сохранено {len(hot_leads)} лидов</b>"
+                                    if cards_sent:
+                                        summary += f", в топик «Горячие лиды» отправлено карточек: {cards_sent}"
+                                    summary += "\n\n"
+                                    for i, lead in enumerate(hot_leads[:3], 1):
+                                        content = (lead.get("content") or lead.get("intent") or "")[:80]
 >>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
-                                    summary += f"{i}. {content}…\n"
-                                await bot.send_message(
-                                    LEADS_GROUP_CHAT_ID,
-                                    summary,
-                                    message_thread_id=THREAD_ID_LOGS,
-                                )
-                            finally:
-                                if _bot_for_send() is None and getattr(bot, "session", None):
-                                    try:
-                                        await bot.session.close()
-                                    except Exception:
-                                        pass
-                        except Exception as e:
-                            logger.warning("Не удалось отправить сводку лидов в группу: %s", e)
-            except Exception as e:
-                logger.error(f"❌ Ошибка hunter_standalone (AI Жюля): {e}")
+                                        summary += f"{i}. {content}…\n"
+                                    # Сводка на каждую пачку — склеиваются в дайджест очереди уведомлений
+                                    await notifier.send(LEADS_GROUP_CHAT_ID, summary, thread_id=THREAD_ID_LOGS,
+                                                        priority=PRIORITY_LOW, digest=True)
+                                except Exception as e:
+                                    logger.warning("Не удалось отправить сводку лидов в группу: %s", e)
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка hunter_standalone (AI Жюля): {e}")
+                _post_fingerprints.clear()  # отпечатки нужны только в пределах пачки
+
+        if _near_dup_skipped:
+            logger.info("🧬 Почти-дубли: пропущено %s постов (привязаны к исходным лидам)", _near_dup_skipped)
 
         # Отчёт в рабочую группу: где был шпион, в какие группы/каналы удалось попасть
         # Отправляем только если есть реальные данные (просмотрено > 0 сообщений)
@@ -1665,22 +1628,8 @@ class LeadHunter:
             if BOT_TOKEN and LEADS_GROUP_CHAT_ID and report and "Отчёта ещё нет" not in report:
                 # Не отправляем пустые отчёты (0 просмотрено сообщений)
                 if total_scanned > 0 or any(r.get("status") == "error" for r in (tg_ok + vk_ok)):
-                    bot = _bot_for_send()
-                    if bot is None:
-                        bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-                    try:
-                        await bot.send_message(
-                            LEADS_GROUP_CHAT_ID,
-                            report,
-                            message_thread_id=THREAD_ID_LOGS,
-                        )
-                        logger.info(f"📊 Отчёт отправлен в топик 'Логи': просмотрено {total_scanned} сообщений")
-                    finally:
-                        if _bot_for_send() is None and getattr(bot, "session", None):
-                            try:
-                                await bot.session.close()
-                            except Exception:
-                                pass
+                    await notifier.send(LEADS_GROUP_CHAT_ID, report, thread_id=THREAD_ID_LOGS)
+                    logger.info(f"📊 Отчёт поставлен в очередь (топик 'Логи'): просмотрено {total_scanned} сообщений")
                 else:
                     logger.debug("⏭️ Пропуск пустого отчёта (0 просмотрено сообщений)")
         except Exception as e:
@@ -1688,8 +1637,8 @@ class LeadHunter:
 
         # Файл со списком всех лидов (источник, превью текста, ссылка) — в тот же топик «Логи»
         # Отправляем только если есть реальные лиды
-        if all_posts and len(all_posts) > 0:
-            await self._send_raw_leads_file_to_group(all_posts)
+        if raw_file.total:
+            await self._send_raw_leads_file_to_group(raw_file)
         else:
             logger.debug("⏭️ Пропуск отправки файла лидов (0 лидов найдено)")
 
@@ -1721,7 +1670,8 @@ class LeadHunter:
             f"✅ Cycle complete: {tg_scanned} TG messages scanned, {vk_scanned} VK posts scanned, {hot_leads_count} Hot leads found"
         )
         
-        logger.info(f"🏹 LeadHunter: охота завершена. Обработано {len(all_posts)} постов.")
+        LeadHunter.last_hunt_posts = posts.total
+        logger.info(f"🏹 LeadHunter: охота завершена. Обработано {posts.total} постов.")
         
         # Сбрасываем статистику парсера после использования
         self.parser.total_scanned = 0
@@ -1729,6 +1679,99 @@ class LeadHunter:
         self.parser.total_leads = 0
         self.parser.total_hot_leads = 0
     
+    async def process_stream_post(self, post) -> Optional[int]:
+        """
+        Обработка одного сообщения из потокового режима (services/lead_hunter/stream.py).
+
+        Те же стадии, что и в hunt(): фильтр ScoutParser → почти-дубли → LeadAnalyzer →
+        анализ намерения → spy_leads → карточка на модерацию (+ горячий лид админу).
+        Возвращает id сохранённого лида или None.
+        """
+        text = getattr(post, "text", "") or ""
+        if not text or not self.parser.detect_lead(text):
+            return None
+
+        main_db = await self._ensure_db_connected()
+        await near_dup_index.load(main_db)
+        fp = simhash(text)
+        near = near_dup_index.find(fp)
+        if near:
+            if near[1]:
+                await near_dup_index.link_duplicate(main_db, near[1], post)
+            logger.debug("⏭️ Поток: почти-дубль %s → лид #%s", post.url, near[1] or "—")
+            return None
+        near_dup_index.remember(fp)
+
+        source_name = getattr(post, "source_name", "") or ""
+        analysis_data = await self.analyzer.analyze_post(text, source_name=source_name)
+        if analysis_data.get("geo_filtered"):
+            return None
+        try:
+            analysis = await self._analyze_intent(text)
+        except Exception as e:
+            logger.debug("🔎 Анализ намерения не удался: %s", e)
+            return None
+        if not analysis.get("is_lead"):
+            return None
+
+        author_id = getattr(post, "author_id", None)
+        profile_url = f"tg://user?id={author_id}" if author_id else ""
+        pain_stage = analysis_data.get("pain_stage", "ST-1")
+        priority_score = analysis_data.get("priority_score", 0)
+        lead_id = await main_db.add_spy_lead(
+            source_type=getattr(post, "source_type", "telegram"),
+            source_name=source_name,
+            url=post.url,
+            text=text[:2000],
+            author_id=str(author_id) if author_id else None,
+            username=getattr(post, "author_name", None),
+            profile_url=profile_url or None,
+            pain_stage=pain_stage,
+            priority_score=priority_score,
+        )
+        LEADS_TOTAL.inc(source=getattr(post, "source_type", "telegram") or "unknown")
+        await near_dup_index.register_lead(main_db, fp, lead_id)
+        logger.info(f"⚡ Поток: лид #{lead_id} из {source_name} (score={priority_score}, {pain_stage})")
+
+        lead = {
+            "content": text,
+            "intent": analysis.get("intent", ""),
+            "hotness": analysis.get("hotness", 0),
+            "geo": analysis.get("geo", source_name),
+            "context_summary": analysis.get("context_summary", ""),
+            "url": post.url,
+            "pain_stage": pain_stage,
+            "priority_score": priority_score,
+        }
+        geo_tag = ""
+        is_priority = False
+        source_link = getattr(post, "source_link", "") or ""
+        if source_link:
+            try:
+                res = await main_db.get_target_resource_by_link(source_link)
+                if res:
+                    geo_tag = res.get("geo_tag") or ""
+                    is_priority = (res.get("is_high_priority") or 0) == 1
+                await main_db.update_target_last_lead_at(source_link)
+            except Exception:
+                pass
+
+        await self._send_lead_card_for_moderation(
+            lead,
+            lead_id,
+            profile_url=profile_url,
+            post_url=post.url,
+            card_header=source_name,
+            post_text=text,
+            source_type=getattr(post, "source_type", "telegram"),
+            source_link=source_link,
+            geo_tag=geo_tag,
+            is_priority=is_priority,
+        )
+        if priority_score >= 8 and self._is_business_hours_msk():
+            await self._send_hot_lead_to_admin(lead)
+        return lead_id
+
     async def send_regular_leads_summary(self) -> bool:
         """Отправка сводки обычных лидов (priority < 3) в рабочую группу.
         
@@ -1781,26 +1824,15 @@ class LeadHunter:
             
             summary_text = "\n".join(lines)
             
-            bot = _bot_for_send()
-            if bot is None:
-                bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-            
-            try:
-                await bot.send_message(
-                    LEADS_GROUP_CHAT_ID,
-                    summary_text,
-                    message_thread_id=THREAD_ID_LOGS,
-                    parse_mode="HTML",
-                    disable_web_page_preview=True
-                )
-                logger.info(f"✅ Сводка обычных лидов отправлена: {len(regular_leads)} лидов")
-                return True
-            finally:
-                if _bot_for_send() is None and getattr(bot, "session", None):
-                    try:
-                        await bot.session.close()
-                    except Exception:
-                        pass
+            await notifier.send(
+                LEADS_GROUP_CHAT_ID,
+                summary_text,
+                thread_id=THREAD_ID_LOGS,
+                parse_mode="HTML",
+                disable_preview=True,
+            )
+            logger.info(f"✅ Сводка обычных лидов поставлена в очередь: {len(regular_leads)} лидов")
+            return True
                         
         except Exception as e:
             logger.error(f"❌ Ошибка отправки сводки обычных лидов: {e}")
@@ -1829,93 +1861,83 @@ class LeadHunter:
                 return False
             
             sent_count = 0
-            bot = _bot_for_send()
-            if bot is None:
-                bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+            for lead in hot_leads[:10]:  # Максимум 10 лидов за раз
+                try:
+                    lead_id = lead.get("id")
+                    source_name = lead.get("source_name", "—")
+                    text = (lead.get("text") or "")[:2000]
+                    url = lead.get("url", "")
+                    profile_url = lead.get("profile_url", "")
+                    priority_score = lead.get("priority_score", 0)
+                    pain_stage = lead.get("pain_stage", "")
+                    
+                    # Форматируем карточку лида с новым форматом
+                    lead_data = {
+                        "content": text,
+                        "text": text,
+                        "priority_score": priority_score,
+                        "pain_stage": pain_stage,
+                        "url": url,
+                        "source_name": source_name,
+                        "author_name": lead.get("author_name"),
+                        "author_id": lead.get("author_id"),
+                        "username": lead.get("username"),
+                    }
+                    card_text = self._format_lead_card(
+                        lead_data,
+                        profile_url=profile_url,
+                        card_header=source_name
+                    )
+                    
+                    # Кнопки (новый формат)
+                    url_buttons = []
+                    if url:
+                        url_buttons.append(InlineKeyboardButton(text="🔗 Перейти к сообщению", url=url[:500]))
+                    if profile_url and profile_url.startswith("http"):
+                        url_buttons.append(InlineKeyboardButton(text="👤 Профиль", url=profile_url))
+                    
+                    action_buttons = [
+                        InlineKeyboardButton(text="✅ В работу", callback_data=f"lead_take_work_{lead_id}"),
+                        InlineKeyboardButton(text="🛠 Ответить экспертно", callback_data=f"lead_expert_reply_{lead_id}"),
+                    ]
+                    
+                    keyboard_rows = []
+                    if url_buttons:
+                        keyboard_rows.append(url_buttons)
+                    if action_buttons:
+                        keyboard_rows.append(action_buttons)
+                    
+                    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_rows) if keyboard_rows else None
+                    
+                    # ── ТИХИЕ УВЕДОМЛЕНИЯ: priority_score < 8 → disable_notification = True ────
+                    disable_notification = priority_score < 8  # Тихие уведомления для низкоприоритетных лидов
+                    
+                    await notifier.send(
+                        LEADS_GROUP_CHAT_ID,
+                        card_text,
+                        reply_markup=keyboard,
+                        thread_id=THREAD_ID_HOT_LEADS,
+                        parse_mode="HTML",
+                        disable_notification=disable_notification,  # Тихие уведомления для priority_score < 8
+                        priority=PRIORITY_LOW if disable_notification else PRIORITY_HOT,
+                        digest=disable_notification,
+                    )
+                    
+                    if disable_notification:
+                        logger.debug(f"🔇 Тихое уведомление поставлено в очередь для лида #{lead_id} (priority_score={priority_score})")
+                    
+                    # Отмечаем как отправленный
+                    await main_db.mark_lead_sent_to_hot_leads(lead_id)
+                    sent_count += 1
+                    
+                except Exception as e:
+                    logger.error(f"❌ Ошибка отправки горячего лида {lead.get('id')}: {e}")
+                    continue
             
-            try:
-                for lead in hot_leads[:10]:  # Максимум 10 лидов за раз
-                    try:
-                        lead_id = lead.get("id")
-                        source_name = lead.get("source_name", "—")
-                        text = (lead.get("text") or "")[:2000]
-                        url = lead.get("url", "")
-                        profile_url = lead.get("profile_url", "")
-                        priority_score = lead.get("priority_score", 0)
-                        pain_stage = lead.get("pain_stage", "")
-                        
-                        # Форматируем карточку лида с новым форматом
-                        lead_data = {
-                            "content": text,
-                            "text": text,
-                            "priority_score": priority_score,
-                            "pain_stage": pain_stage,
-                            "url": url,
-                            "source_name": source_name,
-                            "author_name": lead.get("author_name"),
-                            "author_id": lead.get("author_id"),
-                            "username": lead.get("username"),
-                        }
-                        card_text = self._format_lead_card(
-                            lead_data,
-                            profile_url=profile_url,
-                            card_header=source_name
-                        )
-                        
-                        # Кнопки (новый формат)
-                        url_buttons = []
-                        if url:
-                            url_buttons.append(InlineKeyboardButton(text="🔗 Перейти к сообщению", url=url[:500]))
-                        if profile_url and profile_url.startswith("http"):
-                            url_buttons.append(InlineKeyboardButton(text="👤 Профиль", url=profile_url))
-                        
-                        action_buttons = [
-                            InlineKeyboardButton(text="✅ В работу", callback_data=f"lead_take_work_{lead_id}"),
-                            InlineKeyboardButton(text="🛠 Ответить экспертно", callback_data=f"lead_expert_reply_{lead_id}"),
-                        ]
-                        
-                        keyboard_rows = []
-                        if url_buttons:
-                            keyboard_rows.append(url_buttons)
-                        if action_buttons:
-                            keyboard_rows.append(action_buttons)
-                        
-                        keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_rows) if keyboard_rows else None
-                        
-                        # ── ТИХИЕ УВЕДОМЛЕНИЯ: priority_score < 8 → disable_notification = True ────
-                        disable_notification = priority_score < 8  # Тихие уведомления для низкоприоритетных лидов
-                        
-                        await bot.send_message(
-                            LEADS_GROUP_CHAT_ID,
-                            card_text,
-                            reply_markup=keyboard,
-                            message_thread_id=THREAD_ID_HOT_LEADS,
-                            parse_mode="HTML",
-                            disable_notification=disable_notification,  # Тихие уведомления для priority_score < 8
-                        )
-                        
-                        if disable_notification:
-                            logger.debug(f"🔇 Тихое уведомление отправлено для лида #{lead_id} (priority_score={priority_score})")
-                        
-                        # Отмечаем как отправленный
-                        await main_db.mark_lead_sent_to_hot_leads(lead_id)
-                        sent_count += 1
-                        
-                    except Exception as e:
-                        logger.error(f"❌ Ошибка отправки горячего лида {lead.get('id')}: {e}")
-                        continue
-                
-                if sent_count > 0:
-                    logger.info(f"🔥 Отправлено горячих лидов в топик 'Горячие лиды': {sent_count}")
-                
-                return sent_count > 0
-                
-            finally:
-                if _bot_for_send() is None and getattr(bot, "session", None):
-                    try:
-                        await bot.session.close()
-                    except Exception:
-                        pass
+            if sent_count > 0:
+                logger.info(f"🔥 Отправлено горячих лидов в топик 'Горячие лиды': {sent_count}")
+            
+            return sent_count > 0
                         
         except Exception as e:
             logger.error(f"❌ Ошибка отправки горячих лидов: {e}")
@@ -1960,30 +1982,19 @@ class LeadHunter:
                     profile_url=lead.get("author_url", ""),
                     card_header=lead.get("source", "VK"),
                 )
-                bot = _bot_for_send()
-                _close_bot = False
-                if bot is None:
-                    from config import BOT_TOKEN, LEADS_GROUP_CHAT_ID, THREAD_ID_HOT_LEADS
-                    if BOT_TOKEN:
-                        bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-                        _close_bot = True
-                    else:
-                        logger.warning("⚠️ BOT_TOKEN не задан — карточка лида не отправлена")
-                        return
-                try:
-                    from config import LEADS_GROUP_CHAT_ID, THREAD_ID_HOT_LEADS
-                    await bot.send_message(
-                        LEADS_GROUP_CHAT_ID,
-                        card_text,
-                        message_thread_id=THREAD_ID_HOT_LEADS,
-                        parse_mode="HTML",
-                    )
-                finally:
-                    if _close_bot and bot:
-                        try:
-                            await bot.session.close()
-                        except Exception:
-                            pass
+                from config import BOT_TOKEN, LEADS_GROUP_CHAT_ID, THREAD_ID_HOT_LEADS
+                if not BOT_TOKEN:
+                    logger.warning("⚠️ BOT_TOKEN не задан — карточка лида не отправлена")
+                    return
+                hot = lead.get("lead_type") == "hot"
+                await notifier.send(
+                    LEADS_GROUP_CHAT_ID,
+                    card_text,
+                    thread_id=THREAD_ID_HOT_LEADS,
+                    parse_mode="HTML",
+                    priority=PRIORITY_HOT if hot else PRIORITY_LOW,
+                    digest=not hot,
+                )
             except Exception as e:
                 logger.error(f"Ошибка обработки лида: {e}")
 =======
@@ -2059,26 +2070,15 @@ class LeadHunter:
             
             report_text = "\n".join(lines)
             
-            bot = _bot_for_send()
-            if bot is None:
-                bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-            
-            try:
-                await bot.send_message(
-                    LEADS_GROUP_CHAT_ID,
-                    report_text,
-                    message_thread_id=THREAD_ID_LOGS,
-                    parse_mode="HTML",
-                    disable_web_page_preview=True
-                )
-                logger.info(f"✅ Итоговый отчёт отправлен: {total_leads_24h} лидов за 24 часа")
-                return True
-            finally:
-                if _bot_for_send() is None and getattr(bot, "session", None):
-                    try:
-                        await bot.session.close()
-                    except Exception:
-                        pass
+            await notifier.send(
+                LEADS_GROUP_CHAT_ID,
+                report_text,
+                thread_id=THREAD_ID_LOGS,
+                parse_mode="HTML",
+                disable_preview=True,
+            )
+            logger.info(f"✅ Итоговый отчёт поставлен в очередь: {total_leads_24h} лидов за 24 часа")
+            return True
                         
         except Exception as e:
             logger.error(f"❌ Ошибка отправки итогового отчёта: {e}")
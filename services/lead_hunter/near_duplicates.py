@@ -0,0 +1,186 @@
+"""
+Поиск почти-дубликатов лидов (SimHash по нормализованным шинглам).
+
+Один и тот же вопрос соседа в трёх чатах ЖК или зеркало TG-поста в VK
+имеют разные url/post_id, поэтому точный анти-дубль в hunt() их пропускает.
+Здесь считаем 64-битный SimHash по словесным 3-шинглам нормализованного текста
+и ищем совпадения с расстоянием Хэмминга <= NEAR_DUP_MAX_DISTANCE
+в скользящем окне NEAR_DUP_WINDOW_DAYS.
+
+Поиск кандидатов — через 4 «полосы» по 16 бит: при расстоянии <= 3
+хотя бы одна полоса совпадает точно (принцип Дирихле), так что сравниваем
+только с постами из тех же корзин, а не со всем окном.
+
+Отпечатки сохранённых лидов хранятся в spy_lead_fingerprints (переживают рестарт),
+отпечатки просмотренных НЕ-лидов — только в памяти (чтобы не гонять кросспосты через ИИ).
+"""
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "3"))
+NEAR_DUP_WINDOW_DAYS = int(os.getenv("NEAR_DUP_WINDOW_DAYS", "7"))
+# Слишком короткие тексты («нужен проект?») дают ложные совпадения — их не сравниваем
+NEAR_DUP_MIN_TOKENS = 5
+
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+_URL_RE = re.compile(r"https?://\S+|t\.me/\S+|vk\.com/\S+|@\w+")
+_TOKEN_RE = re.compile(r"[a-zа-я0-9]+")
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """Нижний регистр, ё→е, без ссылок/упоминаний/эмодзи и пунктуации."""
+    text = (text or "").lower().replace("ё", "е")
+    text = _URL_RE.sub(" ", text)
+    return _TOKEN_RE.findall(text)
+
+
+def simhash(text: str, shingle_size: int = 3) -> Optional[int]:
+    """64-битный SimHash по словесным шинглам. None — если текст слишком короткий."""
+    tokens = normalize_tokens(text)
+    if len(tokens) < NEAR_DUP_MIN_TOKENS:
+        return None
+    if len(tokens) < shingle_size:
+        shingles = [" ".join(tokens)]
+    else:
+        shingles = [" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+
+    weights = [0] * 64
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+
+    value = 0
+    for bit in range(64):
+        if weights[bit] > 0:
+            value |= 1 << bit
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def to_sqlite_int(value: int) -> int:
+    """SQLite INTEGER — знаковый 64-бит."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def from_sqlite_int(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class NearDuplicateIndex:
+    """Индекс SimHash-отпечатков со скользящим окном и корзинами по полосам."""
+
+    def __init__(self, max_distance: int = NEAR_DUP_MAX_DISTANCE, window_days: int = NEAR_DUP_WINDOW_DAYS):
+        self.max_distance = max_distance
+        self.window_seconds = window_days * 86400
+        # fingerprint -> (lead_id | None, added_at)
+        self._entries: Dict[int, Tuple[Optional[int], float]] = {}
+        self._bands: Dict[Tuple[int, int], set] = defaultdict(set)
+        self._loaded = False
+
+    @staticmethod
+    def _band_keys(fp: int):
+        for i in range(_BANDS):
+            yield i, (fp >> (i * _BAND_BITS)) & _BAND_MASK
+
+    def _add(self, fp: int, lead_id: Optional[int], added_at: float) -> None:
+        current = self._entries.get(fp)
+        # Отпечаток лида важнее отпечатка не-лида
+        if current and current[0] and not lead_id:
+            return
+        self._entries[fp] = (lead_id, added_at)
+        for key in self._band_keys(fp):
+            self._bands[key].add(fp)
+
+    def _remove(self, fp: int) -> None:
+        self._entries.pop(fp, None)
+        for key in self._band_keys(fp):
+            bucket = self._bands.get(key)
+            if bucket:
+                bucket.discard(fp)
+                if not bucket:
+                    del self._bands[key]
+
+    def prune(self) -> None:
+        """Удалить из памяти отпечатки старше окна."""
+        cutoff = time.time() - self.window_seconds
+        for fp in [fp for fp, (_, ts) in self._entries.items() if ts < cutoff]:
+            self._remove(fp)
+
+    async def load(self, db) -> None:
+        """Загрузить отпечатки сохранённых лидов из БД (один раз) и почистить старые строки."""
+        if self._loaded:
+            return
+        try:
+            await db.cleanup_lead_fingerprints(NEAR_DUP_WINDOW_DAYS)
+            for row in await db.get_lead_fingerprints(NEAR_DUP_WINDOW_DAYS):
+                self._add(from_sqlite_int(row["simhash"]), row["lead_id"], row["added_ts"])
+            self._loaded = True
+            logger.info(f"🧬 Near-dup индекс: загружено {len(self._entries)} отпечатков лидов")
+        except Exception as e:
+            logger.warning(f"⚠️ Near-dup индекс: не удалось загрузить отпечатки: {e}")
+
+    def find(self, fp: Optional[int]) -> Optional[Tuple[int, Optional[int]]]:
+        """Ближайший отпечаток в окне: (fingerprint, lead_id | None) или None."""
+        if fp is None:
+            return None
+        cutoff = time.time() - self.window_seconds
+        best = None  # (rank, fingerprint, lead_id)
+        candidates = set()
+        for key in self._band_keys(fp):
+            candidates |= self._bands.get(key, set())
+        for other in candidates:
+            lead_id, ts = self._entries[other]
+            if ts < cutoff:
+                continue
+            distance = hamming(fp, other)
+            if distance > self.max_distance:
+                continue
+            # Совпадение с сохранённым лидом важнее совпадения с просмотренным не-лидом
+            rank = (lead_id is None, distance)
+            if best is None or rank < best[0]:
+                best = (rank, other, lead_id)
+        return (best[1], best[2]) if best else None
+
+    def remember(self, fp: Optional[int]) -> None:
+        """Запомнить просмотренный пост (не лид) только в памяти."""
+        if fp is not None:
+            self._add(fp, None, time.time())
+
+    async def register_lead(self, db, fp: Optional[int], lead_id: int) -> None:
+        """Сохранить отпечаток нового лида в память и в spy_lead_fingerprints."""
+        if fp is None or not lead_id:
+            return
+        self._add(fp, lead_id, time.time())
+        try:
+            await db.add_lead_fingerprint(lead_id, to_sqlite_int(fp))
+        except Exception as e:
+            logger.debug(f"Не удалось сохранить отпечаток лида #{lead_id}: {e}")
+
+    async def link_duplicate(self, db, lead_id: int, post) -> None:
+        """Привязать почти-дубль к исходному лиду вместо новой карточки."""
+        try:
+            await db.add_lead_duplicate(
+                lead_id=lead_id,
+                source_type=getattr(post, "source_type", "") or "",
+                source_name=getattr(post, "source_name", "") or "",
+                url=getattr(post, "url", "") or "",
+            )
+        except Exception as e:
+            logger.debug(f"Не удалось привязать дубль к лиду #{lead_id}: {e}")
+
+
+near_dup_index = NearDuplicateIndex()
@@ -0,0 +1,133 @@
+"""
+Потоковая охота: скан → фильтры → анализ → сохранение → карточки без накопления всего скана.
+
+Раньше hunt() ждал, пока parse_telegram и parse_vk соберут все посты в списки, и только
+потом начинал анализ — память и задержка первой карточки росли с размером скана.
+Теперь:
+
+  - источники (ScoutParser.iter_telegram / iter_vk) — async-генераторы, каждый читается
+    своей задачей в общую ограниченную очередь (HUNT_PIPELINE_BUFFER постов); при полной
+    очереди сканер ждёт обработку (backpressure), а не копит посты;
+  - посты приоритетных чатов (SPY_PREFERRED_CHATS) обгоняют остальные внутри буфера;
+  - обработка идёт пачками по HUNT_BATCH_SIZE: неполная пачка уходит дальше через
+    HUNT_BATCH_WAIT секунд, так что первые лиды доставляются, пока дальние чаты ещё
+    сканируются;
+  - файл «сырых» лидов пишется по мере прохождения постов и обрезается на max_entries.
+
+Пиковая память — буфер + одна пачка, от размера скана не зависит.
+Метрика: terion_queue_depth{queue="hunt"}.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import weakref
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Sequence
+
+from monitoring.metrics import QUEUE_DEPTH, registry
+
+logger = logging.getLogger(__name__)
+
+HUNT_PIPELINE_BUFFER = int(os.getenv("HUNT_PIPELINE_BUFFER", "200"))
+HUNT_BATCH_SIZE = int(os.getenv("HUNT_BATCH_SIZE", "25"))
+HUNT_BATCH_WAIT = float(os.getenv("HUNT_BATCH_WAIT", "5"))
+
+_DONE = object()
+_active_streams: "weakref.WeakSet[PostStream]" = weakref.WeakSet()
+
+
+class PostStream:
+    """Слияние async-генераторов постов в одну ограниченную очередь с выдачей пачками."""
+
+    def __init__(self, *sources: AsyncIterator, buffer: int = HUNT_PIPELINE_BUFFER):
+        self.sources = sources
+        self.buffer = buffer
+        self.preferred: Sequence[str] = ()
+        self.total = 0
+        self.queue: Optional[asyncio.PriorityQueue] = None
+        self._seq = itertools.count()
+        _active_streams.add(self)
+
+    def _rank(self, post) -> int:
+        name = (getattr(post, "source_name", "") or "").lower()
+        return 0 if any(pref in name for pref in self.preferred) else 1
+
+    async def _produce(self, source: AsyncIterator) -> None:
+        try:
+            async for post in source:
+                await self.queue.put((self._rank(post), next(self._seq), post))
+        except Exception as e:
+            logger.error(f"❌ Поток охоты: источник упал: {e}")
+        await self.queue.put((2, next(self._seq), _DONE))
+
+    async def batches(self, size: int = HUNT_BATCH_SIZE, wait: float = HUNT_BATCH_WAIT) -> AsyncIterator[List]:
+        """Пачки постов по мере сканирования; последняя — когда все источники исчерпаны."""
+        self.queue = asyncio.PriorityQueue(maxsize=self.buffer)
+        tasks = [asyncio.create_task(self._produce(source), name=f"hunt_source_{i}")
+                 for i, source in enumerate(self.sources)]
+        running = len(tasks)
+        loop = asyncio.get_running_loop()
+        try:
+            batch: List = []
+            deadline = None
+            while running:
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                try:
+                    _, _, post = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    post = None
+                if post is _DONE:
+                    running -= 1
+                elif post is not None:
+                    batch.append(post)
+                    self.total += 1
+                    if deadline is None:
+                        deadline = loop.time() + wait
+                if batch and (post is None or len(batch) >= size or not running):
+                    yield batch
+                    batch, deadline = [], None
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.queue = None
+
+
+def _collect_metrics() -> None:
+    QUEUE_DEPTH.set(sum(s.queue.qsize() for s in list(_active_streams) if s.queue is not None), queue="hunt")
+
+
+registry.add_collector(_collect_metrics)
+
+
+class RawLeadsFile:
+    """Файл «источник | превью | ссылка», собираемый по одному посту; хранит не больше max_entries."""
+
+    __slots__ = ("max_entries", "total", "lines")
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self.total = 0
+        self.lines: List[str] = []
+
+    def add(self, post) -> None:
+        self.total += 1
+        if self.total > self.max_entries:
+            return
+        source = getattr(post, "source_name", "") or post.source_id
+        text_preview = (post.text or "").replace("\n", " ").strip()[:400]
+        url = getattr(post, "url", "") or f"{post.source_type}/{post.source_id}/{post.post_id}"
+        self.lines.append(f"[{self.total}] {source}\nТекст: {text_preview}\nСсылка: {url}\n")
+
+    def render(self) -> bytes:
+        header = [
+            "Лиды шпиона (последний скан)",
+            f"Дата: {datetime.now().strftime('%d.%m.%Y %H:%M')}",
+            f"Всего постов с ключевыми словами: {self.total}",
+            "",
+            "---",
+            "",
+        ]
+        footer = [f"... и ещё {self.total - self.max_entries} лидов (обрезано)."] if self.total > self.max_entries else []
+        return "\n".join(header + self.lines + footer).encode("utf-8")
@@ -0,0 +1,380 @@
+"""
+Потоковый режим Lead Hunter: лиды из Telegram за секунды, а не за 30 минут.
+
+Долгоживущий Telethon-клиент подписан на events.NewMessage всех активных
+Telegram-ресурсов из target_resources. Каждое сообщение кладётся в ограниченную
+asyncio.Queue; воркеры прогоняют его через LeadHunter.process_stream_post
+(фильтр → почти-дубли → анализ → spy_leads → карточка).
+
+Backpressure: если очередь заполнена, сообщение не ждёт в памяти, а чат помечается
+для догоняющего прохода. Догоняющий проход (после старта, переподключения и
+переполнения) читает iter_messages(min_id=last_post_id) — last_post_id продвигается
+только до последнего сообщения, перед которым всё уже обработано: при нескольких
+воркерах более поздний id не фиксируется, пока раннее сообщение в работе, выброшено
+из очереди или упало (упавшее дочитывается ещё раз, после второй ошибки — пропускается).
+Поэтому при падении процесса ничего не теряется.
+
+Пакетный hunt() остаётся запасным вариантом: пока поток работает, он пропускает
+только чаты, на которые поток реально подписан (subscribed_target_ids); чаты, сущность
+которых получить не удалось, и VK сканируются как обычно.
+
+Включение: LEAD_STREAM_ENABLED=1 (сессия — LEAD_STREAM_SESSION, по умолчанию anton_parser).
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+LEAD_STREAM_ENABLED = os.getenv("LEAD_STREAM_ENABLED", "0") == "1"
+LEAD_STREAM_SESSION = os.getenv("LEAD_STREAM_SESSION", "anton_parser")
+STREAM_QUEUE_SIZE = int(os.getenv("LEAD_STREAM_QUEUE_SIZE", "500"))
+STREAM_WORKERS = int(os.getenv("LEAD_STREAM_WORKERS", "2"))
+# Сколько сообщений максимум дочитывать из одного чата за догоняющий проход
+CATCHUP_LIMIT = int(os.getenv("LEAD_STREAM_CATCHUP_LIMIT", "200"))
+# Период проверки соединения и пересборки подписок (новые/архивные ресурсы)
+SUPERVISE_INTERVAL = 30
+RESUBSCRIBE_INTERVAL = 600
+
+
+def _message_url(link: str, msg_id: int) -> str:
+    link = (link or "").strip().rstrip("/")
+    if link.startswith("http"):
+        return f"{link}/{msg_id}"
+    return f"https://t.me/{link.lstrip('@')}/{msg_id}"
+
+
+class LeadStream:
+    """Подписка Telethon на чаты target_resources + очередь обработки."""
+
+    def __init__(self):
+        self.hunter = None
+        self.client = None
+        self._shared_client = False
+        self.queue: Optional[asyncio.Queue] = None
+        self._handler = None
+        self._tasks: list = []
+        # peer_id (марк. id Telethon) -> запись target_resources
+        self._targets: Dict[int, Dict] = {}
+        # peer_id -> InputPeer из кэша сущностей (без обращений к серверу)
+        self._peers: Dict[int, object] = {}
+        # peer_id -> последний обработанный message_id
+        self._last_ids: Dict[int, int] = {}
+        # peer_id -> минимальный id, выброшенный из-за переполнения очереди
+        self._needs_catchup: Dict[int, int] = {}
+        # peer_id -> id в очереди или в обработке
+        self._queued: Dict[int, Set[int]] = {}
+        # peer_id -> обработанные id выше last_post_id (ждут более ранних)
+        self._completed: Dict[int, Set[int]] = {}
+        # peer_id -> id, которые надо дочитать: выброшены при переполнении или упали
+        self._owed: Dict[int, Set[int]] = {}
+        self._attempts: Dict[Tuple[int, int], int] = {}
+        self._start_task: Optional[asyncio.Task] = None
+        self._running = False
+        self.processed = 0
+        self.dropped = 0
+        self.leads = 0
+        self._last_drop_log = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._running and self.client is not None and self.client.is_connected()
+
+    def subscribed_target_ids(self) -> Set[int]:
+        """id записей target_resources, на которые поток подписан (их пакетный hunt() не читает)."""
+        if not self.is_running:
+            return set()
+        return {target["id"] for target in self._targets.values() if target.get("id")}
+
+    def stats(self) -> Dict:
+        return {
+            "running": self.is_running,
+            "chats": len(self._targets),
+            "queue": self.queue.qsize() if self.queue else 0,
+            "queue_max": STREAM_QUEUE_SIZE,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "leads": self.leads,
+        }
+
+    def _collect_metrics(self) -> None:
+        from monitoring.metrics import QUEUE_DEPTH
+        QUEUE_DEPTH.set(self.queue.qsize() if self.queue else 0, queue="lead_stream")
+
+    def start_background(self, hunter) -> None:
+        """start() фоновой задачей: ссылка хранится здесь, stop() отменит незавершённый старт."""
+        if self._start_task is None or self._start_task.done():
+            self._start_task = asyncio.create_task(self.start(hunter), name="lead_stream_start")
+
+    async def start(self, hunter) -> bool:
+        """Подключиться, подписаться на чаты, догнать пропущенное и запустить воркеры."""
+        if self._running:
+            return True
+        from config import API_ID, API_HASH
+        if not API_ID or not API_HASH:
+            logger.warning("⚠️ Поток лидов: API_ID/API_HASH не заданы — остаёмся на пакетном hunt()")
+            return False
+
+        from telethon import TelegramClient
+        from services.session_pool import session_pool
+        self.hunter = hunter
+        # Сессия из пула сканера — берём его клиент: два клиента на одном .session файле конфликтуют
+        self._shared_client = LEAD_STREAM_SESSION in session_pool.sessions
+        if self._shared_client:
+            self.client = await session_pool.client_for(LEAD_STREAM_SESSION)
+        else:
+            self.client = TelegramClient(LEAD_STREAM_SESSION, API_ID, API_HASH)
+            await self.client.connect()
+        if self.client is None or not await self.client.is_user_authorized():
+            logger.error("❌ Поток лидов: сессия не авторизована — остаёмся на пакетном hunt()")
+            if self.client is not None and not self._shared_client:
+                await self.client.disconnect()
+            self.client = None
+            return False
+
+        self.queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self._running = True
+        from monitoring.metrics import registry
+        registry.add_collector(self._collect_metrics)
+        await self._subscribe()
+        self._tasks = [asyncio.create_task(self._worker(i), name=f"lead_stream_worker_{i}") for i in range(STREAM_WORKERS)]
+        self._tasks.append(asyncio.create_task(self._supervise(), name="lead_stream_supervisor"))
+        await self._catch_up(list(self._targets))
+        logger.info(f"⚡ Поток лидов запущен: {len(self._targets)} чатов, очередь {STREAM_QUEUE_SIZE}, воркеров {STREAM_WORKERS}")
+        return True
+
+    async def stop(self) -> None:
+        start_task, self._start_task = self._start_task, None
+        if start_task is not None and not start_task.done():
+            start_task.cancel()
+            try:
+                await start_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        if not self._running and self.client is None:
+            return
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._tasks = []
+        if self.client and self._handler:
+            self.client.remove_event_handler(self._handler)
+            self._handler = None
+        if self.client and not self._shared_client:
+            try:
+                await self.client.disconnect()
+            except Exception:
+                pass
+        self.client = None
+        logger.info("⚡ Поток лидов остановлен")
+
+    # ── Подписки ───────────────────────────────────────────────────────────────
+
+    async def _subscribe(self) -> None:
+        """Разрешить сущности активных Telegram-ресурсов и (пере)повесить обработчик NewMessage."""
+        from telethon import events
+        from services.entity_cache import entity_cache
+
+        main_db = await self.hunter._ensure_db_connected()
+        targets = await main_db.get_active_targets_for_scout(platform="telegram")
+        resolved: Dict[int, Dict] = {}
+        peers: Dict[int, object] = {}
+        for target in targets:
+            link = target.get("link")
+            if not link:
+                continue
+            cached = entity_cache.get(LEAD_STREAM_SESSION, link) is not None
+            try:
+                entity = await entity_cache.resolve(self.client, link, LEAD_STREAM_SESSION)
+            except Exception as e:
+                logger.debug(f"Поток лидов: не удалось получить {link}: {e}")
+                continue
+            peer_id = entity.peer_id
+            resolved[peer_id] = target
+            peers[peer_id] = entity.input_peer
+            self._last_ids.setdefault(peer_id, int(target.get("last_post_id") or 0))
+            if not cached:
+                await asyncio.sleep(0.3)  # бережём лимиты get_entity
+
+        if self._handler:
+            self.client.remove_event_handler(self._handler)
+        self._targets = resolved
+        self._peers = peers
+        if resolved:
+            self._handler = self._on_message
+            self.client.add_event_handler(self._handler, events.NewMessage(chats=list(peers.values())))
+
+    async def _on_message(self, event) -> None:
+        msg = event.message
+        if not msg or not msg.text or not self._track(event.chat_id, msg.id):
+            return
+        try:
+            self.queue.put_nowait((event.chat_id, msg))
+        except asyncio.QueueFull:
+            self._queued[event.chat_id].discard(msg.id)
+            self._owed.setdefault(event.chat_id, set()).add(msg.id)
+            self.dropped += 1
+            prev = self._needs_catchup.get(event.chat_id)
+            self._needs_catchup[event.chat_id] = msg.id if prev is None else min(prev, msg.id)
+            now = time.monotonic()
+            if now - self._last_drop_log > 60:
+                self._last_drop_log = now
+                logger.warning(f"⚠️ Поток лидов: очередь заполнена ({STREAM_QUEUE_SIZE}), сообщения дочитаем позже")
+
+    # ── Обработка ──────────────────────────────────────────────────────────────
+
+    def _track(self, peer_id: int, msg_id: int) -> bool:
+        """Учесть сообщение как поставленное в очередь; False — оно уже в работе или обработано."""
+        if (
+            msg_id <= self._last_ids.get(peer_id, 0)
+            or msg_id in self._queued.get(peer_id, ())
+            or msg_id in self._completed.get(peer_id, ())
+        ):
+            return False
+        self._queued.setdefault(peer_id, set()).add(msg_id)
+        self._owed.get(peer_id, set()).discard(msg_id)
+        return True
+
+    def _to_post(self, peer_id: int, msg):
+        from services.scout_parser import ScoutPost
+
+        target = self._targets.get(peer_id, {})
+        link = target.get("link", "")
+        source_name = target.get("title", "Чат ЖК")
+        if target.get("geo_tag"):
+            source_name = f"{target['geo_tag']} | {source_name}"
+        author_id = None
+        if not getattr(msg, "post", False):
+            author_id = getattr(msg, "sender_id", None)
+            if author_id is not None and author_id < 0:
+                author_id = None  # сообщение от имени канала/чата
+        return ScoutPost(
+            source_type="telegram",
+            source_name=source_name,
+            source_id=str(peer_id),
+            post_id=str(msg.id),
+            text=msg.text,
+            author_id=author_id,
+            url=_message_url(link, msg.id),
+            published_at=msg.date,
+            source_link=link,
+        )
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            peer_id, msg = await self.queue.get()
+            try:
+                lead_id = await self.hunter.process_stream_post(self._to_post(peer_id, msg))
+                self.processed += 1
+                if lead_id:
+                    self.leads += 1
+                await self._advance(peer_id, msg.id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Поток лидов (воркер {index}): {e}")
+                await self._advance(peer_id, msg.id, failed=True)
+            finally:
+                self.queue.task_done()
+
+    async def _advance(self, peer_id: int, msg_id: int, failed: bool = False) -> None:
+        """Отметить сообщение обработанным (или упавшим) и продвинуть last_post_id, если можно."""
+        self._queued.get(peer_id, set()).discard(msg_id)
+        key = (peer_id, msg_id)
+        if failed:
+            attempts = self._attempts.get(key, 0) + 1
+            if attempts < 2:
+                # Держит last_post_id и дочитывается ближайшим догоняющим проходом
+                self._attempts[key] = attempts
+                self._owed.setdefault(peer_id, set()).add(msg_id)
+                prev = self._needs_catchup.get(peer_id)
+                self._needs_catchup[peer_id] = msg_id if prev is None else min(prev, msg_id)
+                return
+            logger.warning(f"⚠️ Поток лидов: сообщение {msg_id} ({peer_id}) пропущено после повторной ошибки")
+        self._attempts.pop(key, None)
+        self._completed.setdefault(peer_id, set()).add(msg_id)
+        await self._commit(peer_id)
+
+    async def _commit(self, peer_id: int) -> None:
+        """last_post_id — наибольший обработанный id, перед которым ничего не в работе и не в долгу."""
+        completed = self._completed.get(peer_id)
+        if not completed:
+            return
+        blockers = self._queued.get(peer_id, set()) | self._owed.get(peer_id, set())
+        ready = {i for i in completed if i < min(blockers)} if blockers else set(completed)
+        if not ready:
+            return
+        completed -= ready
+        msg_id = max(ready)
+        if msg_id <= self._last_ids.get(peer_id, 0):
+            return
+        self._last_ids[peer_id] = msg_id
+        target = self._targets.get(peer_id)
+        if not target or not target.get("id"):
+            return
+        try:
+            main_db = await self.hunter._ensure_db_connected()
+            await main_db.update_last_post_id(target["id"], msg_id)
+        except Exception as e:
+            logger.debug(f"Поток лидов: не удалось обновить last_post_id: {e}")
+
+    async def _catch_up(self, peer_ids) -> None:
+        """Дочитать сообщения после last_post_id (старт, переподключение, переполнение очереди)."""
+        for peer_id in peer_ids:
+            min_id = self._last_ids.get(peer_id, 0)
+            dropped_from = self._needs_catchup.pop(peer_id, None)
+            if dropped_from is not None:
+                min_id = min(min_id, dropped_from - 1)
+            if min_id <= 0:
+                continue  # первый запуск по чату — историю не тянем, только новые сообщения
+            seen: Set[int] = set()
+            try:
+                async for msg in self.client.iter_messages(self._peers.get(peer_id, peer_id), min_id=min_id, limit=CATCHUP_LIMIT, reverse=True):
+                    seen.add(msg.id)
+                    if msg.text and self._track(peer_id, msg.id):
+                        # await put — при полной очереди догоняющий проход просто ждёт воркеров
+                        await self.queue.put((peer_id, msg))
+            except Exception as e:
+                logger.debug(f"Поток лидов: догоняющий проход {peer_id}: {e}")
+                continue
+            # Долги, которых в чате уже нет (удалены), не должны держать last_post_id вечно
+            owed = self._owed.get(peer_id)
+            if owed:
+                read_until = max(seen) if len(seen) >= CATCHUP_LIMIT else float("inf")
+                owed.difference_update({i for i in owed if i not in seen and i <= read_until})
+                if owed:
+                    self._needs_catchup[peer_id] = min(owed)
+                await self._commit(peer_id)
+
+    async def _supervise(self) -> None:
+        """Переподключение + догоняющий проход, периодическая пересборка подписок."""
+        last_resubscribe = time.monotonic()
+        while self._running:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+            try:
+                if not self.client.is_connected():
+                    logger.warning("⚠️ Поток лидов: соединение потеряно, переподключаюсь...")
+                    await self.client.connect()
+                    await self._catch_up(list(self._targets))
+                    continue
+                if self._needs_catchup and self.queue.qsize() < STREAM_QUEUE_SIZE // 2:
+                    await self._catch_up(list(self._needs_catchup))
+                if time.monotonic() - last_resubscribe > RESUBSCRIBE_INTERVAL:
+                    last_resubscribe = time.monotonic()
+                    known = set(self._targets)
+                    await self._subscribe()
+                    new_chats = [p for p in self._targets if p not in known]
+                    if new_chats:
+                        logger.info(f"⚡ Поток лидов: подписка на {len(new_chats)} новых чатов")
+            except Exception as e:
+                logger.warning(f"⚠️ Поток лидов (supervisor): {e}")
+
+
+lead_stream = LeadStream()
@@ -0,0 +1,583 @@
+"""
+services/notifier.py — единая очередь исходящих уведомлений в Telegram.
+
+Карточки лидов, горячие лиды админу, файлы со списками, отчёты и логи публикаций
+не шлются напрямую, а ставятся в очередь; один отправитель выдерживает лимиты Telegram:
+  - общий бакет на бота (NOTIFY_GLOBAL_RATE в секунду, лимит Telegram ~30);
+  - бакет на чат: группа — NOTIFY_GROUP_PER_MIN в минуту (лимит 20), личка —
+    NOTIFY_PRIVATE_RATE в секунду (лимит ~1); топики одной группы делят её лимит;
+  - 429 (retry_after) блокирует бакет чата на указанное время, сообщение остаётся в очереди.
+
+Приоритеты: HOT (горячие лиды) → NORMAL (отчёты, логи, модерация) → LOW (тихие карточки).
+Горячим резервируется NOTIFY_HOT_RESERVE токенов бакета чата — они уходят сразу,
+даже когда группу заливают обычные сообщения. Порядок внутри чата и приоритета — FIFO.
+
+Если очередь длиннее NOTIFY_DIGEST_BACKLOG, LOW-сообщения с digest=True для одного
+чата/топика склеиваются в сводку (до NOTIFY_DIGEST_MAX штук, кнопки карточек
+сохраняются с номером карточки).
+
+Очередь персистентна: SQLite NOTIFY_DB_PATH (WAL), строка удаляется после доставки,
+после перезапуска неотправленное поднимается заново. Запись и удаление строк (с BLOB
+документов) идут в потоке (asyncio.to_thread), цикл событий не ждёт commit. Общий файл для main.py и
+vk_spy.py (разные namespace), у каждого процесса свой отправитель.
+
+Метрики: terion_notify_total{result}, terion_notify_latency_seconds{priority},
+terion_queue_depth{queue="notify"}.
+"""
+import asyncio
+import html
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+from monitoring.metrics import QUEUE_DEPTH, counter, histogram, registry
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HOT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+_PRIORITY_NAMES = {PRIORITY_HOT: "hot", PRIORITY_NORMAL: "normal", PRIORITY_LOW: "low"}
+
+NOTIFY_DB_PATH = os.getenv("NOTIFY_DB_PATH", "notify_queue.db")
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "25"))  # сообщений в секунду на бота
+NOTIFY_GROUP_PER_MIN = float(os.getenv("NOTIFY_GROUP_PER_MIN", "18"))  # в одну группу/канал
+NOTIFY_GROUP_BURST = float(os.getenv("NOTIFY_GROUP_BURST", "4"))
+NOTIFY_PRIVATE_RATE = float(os.getenv("NOTIFY_PRIVATE_RATE", "1"))  # в один личный чат, в секунду
+NOTIFY_HOT_RESERVE = float(os.getenv("NOTIFY_HOT_RESERVE", "1"))
+NOTIFY_DIGEST_BACKLOG = int(os.getenv("NOTIFY_DIGEST_BACKLOG", "8"))
+NOTIFY_DIGEST_MAX = int(os.getenv("NOTIFY_DIGEST_MAX", "10"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_MAX_AGE_HOURS = float(os.getenv("NOTIFY_MAX_AGE_HOURS", "24"))
+
+DIGEST_ITEM_CHARS = 350
+MESSAGE_LIMIT = 4096
+KEYBOARD_LIMIT = 100
+
+NOTIFY_EVENTS = counter(
+    "terion_notify_total", "Исходящие уведомления: queued / sent / digested / retry_after / failed / dropped",
+    ("result",),
+)
+NOTIFY_LATENCY = histogram(
+    "terion_notify_latency_seconds", "От постановки в очередь до доставки", ("priority",),
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900),
+)
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+class RetryAfter(Exception):
+    """Telegram ответил 429: повторить через seconds."""
+
+    def __init__(self, seconds: float):
+        super().__init__(f"retry after {seconds}s")
+        self.seconds = seconds
+
+
+class PermanentError(Exception):
+    """Повтор не поможет (чат не найден, бот заблокирован, битая разметка)."""
+
+
+class Notification:
+    __slots__ = ("id", "chat_id", "thread_id", "priority", "text", "parse_mode", "reply_markup",
+                 "disable_notification", "disable_preview", "digest", "document", "filename",
+                 "created_at", "queued_at", "attempts", "not_before")
+
+    def __init__(self, chat_id: Union[int, str], text: str, thread_id: Optional[int] = None,
+                 priority: int = PRIORITY_NORMAL, parse_mode: Optional[str] = "HTML",
+                 reply_markup: Optional[dict] = None, disable_notification: bool = False,
+                 disable_preview: bool = False, digest: bool = False, document: Optional[bytes] = None,
+                 filename: Optional[str] = None, created_at: Optional[float] = None):
+        self.id: Optional[int] = None
+        self.chat_id = chat_id
+        self.thread_id = thread_id
+        self.priority = priority
+        self.text = text
+        self.parse_mode = parse_mode
+        self.reply_markup = reply_markup
+        self.disable_notification = disable_notification
+        self.disable_preview = disable_preview
+        self.digest = digest
+        self.document = document
+        self.filename = filename
+        self.created_at = created_at or time.time()
+        self.queued_at = time.monotonic() - (time.time() - self.created_at)
+        self.attempts = 0
+        self.not_before = 0.0
+
+    def payload(self) -> str:
+        return json.dumps({
+            "text": self.text, "parse_mode": self.parse_mode, "reply_markup": self.reply_markup,
+            "disable_notification": self.disable_notification, "disable_preview": self.disable_preview,
+            "digest": self.digest, "filename": self.filename,
+        }, ensure_ascii=False)
+
+
+class _Bucket:
+    """Токен-бакет чата: ready_in() — сколько ждать (с резервом для горячих), take() — списать."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_in(self, now: float, reserve: float = 0.0) -> float:
+        self._refill(now)
+        need = 1.0 + min(reserve, self.capacity - 1.0)
+        return max((need - self.tokens) / self.rate, self.blocked_until - now, 0.0)
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1.0
+
+    def block(self, now: float, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = min(self.tokens, 0.0)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+def _normalize_chat_id(chat_id: Union[int, str]) -> Union[int, str]:
+    try:
+        return int(chat_id)
+    except (TypeError, ValueError):
+        return str(chat_id)
+
+
+def _markup_to_dict(reply_markup: Any) -> Optional[dict]:
+    if reply_markup is None or isinstance(reply_markup, dict):
+        return reply_markup
+    return reply_markup.model_dump(exclude_none=True)
+
+
+def _plain(notification: Notification) -> str:
+    text = notification.text or ""
+    if notification.parse_mode and notification.parse_mode.upper() == "HTML":
+        text = html.unescape(_TAG_RE.sub("", text))
+    text = " ".join(text.split())
+    return text if len(text) <= DIGEST_ITEM_CHARS else text[:DIGEST_ITEM_CHARS - 1] + "…"
+
+
+def build_digest(items: List[Notification]) -> Tuple[Notification, List[Notification]]:
+    """Склеить LOW-сообщения одного чата/топика; возвращает сводку и реально вошедшие сообщения."""
+    first = items[0]
+    parts: List[str] = []
+    rows: List[list] = []
+    included: List[Notification] = []
+    length = 100  # запас на заголовок
+    for number, item in enumerate(items, 1):
+        part = f"<b>{number}.</b> {html.escape(_plain(item))}"
+        item_rows = [
+            [{**button, "text": f"{number}· {button.get('text', '')}"} for button in row]
+            for row in (item.reply_markup or {}).get("inline_keyboard", [])
+        ]
+        buttons = sum(len(row) for row in rows + item_rows)
+        if included and (length + len(part) + 2 > MESSAGE_LIMIT or buttons > KEYBOARD_LIMIT):
+            break
+        parts.append(part)
+        rows.extend(item_rows)
+        included.append(item)
+        length += len(part) + 2
+    header = f"📦 <b>Сводка: {len(included)} уведомлений</b> <i>(очередь перегружена — объединено)</i>"
+    digest = Notification(
+        first.chat_id, "\n\n".join([header] + parts), thread_id=first.thread_id, priority=PRIORITY_LOW,
+        parse_mode="HTML", reply_markup={"inline_keyboard": rows} if rows else None,
+        disable_notification=all(i.disable_notification for i in included), disable_preview=True,
+    )
+    return digest, included
+
+
+# ── Транспорты ───────────────────────────────────────────────────────────────
+
+class BotTransport:
+    """Отправка через aiogram: основной бот из utils.bot_config, вне main.py — свой Bot(BOT_TOKEN)."""
+
+    def __init__(self):
+        self._own_bot = None
+
+    def _bot(self):
+        from utils.bot_config import get_main_bot
+
+        bot = get_main_bot()
+        if bot is not None:
+            return bot
+        if self._own_bot is None:
+            from aiogram import Bot
+            from aiogram.client.default import DefaultBotProperties
+            from config import BOT_TOKEN
+
+            if not BOT_TOKEN:
+                raise PermanentError("BOT_TOKEN не задан")
+            self._own_bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+        return self._own_bot
+
+    async def send(self, n: Notification) -> None:
+        from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+        from aiogram.types import BufferedInputFile, InlineKeyboardMarkup
+
+        bot = self._bot()
+        markup = InlineKeyboardMarkup.model_validate(n.reply_markup) if n.reply_markup else None
+        try:
+            if n.document is not None:
+                await bot.send_document(
+                    n.chat_id, BufferedInputFile(n.document, filename=n.filename or "file.txt"),
+                    caption=n.text or None, parse_mode=n.parse_mode, message_thread_id=n.thread_id,
+                    reply_markup=markup, disable_notification=n.disable_notification,
+                )
+            else:
+                await bot.send_message(
+                    n.chat_id, n.text, parse_mode=n.parse_mode, message_thread_id=n.thread_id,
+                    reply_markup=markup, disable_notification=n.disable_notification,
+                    disable_web_page_preview=n.disable_preview,
+                )
+        except TelegramRetryAfter as e:
+            raise RetryAfter(e.retry_after) from e
+        except (TelegramBadRequest, TelegramForbiddenError) as e:
+            raise PermanentError(str(e)) from e
+
+    async def close(self) -> None:
+        if self._own_bot is not None:
+            try:
+                await self._own_bot.session.close()
+            except Exception:
+                pass
+            self._own_bot = None
+
+
+class HttpTransport:
+    """Отправка напрямую в Bot API через aiohttp (vk_spy.py: без aiogram и основного бота)."""
+
+    def __init__(self, token: str, session, api_base: str = "https://api.telegram.org"):
+        self.token = token
+        self.session = session
+        self.api_base = api_base.rstrip("/")
+
+    async def send(self, n: Notification) -> None:
+        import aiohttp
+
+        if n.document is not None:
+            raise PermanentError("HttpTransport не отправляет файлы")
+        payload: Dict[str, Any] = {"chat_id": n.chat_id, "text": n.text,
+                                   "disable_web_page_preview": n.disable_preview,
+                                   "disable_notification": n.disable_notification}
+        if n.parse_mode:
+            payload["parse_mode"] = n.parse_mode
+        if n.thread_id:
+            payload["message_thread_id"] = n.thread_id
+        if n.reply_markup:
+            payload["reply_markup"] = n.reply_markup
+        async with self.session.post(
+            f"{self.api_base}/bot{self.token}/sendMessage", json=payload, timeout=aiohttp.ClientTimeout(total=15),
+        ) as resp:
+            if resp.status == 200:
+                return
+            try:
+                body = await resp.json(content_type=None)
+            except Exception:
+                body = {"description": (await resp.text())[:200]}
+            if resp.status == 429:
+                raise RetryAfter(float((body.get("parameters") or {}).get("retry_after", 5)))
+            if resp.status in (400, 403):
+                raise PermanentError(f"{resp.status}: {body.get('description', '')}")
+            raise RuntimeError(f"Telegram sendMessage {resp.status}: {body.get('description', '')}")
+
+    async def close(self) -> None:
+        pass
+
+
+# ── Очередь ──────────────────────────────────────────────────────────────────
+
+class Notifier:
+    """Очередь уведомлений процесса; отправитель стартует при первом send() или из start()."""
+
+    def __init__(self, namespace: str = "main", transport=None, db_path: Optional[str] = None):
+        self.namespace = namespace
+        self.transport = transport or BotTransport()
+        self.db_path = db_path or NOTIFY_DB_PATH
+        self.queues: Dict[int, Deque[Notification]] = {p: deque() for p in _PRIORITY_NAMES}
+        self.global_bucket = _Bucket(NOTIFY_GLOBAL_RATE, max(1.0, NOTIFY_GLOBAL_RATE))
+        self.chat_buckets: Dict[Union[int, str], _Bucket] = {}
+        self.conn: Optional[sqlite3.Connection] = None
+        # Соединение общее для потоков to_thread — запросы по очереди
+        self._db_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        registry.add_collector(lambda: QUEUE_DEPTH.set(len(self), queue="notify"))
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+    # ── SQLite ─────────────────────────────────────────────────────────────────
+
+    def _open(self) -> None:
+        if self.conn is not None:
+            return
+        dir_name = os.path.dirname(self.db_path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=30.0, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS notifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                namespace TEXT NOT NULL,
+                chat_id NOT NULL,
+                thread_id INTEGER,
+                priority INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                document BLOB,
+                created_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_notifications_ns ON notifications(namespace, id)")
+        self.conn.commit()
+
+    def _load(self) -> None:
+        """Поднять неотправленное после перезапуска (слишком старое удаляется)."""
+        cutoff = time.time() - NOTIFY_MAX_AGE_HOURS * 3600
+        expired = self.conn.execute(
+            "DELETE FROM notifications WHERE namespace = ? AND created_at < ?", (self.namespace, cutoff),
+        ).rowcount
+        self.conn.commit()
+        known = {n.id for q in self.queues.values() for n in q}
+        rows = self.conn.execute(
+            "SELECT id, chat_id, thread_id, priority, payload, document, created_at FROM notifications "
+            "WHERE namespace = ? ORDER BY id", (self.namespace,),
+        ).fetchall()
+        loaded = 0
+        for row_id, chat_id, thread_id, priority, payload, document, created_at in rows:
+            if row_id in known:
+                continue
+            data = json.loads(payload)
+            n = Notification(
+                chat_id, data.get("text") or "", thread_id=thread_id, priority=priority,
+                parse_mode=data.get("parse_mode"), reply_markup=data.get("reply_markup"),
+                disable_notification=bool(data.get("disable_notification")),
+                disable_preview=bool(data.get("disable_preview")), digest=bool(data.get("digest")),
+                document=document, filename=data.get("filename"), created_at=created_at,
+            )
+            n.id = row_id
+            self.queues.setdefault(priority, deque()).append(n)
+            loaded += 1
+        if loaded or expired:
+            logger.info(f"📮 Очередь уведомлений ({self.namespace}): поднято {loaded}, устарело {expired}")
+
+    def _persist(self, n: Notification) -> None:
+        """Синхронно (вызывать через asyncio.to_thread)."""
+        try:
+            with self._db_lock:
+                cursor = self.conn.execute(
+                    "INSERT INTO notifications (namespace, chat_id, thread_id, priority, payload, document, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.namespace, n.chat_id, n.thread_id, n.priority, n.payload(), n.document, n.created_at),
+                )
+                self.conn.commit()
+            n.id = cursor.lastrowid
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Уведомление не сохранено в {self.db_path}: {e}")
+
+    def _forget(self, ids: List[Tuple[int]]) -> None:
+        """Синхронно (вызывать через asyncio.to_thread)."""
+        try:
+            with self._db_lock:
+                self.conn.executemany("DELETE FROM notifications WHERE id = ?", ids)
+                self.conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Не удалось удалить доставленные уведомления: {e}")
+
+    # ── Жизненный цикл ─────────────────────────────────────────────────────────
+
+    async def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._open()
+        self._load()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name=f"notifier_{self.namespace}")
+
+    async def stop(self, drain_timeout: float = 5.0) -> None:
+        """Дать очереди досылаться drain_timeout секунд; остаток останется в SQLite до следующего старта."""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + drain_timeout
+        while len(self) and time.monotonic() < deadline and not self._task.done():
+            await asyncio.sleep(0.1)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.transport.close()
+        if len(self):
+            logger.info(f"📮 Очередь уведомлений ({self.namespace}): {len(self)} отложено до следующего запуска")
+
+    async def send(
+        self,
+        chat_id: Union[int, str],
+        text: str,
+        *,
+        thread_id: Optional[int] = None,
+        priority: int = PRIORITY_NORMAL,
+        digest: bool = False,
+        parse_mode: Optional[str] = "HTML",
+        reply_markup: Any = None,
+        disable_notification: bool = False,
+        disable_preview: bool = False,
+        document: Optional[bytes] = None,
+        filename: Optional[str] = None,
+    ) -> Notification:
+        """Поставить сообщение в очередь (сразу записывается в SQLite); доставка — в фоне."""
+        await self.start()
+        n = Notification(
+            _normalize_chat_id(chat_id), text, thread_id=int(thread_id) if thread_id else None,
+            priority=priority, parse_mode=parse_mode, reply_markup=_markup_to_dict(reply_markup),
+            disable_notification=disable_notification, disable_preview=disable_preview,
+            digest=digest and priority == PRIORITY_LOW and document is None, document=document, filename=filename,
+        )
+        await asyncio.to_thread(self._persist, n)
+        self.queues[priority].append(n)
+        NOTIFY_EVENTS.inc(result="queued")
+        self._wakeup.set()
+        return n
+
+    # ── Отправитель ────────────────────────────────────────────────────────────
+
+    def _bucket(self, chat_id: Union[int, str]) -> _Bucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            group = isinstance(chat_id, str) or chat_id < 0
+            if group:
+                bucket = _Bucket(NOTIFY_GROUP_PER_MIN / 60.0, NOTIFY_GROUP_BURST)
+            else:
+                bucket = _Bucket(NOTIFY_PRIVATE_RATE, 1.0)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _next(self, now: float) -> Tuple[Optional[Notification], float]:
+        """Первое сообщение, которое можно слать сейчас, или сколько ждать до ближайшего."""
+        wait = self.global_bucket.ready_in(now)
+        if wait > 0:
+            return None, wait
+        wait = 60.0
+        for priority in sorted(self.queues):
+            reserve = 0.0 if priority == PRIORITY_HOT else NOTIFY_HOT_RESERVE
+            blocked = set()
+            for n in self.queues[priority]:
+                if n.chat_id in blocked:
+                    continue  # порядок внутри чата сохраняется
+                delay = max(n.not_before - now, self._bucket(n.chat_id).ready_in(now, reserve))
+                if delay <= 0:
+                    return n, 0.0
+                blocked.add(n.chat_id)
+                wait = min(wait, delay)
+        return None, wait
+
+    def _batch(self, n: Notification) -> Tuple[Notification, List[Notification]]:
+        if not n.digest or len(self) <= NOTIFY_DIGEST_BACKLOG:
+            return n, [n]
+        same = [
+            item for item in self.queues[PRIORITY_LOW]
+            if item.digest and item.chat_id == n.chat_id and item.thread_id == n.thread_id
+        ][:NOTIFY_DIGEST_MAX]
+        if len(same) < 2:
+            return n, [n]
+        return build_digest(same)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self._wakeup.clear()
+                now = time.monotonic()
+                n, delay = self._next(now)
+                if n is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                message, items = self._batch(n)
+                await self._deliver(message, items)
+                self._prune(now)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Отправитель уведомлений: {e}")
+                await asyncio.sleep(1)
+
+    async def _deliver(self, message: Notification, items: List[Notification]) -> None:
+        now = time.monotonic()
+        bucket = self._bucket(message.chat_id)
+        bucket.take(now)
+        self.global_bucket.take(now)
+        try:
+            await self.transport.send(message)
+        except RetryAfter as e:
+            bucket.block(time.monotonic(), e.seconds)
+            NOTIFY_EVENTS.inc(result="retry_after")
+            logger.warning(f"⏳ Telegram 429 для чата {message.chat_id}: пауза {e.seconds} с, в очереди {len(self)}")
+            return
+        except PermanentError as e:
+            NOTIFY_EVENTS.inc(len(items), result="dropped")
+            logger.warning(f"⚠️ Уведомление в {message.chat_id} отброшено: {e}")
+            await self._done(items)
+            return
+        except Exception as e:
+            for item in items:
+                item.attempts += 1
+                item.not_before = time.monotonic() + min(300.0, 2.0 ** item.attempts)
+            failed = [item for item in items if item.attempts >= NOTIFY_MAX_ATTEMPTS]
+            if failed:
+                NOTIFY_EVENTS.inc(len(failed), result="failed")
+                logger.error(f"❌ Уведомление в {message.chat_id} не доставлено за {NOTIFY_MAX_ATTEMPTS} попыток: {e}")
+                await self._done(failed)
+            else:
+                logger.debug(f"Уведомление в {message.chat_id}: ошибка, повтор позже: {e}")
+            return
+        delivered = time.monotonic()
+        for item in items:
+            NOTIFY_LATENCY.observe(delivered - item.queued_at, priority=_PRIORITY_NAMES.get(item.priority, "normal"))
+        if len(items) > 1:
+            NOTIFY_EVENTS.inc(len(items), result="digested")
+            logger.info(f"📦 Сводка из {len(items)} уведомлений отправлена в {message.chat_id}")
+        NOTIFY_EVENTS.inc(result="sent")
+        await self._done(items)
+
+    async def _done(self, items: List[Notification]) -> None:
+        for item in items:
+            try:
+                self.queues[item.priority].remove(item)
+            except ValueError:
+                pass
+        ids = [(n.id,) for n in items if n.id is not None]
+        if ids:
+            await asyncio.to_thread(self._forget, ids)
+
+    def _prune(self, now: float) -> None:
+        if len(self.chat_buckets) <= 1000:
+            return
+        for chat_id in [c for c, b in self.chat_buckets.items() if b.idle(now)]:
+            del self.chat_buckets[chat_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {_PRIORITY_NAMES.get(p, str(p)): len(q) for p, q in self.queues.items()}
+
+
+notifier = Notifier()
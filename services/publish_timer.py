@@ -0,0 +1,190 @@
+"""
+Таймер публикаций контент-плана.
+
+Вместо опроса get_posts_to_publish() раз в час держим в памяти min-heap
+(publish_date, post_id) одобренных постов и спим ровно до ближайшего.
+База уведомляет таймер при save_post / update_content_plan_entry /
+update_content_post (через Database.add_content_plan_listener), поэтому
+новые и перенесённые посты подхватываются без перезагрузки.
+
+Посты, одобренные в другом процессе (content_bot.py, scripts/activate_*.py), уведомлений
+не присылают — их подбирает сверка с БД раз в PUBLISH_SWEEP_SECONDS.
+Посты без publish_date не публикуются (как и раньше в get_posts_to_publish).
+"""
+import asyncio
+import heapq
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Сверка heap с БД (и потолок сна): посты, одобренные другими процессами
+PUBLISH_SWEEP_SECONDS = int(os.getenv("PUBLISH_SWEEP_SECONDS", "300"))
+# Повтор публикации после ошибки
+RETRY_DELAY = timedelta(minutes=5)
+
+HASHTAGS = "#перепланировка #согласование #терион"
+
+
+def _parse_publish_date(value) -> Optional[datetime]:
+    """publish_date из SQLite приходит строкой ISO, из кода — datetime."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        logger.warning(f"⚠️ PublishTimer: не удалось разобрать publish_date={value!r}")
+        return None
+
+
+async def publish_content_plan_post(post: Dict) -> None:
+    """Публикация одного поста контент-плана во все каналы и пометка published."""
+    from services.publisher import publisher
+
+    title = (post.get("title") or "").strip()
+    body = (post.get("body") or "").strip()
+    if title:
+        text = f"📌 <b>{title}</b>\n\n{body}\n\n{HASHTAGS}"
+    else:
+        text = f"{body}\n\n{HASHTAGS}"
+    await publisher.publish_all(text, None)
+    await db.mark_as_published(post["id"])
+    logger.info("✅ Опубликован пост #%s из контент-плана", post["id"])
+
+
+class PublishTimer:
+    """Событийный планировщик публикаций: heap + asyncio.Event вместо polling."""
+
+    def __init__(self, publish: Callable[[Dict], Awaitable[None]] = publish_content_plan_post):
+        self._publish = publish
+        self._heap: List[Tuple[datetime, int]] = []
+        # post_id → не раньше этого времени (повтор после ошибки); переживает сверку с БД
+        self._retry: Dict[int, datetime] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._heap)
+
+    def next_due(self) -> Optional[datetime]:
+        return self._heap[0][0] if self._heap else None
+
+    async def start(self) -> None:
+        """Загрузить одобренные посты из БД и запустить фоновую задачу."""
+        if self._task and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        db.add_content_plan_listener(self.on_content_plan_changed)
+        await self.reload()
+        self._task = asyncio.create_task(self._run(), name="publish_timer")
+        logger.info(f"⏰ PublishTimer запущен: в очереди {self.pending} постов, ближайший — {self.next_due()}")
+
+    async def stop(self) -> None:
+        db.remove_content_plan_listener(self.on_content_plan_changed)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def reload(self) -> None:
+        """Полная пересборка heap из content_plan (status='approved')."""
+        heap = []
+        for row in await db.get_upcoming_posts():
+            publish_date = _parse_publish_date(row.get("publish_date"))
+            if publish_date is not None:
+                retry_at = self._retry.get(row["id"])
+                heap.append((max(publish_date, retry_at) if retry_at else publish_date, row["id"]))
+        heapq.heapify(heap)
+        self._heap = heap
+        alive = {post_id for _, post_id in heap}
+        self._retry = {post_id: at for post_id, at in self._retry.items() if post_id in alive}
+        self._wake()
+
+    def on_content_plan_changed(self, post_id: int, publish_date=None, status: Optional[str] = None) -> None:
+        """
+        Колбэк из Database: пост создан или изменён.
+
+        Старые записи в heap не ищем — при срабатывании пост перечитывается из БД,
+        и устаревшие записи (другой статус или дата) просто отбрасываются.
+        """
+        if status is not None and status != "approved":
+            return
+        due = _parse_publish_date(publish_date)
+        if due is None:
+            return
+        heapq.heappush(self._heap, (due, post_id))
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_sweep = loop.time() + PUBLISH_SWEEP_SECONDS
+        while True:
+            if loop.time() >= next_sweep:
+                next_sweep = loop.time() + PUBLISH_SWEEP_SECONDS
+                try:
+                    await self.reload()
+                except Exception as e:
+                    logger.error(f"❌ PublishTimer: сверка с БД не удалась: {e}")
+            self._wakeup.clear()
+            now = datetime.now()
+            if self._heap and self._heap[0][0] <= now:
+                _, post_id = heapq.heappop(self._heap)
+                await self._fire(post_id)
+                continue
+
+            timeout = next_sweep - loop.time()
+            if self._heap:
+                timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, post_id: int) -> None:
+        """Перечитать пост и опубликовать, если он всё ещё одобрен и срок наступил."""
+        try:
+            post = await db.get_content_post(post_id)
+        except Exception as e:
+            logger.error(f"❌ PublishTimer: не удалось прочитать пост #{post_id}: {e}")
+            heapq.heappush(self._heap, (datetime.now() + RETRY_DELAY, post_id))
+            return
+        if not post or post.get("status") != "approved":
+            return
+
+        due = _parse_publish_date(post.get("publish_date"))
+        if due is None:
+            return  # без даты не публикуем
+        retry_at = self._retry.get(post_id)
+        if retry_at and retry_at > datetime.now():
+            heapq.heappush(self._heap, (retry_at, post_id))
+            return
+        if due > datetime.now():
+            # Пост перенесли на более позднее время — ставим заново
+            heapq.heappush(self._heap, (due, post_id))
+            return
+
+        try:
+            await self._publish(post)
+        except Exception as e:
+            logger.error(f"❌ Ошибка публикации поста #{post_id}: {e}")
+            self._retry[post_id] = datetime.now() + RETRY_DELAY
+            heapq.heappush(self._heap, (self._retry[post_id], post_id))
+            return
+        self._retry.pop(post_id, None)
+
+
+publish_timer = PublishTimer()
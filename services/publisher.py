@@ -8,8 +8,11 @@ from typing import Dict, Optional
 import aiohttp
 from aiogram import Bot
 
+from monitoring.metrics import PUBLISHER_SECONDS, instrument_methods
+
 logger = logging.getLogger(__name__)
 
+@instrument_methods(PUBLISHER_SECONDS)
 class Publisher:
     """Публикация контента в Telegram и VK"""
     
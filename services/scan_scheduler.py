@@ -0,0 +1,276 @@
+"""
+Адаптивное расписание сканирования источников (target_resources) по выходу лидов.
+
+По каждому источнику копится статистика (колонки миграции 006):
+  msg_rate               — новых сообщений в час (EWMA по сканам);
+  msgs_seen, leads_seen  — просмотрено сообщений / найдено лидов, с полураспадом
+                           SCAN_HALF_LIFE_DAYS (старая статистика постепенно забывается);
+  scan_count, scan_errors, last_message_at, next_scan_at, scan_limit;
+  scan_tracked_since     — первый адаптивный скан (миграция 007).
+
+План цикла (plan):
+  - сканируются только источники, чей next_scan_at наступил (новые — всегда);
+  - ценность источника — выборка Томпсона: доля лидов ~ Beta(лиды + 1, сообщения + SCAN_PRIOR_MESSAGES)
+    × ожидаемое число новых сообщений. У новых и малоизученных источников распределение
+    широкое — они «исследуются» сами; просроченные источники получают надбавку;
+  - источники берутся по убыванию ценности, пока сумма окон не превысит SCAN_CYCLE_BUDGET
+    сообщений — остальные ждут следующего цикла.
+
+После скана (record):
+  - интервал = время накопления SCAN_WINDOW_TARGET новых сообщений, делённое на
+    относительную урожайность (доля лидов источника / средняя по платформе),
+    в пределах [SCAN_MIN_INTERVAL_MIN, SCAN_MAX_INTERVAL_HOURS];
+  - окно (limit) = ожидаемые новые сообщения за интервал × 1.5 в пределах
+    [SCAN_LIMIT_MIN, SCAN_LIMIT_MAX]; окно заполнилось целиком — удваивается;
+  - автоархив (кроме is_high_priority): нет сообщений SCAN_ARCHIVE_SILENT_DAYS дней
+    (с последнего увиденного, а если их не было — с scan_tracked_since, не с created_at:
+    старый источник иначе архивировался бы сразу после исследования),
+    SCAN_ARCHIVE_MAX_ERRORS ошибок подряд или SCAN_ARCHIVE_BARREN_MSGS сообщений без лидов.
+    Вернуть источник — статус active в админке.
+
+SCAN_ADAPTIVE=0 — как раньше: все активные источники каждый цикл с фиксированным окном.
+"""
+import logging
+import math
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from monitoring.metrics import counter
+
+logger = logging.getLogger(__name__)
+
+SCAN_ADAPTIVE = os.getenv("SCAN_ADAPTIVE", "1") != "0"
+SCAN_CYCLE_BUDGET = int(os.getenv("SCAN_CYCLE_BUDGET", "1500"))  # сообщений на платформу за цикл
+SCAN_WINDOW_TARGET = float(os.getenv("SCAN_WINDOW_TARGET", "40"))
+SCAN_LIMIT_MIN = int(os.getenv("SCAN_LIMIT_MIN", "10"))
+SCAN_LIMIT_MAX = int(os.getenv("SCAN_LIMIT_MAX", "300"))
+SCAN_MIN_INTERVAL_MIN = float(os.getenv("SCAN_MIN_INTERVAL_MIN", "30"))
+SCAN_MAX_INTERVAL_HOURS = float(os.getenv("SCAN_MAX_INTERVAL_HOURS", "24"))
+SCAN_HALF_LIFE_DAYS = float(os.getenv("SCAN_HALF_LIFE_DAYS", "14"))
+SCAN_PRIOR_MESSAGES = float(os.getenv("SCAN_PRIOR_MESSAGES", "50"))
+SCAN_EXPLORE_SCANS = int(os.getenv("SCAN_EXPLORE_SCANS", "3"))
+SCAN_ARCHIVE_SILENT_DAYS = float(os.getenv("SCAN_ARCHIVE_SILENT_DAYS", "30"))
+SCAN_ARCHIVE_MAX_ERRORS = int(os.getenv("SCAN_ARCHIVE_MAX_ERRORS", "5"))
+SCAN_ARCHIVE_BARREN_MSGS = float(os.getenv("SCAN_ARCHIVE_BARREN_MSGS", "1500"))
+
+RATE_EWMA = 0.3
+# Прежние фиксированные окна (обычный, приоритетный) — для SCAN_ADAPTIVE=0 и первого скана
+LEGACY_LIMITS = {"telegram": (20, 100), "vk": (5, 100)}
+# Ограничения API на одно чтение
+PLATFORM_MAX_LIMIT = {"vk": 100}
+
+SCAN_SOURCES = counter(
+    "terion_scan_sources_total", "Источники в циклах скана: scanned / deferred / error / archived",
+    ("platform", "result"),
+)
+
+
+def _ts(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    try:
+        return datetime.fromisoformat(str(value)).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _clamp(value: float, low: float, high: float) -> float:
+    return max(low, min(high, value))
+
+
+class ScanPlan:
+    __slots__ = ("target", "limit", "value")
+
+    def __init__(self, target: Dict, limit: int, value: float):
+        self.target = target
+        self.limit = limit
+        self.value = value
+
+
+class ScanScheduler:
+    """Планировщик сканов; статистика живёт в строках target_resources, здесь — только расчёт."""
+
+    def __init__(self):
+        # Средняя доля лидов по платформе — база для относительной урожайности
+        self.platform_rate: Dict[str, float] = {}
+
+    @staticmethod
+    def _is_priority(target: Dict) -> bool:
+        return (target.get("is_high_priority") or 0) == 1
+
+    def _legacy_limit(self, target: Dict, platform: str) -> int:
+        normal, priority = LEGACY_LIMITS.get(platform, (20, 100))
+        return priority if self._is_priority(target) else normal
+
+    def _max_limit(self, platform: str) -> int:
+        return min(SCAN_LIMIT_MAX, PLATFORM_MAX_LIMIT.get(platform, SCAN_LIMIT_MAX))
+
+    def _prior(self, target: Dict):
+        return (2.0 if self._is_priority(target) else 1.0), SCAN_PRIOR_MESSAGES
+
+    def lead_rate(self, target: Dict) -> float:
+        """Апостериорное среднее доли лидов источника."""
+        a0, b0 = self._prior(target)
+        return (float(target.get("leads_seen") or 0) + a0) / (float(target.get("msgs_seen") or 0) + a0 + b0)
+
+    def plan(self, targets: List[Dict], platform: str, now: Optional[datetime] = None) -> List[ScanPlan]:
+        """Кого сканировать в этом цикле и сколько сообщений читать (по убыванию ценности)."""
+        if not SCAN_ADAPTIVE:
+            return [ScanPlan(t, self._legacy_limit(t, platform), 0.0) for t in
+                    sorted(targets, key=lambda x: (not self._is_priority(x), x.get("title") or ""))]
+        now = now or datetime.now()
+        msgs = sum(float(t.get("msgs_seen") or 0) for t in targets)
+        leads = sum(float(t.get("leads_seen") or 0) for t in targets)
+        self.platform_rate[platform] = (leads + 1.0) / (msgs + 1.0 + SCAN_PRIOR_MESSAGES)
+
+        candidates: List[ScanPlan] = []
+        for target in targets:
+            next_at = _ts(target.get("next_scan_at"))
+            if next_at is not None and next_at > now:
+                continue
+            a0, b0 = self._prior(target)
+            sample = random.betavariate(float(target.get("leads_seen") or 0) + a0,
+                                        float(target.get("msgs_seen") or 0) + b0)
+            limit = int(target.get("scan_limit") or self._legacy_limit(target, platform))
+            limit = int(_clamp(limit, SCAN_LIMIT_MIN, self._max_limit(platform)))
+            rate = target.get("msg_rate")
+            last = _ts(target.get("last_scanned_at"))
+            if rate is None or last is None:
+                expected = float(limit)
+            else:
+                expected = min(float(limit), float(rate) * (now - last).total_seconds() / 3600)
+            overdue = 1.0
+            if next_at is not None and last is not None and next_at > last:
+                overdue += (now - next_at).total_seconds() / max(1.0, (next_at - last).total_seconds())
+            candidates.append(ScanPlan(target, limit, sample * max(expected, 1.0) * min(overdue, 4.0)))
+
+        candidates.sort(key=lambda p: p.value, reverse=True)
+        chosen: List[ScanPlan] = []
+        budget = SCAN_CYCLE_BUDGET
+        for plan in candidates:
+            if chosen and plan.limit > budget:
+                continue
+            chosen.append(plan)
+            budget -= plan.limit
+        deferred = len(candidates) - len(chosen)
+        SCAN_SOURCES.inc(len(chosen), platform=platform, result="scanned")
+        if deferred:
+            SCAN_SOURCES.inc(deferred, platform=platform, result="deferred")
+        logger.info(
+            f"🗓 {platform}: к скану {len(chosen)} из {len(targets)} источников "
+            f"(окно {sum(p.limit for p in chosen)} сообщений; не пришёл срок {len(targets) - len(candidates)}, "
+            f"отложено по бюджету {deferred})"
+        )
+        return chosen
+
+    def update(self, target: Dict, platform: str, limit: int, fetched: int, leads: int,
+               newest_at: Optional[datetime] = None, oldest_at: Optional[datetime] = None,
+               now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Новая статистика источника после успешного скана (+ status='archived', если источник мёртв)."""
+        now = now or datetime.now()
+        last = _ts(target.get("last_scanned_at"))
+        hours = (now - last).total_seconds() / 3600 if last else None
+        decay = 0.5 ** (hours / (SCAN_HALF_LIFE_DAYS * 24)) if hours else 1.0
+        msgs_seen = float(target.get("msgs_seen") or 0) * decay + fetched
+        leads_seen = float(target.get("leads_seen") or 0) * decay + leads
+        saturated = fetched >= limit
+
+        rate = target.get("msg_rate")
+        observed = None
+        if hours and hours > 0:
+            observed = fetched / hours
+        elif fetched >= 2 and newest_at and oldest_at and newest_at > oldest_at:
+            observed = fetched / max((newest_at - oldest_at).total_seconds() / 3600, 0.1)
+        if observed is not None:
+            rate = observed if rate is None else (1 - RATE_EWMA) * float(rate) + RATE_EWMA * observed
+            if saturated:
+                rate = max(rate, observed)  # окно заполнено — реальный поток не меньше наблюдаемого
+
+        last_message_at = _ts(target.get("last_message_at"))
+        newest_at = _ts(newest_at)
+        if newest_at and (last_message_at is None or newest_at > last_message_at):
+            last_message_at = newest_at
+
+        scan_count = int(target.get("scan_count") or 0) + 1
+        tracked_since = _ts(target.get("scan_tracked_since")) or now
+        stats: Dict[str, Any] = {
+            "scan_count": scan_count, "scan_errors": 0, "msgs_seen": round(msgs_seen, 3),
+            "leads_seen": round(leads_seen, 3), "msg_rate": rate, "last_message_at": last_message_at,
+            "last_scanned_at": now, "scan_tracked_since": tracked_since,
+        }
+
+        min_h = SCAN_MIN_INTERVAL_MIN / 60
+        if scan_count < SCAN_EXPLORE_SCANS or not rate:
+            interval_h = min_h if scan_count < SCAN_EXPLORE_SCANS else SCAN_MAX_INTERVAL_HOURS / 4
+        else:
+            candidate = dict(target, msgs_seen=msgs_seen, leads_seen=leads_seen)
+            ratio = self.lead_rate(candidate) / self.platform_rate.get(platform, self.lead_rate(candidate))
+            interval_h = (SCAN_WINDOW_TARGET / float(rate)) / _clamp(ratio, 0.25, 4.0)
+        interval_h = _clamp(interval_h, min_h, SCAN_MAX_INTERVAL_HOURS)
+        new_limit = math.ceil(float(rate or 0) * interval_h * 1.5) or self._legacy_limit(target, platform)
+        if saturated:
+            new_limit = max(new_limit, limit * 2)
+        stats["scan_limit"] = int(_clamp(new_limit, SCAN_LIMIT_MIN, self._max_limit(platform)))
+        stats["next_scan_at"] = now + timedelta(hours=interval_h)
+
+        reason = self._archive_reason(target, scan_count, msgs_seen, leads_seen, last_message_at,
+                                      tracked_since, now)
+        if reason:
+            stats.update(status="archived", is_active=0)
+            SCAN_SOURCES.inc(platform=platform, result="archived")
+            logger.info(f"🗄 Источник архивирован ({reason}): {target.get('title') or target.get('link')}")
+        return stats
+
+    def _archive_reason(self, target: Dict, scan_count: int, msgs_seen: float, leads_seen: float,
+                        last_message_at: Optional[datetime], tracked_since: datetime,
+                        now: datetime) -> Optional[str]:
+        if not SCAN_ADAPTIVE or self._is_priority(target) or scan_count < SCAN_EXPLORE_SCANS:
+            return None
+        # Сообщений не видели — молчание считаем с начала учёта (VK-дедуп даёт fetched=0 и у живых)
+        silent_since = last_message_at or tracked_since
+        if now - silent_since > timedelta(days=SCAN_ARCHIVE_SILENT_DAYS):
+            return f"нет сообщений {SCAN_ARCHIVE_SILENT_DAYS:g} дн."
+        last_lead = _ts(target.get("last_lead_at"))
+        recent_lead = last_lead and now - last_lead < timedelta(days=SCAN_ARCHIVE_SILENT_DAYS)
+        if msgs_seen >= SCAN_ARCHIVE_BARREN_MSGS and leads_seen < 0.5 and not recent_lead:
+            return f"{int(msgs_seen)} сообщений без лидов"
+        return None
+
+    def update_error(self, target: Dict, platform: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Ошибка чтения: экспоненциальная пауза, после SCAN_ARCHIVE_MAX_ERRORS подряд — архив."""
+        now = now or datetime.now()
+        errors = int(target.get("scan_errors") or 0) + 1
+        backoff_h = min(SCAN_MAX_INTERVAL_HOURS, SCAN_MIN_INTERVAL_MIN / 60 * 2 ** errors)
+        stats: Dict[str, Any] = {"scan_errors": errors, "next_scan_at": now + timedelta(hours=backoff_h)}
+        SCAN_SOURCES.inc(platform=platform, result="error")
+        if SCAN_ADAPTIVE and errors >= SCAN_ARCHIVE_MAX_ERRORS and not self._is_priority(target):
+            stats.update(status="archived", is_active=0)
+            SCAN_SOURCES.inc(platform=platform, result="archived")
+            logger.info(f"🗄 Источник архивирован ({errors} ошибок подряд): {target.get('title') or target.get('link')}")
+        return stats
+
+    async def record(self, db, plan: ScanPlan, platform: str, fetched: int, leads: int,
+                     newest_at: Optional[datetime] = None, oldest_at: Optional[datetime] = None,
+                     error: Optional[Exception] = None) -> None:
+        """Пересчитать расписание источника после скана и сохранить в target_resources."""
+        if not SCAN_ADAPTIVE:
+            return
+        target = plan.target
+        if error is not None:
+            stats = self.update_error(target, platform)
+        else:
+            stats = self.update(target, platform, plan.limit, fetched, leads, newest_at, oldest_at)
+        target.update(stats)
+        if db is None or not target.get("id"):
+            return
+        try:
+            await db.update_target_scan_stats(target["id"], stats)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить расписание скана для {target.get('link')}: {e}")
+
+
+scan_scheduler = ScanScheduler()
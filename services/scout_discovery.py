@@ -19,6 +19,8 @@ from typing import List, Dict, Optional, Set
 
 import aiohttp
 
+from services.seen_store import SeenStore
+
 logger = logging.getLogger("ScoutDiscovery")
 
 # Конфигурация
@@ -55,7 +57,8 @@ STOP_WORDS = [
 
 # Файл для хранения найденных групп
 FOUND_GROUPS_FILE = Path("vk_scout_found_groups.json")
-SEEN_GROUPS_FILE = Path("vk_scout_seen_groups.json")
+SEEN_GROUPS_FILE = Path("vk_scout_seen_groups.json")  # старый формат, переносится в SeenStore
+SEEN_GROUPS_TTL_DAYS = int(os.getenv("SEEN_GROUPS_TTL_DAYS", "90"))
 
 # Интервал поиска новых групп (раз в сутки)
 DISCOVERY_INTERVAL = 24 * 3600  # 24 часа
@@ -67,11 +70,13 @@ class ScoutDiscovery:
     def __init__(self):
         self.session: Optional[aiohttp.ClientSession] = None
         self.found_groups: Dict[str, Dict] = {}  # group_id -> info
-        self.seen_groups: Set[str] = set()
+        # Просмотренные группы: SQLite с TTL — через SEEN_GROUPS_TTL_DAYS группа снова может попасть в выдачу
+        self.seen_groups = SeenStore(namespace="vk_discovery_groups", ttl_days=SEEN_GROUPS_TTL_DAYS)
+        self._found_dirty = False
         self.load_state()
     
     def load_state(self):
-        """Загружает сохранённые группы и просмотренные ID."""
+        """Загружает сохранённые группы и переносит старый JSON просмотренных ID."""
         if FOUND_GROUPS_FILE.exists():
             try:
                 data = json.loads(FOUND_GROUPS_FILE.read_text(encoding="utf-8"))
@@ -79,30 +84,21 @@ class ScoutDiscovery:
             except Exception as e:
                 logger.warning("Не удалось загрузить found_groups: %s", e)
         
-        if SEEN_GROUPS_FILE.exists():
-            try:
-                data = json.loads(SEEN_GROUPS_FILE.read_text(encoding="utf-8"))
-                self.seen_groups = set(data.get("seen", []))
-            except Exception as e:
-                logger.warning("Не удалось загрузить seen_groups: %s", e)
+        self.seen_groups.import_legacy_json(SEEN_GROUPS_FILE, field="seen")
     
     def save_state(self):
-        """Сохраняет найденные группы и просмотренные ID."""
-        try:
-            FOUND_GROUPS_FILE.write_text(
-                json.dumps({"groups": self.found_groups}, ensure_ascii=False, indent=2),
-                encoding="utf-8"
-            )
-        except Exception as e:
-            logger.warning("Не удалось сохранить found_groups: %s", e)
+        """Сохраняет найденные группы (только при изменениях) и новые просмотренные ID."""
+        if self._found_dirty:
+            try:
+                FOUND_GROUPS_FILE.write_text(
+                    json.dumps({"groups": self.found_groups}, ensure_ascii=False, separators=(",", ":")),
+                    encoding="utf-8"
+                )
+                self._found_dirty = False
+            except Exception as e:
+                logger.warning("Не удалось сохранить found_groups: %s", e)
         
-        try:
-            SEEN_GROUPS_FILE.write_text(
-                json.dumps({"seen": list(self.seen_groups)}, ensure_ascii=False, indent=2),
-                encoding="utf-8"
-            )
-        except Exception as e:
-            logger.warning("Не удалось сохранить seen_groups: %s", e)
+        self.seen_groups.flush()
     
     async def vk_get(self, method: str, params: dict) -> Optional[dict]:
         """Выполняет запрос к VK API."""
@@ -224,6 +220,7 @@ class ScoutDiscovery:
                 "description": g.get("description", "")[:200],
                 "added_at": datetime.now().isoformat(),
             }
+            self._found_dirty = True
         
         self.save_state()
         logger.info("🎯 Найдено %d новых групп", len(new_groups))
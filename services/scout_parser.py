@@ -13,7 +13,6 @@ import aiohttp
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 from dataclasses import dataclass
-from telethon import TelegramClient
 from config import API_ID, API_HASH
 from database.db import Database
 
@@ -24,7 +23,7 @@ SESSION_NAME = "anton_parser"
 =======
 import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional
 from dataclasses import dataclass
 import aiohttp
 from config import VK_TOKEN, VK_GROUP_ID
@@ -32,8 +31,9 @@ from config import VK_TOKEN, VK_GROUP_ID
 logger = logging.getLogger(__name__)
 
 >>>>>>> 7088a20d30a8942893a1c5c26400c6546150a377
-@dataclass
+@dataclass(slots=True)
 class ScoutPost:
+    """Найденный пост; slots — охота держит их сотнями в буфере потока."""
     source_type: str
     source_name: str
     source_id: str
@@ -48,6 +48,23 @@ class ScoutPost:
     likes: int = 0
     comments: int = 0
     source_link: Optional[str] = None
+    diy_boost: bool = False  # DIY-фраза («своими руками», «сломали стену») — поднимаем приоритет
+
+
+from services.seen_store import SeenStore
+from services.scan_scheduler import scan_scheduler
+from services.session_pool import PoolUnavailable, session_pool
+from monitoring.metrics import STAGE_ITEMS, STAGE_SECONDS, counted, timed
+
+_vk_seen: Optional[SeenStore] = None
+
+
+def get_vk_seen() -> SeenStore:
+    """Общее хранилище просмотренных постов/комментариев VK (создаётся лениво)."""
+    global _vk_seen
+    if _vk_seen is None:
+        _vk_seen = SeenStore(namespace="scout_vk")
+    return _vk_seen
 
 <<<<<<< HEAD
 # Ключевые слова для фильтрации лидов
@@ -121,7 +138,6 @@ QUESTION_MARKERS = [
 
 class ScoutParser:
     def __init__(self):
-        self.client = None
         self.db = Database()
         self.last_leads = []
         self.KEYWORDS = ["перепланировка", "согласование", "узаконить", "МЖИ", "антресоль"]
@@ -130,20 +146,14 @@ class ScoutParser:
     async def start(self):
         from config import API_ID, API_HASH
         if API_ID and API_HASH:
-            if not self.client:
-                self.client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
-                await self.client.connect()
+            await session_pool.start()  # Telethon-сессии общие для всех сканеров
         else:
             logger.warning("⚠️ TG_API_ID/API_HASH не заданы — Telegram-парсинг отключён")
-            self.client = None
         
         if not self.db.conn:
             await self.db.connect()
 
     async def stop(self):
-        if self.client:
-            await self.client.disconnect()
-            self.client = None
         if self.db.conn:
             await self.db.close()
 
@@ -158,7 +168,7 @@ class ScoutParser:
         
         for chat in chats:
             try:
-                async for message in self.client.iter_messages(chat, limit=50):
+                for message in await session_pool.fetch_messages(chat, limit=50):
                     if any(kw.lower() in (message.text or "").lower() for kw in self.KEYWORDS):
                         post = ScoutPost(
                             source_type="telegram",
@@ -175,6 +185,7 @@ class ScoutParser:
         
         return self.last_leads
 
+    @timed(STAGE_SECONDS, stage="scan_fetch", source="vk")
     async def scan_vk_groups(self) -> List[ScoutPost]:
         """Сканирование групп ВКонтакте (не требует авторизации Telethon)"""
         self.last_leads = []
@@ -198,6 +209,7 @@ class ScoutParser:
             logger.warning("⚠️ No VK groups found in database (is_active=1)")
             return self.last_leads
         
+        vk_seen = get_vk_seen()
         for group in vk_groups:
             link = group.get('link', '')
             title = group.get('title', link)
@@ -211,8 +223,12 @@ class ScoutParser:
             try:
                 posts = await self._get_vk_posts(group_id)
                 for post in posts:
-                    # Проверяем пост на лид
-                    lead_type = self.detect_lead(post.get('text', ''))
+                    # Проверяем пост на лид (уже просмотренные пропускаем)
+                    post_key = f"post_{group_id}_{post.get('id', '')}"
+                    lead_type = None
+                    if post_key not in vk_seen:
+                        vk_seen.add(post_key)
+                        lead_type = self.detect_lead(post.get('text', ''))
                     if lead_type:
                         scout_post = ScoutPost(
                             source_type="vk",
@@ -228,6 +244,10 @@ class ScoutParser:
                     # Проверяем комментарии к посту
                     comments = await self._get_vk_comments(group_id, post.get('id', 0))
                     for comment in comments:
+                        comment_key = f"comment_{group_id}_{post.get('id', '')}_{comment.get('id', '')}"
+                        if comment_key in vk_seen:
+                            continue
+                        vk_seen.add(comment_key)
                         lead_type = self.detect_lead(comment.get('text', ''))
                         if lead_type:
                             scout_post = ScoutPost(
@@ -244,6 +264,7 @@ class ScoutParser:
             except Exception as e:
                 logger.error(f"Error scanning VK group {title} (ID: {group_id}): {e}")
         
+        vk_seen.flush()
         logger.info(f"✅ VK groups scan complete: {len(self.last_leads)} leads found")
         return self.last_leads
 
@@ -351,6 +372,8 @@ class ScoutParser:
             
         return report
 
+    @counted(STAGE_ITEMS, stage="filter", source="all")
+    @timed(STAGE_SECONDS, stage="filter", source="all")
     def detect_lead(self, text: str) -> Optional[str]:
         """Возвращает 'hot', 'warm' или None."""
         if not text or len(text.strip()) < 15:
@@ -506,6 +529,8 @@ class ScoutParser:
         # Вызываем синхронную версию detect_lead
         return self.detect_lead(text, platform, sender_type, author_id, url, db)
     
+    @counted(STAGE_ITEMS, stage="filter", source="all")
+    @timed(STAGE_SECONDS, stage="filter", source="all")
     def detect_lead(
         self, 
         text: str, 
@@ -609,36 +634,40 @@ class ScoutParser:
         return has_tech and (has_question_mark or has_question_pattern or has_comm)
 
     async def parse_telegram(self, db=None) -> List[ScoutPost]:
+        """Все лиды Telegram-скана списком (охота читает iter_telegram потоком)."""
+        return [post async for post in self.iter_telegram(db)]
+
+    @timed(STAGE_SECONDS, stage="scan_fetch", source="telegram")
+    async def iter_telegram(self, db=None, skip_ids=()) -> AsyncIterator[ScoutPost]:
         """
         Парсинг Telegram каналов с использованием Data-Driven Scout.
         Использует фильтрацию по платформе и приоритеты из БД.
+        Каналы читаются через пул Telethon-сессий (services/session_pool.py).
+        Лиды отдаются по мере нахождения — обработка не ждёт конца скана.
+        skip_ids — id ресурсов, которые уже читает потоковый режим (lead_stream).
         """
-        from telethon import TelegramClient
-        from config import API_ID, API_HASH
-        
-        posts = []
-        client = TelegramClient('anton_parser', API_ID, API_HASH)
-        await client.connect()
-        
-        if not await client.is_user_authorized():
-            logger.error("❌ Антон не авторизован в Telegram!")
-            await client.disconnect()
-            return []
+        found = 0
+        if not await session_pool.start():
+            logger.error("❌ Нет авторизованных Telethon-сессий для сканирования!")
+            return
 
         # Загружаем цели из БД с фильтрацией по платформе (Data-Driven Scout)
         targets = await db.get_active_targets_for_scout(platform="telegram") if db else []
         
         if not targets:
             logger.warning("⚠️ Не найдено активных Telegram каналов в БД")
-            await client.disconnect()
-            return []
-        
-        logger.info(f"🔍 Сканирование {len(targets)} Telegram каналов...")
-        
-        # Сортируем по приоритету: сначала приоритетные ЖК (is_high_priority=1)
-        targets_sorted = sorted(targets, key=lambda x: (x.get("is_high_priority", 0) == 0, x.get("title", "")))
-        
-        for target in targets_sorted:
+            return
+        if skip_ids:
+            targets = [t for t in targets if t.get("id") not in skip_ids]
+            if not targets:
+                return
+        
+        # Адаптивное расписание: только источники, которым пора, окно — по их потоку и выходу лидов
+        plans = scan_scheduler.plan(targets, platform="telegram")
+        logger.info(f"🔍 Сканирование {len(plans)} из {len(targets)} Telegram каналов...")
+        
+        for plan in plans:
+            target = plan.target
             link = target.get("link")
             if not link: 
                 continue
@@ -654,10 +683,13 @@ class ScoutParser:
             if is_priority:
                 logger.info(f"⭐ Приоритетный ЖК: {source_name}")
             
+            chat_leads = 0
+            fetched = 0
+            newest_at = oldest_at = None
             try:
                 # Используем last_post_id для инкрементального парсинга
-                last_post_id = target.get("last_post_id", 0)
-                limit = 100 if is_priority else 20  # Больше сообщений для приоритетных ЖК
+                last_post_id = target.get("last_post_id") or 0
+                limit = plan.limit  # окно от планировщика (раньше: 100 приоритетным, 20 остальным)
                 
                 # Читаем сообщения с учетом last_post_id
                 iter_params = {"limit": limit}
@@ -665,9 +697,15 @@ class ScoutParser:
                     iter_params["min_id"] = last_post_id
                 
                 max_id = last_post_id
-                for msg in client.iter_messages(link, **iter_params):
+                messages = await session_pool.fetch_messages(link, **iter_params)
+                for msg in messages:
                     if msg.id > max_id:
                         max_id = msg.id
+                    fetched += 1
+                    if msg.date:
+                        msg_at = msg.date.astimezone().replace(tzinfo=None)
+                        newest_at = max(newest_at or msg_at, msg_at)
+                        oldest_at = min(oldest_at or msg_at, msg_at)
                     
                     if not msg.text:
                         continue
@@ -708,7 +746,8 @@ class ScoutParser:
                             elif hasattr(msg.sender, 'first_name'):
                                 author_name = msg.sender.first_name
                         
-                        posts.append(ScoutPost(
+                        chat_leads += 1
+                        yield ScoutPost(
                             source_type="telegram",
                             source_name=source_name,
                             source_id=str(msg.peer_id.channel_id if hasattr(msg.peer_id, 'channel_id') else msg.peer_id),
@@ -718,7 +757,7 @@ class ScoutParser:
                             author_name=author_name,
                             url=f"https://t.me/{link}/{msg.id}",
                             source_link=link  # Для использования geo_tag в hunter.py
-                        ))
+                        )
                 
                 # Обновляем last_post_id в БД
                 if db and max_id > last_post_id:
@@ -729,44 +768,54 @@ class ScoutParser:
                             logger.debug(f"✅ Обновлен last_post_id для {source_name}: {max_id}")
                     except Exception as e:
                         logger.warning(f"Не удалось обновить last_post_id для {source_name}: {e}")
+                found += chat_leads
+                await scan_scheduler.record(db, plan, "telegram", fetched, chat_leads,
+                                            newest_at, oldest_at)
                         
+            except PoolUnavailable as e:
+                logger.warning(f"⏸ Сканирование Telegram прервано: {e}")
+                break
             except Exception as e:
                 logger.error(f"⚠️ Ошибка парсинга {link}: {e}")
+                await scan_scheduler.record(db, plan, "telegram", fetched, 0, error=e)
         
-        await client.disconnect()
-        logger.info(f"✅ Telegram: найдено {len(posts)} лидов из {len(targets)} каналов")
+        logger.info(f"✅ Telegram: найдено {found} лидов из {len(plans)} каналов")
         
         # Сохраняем отчет сканирования
         self.last_scan_at = datetime.now()
         if not hasattr(self, 'last_scan_report'):
             self.last_scan_report = []
-        
-        return posts
 
     async def parse_vk(self, db=None) -> List[ScoutPost]:
+        """Все лиды VK-скана списком (охота читает iter_vk потоком)."""
+        return [post async for post in self.iter_vk(db)]
+
+    @timed(STAGE_SECONDS, stage="scan_fetch", source="vk")
+    async def iter_vk(self, db=None) -> AsyncIterator[ScoutPost]:
         """
         Парсинг VK групп с использованием Data-Driven Scout.
         Использует фильтрацию по платформе и приоритеты из БД.
+        Лиды отдаются по мере нахождения — обработка не ждёт конца скана.
         """
-        posts = []
+        found = 0
         if not VK_TOKEN or "vk1.a" not in VK_TOKEN:
             logger.warning("⚠️ VK_TOKEN не настроен или невалиден")
-            return []
+            return
 
         # Загружаем цели из БД с фильтрацией по платформе (Data-Driven Scout)
         targets = await db.get_active_targets_for_scout(platform="vk") if db else []
         
         if not targets:
             logger.warning("⚠️ Не найдено активных VK групп в БД")
-            return []
+            return
         
-        logger.info(f"🔍 Сканирование {len(targets)} VK групп...")
-        
-        # Сортируем по приоритету: сначала приоритетные ЖК
-        targets_sorted = sorted(targets, key=lambda x: (x.get("is_high_priority", 0) == 0, x.get("title", "")))
+        plans = scan_scheduler.plan(targets, platform="vk")
+        logger.info(f"🔍 Сканирование {len(plans)} из {len(targets)} VK групп...")
         
+        vk_seen = get_vk_seen()
         async with aiohttp.ClientSession() as session:
-            for target in targets_sorted:
+            for plan in plans:
+                target = plan.target
                 link = target.get("link", "")
                 if not link:
                     continue
@@ -783,9 +832,11 @@ class ScoutParser:
                 if geo_tag:
                     source_name = f"{geo_tag} | {source_name}"
                 
-                # Приоритетный ЖК - больше постов
                 is_priority = target.get("is_high_priority", 0) == 1
-                count = 100 if is_priority else 5  # Больше постов для приоритетных ЖК
+                count = plan.limit  # окно от планировщика (раньше: 100 приоритетным, 5 остальным)
+                chat_leads = 0
+                fetched = 0
+                newest_at = oldest_at = None
                 
                 if is_priority:
                     logger.info(f"⭐ Приоритетный ЖК VK: {source_name}")
@@ -796,6 +847,15 @@ class ScoutParser:
                         data = await resp.json()
                         if "response" in data and "items" in data["response"]:
                             for item in data["response"]["items"]:
+                                item_key = f"post_{owner_id}_{item['id']}"
+                                if item_key in vk_seen:
+                                    continue
+                                vk_seen.add(item_key)
+                                fetched += 1
+                                if item.get("date"):
+                                    item_at = datetime.fromtimestamp(item["date"])
+                                    newest_at = max(newest_at or item_at, item_at)
+                                    oldest_at = min(oldest_at or item_at, item_at)
                                 text = item.get("text", "")
                                 if not text:
                                     continue
@@ -828,7 +888,8 @@ class ScoutParser:
                                         # Пока оставляем None
                                         pass
                                     
-                                    posts.append(ScoutPost(
+                                    chat_leads += 1
+                                    yield ScoutPost(
                                         source_type="vk",
                                         source_name=source_name,
                                         source_id=owner_id,
@@ -838,18 +899,23 @@ class ScoutParser:
                                         author_name=author_name,
                                         url=f"https://vk.com/wall{owner_id}_{item['id']}",
                                         source_link=link  # Для использования geo_tag в hunter.py
-                                    ))
+                                    )
+                        if "error" in data:
+                            raise RuntimeError(data["error"].get("error_msg", data["error"]))
+                    found += chat_leads
+                    await scan_scheduler.record(db, plan, "vk", fetched, chat_leads,
+                                                newest_at, oldest_at)
                 except Exception as e:
                     logger.error(f"❌ Ошибка VK ({owner_id}): {e}")
+                    await scan_scheduler.record(db, plan, "vk", fetched, 0, error=e)
         
-        logger.info(f"✅ VK: найдено {len(posts)} лидов из {len(targets)} групп")
+        vk_seen.flush()
+        logger.info(f"✅ VK: найдено {found} лидов из {len(plans)} групп")
         
         # Сохраняем отчет сканирования
         self.last_scan_at = datetime.now()
         if not hasattr(self, 'last_scan_report'):
             self.last_scan_report = []
-        
-        return posts
 
     def extract_geo_header(self, text: str, source_name: str = "") -> str:
         """
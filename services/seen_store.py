@@ -0,0 +1,232 @@
+"""
+services/seen_store.py — компактное хранилище просмотренных ID (посты, комментарии, группы VK).
+
+Заменяет JSON-файлы vk_spy_seen.json / vk_scout_seen_groups.json:
+  - SQLite (WAL), запись только новых ключей батчем (executemany) — стоимость ∝ новому
+  - у каждого ключа время добавления → TTL и обрезка «самых старых», а не случайных
+  - периодическая компакция (DELETE просроченных + лимит max_items)
+  - проверка членства O(1): in-memory set или (use_bloom=True) Bloom-фильтр + точечный SELECT
+
+Интерфейс совместим с set: `key in store`, `store.add(key)`, `len(store)`.
+Общий для vk_spy.py, ScoutDiscovery и VK-части ScoutParser (разные namespace).
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+SEEN_DB_PATH = os.getenv("SEEN_DB_PATH", "seen_ids.db")
+
+DEFAULT_TTL_DAYS = int(os.getenv("SEEN_TTL_DAYS", "30"))
+DEFAULT_MAX_ITEMS = int(os.getenv("SEEN_MAX_ITEMS", "200000"))
+# Компакция не чаще раза в час
+COMPACT_INTERVAL = 3600
+
+
+class BloomFilter:
+    """Простой Bloom-фильтр (double hashing поверх blake2b)."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1000)
+        self.size = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class SeenStore:
+    """Персистентное множество просмотренных ключей с TTL."""
+
+    def __init__(
+        self,
+        namespace: str,
+        db_path: str = None,
+        ttl_days: Optional[int] = DEFAULT_TTL_DAYS,
+        max_items: int = DEFAULT_MAX_ITEMS,
+        use_bloom: bool = False,
+    ):
+        self.namespace = namespace
+        self.db_path = db_path or SEEN_DB_PATH
+        self.ttl_seconds = ttl_days * 86400 if ttl_days else None
+        self.max_items = max_items
+        self.use_bloom = use_bloom
+
+        self._pending: dict = {}  # key -> seen_at, ещё не записанные
+        self._keys: Set[str] = set()
+        self._bloom: Optional[BloomFilter] = None
+        self._count = 0
+        self._last_compact = 0.0
+
+        dir_name = os.path.dirname(self.db_path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=30.0)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS seen_ids (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                seen_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_seen_ids_ns_time ON seen_ids(namespace, seen_at)")
+        self.conn.commit()
+
+        self.compact(force=True)
+        self._load()
+
+    # ── set-совместимый интерфейс ──────────────────────────────────────────────
+
+    def __contains__(self, key: str) -> bool:
+        if key in self._pending:
+            return True
+        if not self.use_bloom:
+            return key in self._keys
+        if key not in self._bloom:
+            return False
+        # Bloom сказал «возможно» — подтверждаем точечным запросом по PK
+        row = self.conn.execute(
+            "SELECT seen_at FROM seen_ids WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        return bool(row) and not self._expired(row[0])
+
+    def __len__(self) -> int:
+        return self._count + len(self._pending)
+
+    def add(self, key: str) -> None:
+        if key in self:
+            return
+        self._pending[key] = time.time()
+
+    def update(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self.add(key)
+
+    # ── запись и обслуживание ──────────────────────────────────────────────────
+
+    def flush(self) -> int:
+        """Записать новые ключи одной транзакцией. Возвращает количество записанных."""
+        if not self._pending:
+            self.compact()
+            return 0
+        rows = [(self.namespace, key, ts) for key, ts in self._pending.items()]
+        try:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO seen_ids (namespace, key, seen_at) VALUES (?, ?, ?)",
+                rows,
+            )
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.warning("Не удалось сохранить seen (%s): %s", self.namespace, e)
+            return 0
+        for key in self._pending:
+            self._remember(key)
+        self._count += len(rows)
+        self._pending.clear()
+        self.compact()
+        return len(rows)
+
+    def compact(self, force: bool = False) -> int:
+        """Удалить просроченные ключи и всё сверх max_items (самые старые по seen_at)."""
+        now = time.time()
+        if not force and now - self._last_compact < COMPACT_INTERVAL:
+            return 0
+        self._last_compact = now
+        removed = 0
+        try:
+            if self.ttl_seconds:
+                cur = self.conn.execute(
+                    "DELETE FROM seen_ids WHERE namespace = ? AND seen_at < ?",
+                    (self.namespace, now - self.ttl_seconds),
+                )
+                removed += cur.rowcount
+            cur = self.conn.execute(
+                """DELETE FROM seen_ids WHERE namespace = ? AND key IN (
+                       SELECT key FROM seen_ids WHERE namespace = ?
+                       ORDER BY seen_at DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.namespace, self.namespace, self.max_items),
+            )
+            removed += cur.rowcount
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.warning("Ошибка компакции seen (%s): %s", self.namespace, e)
+            return 0
+        if removed and self._count:
+            # После удаления пересобираем in-memory индекс
+            self._load()
+            logger.info("🧹 seen[%s]: удалено %d устаревших ключей", self.namespace, removed)
+        return removed
+
+    def import_legacy(self, keys: Iterable[str]) -> int:
+        """Перенести ключи из старого JSON (время добавления неизвестно — считаем «сейчас»)."""
+        before = len(self._pending)
+        self.update(str(k) for k in keys)
+        added = len(self._pending) - before
+        self.flush()
+        return added
+
+    def import_legacy_json(self, path: Path, field: str = None) -> int:
+        """Однократная миграция из JSON-файла; файл переименовывается в *.migrated."""
+        path = Path(path)
+        if not path.exists():
+            return 0
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            keys = data.get(field, []) if field else data
+            added = self.import_legacy(keys)
+            path.rename(path.with_name(path.name + ".migrated"))
+            logger.info("📦 seen[%s]: перенесено %d ключей из %s", self.namespace, added, path)
+            return added
+        except Exception as e:
+            logger.warning("Не удалось перенести %s: %s", path, e)
+            return 0
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+    # ── внутреннее ─────────────────────────────────────────────────────────────
+
+    def _expired(self, seen_at: float) -> bool:
+        return bool(self.ttl_seconds) and seen_at < time.time() - self.ttl_seconds
+
+    def _remember(self, key: str) -> None:
+        if self.use_bloom:
+            self._bloom.add(key)
+        else:
+            self._keys.add(key)
+
+    def _load(self) -> None:
+        (self._count,) = self.conn.execute(
+            "SELECT COUNT(*) FROM seen_ids WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        self._keys = set()
+        if self.use_bloom:
+            self._bloom = BloomFilter(capacity=max(self.max_items, self._count * 2))
+        for (key,) in self.conn.execute("SELECT key FROM seen_ids WHERE namespace = ?", (self.namespace,)):
+            self._remember(key)
@@ -0,0 +1,369 @@
+"""
+Пул Telethon-сессий для сканера и поиска: чаты распределяются между аккаунтами.
+
+Сессии перечисляются в TELETHON_SESSIONS через запятую (файлы NAME.session, создаются
+через `python session_manager.py --session NAME`). По умолчанию — одна anton_parser,
+то есть поведение как раньше.
+
+  - чат закрепляется за сессией по консистентному хэшу (TELETHON_VNODES точек на
+    кольце на каждую сессию): одни и те же чаты читает один аккаунт, кэш сущностей
+    Telethon не размазывается, а при добавлении сессии переезжает только ~1/N чатов;
+  - FloodWait — сессия выводится из кольца до конца ожидания, её чаты сразу уходят
+    следующим по кольцу и возвращаются, когда ожидание кончится;
+  - сессия разлогинена/отозвана — выводится из кольца; повторная проверка авторизации
+    раз в TELETHON_RECHECK_SECONDS (после `session_manager.py --session NAME` она вернётся сама);
+  - username/ссылки разрешаются через кэш сущностей (services/entity_cache.py) —
+    в установившемся режиме чтение чата не делает ни одного resolve-запроса;
+  - все сессии во флуде — ждём ближайшую, если это не дольше TELETHON_MAX_FLOOD_WAIT,
+    иначе PoolUnavailable;
+  - по каждой сессии считаются запросы, сообщения, ошибки, флуды и время в запросах:
+    /sessions и кнопка «📡 Сессии Telethon» в админ-панели,
+    метрики terion_telethon_requests_total{session,result}, terion_telethon_sessions{state}.
+"""
+import asyncio
+import bisect
+import hashlib
+import html
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from monitoring.metrics import counter, gauge, registry
+from services.entity_cache import CachedEntity, entity_cache, normalize_link
+
+logger = logging.getLogger(__name__)
+
+TELETHON_SESSIONS = [s.strip() for s in os.getenv("TELETHON_SESSIONS", "anton_parser").split(",") if s.strip()]
+TELETHON_VNODES = int(os.getenv("TELETHON_VNODES", "64"))
+TELETHON_RECHECK_SECONDS = float(os.getenv("TELETHON_RECHECK_SECONDS", "600"))
+TELETHON_MAX_FLOOD_WAIT = float(os.getenv("TELETHON_MAX_FLOOD_WAIT", "30"))
+
+STATE_OK = "ok"
+STATE_FLOOD = "flood"
+STATE_UNAUTHORIZED = "unauthorized"
+STATE_OFFLINE = "offline"
+
+_STATE_LABELS = {
+    STATE_OK: "🟢 работает",
+    STATE_FLOOD: "🟡 FloodWait",
+    STATE_UNAUTHORIZED: "🔴 не авторизована",
+    STATE_OFFLINE: "⚪ нет соединения",
+}
+
+TELETHON_REQUESTS = counter(
+    "terion_telethon_requests_total", "Запросы через пул Telethon-сессий: ok / flood / deauth / error",
+    ("session", "result"),
+)
+TELETHON_SESSIONS_GAUGE = gauge(
+    "terion_telethon_sessions", "Telethon-сессии пула по состоянию", ("state",),
+)
+
+
+class PoolUnavailable(RuntimeError):
+    """Ни одна сессия пула сейчас не может выполнить запрос."""
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class _Session:
+    __slots__ = ("name", "client", "state", "flood_until", "retry_at", "requests", "messages", "errors",
+                 "floods", "busy_seconds", "last_error", "last_used", "chats")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.client = None
+        self.state = STATE_OFFLINE
+        self.flood_until = 0.0
+        self.retry_at = 0.0
+        self.requests = 0
+        self.messages = 0
+        self.errors = 0
+        self.floods = 0
+        self.busy_seconds = 0.0
+        self.last_error = ""
+        self.last_used = 0.0
+        self.chats: Set[str] = set()
+
+    def available(self, now: float) -> bool:
+        if self.state == STATE_FLOOD and now >= self.flood_until:
+            self.state = STATE_OK
+            logger.info(f"🔀 Сессия {self.name}: FloodWait закончился, чаты возвращаются")
+        return self.state == STATE_OK and self.client is not None
+
+
+class SessionPool:
+    """Набор Telethon-клиентов с консистентным хэшированием чатов по сессиям."""
+
+    def __init__(self, names: Optional[List[str]] = None):
+        self.names = list(dict.fromkeys(names or TELETHON_SESSIONS))
+        self.sessions: Dict[str, _Session] = {name: _Session(name) for name in self.names}
+        points = sorted((_hash(f"{name}#{i}"), name) for name in self.names for i in range(TELETHON_VNODES))
+        self._ring_keys = [p[0] for p in points]
+        self._ring_names = [p[1] for p in points]
+        self._lock = asyncio.Lock()
+        self._started = False
+        registry.add_collector(self._collect_metrics)
+
+    # ── Кольцо ─────────────────────────────────────────────────────────────────
+
+    def _walk(self, key: str):
+        """Сессии в порядке обхода кольца от точки ключа (каждая — один раз)."""
+        if not self._ring_keys:
+            return
+        start = bisect.bisect(self._ring_keys, _hash(key))
+        seen: Set[str] = set()
+        for step in range(len(self._ring_names)):
+            name = self._ring_names[(start + step) % len(self._ring_names)]
+            if name not in seen:
+                seen.add(name)
+                yield self.sessions[name]
+                if len(seen) == len(self.sessions):
+                    return
+
+    def home(self, key: str) -> Optional[str]:
+        """Сессия, за которой чат закреплён, без учёта её состояния."""
+        return next((s.name for s in self._walk(str(key))), None)
+
+    def owner(self, key: str, exclude: Optional[Set[str]] = None) -> Optional[_Session]:
+        """Первая доступная сессия по кольцу: закреплённая или та, что её подменяет."""
+        now = time.time()
+        for session in self._walk(str(key)):
+            if (not exclude or session.name not in exclude) and session.available(now):
+                return session
+        return None
+
+    # ── Жизненный цикл ─────────────────────────────────────────────────────────
+
+    async def start(self) -> int:
+        """Подключить сессии (повторный вызов дешёвый); возвращает число авторизованных."""
+        await self._ensure_connected(force=not self._started)
+        ready = sum(1 for s in self.sessions.values() if s.state in (STATE_OK, STATE_FLOOD))
+        if not self._started:
+            self._started = True
+            logger.info(f"📡 Пул Telethon: {ready}/{len(self.sessions)} сессий готовы ({', '.join(self.names)})")
+        return ready
+
+    async def stop(self) -> None:
+        for session in self.sessions.values():
+            if session.client is not None:
+                try:
+                    await session.client.disconnect()
+                except Exception:
+                    pass
+            session.client = None
+            session.state = STATE_OFFLINE
+        self._started = False
+
+    async def client_for(self, name: str):
+        """Клиент конкретной сессии пула — чтобы не открывать тот же .session файл вторым клиентом."""
+        session = self.sessions.get(name)
+        if session is None:
+            return None
+        async with self._lock:
+            if session.client is None or session.state in (STATE_OFFLINE, STATE_UNAUTHORIZED):
+                await self._connect(session)
+        return session.client if session.state in (STATE_OK, STATE_FLOOD) else None
+
+    async def _ensure_connected(self, force: bool = False) -> None:
+        now = time.time()
+        pending = [s for s in self.sessions.values()
+                   if s.state in (STATE_OFFLINE, STATE_UNAUTHORIZED) and (force or now >= s.retry_at)]
+        if not pending:
+            return
+        async with self._lock:
+            for session in pending:
+                if session.state in (STATE_OFFLINE, STATE_UNAUTHORIZED):
+                    await self._connect(session)
+
+    async def _connect(self, session: _Session) -> None:
+        from config import API_ID, API_HASH
+
+        session.retry_at = time.time() + TELETHON_RECHECK_SECONDS
+        if not API_ID or not API_HASH:
+            session.last_error = "API_ID/API_HASH не заданы"
+            return
+        try:
+            if session.client is None:
+                from telethon import TelegramClient
+
+                session.client = TelegramClient(session.name, API_ID, API_HASH)
+            if not session.client.is_connected():
+                await session.client.connect()
+            if await session.client.is_user_authorized():
+                if session.state != STATE_OK:
+                    logger.info(f"📡 Сессия {session.name} подключена")
+                session.state = STATE_OK
+                return
+            session.state = STATE_UNAUTHORIZED
+            session.last_error = "сессия не авторизована"
+            logger.warning(f"⚠️ Сессия {session.name} не авторизована — python session_manager.py --session {session.name}")
+        except Exception as e:
+            session.state = STATE_OFFLINE
+            session.last_error = str(e)[:200]
+            logger.warning(f"⚠️ Сессия {session.name}: не удалось подключиться: {e}")
+
+    # ── Запросы ────────────────────────────────────────────────────────────────
+
+    async def run(self, key: Any, fn: Callable[[Any], Awaitable[Any]],
+                  count: Optional[Callable[[Any], int]] = None) -> Any:
+        """
+        Выполнить fn(client) на сессии, за которой закреплён ключ (обычно username чата).
+
+        FloodWait и потеря авторизации выводят сессию из кольца и повторяют запрос
+        на следующей; прочие ошибки пробрасываются вызывающему.
+        """
+        return await self._run(key, lambda session: fn(session.client), count)
+
+    async def _run(self, key: Any, fn: Callable[[_Session], Awaitable[Any]],
+                   count: Optional[Callable[[Any], int]] = None) -> Any:
+        from telethon import errors
+
+        deauth_errors = (
+            errors.AuthKeyUnregisteredError, errors.AuthKeyDuplicatedError, errors.SessionRevokedError,
+            errors.SessionExpiredError, errors.UserDeactivatedError, errors.UserDeactivatedBanError,
+        )
+        key = str(key)
+        await self._ensure_connected()
+        tried: Set[str] = set()
+        while True:
+            session = self.owner(key, exclude=tried)
+            if session is None:
+                await self._wait_for_session(key)
+                tried.clear()
+                continue
+
+            started = time.monotonic()
+            session.requests += 1
+            try:
+                result = await fn(session)
+            except errors.FloodWaitError as e:
+                self._mark_flood(session, e.seconds)
+                tried.add(session.name)
+                continue
+            except deauth_errors as e:
+                self._mark_unauthorized(session, e)
+                tried.add(session.name)
+                continue
+            except Exception as e:
+                session.errors += 1
+                session.last_error = str(e)[:200]
+                TELETHON_REQUESTS.inc(session=session.name, result="error")
+                raise
+            finally:
+                session.busy_seconds += time.monotonic() - started
+
+            session.last_used = time.time()
+            if len(session.chats) < 10000:
+                session.chats.add(key)
+            if count is not None:
+                session.messages += count(result)
+            TELETHON_REQUESTS.inc(session=session.name, result="ok")
+            return result
+
+    async def resolve(self, link: str) -> CachedEntity:
+        """Сущность по ссылке/username из кэша закреплённой сессии (в сеть — только при промахе)."""
+        return await self._run(normalize_link(link),
+                               lambda session: entity_cache.resolve(session.client, link, session.name))
+
+    async def fetch_messages(self, chat: Any, **kwargs) -> list:
+        """Сообщения чата через закреплённую сессию (аргументы — как у client.iter_messages)."""
+        from telethon import errors
+
+        async def read(session: _Session):
+            for attempt in range(2):
+                entity = await entity_cache.resolve(session.client, chat, session.name)
+                try:
+                    return [message async for message in session.client.iter_messages(entity.input_peer, **kwargs)]
+                except (errors.ChannelInvalidError, errors.PeerIdInvalidError):
+                    if attempt:
+                        raise
+                    # access_hash из кэша больше не принимается — разрешаем ссылку заново
+                    entity_cache.invalidate(session.name, chat)
+
+        return await self._run(normalize_link(str(chat)), read, count=len)
+
+    async def _wait_for_session(self, key: str) -> None:
+        now = time.time()
+        floods = [s.flood_until for s in self.sessions.values() if s.state == STATE_FLOOD]
+        wait = min(floods) - now if floods else None
+        if wait is None or wait > TELETHON_MAX_FLOOD_WAIT:
+            raise PoolUnavailable(
+                "нет доступных Telethon-сессий"
+                + (f" (ближайшая освободится через {int(wait)} с)" if wait is not None else "")
+            )
+        logger.info(f"⏳ Все сессии во FloodWait, жду {wait:.0f} с ради {key}")
+        await asyncio.sleep(max(0.0, wait))
+
+    def _mark_flood(self, session: _Session, seconds: int) -> None:
+        session.state = STATE_FLOOD
+        session.flood_until = time.time() + seconds
+        session.floods += 1
+        session.last_error = f"FloodWait {seconds} с"
+        TELETHON_REQUESTS.inc(session=session.name, result="flood")
+        moved, session.chats = len(session.chats), set()
+        logger.warning(f"🔀 Сессия {session.name}: FloodWait {seconds} с — её чаты ({moved}) переходят к остальным")
+
+    def _mark_unauthorized(self, session: _Session, error: Exception) -> None:
+        session.state = STATE_UNAUTHORIZED
+        session.retry_at = time.time() + TELETHON_RECHECK_SECONDS
+        session.errors += 1
+        session.last_error = f"{type(error).__name__}: {error}"[:200]
+        TELETHON_REQUESTS.inc(session=session.name, result="deauth")
+        moved, session.chats = len(session.chats), set()
+        logger.error(f"🔀 Сессия {session.name} разлогинена ({type(error).__name__}) — её чаты ({moved}) "
+                     f"переходят к остальным")
+
+    # ── Статистика ─────────────────────────────────────────────────────────────
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        result = []
+        for session in self.sessions.values():
+            session.available(now)
+            result.append({
+                "name": session.name,
+                "state": session.state,
+                "flood_left": max(0, int(session.flood_until - now)) if session.state == STATE_FLOOD else 0,
+                "requests": session.requests,
+                "messages": session.messages,
+                "errors": session.errors,
+                "floods": session.floods,
+                "avg_ms": session.busy_seconds / session.requests * 1000 if session.requests else 0.0,
+                "chats": len(session.chats),
+                "last_used": session.last_used,
+                "last_error": session.last_error,
+            })
+        return result
+
+    def format_report(self) -> str:
+        lines = [f"📡 <b>Telethon-сессии</b> ({len(self.sessions)})", ""]
+        for item in self.stats():
+            state = _STATE_LABELS.get(item["state"], item["state"])
+            if item["flood_left"]:
+                state += f" ещё {item['flood_left']} с"
+            lines.append(f"<b>{item['name']}</b> — {state}")
+            lines.append(
+                f"   запросов {item['requests']}, сообщений {item['messages']}, чатов {item['chats']}, "
+                f"в среднем {item['avg_ms']:.0f} мс"
+            )
+            lines.append(f"   ошибок {item['errors']}, FloodWait {item['floods']}")
+            if item["last_used"]:
+                lines.append(f"   последний запрос {time.strftime('%d.%m %H:%M', time.localtime(item['last_used']))}")
+            if item["last_error"] and item["state"] != STATE_OK:
+                lines.append(f"   <i>{html.escape(item['last_error'][:120])}</i>")
+        return "\n".join(lines)
+
+    def _collect_metrics(self) -> None:
+        now = time.time()
+        states: Dict[str, int] = {state: 0 for state in _STATE_LABELS}
+        for session in self.sessions.values():
+            session.available(now)
+            states[session.state] = states.get(session.state, 0) + 1
+        for state, n in states.items():
+            TELETHON_SESSIONS_GAUGE.set(n, state=state)
+
+
+session_pool = SessionPool()
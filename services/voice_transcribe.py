@@ -31,7 +31,8 @@ async def transcribe_voice(voice_bytes: bytes, bot=None, file_id: str = None) ->
         logger.debug("YANDEX_API_KEY не задан — транскрибация отключена")
         return None
 
-    url = "https://stt.api.cloud.yandex.net/speech/v1/stt:recognize"
+    base = os.getenv("YANDEX_STT_URL", "https://stt.api.cloud.yandex.net").rstrip("/")
+    url = f"{base}/speech/v1/stt:recognize"
     headers = {"Authorization": f"Api-Key {api_key}"}
     # Telegram голосовые — OGG Opus
     params = {"lang": "ru-RU", "format": "oggopus"}
@@ -0,0 +1,240 @@
+"""
+services/webhook.py — приём апдейтов обоих ботов через webhook (aiohttp) вместо long polling.
+
+UPDATES_MODE=webhook: один aiohttp-сервер на WEBHOOK_HOST:WEBHOOK_PORT принимает апдейты
+main_bot и content_bot на WEBHOOK_PATH/main и WEBHOOK_PATH/content (снаружи — https
+через локальный nginx/Caddy, публичный адрес WEBHOOK_BASE_URL):
+
+  - каждый запрос проверяется по X-Telegram-Bot-Api-Secret-Token (WEBHOOK_SECRET; пусто —
+    секрет выводится из токена бота, одинаковый во всех процессах); чужие — 401;
+  - апдейт подтверждается сразу, обработка — в фоне, но не больше WEBHOOK_MAX_CONCURRENCY
+    одновременно: при заполнении ответ Telegram задерживается (он не шлёт больше
+    max_connections параллельно), через WEBHOOK_ACQUIRE_TIMEOUT — 503, Telegram повторит;
+  - повторно доставленные апдейты (тот же update_id) отбрасываются.
+
+Polling остаётся запасным: UPDATES_MODE=polling (по умолчанию), нет WEBHOOK_BASE_URL или
+не удалось занять порт / вызвать setWebhook — main.py запускает polling как раньше.
+
+Несколько процессов за прокси: основной main.py регистрирует webhook и держит фоновые
+сервисы; дополнительные — с SERVICES_ENABLED=0, своим WEBHOOK_PORT и BOT_LOCK_FILE,
+только принимают апдейты (nginx upstream на все порты). Состояния FSM — общие через
+FSM_STORAGE=sqlite (services/fsm_storage.py). Ограничения LLM (middleware/throttling.py) —
+на процесс: токен-бакеты и склейка сообщений в каждом свои, общий лимит
+THROTTLE_GLOBAL_RATE умножается на число процессов (задавайте его в расчёте на один), а
+части одного сообщения, попавшие в разные процессы, не склеиваются. Кэш ответов
+(utils/answer_cache.py) в памяти тоже свой, общая у процессов только таблица answer_cache.
+
+Метрики: terion_webhook_updates_total{bot,result}, terion_queue_depth{queue="webhook"}.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from monitoring.metrics import QUEUE_DEPTH, counter, registry
+
+logger = logging.getLogger(__name__)
+
+UPDATES_MODE = os.getenv("UPDATES_MODE", "polling").lower()
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").rstrip("/")
+WEBHOOK_PATH = "/" + os.getenv("WEBHOOK_PATH", "/tg").strip("/")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_CONCURRENCY = max(1, int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "64")))
+WEBHOOK_ACQUIRE_TIMEOUT = float(os.getenv("WEBHOOK_ACQUIRE_TIMEOUT", "10"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+RECENT_UPDATES = 1000
+
+WEBHOOK_UPDATES = counter(
+    "terion_webhook_updates_total", "Апдейты webhook: accepted / duplicate / rejected / busy / bad_request / failed",
+    ("bot", "result"),
+)
+
+
+def secret_for(token: str) -> str:
+    """Секрет webhook: WEBHOOK_SECRET или производный от токена (Telegram: 1–256 символов A-Za-z0-9_-)."""
+    if WEBHOOK_SECRET:
+        return WEBHOOK_SECRET
+    return hashlib.sha256(f"terion-webhook:{token}".encode()).hexdigest()
+
+
+class _Endpoint:
+    __slots__ = ("name", "bot", "dp", "secret", "recent")
+
+    def __init__(self, name: str, bot, dp):
+        self.name = name
+        self.bot = bot
+        self.dp = dp
+        self.secret = secret_for(bot.token)
+        self.recent: "OrderedDict[int, None]" = OrderedDict()
+
+    def seen(self, update_id: int) -> bool:
+        """True — апдейт уже принимали (Telegram повторил доставку)."""
+        if update_id in self.recent:
+            return True
+        self.recent[update_id] = None
+        if len(self.recent) > RECENT_UPDATES:
+            self.recent.popitem(last=False)
+        return False
+
+
+class WebhookServer:
+    """aiohttp-приёмник апдейтов для нескольких пар Bot/Dispatcher с общим ограничением обработки."""
+
+    def __init__(self):
+        self.endpoints: Dict[str, _Endpoint] = {}
+        self.runner = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopped: Optional[asyncio.Event] = None
+        registry.add_collector(lambda: QUEUE_DEPTH.set(len(self._tasks), queue="webhook"))
+
+    def url_for(self, name: str) -> str:
+        return f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}/{name}"
+
+    async def start(self, bots: Dict[str, Tuple[object, object]], register: bool = True) -> bool:
+        """
+        Поднять сервер и (register=True) выставить webhook обоим ботам.
+
+        False — webhook недоступен (нет WEBHOOK_BASE_URL, порт занят, setWebhook упал): вызывающий
+        переходит на polling.
+        """
+        if self.runner is not None:
+            return True
+        if register and not WEBHOOK_BASE_URL:
+            logger.warning("⚠️ Webhook: WEBHOOK_BASE_URL не задан — запасной режим polling")
+            return False
+        from aiohttp import web
+
+        self.endpoints = {name: _Endpoint(name, bot, dp) for name, (bot, dp) in bots.items()}
+        self._slots = asyncio.Semaphore(WEBHOOK_MAX_CONCURRENCY)
+        self._stopped = asyncio.Event()
+
+        app = web.Application(client_max_size=10 * 1024 * 1024)
+        app.router.add_post(f"{WEBHOOK_PATH}/{{bot}}", self._handle)
+        app.router.add_get(f"{WEBHOOK_PATH}/health", self._health)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+        except OSError as e:
+            logger.error(f"❌ Webhook: не удалось занять {WEBHOOK_HOST}:{WEBHOOK_PORT}: {e}")
+            await runner.cleanup()
+            return False
+        self.runner = runner
+
+        for endpoint in self.endpoints.values():
+            await endpoint.dp.emit_startup(bot=endpoint.bot, bots=[endpoint.bot], dispatcher=endpoint.dp)
+        if register and not await self._register():
+            await self.stop()
+            return False
+        logger.info(
+            f"🌐 Webhook: {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}/{{{','.join(self.endpoints)}}}, "
+            f"обработка до {WEBHOOK_MAX_CONCURRENCY} апдейтов одновременно"
+        )
+        return True
+
+    async def _register(self) -> bool:
+        for endpoint in self.endpoints.values():
+            try:
+                await endpoint.bot.set_webhook(
+                    self.url_for(endpoint.name),
+                    secret_token=endpoint.secret,
+                    allowed_updates=endpoint.dp.resolve_used_update_types(),
+                    max_connections=WEBHOOK_MAX_CONNECTIONS,
+                    drop_pending_updates=True,
+                )
+            except Exception as e:
+                logger.error(f"❌ Webhook: setWebhook для {endpoint.name}: {e}")
+                return False
+        return True
+
+    async def wait(self) -> None:
+        """Ждать остановки (stop() или SIGTERM/SIGINT)."""
+        import signal
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self._stopped.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: остановка по KeyboardInterrupt
+        await self._stopped.wait()
+
+    async def stop(self) -> None:
+        """Перестать принимать, дать обработке WEBHOOK_DRAIN_TIMEOUT секунд, затем отменить остаток."""
+        if self.runner is None:
+            return
+        self._stopped.set()
+        await self.runner.cleanup()
+        self.runner = None
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=WEBHOOK_DRAIN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        for endpoint in self.endpoints.values():
+            try:
+                await endpoint.dp.emit_shutdown(bot=endpoint.bot, bots=[endpoint.bot], dispatcher=endpoint.dp)
+            except Exception as e:
+                logger.warning(f"Webhook: shutdown {endpoint.name}: {e}")
+        logger.info("🌐 Webhook остановлен")
+
+    # ── Обработка запросов ─────────────────────────────────────────────────────
+
+    async def _health(self, request):
+        from aiohttp import web
+
+        return web.json_response({"ok": True, "in_flight": len(self._tasks)})
+
+    async def _handle(self, request):
+        from aiohttp import web
+        from aiogram.types import Update
+
+        endpoint = self.endpoints.get(request.match_info["bot"])
+        if endpoint is None:
+            return web.Response(status=404)
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), endpoint.secret):
+            WEBHOOK_UPDATES.inc(bot=endpoint.name, result="rejected")
+            logger.warning(f"⚠️ Webhook {endpoint.name}: неверный секрет от {request.remote}")
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": endpoint.bot})
+        except Exception as e:
+            WEBHOOK_UPDATES.inc(bot=endpoint.name, result="bad_request")
+            logger.warning(f"⚠️ Webhook {endpoint.name}: битый апдейт: {e}")
+            return web.Response(status=400)
+        if endpoint.seen(update.update_id):
+            WEBHOOK_UPDATES.inc(bot=endpoint.name, result="duplicate")
+            return web.Response()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), WEBHOOK_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            endpoint.recent.pop(update.update_id, None)  # Telegram повторит — тогда и обработаем
+            WEBHOOK_UPDATES.inc(bot=endpoint.name, result="busy")
+            logger.warning(f"⏳ Webhook {endpoint.name}: все {WEBHOOK_MAX_CONCURRENCY} слотов заняты — 503")
+            return web.Response(status=503)
+        task = asyncio.create_task(self._process(endpoint, update), name=f"update_{endpoint.name}_{update.update_id}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        WEBHOOK_UPDATES.inc(bot=endpoint.name, result="accepted")
+        return web.Response()
+
+    async def _process(self, endpoint: _Endpoint, update) -> None:
+        try:
+            await endpoint.dp.feed_update(endpoint.bot, update, bots=[endpoint.bot])
+        except Exception as e:
+            WEBHOOK_UPDATES.inc(bot=endpoint.name, result="failed")
+            logger.error(f"❌ Webhook {endpoint.name}: апдейт {update.update_id}: {e}", exc_info=True)
+        finally:
+            self._slots.release()
+
+
+webhook_server = WebhookServer()
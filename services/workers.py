@@ -0,0 +1,560 @@
+"""
+services/workers.py — процессы-воркеры: скан/анализ и медиа вне цикла событий ботов.
+
+В одном цикле main.py крутятся polling двух ботов, APScheduler, hunt (регулярки по
+тысячам постов, длинные итерации Telethon), гео-шпион, креативщик и Pillow — пока
+идёт охота, ответы живым пользователям задерживаются. Режим WORKER_MODE=process
+выносит эту работу в отдельные процессы:
+
+  - scan  — hunt, vk_discovery, geo_spy, scout_topics и потоковый режим лидов
+    (lead_stream); ровно один процесс: файлы сессий Telethon однопользовательские,
+    а пул сессий и кэш сущностей живут в этом процессе — отчёты о скане и сессиях
+    админка тоже запрашивает через очередь (scan_report, session_report);
+  - media — сжатие (Pillow) и генерация картинок; WORKER_MEDIA_PROCS процессов,
+    каждый на своём ядре.
+
+Связь — локальная очередь в SQLite WORKER_DB_PATH (WAL): main.py кладёт задачу
+(имя из TASKS + аргументы pickle), воркер забирает её в транзакции BEGIN IMMEDIATE,
+выполняет в своём цикле событий и пишет результат; вызывающий ждёт ответ опросом
+раз в WORKER_POLL_INTERVAL и удаляет строку. Запросы к SQLite из циклов событий идут
+через asyncio.to_thread. Если вызывающий не дождался (таймаут, отмена), задача не
+удаляется, а помечается orphaned: из очереди её не возьмут, а начатую воркер отменит
+при следующем опросе; строка остаётся для разбора до перезапуска main.py.
+hunt в воркере выполняется по одному (общий LeadHunter), даже если вызов пришёл
+мимо job_coordinator. Воркеры шлют карточки и отчёты сами,
+через свою очередь notifier (namespace worker_<имя>), пишут в ту же БД и
+system_logs, heartbeat — logs/heartbeat/worker_<имя>.json.
+
+main.py запускает воркеры и следит за ними: упавший процесс перезапускается
+(пауза растёт до 60 с), его незавершённые задачи возвращаются в очередь.
+
+WORKER_MODE=inline (по умолчанию) — всё как раньше: workers.route() отдаёт исходную
+функцию, workers.call() выполняет задачу в текущем процессе.
+Метрики: terion_worker_tasks_total{task,result}, terion_worker_task_seconds{task},
+terion_queue_depth{queue="workers"}.
+"""
+import asyncio
+import functools
+import importlib
+import inspect
+import logging
+import os
+import pickle
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from monitoring.metrics import QUEUE_DEPTH, counter, histogram, registry
+
+logger = logging.getLogger(__name__)
+
+WORKER_MODE = os.getenv("WORKER_MODE", "inline").lower()
+WORKER_DB_PATH = os.getenv("WORKER_DB_PATH", "worker_tasks.db")
+WORKER_MEDIA_PROCS = max(1, int(os.getenv("WORKER_MEDIA_PROCS", "1")))
+WORKER_CONCURRENCY = max(1, int(os.getenv("WORKER_CONCURRENCY", "4")))  # задач одновременно в одном воркере
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "0.2"))
+WORKER_TASK_TIMEOUT = float(os.getenv("WORKER_TASK_TIMEOUT", "3600"))
+WORKER_STOP_TIMEOUT = float(os.getenv("WORKER_STOP_TIMEOUT", "15"))
+# Роль и имя задаёт main.py при запуске воркера; в самом воркере задачи выполняются на месте
+WORKER_ROLE = os.getenv("WORKER_ROLE", "")
+WORKER_NAME = os.getenv("WORKER_NAME", "")
+
+ROLE_SCAN = "scan"
+ROLE_MEDIA = "media"
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Имя задачи → (роль воркера, "модуль:атрибут[.метод]")
+TASKS: Dict[str, Tuple[str, str]] = {
+    "hunt": (ROLE_SCAN, "services.workers:_hunt"),
+    "vk_discovery": (ROLE_SCAN, "services.workers:_run_discovery"),
+    "geo_spy": (ROLE_SCAN, "services.competitor_spy:competitor_spy.scan_geo_chats"),
+    "scout_topics": (ROLE_SCAN, "agents.creative_agent:creative_agent.scout_topics"),
+    "scan_report": (ROLE_SCAN, "services.scout_parser:scout_parser.get_last_scan_report"),
+    "session_report": (ROLE_SCAN, "services.session_pool:session_pool.format_report"),
+    "compress_image": (ROLE_MEDIA, "handlers.content:compress_image"),
+    "generate_image": (ROLE_MEDIA, "services.image_generator:image_generator.generate_image"),
+}
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_ORPHANED = "orphaned"  # вызывающий не дождался: не брать, а начатую — отменить
+
+# Задачи на общих синглтонах процесса — в воркере по одной, лишние вызовы ждут
+EXCLUSIVE_TASKS = {"hunt"}
+
+WORKER_TASKS = counter(
+    "terion_worker_tasks_total", "Задачи воркеров: queued / done / failed / timeout / cancelled / orphaned", ("task", "result"),
+)
+WORKER_TASK_SECONDS = histogram(
+    "terion_worker_task_seconds", "Задача воркера от постановки в очередь до результата", ("task",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 1800),
+)
+
+
+class WorkerTaskError(RuntimeError):
+    """Задача упала в воркере (текст — тип и сообщение исключения) или пропала из очереди."""
+
+
+def _resolve(target: str) -> Callable:
+    module_name, _, attr_path = target.partition(":")
+    obj: Any = importlib.import_module(module_name)
+    for attr in attr_path.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+async def _invoke(name: str, args: tuple, kwargs: dict) -> Any:
+    result = _resolve(TASKS[name][1])(*args, **kwargs)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+# ── Задачи scan-воркера ──────────────────────────────────────────────────────
+
+_hunter = None
+
+
+def _scan_hunter():
+    """Один LeadHunter на процесс: его же использует lead_stream в scan-воркере."""
+    global _hunter
+    if _hunter is None:
+        from services.lead_hunter.hunter import LeadHunter
+
+        _hunter = LeadHunter()
+    return _hunter
+
+
+async def _hunt():
+    return await _scan_hunter().hunt()
+
+
+async def _run_discovery():
+    return await _scan_hunter().run_discovery()
+
+
+# ── Очередь ──────────────────────────────────────────────────────────────────
+
+class TaskQueue:
+    """
+    Очередь задач в SQLite, общая для main.py и воркеров (у каждого процесса своё соединение).
+
+    Методы синхронные: из цикла событий — через asyncio.to_thread (соединение общее для
+    потоков, запросы по очереди под _lock).
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or WORKER_DB_PATH
+        self.conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._depth: Dict[str, int] = {}
+
+    def _open(self) -> sqlite3.Connection:
+        if self.conn is not None:
+            return self.conn
+        dir_name = os.path.dirname(self.db_path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS worker_tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                role TEXT NOT NULL,
+                name TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                result BLOB,
+                error TEXT,
+                worker TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_worker_tasks_role ON worker_tasks(role, status, id)")
+        return self.conn
+
+    def submit(self, name: str, args: tuple = (), kwargs: Optional[dict] = None) -> int:
+        role = TASKS[name][0]
+        payload = pickle.dumps((args, kwargs or {}), protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            cursor = self._open().execute(
+                "INSERT INTO worker_tasks (role, name, payload, created_at) VALUES (?, ?, ?, ?)",
+                (role, name, payload, time.time()),
+            )
+            return cursor.lastrowid
+
+    def claim(self, role: str, worker: str) -> Optional[Tuple[int, str, bytes]]:
+        """Забрать самую старую задачу роли; BEGIN IMMEDIATE — два воркера не возьмут одну и ту же."""
+        with self._lock:
+            conn = self._open()
+            # Пустую очередь проверяем без блокировки записи — простаивающие воркеры опрашивают её постоянно
+            if conn.execute(
+                "SELECT 1 FROM worker_tasks WHERE role = ? AND status = ? LIMIT 1", (role, STATUS_QUEUED),
+            ).fetchone() is None:
+                return None
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, name, payload FROM worker_tasks WHERE role = ? AND status = ? ORDER BY id LIMIT 1",
+                    (role, STATUS_QUEUED),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE worker_tasks SET status = ?, worker = ?, started_at = ? WHERE id = ?",
+                        (STATUS_RUNNING, worker, time.time(), row[0]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return row
+
+    def finish(self, task_id: int, result: Optional[bytes] = None, error: Optional[str] = None) -> None:
+        """Записать результат; у orphaned сохраняются статус и причина — результат никто не ждёт."""
+        with self._lock:
+            self._open().execute(
+                "UPDATE worker_tasks SET status = CASE WHEN status = ? THEN status ELSE ? END, result = ?, "
+                "error = CASE WHEN status = ? THEN error ELSE ? END, finished_at = ? WHERE id = ?",
+                (STATUS_ORPHANED, STATUS_FAILED if error is not None else STATUS_DONE, result,
+                 STATUS_ORPHANED, error, time.time(), task_id),
+            )
+
+    def poll(self, task_id: int) -> Optional[Tuple[str, Optional[bytes], Optional[str]]]:
+        """(status, result, error); None — строки нет (очередь сброшена)."""
+        with self._lock:
+            return self._open().execute(
+                "SELECT status, result, error FROM worker_tasks WHERE id = ?", (task_id,),
+            ).fetchone()
+
+    def forget(self, task_id: int) -> None:
+        with self._lock:
+            self._open().execute("DELETE FROM worker_tasks WHERE id = ?", (task_id,))
+
+    def abandon(self, task_id: int, reason: str) -> Optional[str]:
+        """
+        Вызывающий больше не ждёт: задача становится orphaned (не берётся из очереди, начатую
+        воркер отменит). Возвращает прежний статус; None — строки нет.
+        """
+        with self._lock:
+            conn = self._open()
+            row = conn.execute("SELECT status FROM worker_tasks WHERE id = ?", (task_id,)).fetchone()
+            if row is None:
+                return None
+            if row[0] in (STATUS_QUEUED, STATUS_RUNNING):
+                conn.execute(
+                    "UPDATE worker_tasks SET status = ?, error = ? WHERE id = ? AND status IN (?, ?)",
+                    (STATUS_ORPHANED, reason, task_id, STATUS_QUEUED, STATUS_RUNNING),
+                )
+            else:
+                conn.execute("DELETE FROM worker_tasks WHERE id = ?", (task_id,))  # результат уже есть
+            return row[0]
+
+    def orphaned(self, worker: str) -> List[int]:
+        """Начатые этим воркером задачи, которые вызывающий бросил."""
+        with self._lock:
+            rows = self._open().execute(
+                "SELECT id FROM worker_tasks WHERE worker = ? AND status = ? AND finished_at IS NULL",
+                (worker, STATUS_ORPHANED),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def release(self, worker: str) -> int:
+        """Вернуть в очередь задачи упавшего воркера (брошенные — закрыть)."""
+        with self._lock:
+            conn = self._open()
+            conn.execute(
+                "UPDATE worker_tasks SET finished_at = ? WHERE status = ? AND worker = ? AND finished_at IS NULL",
+                (time.time(), STATUS_ORPHANED, worker),
+            )
+            return conn.execute(
+                "UPDATE worker_tasks SET status = ?, worker = NULL, started_at = NULL WHERE status = ? AND worker = ?",
+                (STATUS_QUEUED, STATUS_RUNNING, worker),
+            ).rowcount
+
+    def reset(self) -> int:
+        """Очистить очередь при старте main.py: ждавших результата вызовов больше нет."""
+        with self._lock:
+            return self._open().execute("DELETE FROM worker_tasks").rowcount
+
+    def depth(self) -> Dict[str, int]:
+        """
+        Роль → задач в очереди и в работе. Зовётся синхронно из сборщика метрик и /workers:
+        если соединение занято запросом из потока, отдаётся прошлое значение, а не ждём его.
+        """
+        if not self._lock.acquire(blocking=False):
+            return dict(self._depth)
+        try:
+            rows = self._open().execute(
+                "SELECT role, COUNT(*) FROM worker_tasks WHERE status IN (?, ?) GROUP BY role",
+                (STATUS_QUEUED, STATUS_RUNNING),
+            ).fetchall()
+        finally:
+            self._lock.release()
+        self._depth = dict(rows)
+        return dict(rows)
+
+
+# ── Главный процесс: запуск воркеров и вызовы ────────────────────────────────
+
+class WorkerPool:
+    """Воркеры main.py: запуск и перезапуск процессов, постановка задач и ожидание результата."""
+
+    def __init__(self, mode: str = WORKER_MODE):
+        # Внутри самого воркера задачи не пересылаются дальше, а выполняются на месте
+        self.enabled = mode == "process" and not WORKER_ROLE
+        self.queue = TaskQueue()
+        self.processes: Dict[str, asyncio.subprocess.Process] = {}
+        self.restarts: Dict[str, int] = {}
+        self._supervisors: List[asyncio.Task] = []
+        self._stopping = False
+
+    @staticmethod
+    def layout() -> Dict[str, str]:
+        """Имя воркера → роль: один scan, WORKER_MEDIA_PROCS media."""
+        names = {f"{ROLE_SCAN}_1": ROLE_SCAN}
+        names.update({f"{ROLE_MEDIA}_{i}": ROLE_MEDIA for i in range(1, WORKER_MEDIA_PROCS + 1)})
+        return names
+
+    async def start(self) -> None:
+        if not self.enabled or self._supervisors:
+            return
+        self._stopping = False
+        dropped = await asyncio.to_thread(self.queue.reset)
+        if dropped:
+            logger.info(f"🧹 Очередь воркеров: удалено {dropped} задач прошлого запуска")
+        registry.add_collector(lambda: QUEUE_DEPTH.set(sum(self.queue.depth().values()), queue="workers"))
+        for name, role in self.layout().items():
+            self._supervisors.append(asyncio.create_task(self._supervise(name, role), name=f"worker_{name}"))
+        logger.info(f"⚙️ Воркеры: {', '.join(self.layout())} (очередь {self.queue.db_path})")
+
+    async def _supervise(self, name: str, role: str) -> None:
+        while not self._stopping:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    sys.executable, str(PROJECT_ROOT / "worker.py"), role, cwd=str(PROJECT_ROOT),
+                    env={**os.environ, "WORKER_ROLE": role, "WORKER_NAME": name, "HEARTBEAT_NAME": f"worker_{name}"},
+                )
+                self.processes[name] = process
+                returncode = await process.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Воркер {name}: не удалось запустить: {e}")
+                returncode = None
+            finally:
+                self.processes.pop(name, None)
+            if self._stopping:
+                return
+            released = await asyncio.to_thread(self.queue.release, name)
+            self.restarts[name] = self.restarts.get(name, 0) + 1
+            delay = min(60, 5 * self.restarts[name])
+            logger.warning(
+                f"⚠️ Воркер {name} завершился (код {returncode}), задач возвращено в очередь: {released}; "
+                f"перезапуск через {delay} с"
+            )
+            await asyncio.sleep(delay)
+
+    async def stop(self) -> None:
+        """SIGTERM воркерам, WORKER_STOP_TIMEOUT на завершение текущих задач, дальше — kill."""
+        if not self._supervisors:
+            return
+        self._stopping = True
+        for process in list(self.processes.values()):
+            if process.returncode is None:
+                process.terminate()
+        for name, process in list(self.processes.items()):
+            try:
+                await asyncio.wait_for(process.wait(), WORKER_STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Воркер {name} не завершился за {WORKER_STOP_TIMEOUT:g} с — kill")
+                process.kill()
+                await process.wait()
+        for task in self._supervisors:
+            task.cancel()
+        await asyncio.gather(*self._supervisors, return_exceptions=True)
+        self._supervisors = []
+        logger.info("⚙️ Воркеры остановлены")
+
+    async def call(self, name: str, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Выполнить задачу TASKS[name]: в воркере (WORKER_MODE=process) или здесь же."""
+        if not self.enabled:
+            return await _invoke(name, args, kwargs)
+        started = time.monotonic()
+        task_id = await asyncio.to_thread(self.queue.submit, name, args, kwargs)
+        WORKER_TASKS.inc(task=name, result="queued")
+        deadline = started + (timeout or WORKER_TASK_TIMEOUT)
+        finished = False
+        reason = "вызывающий отменён"
+        try:
+            while True:
+                await asyncio.sleep(WORKER_POLL_INTERVAL)
+                row = await asyncio.to_thread(self.queue.poll, task_id)
+                if row is None:
+                    raise WorkerTaskError(f"{name}: задача пропала из очереди воркеров")
+                status, result, error = row
+                if status in (STATUS_DONE, STATUS_FAILED):
+                    finished = True
+                    break
+                if time.monotonic() > deadline:
+                    WORKER_TASKS.inc(task=name, result="timeout")
+                    reason = f"нет результата за {timeout or WORKER_TASK_TIMEOUT:g} с"
+                    raise asyncio.TimeoutError(f"{name}: нет результата от воркера за {timeout or WORKER_TASK_TIMEOUT:g} с")
+        except asyncio.CancelledError:
+            WORKER_TASKS.inc(task=name, result="cancelled")
+            raise
+        finally:
+            if finished:
+                await asyncio.to_thread(self.queue.forget, task_id)
+                WORKER_TASK_SECONDS.observe(time.monotonic() - started, task=name)
+            else:
+                # Не удаляем молча: задачу из очереди не возьмут, начатую воркер отменит,
+                # а строка orphaned останется для разбора; shield — отмена вызывающего не
+                # обрывает саму запись
+                await asyncio.shield(self._abandon(name, task_id, reason))
+        if status == STATUS_FAILED:
+            WORKER_TASKS.inc(task=name, result="failed")
+            raise WorkerTaskError(f"{name}: {error}")
+        WORKER_TASKS.inc(task=name, result="done")
+        return pickle.loads(result) if result is not None else None
+
+    async def _abandon(self, name: str, task_id: int, reason: str) -> None:
+        try:
+            previous = await asyncio.to_thread(self.queue.abandon, task_id, reason)
+        except Exception as e:
+            logger.error(f"❌ Очередь воркеров: не удалось пометить {name} #{task_id} брошенной: {e}")
+            return
+        if previous in (STATUS_QUEUED, STATUS_RUNNING):
+            WORKER_TASKS.inc(task=name, result="orphaned")
+            logger.warning(f"⚠️ {name} #{task_id}: {reason}, задача ({previous}) помечена orphaned")
+
+    def route(self, name: str, func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        """func как есть в режиме inline, иначе — обёртка, отправляющая вызов в воркер."""
+        if not self.enabled:
+            return func
+
+        @functools.wraps(func)
+        async def remote(*args, **kwargs):
+            return await self.call(name, *args, **kwargs)
+
+        return remote
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "process" if self.enabled else "inline",
+            "alive": {name: process.pid for name, process in self.processes.items()},
+            "restarts": dict(self.restarts),
+            "queue": self.queue.depth() if self.enabled else {},
+        }
+
+
+workers = WorkerPool()
+
+
+# ── Процесс-воркер (worker.py) ───────────────────────────────────────────────
+
+_exclusive: Dict[str, asyncio.Lock] = {}
+
+
+async def _execute(queue: TaskQueue, task_id: int, name: str, payload: bytes) -> None:
+    started = time.monotonic()
+    try:
+        args, kwargs = pickle.loads(payload)
+        if name in EXCLUSIVE_TASKS:
+            lock = _exclusive.setdefault(name, asyncio.Lock())
+            if lock.locked():
+                logger.info(f"⏳ {name} #{task_id}: ждёт завершения предыдущего запуска")
+            async with lock:
+                result = await asyncio.wait_for(_invoke(name, args, kwargs), WORKER_TASK_TIMEOUT)
+        else:
+            result = await asyncio.wait_for(_invoke(name, args, kwargs), WORKER_TASK_TIMEOUT)
+        await asyncio.to_thread(queue.finish, task_id, result=pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        logger.info(f"⚙️ {name} #{task_id}: готово за {time.monotonic() - started:.1f} с")
+    except asyncio.CancelledError:
+        # Запись статуса не должна оборваться вместе с задачей
+        await asyncio.shield(asyncio.to_thread(queue.finish, task_id, error="воркер остановлен"))
+        raise
+    except Exception as e:
+        logger.exception(f"❌ {name} #{task_id}")
+        await asyncio.to_thread(queue.finish, task_id, error=f"{type(e).__name__}: {e}"[:1000])
+
+
+async def run_worker(role: str) -> None:
+    """Цикл воркера: забирает задачи своей роли (до WORKER_CONCURRENCY одновременно) до SIGTERM."""
+    from database import db
+    from monitoring.heartbeat import heartbeat
+    from monitoring.log_sink import log_sink
+    from monitoring.loop_monitor import loop_monitor
+    from services.notifier import notifier
+
+    name = WORKER_NAME or f"{role}_{os.getpid()}"
+    queue = TaskQueue()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: остановка через kill
+
+    await db.connect()
+    await log_sink.start(db)
+    # Своя очередь уведомлений: после перезапуска воркер досылает только своё
+    notifier.namespace = f"worker_{name}"
+    await notifier.start()
+    await heartbeat.start()
+    await loop_monitor.start()
+
+    if role == ROLE_SCAN:
+        from services.lead_hunter.stream import lead_stream, LEAD_STREAM_ENABLED
+        if LEAD_STREAM_ENABLED:
+            lead_stream.start_background(_scan_hunter())
+
+    logger.info(f"⚙️ Воркер {name} ({role}) запущен, PID {os.getpid()}")
+    running: Dict[int, asyncio.Task] = {}
+    try:
+        while not stop.is_set():
+            if running:
+                for task_id in await asyncio.to_thread(queue.orphaned, name):
+                    task = running.get(task_id)
+                    if task is not None and not task.done():
+                        logger.warning(f"⚠️ Воркер {name}: задача #{task_id} брошена вызывающим — отменяю")
+                        task.cancel()
+            claimed = await asyncio.to_thread(queue.claim, role, name) if len(running) < WORKER_CONCURRENCY else None
+            if claimed is None:
+                try:
+                    await asyncio.wait_for(stop.wait(), WORKER_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task_id = claimed[0]
+            task = asyncio.create_task(_execute(queue, *claimed), name=f"worker_task_{claimed[1]}")
+            running[task_id] = task
+            task.add_done_callback(lambda _, task_id=task_id: running.pop(task_id, None))
+        if running:
+            logger.info(f"⚙️ Воркер {name}: дожидаюсь {len(running)} задач")
+            _, pending = await asyncio.wait(set(running.values()), timeout=max(1.0, WORKER_STOP_TIMEOUT - 3))
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+    finally:
+        if role == ROLE_SCAN:
+            from services.lead_hunter.stream import lead_stream
+            from services.session_pool import session_pool
+            await lead_stream.stop()
+            await session_pool.stop()
+        await notifier.stop()
+        await heartbeat.stop()
+        await loop_monitor.stop()
+        await log_sink.stop()
+        await db.close()
+        logger.info(f"⚙️ Воркер {name} остановлен")
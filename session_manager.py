@@ -8,20 +8,30 @@ from config import API_ID, API_HASH
 
 SESSION_NAME = "anton_parser"
 
-async def check_session():
-    client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
+async def check_session(name=SESSION_NAME):
+    client = TelegramClient(name, API_ID, API_HASH)
     await client.connect()
     is_auth = await client.is_user_authorized()
     await client.disconnect()
     return is_auth
 
-async def create_session(reset=False):
-    session_file = f"{SESSION_NAME}.session"
+async def check_pool():
+    """Проверить все сессии пула (TELETHON_SESSIONS); True — если все авторизованы."""
+    from services.session_pool import TELETHON_SESSIONS
+    all_valid = True
+    for name in TELETHON_SESSIONS:
+        is_valid = await check_session(name)
+        all_valid = all_valid and is_valid
+        print(f"{'✅' if is_valid else '❌'} {name}")
+    return all_valid
+
+async def create_session(reset=False, name=SESSION_NAME):
+    session_file = f"{name}.session"
     if reset and os.path.exists(session_file):
         os.remove(session_file)
         print(f"🗑️ Session file {session_file} removed.")
 
-    client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
+    client = TelegramClient(name, API_ID, API_HASH)
     await client.start()
     print("✅ Session created successfully!")
     me = await client.get_me()
@@ -32,10 +42,15 @@ def main():
     parser = argparse.ArgumentParser(description="Telegram Session Manager")
     parser.add_argument("--reset", action="store_true", help="Force recreate session")
     parser.add_argument("--check", action="store_true", help="Check if session is valid")
+    parser.add_argument("--session", default=SESSION_NAME, help="Session name (one of TELETHON_SESSIONS)")
+    parser.add_argument("--pool", action="store_true", help="Check all sessions from TELETHON_SESSIONS")
     args = parser.parse_args()
 
+    if args.pool:
+        sys.exit(0 if asyncio.run(check_pool()) else 1)
+
     if args.check:
-        is_valid = asyncio.run(check_session())
+        is_valid = asyncio.run(check_session(args.session))
         if is_valid:
             print("✅ Session is valid")
             sys.exit(0)
@@ -43,7 +58,7 @@ def main():
             print("❌ Session is invalid or not found")
             sys.exit(1)
     
-    asyncio.run(create_session(reset=args.reset))
+    asyncio.run(create_session(reset=args.reset, name=args.session))
 
 if __name__ == "__main__":
     main()
@@ -65,7 +80,7 @@ API_ID = os.getenv("API_ID")
 API_HASH = os.getenv("API_HASH")
 PHONE = os.getenv("PHONE")
 
-# Путь к файлу сессии
+# Путь к файлу сессии (другая сессия пула — аргумент --session NAME)
 SESSION_FILE = "anton_parser.session"
 
 
@@ -128,7 +143,12 @@ async def get_client():
 
 
 if __name__ == "__main__":
+    import argparse
     import asyncio
+
+    parser = argparse.ArgumentParser(description="Telethon Session Manager")
+    parser.add_argument("--session", default="anton_parser", help="Имя сессии из TELETHON_SESSIONS")
+    SESSION_FILE = f"{parser.parse_args().session}.session"
     
     async def main():
         client = await get_client()
@@ -0,0 +1,313 @@
+"""
+Кэш ответов консультанта: повторный вопрос — ответ за миллисекунды и без токенов.
+
+Ключ — нормализованный вопрос + версия базы знаний (kb.version) + версия промпта
+(провайдер и хэш системного промпта). Переиндексация базы с новым содержимым меняет
+версию — старые ответы перестают находиться и удаляются из SQLite при следующей загрузке.
+
+Поиск:
+  1. точное совпадение нормализованного вопроса (регистр, ё, пунктуация, приветствия
+     и порядок слов не важны);
+  2. похожий вопрос (ANSWER_CACHE_MATCH): shingles — Жаккар по символьным 3-граммам,
+     embedding — косинус векторов энкодера базы знаний (utils/kb_semantic.py).
+     Два порога уверенности: при сходстве ≥ ANSWER_CACHE_MIN_SIMILARITY ответ берётся
+     сразу; при сходстве ≥ ANSWER_CACHE_CONTEXT_SIMILARITY — только если RAG-контекст
+     вопроса тот же самый (ответ строился из тех же фрагментов базы).
+
+Не кэшируются персональные ходы: есть история текущего разговора (ответ на неё
+опирается) или в вопросе личные детали (цифры — этаж, площадь, адрес; «у меня», «моя
+квартира»…). Текущий разговор — ходы без перерыва дольше ANSWER_CACHE_SESSION_GAP_MINUTES
+(current_session): более старая история в промпт консультанта не попадает, поэтому
+вопрос, заданный через день, снова может взять ответ из кэша.
+Ошибки провайдеров и пустые ответы не сохраняются.
+
+Записи живут ANSWER_CACHE_TTL_HOURS; в памяти — не больше ANSWER_CACHE_MAX (LRU),
+на диске — таблица answer_cache (переживает перезапуск). Память — своя у каждого
+процесса webhook: ответы, сохранённые другими процессами, подхватываются только при
+следующей загрузке из таблицы (перезапуск или новая версия базы знаний).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from monitoring.metrics import counter
+from .kb_semantic import get_encoder, np, semantic_available
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") != "0"
+ANSWER_CACHE_MATCH = os.getenv("ANSWER_CACHE_MATCH", "shingles").lower()  # exact | shingles | embedding
+ANSWER_CACHE_TTL_HOURS = float(os.getenv("ANSWER_CACHE_TTL_HOURS", "72"))
+ANSWER_CACHE_MAX = int(os.getenv("ANSWER_CACHE_MAX", "2000"))
+# Ручной сброс при правках шаблонов ответа, которые не меняют текст системного промпта
+ANSWER_CACHE_PROMPT_VERSION = os.getenv("ANSWER_CACHE_PROMPT_VERSION", "1")
+ANSWER_CACHE_MIN_SIMILARITY = os.getenv("ANSWER_CACHE_MIN_SIMILARITY", "")
+ANSWER_CACHE_CONTEXT_SIMILARITY = os.getenv("ANSWER_CACHE_CONTEXT_SIMILARITY", "")
+ANSWER_CACHE_SESSION_GAP_MINUTES = float(os.getenv("ANSWER_CACHE_SESSION_GAP_MINUTES", "30"))
+
+# Пороги по умолчанию: (сразу, при том же контексте)
+_THRESHOLDS = {"shingles": (0.85, 0.6), "embedding": (0.95, 0.88)}
+
+ANSWER_CACHE_EVENTS = counter(
+    "terion_answer_cache_total", "Кэш ответов консультанта: hit_exact / hit_similar / miss / skip / store",
+    ("result",),
+)
+
+_WORD_RE = re.compile(r"\w+")
+_FILLER_WORDS = frozenset({
+    "здравствуйте", "здравствуй", "добрый", "доброе", "день", "вечер", "утро", "привет", "подскажите",
+    "подскажи", "пожалуйста", "скажите", "спасибо", "заранее", "извините", "антон", "уважаемый", "а", "и", "ну", "вот",
+})
+_PERSONAL_RE = re.compile(
+    r"\d|\b(у меня|у нас|мо[йяеёию]|моей|моего|моем|моём|моих|мне|наш[аеиу]?|нашей|нашего|нашем)\b",
+    re.IGNORECASE,
+)
+_ERROR_PREFIXES = ("Ошибка", "Извините, запрос слишком большой", "К сожалению, сервис")
+
+
+def normalize_question(text: str) -> str:
+    words = _WORD_RE.findall((text or "").lower().replace("ё", "е"))
+    return " ".join(sorted(w for w in words if w not in _FILLER_WORDS))
+
+
+def _shingles(normalized: str) -> FrozenSet[str]:
+    compact = normalized.replace(" ", "_")
+    return frozenset(compact[i:i + 3] for i in range(max(1, len(compact) - 2)))
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+
+def prompt_version(provider: str, system_prompt: str) -> str:
+    return f"{provider}:{ANSWER_CACHE_PROMPT_VERSION}:{_digest(system_prompt)[:8]}"
+
+
+def is_personal(question: str, history_used: bool) -> bool:
+    return history_used or bool(_PERSONAL_RE.search(question or ""))
+
+
+def _history_time(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def current_session(history: Optional[List[Dict]], gap_minutes: float = ANSWER_CACHE_SESSION_GAP_MINUTES) -> List[Dict]:
+    """
+    Хвост истории диалога без перерывов дольше gap_minutes — текущий разговор.
+
+    created_at из dialog_history — CURRENT_TIMESTAMP SQLite (UTC); ходы без даты считаются текущими.
+    """
+    if not history:
+        return []
+    gap = timedelta(minutes=gap_minutes)
+    newer = datetime.utcnow()
+    start = len(history)
+    for i in range(len(history) - 1, -1, -1):
+        at = _history_time(history[i].get("created_at"))
+        if at is not None:
+            if newer - at > gap:
+                break
+            newer = at
+        start = i
+    return list(history[start:])
+
+
+class _Entry:
+    __slots__ = ("key", "prompt_version", "question", "normalized", "shingles", "vector", "context_hash", "answer",
+                 "created_at")
+
+    def __init__(self, key: str, prompt_version: str, question: str, normalized: str, context_hash: str,
+                 answer: str, created_at: float):
+        self.key = key
+        self.prompt_version = prompt_version
+        self.question = question
+        self.normalized = normalized
+        self.shingles = _shingles(normalized)
+        self.vector = None
+        self.context_hash = context_hash
+        self.answer = answer
+        self.created_at = created_at
+
+
+class AnswerCache:
+    """Кэш ответов консультанта; версия базы знаний приходит из KnowledgeBase.index_documents."""
+
+    def __init__(self):
+        self.kb_version: Optional[str] = None
+        self.entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._loaded_version: Optional[str] = None
+        self._load_lock = asyncio.Lock()
+        self._pending_hits: Dict[str, int] = {}
+        match = ANSWER_CACHE_MATCH
+        if match == "embedding" and not semantic_available():
+            logger.warning("⚠️ Кэш ответов: эмбеддинги недоступны (нет NumPy), сравнение по шинглам")
+            match = "shingles"
+        self.match = match
+        strict, loose = _THRESHOLDS.get(match, (1.0, 1.0))
+        self.min_similarity = float(ANSWER_CACHE_MIN_SIMILARITY or strict)
+        self.context_similarity = float(ANSWER_CACHE_CONTEXT_SIMILARITY or loose)
+
+    @property
+    def ttl(self) -> float:
+        return ANSWER_CACHE_TTL_HOURS * 3600
+
+    def set_kb_version(self, version: Optional[str]) -> None:
+        """База знаний переиндексирована: при новой версии все ответы в памяти недействительны."""
+        if version == self.kb_version:
+            return
+        if self.entries:
+            logger.info(f"🧠 Кэш ответов сброшен: база знаний {self.kb_version} → {version}")
+        self.kb_version = version
+        self.entries.clear()
+        self._pending_hits.clear()
+        self._loaded_version = None
+
+    # ── Поиск ──────────────────────────────────────────────────────────────────
+
+    async def lookup(self, question: str, rag_context: str, prompt_ver: str, history_used: bool) -> Optional[str]:
+        if not ANSWER_CACHE_ENABLED or not self.kb_version:
+            return None
+        if is_personal(question, history_used):
+            ANSWER_CACHE_EVENTS.inc(result="skip")
+            return None
+        await self._ensure_loaded()
+        t0 = time.monotonic()
+        normalized = normalize_question(question)
+        now = time.time()
+
+        entry = self.entries.get(_digest(prompt_ver, normalized))
+        result = "hit_exact"
+        if entry is None or now - entry.created_at > self.ttl:
+            result = "hit_similar"
+            entry = await self._find_similar(question, normalized, _digest(rag_context), prompt_ver, now)
+        if entry is None:
+            ANSWER_CACHE_EVENTS.inc(result="miss")
+            return None
+
+        self.entries.move_to_end(entry.key)
+        self._pending_hits[entry.key] = self._pending_hits.get(entry.key, 0) + 1
+        ANSWER_CACHE_EVENTS.inc(result=result)
+        logger.info(f"⚡ Кэш ответов ({result}): «{question[:60]}» за {(time.monotonic() - t0) * 1000:.1f} мс")
+        return entry.answer
+
+    async def _find_similar(self, question: str, normalized: str, context_hash: str, prompt_ver: str,
+                            now: float) -> Optional[_Entry]:
+        candidates = [e for e in self.entries.values()
+                      if e.prompt_version == prompt_ver and now - e.created_at <= self.ttl]
+        if self.match not in ("shingles", "embedding") or not candidates:
+            return None
+        if self.match == "embedding":
+            query = await self._vector(question)
+            await self._fill_vectors(candidates)
+            scores = (np.stack([e.vector for e in candidates]) @ query).tolist()
+        else:
+            query = _shingles(normalized)
+            scores = [len(query & e.shingles) / (len(query | e.shingles) or 1) for e in candidates]
+
+        best: Optional[Tuple[float, _Entry]] = None
+        for score, entry in zip(scores, candidates):
+            confident = score >= self.min_similarity or (
+                score >= self.context_similarity and entry.context_hash == context_hash
+            )
+            if confident and (best is None or score > best[0]):
+                best = (score, entry)
+        return best[1] if best else None
+
+    async def _vector(self, question: str):
+        encoder = get_encoder()
+        return (await asyncio.to_thread(encoder.encode, [question], True))[0]
+
+    async def _fill_vectors(self, entries: List[_Entry]) -> None:
+        missing = [e for e in entries if e.vector is None]
+        if not missing:
+            return
+        encoder = get_encoder()
+        vectors = await asyncio.to_thread(encoder.encode, [e.question for e in missing], True)
+        for entry, vector in zip(missing, vectors):
+            entry.vector = vector
+
+    # ── Запись ─────────────────────────────────────────────────────────────────
+
+    async def store(self, question: str, rag_context: str, prompt_ver: str, answer: Optional[str],
+                    history_used: bool) -> None:
+        if not ANSWER_CACHE_ENABLED or not self.kb_version or not answer or not answer.strip():
+            return
+        if answer.startswith(_ERROR_PREFIXES) or is_personal(question, history_used):
+            return
+        normalized = normalize_question(question)
+        if not normalized:
+            return
+        key = _digest(prompt_ver, normalized)
+        context_hash = _digest(rag_context)
+        question = question[:1000]
+        self._remember(_Entry(key, prompt_ver, question, normalized, context_hash, answer, time.time()))
+        ANSWER_CACHE_EVENTS.inc(result="store")
+        db = self._db()
+        if db is None:
+            return
+        try:
+            await db.save_answer_cache(key, self.kb_version, prompt_ver, question, normalized,
+                                       context_hash, answer)
+            if self._pending_hits:
+                hits, self._pending_hits = self._pending_hits, {}
+                await db.add_answer_cache_hits(hits)
+        except Exception as e:
+            logger.debug(f"Кэш ответов: не удалось сохранить в БД: {e}")
+
+    def _remember(self, entry: _Entry) -> None:
+        self.entries[entry.key] = entry
+        self.entries.move_to_end(entry.key)
+        while len(self.entries) > ANSWER_CACHE_MAX:
+            self.entries.popitem(last=False)
+
+    # ── SQLite ─────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _db():
+        from database import db
+
+        return db if db.conn is not None else None
+
+    async def _ensure_loaded(self) -> None:
+        """Один раз на версию базы знаний: удалить устаревшее и поднять свежие ответы из SQLite."""
+        version = self.kb_version
+        if self._loaded_version == version:
+            return
+        async with self._load_lock:
+            if self._loaded_version == version:
+                return
+            db = self._db()
+            if db is None:
+                return  # БД ещё не подключена — попробуем при следующем вопросе
+            try:
+                since = datetime.now() - timedelta(hours=ANSWER_CACHE_TTL_HOURS)
+                await db.cleanup_answer_cache(version, since)
+                rows = await db.get_answer_cache(version, since)
+                if self.kb_version != version:
+                    return  # пока читали, база знаний переиндексирована
+                for row in rows[-ANSWER_CACHE_MAX:]:
+                    created = row["created_at"]
+                    if isinstance(created, str):
+                        created = datetime.fromisoformat(created)
+                    self._remember(_Entry(row["cache_key"], row["prompt_version"], row["question"],
+                                          row["normalized"], row["context_hash"], row["answer"],
+                                          created.timestamp()))
+                if rows:
+                    logger.info(f"🧠 Кэш ответов: загружено {len(rows)} ответов (база знаний {version})")
+            except Exception as e:
+                logger.debug(f"Кэш ответов: не удалось загрузить из БД: {e}")
+            self._loaded_version = version
+
+
+answer_cache = AnswerCache()
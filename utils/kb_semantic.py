@@ -0,0 +1,285 @@
+"""
+Семантический поиск по базе знаний (CPU, без внешних API).
+
+При индексации документы режутся на фрагменты, локальная модель эмбеддингов
+считает их векторы в матрицу NumPy (float32, нормированную), матрица сохраняется
+в KB_INDEX_DIR и при следующем запуске открывается через memmap — пересчёт только
+если изменились документы, модель или параметры нарезки.
+
+Запрос: вектор запроса (LRU-кэш) × матрица фрагментов = косинусы всех фрагментов
+одним умножением; затем гибридный ранг с ключевыми словами:
+    score = KB_HYBRID_ALPHA * семантика + (1 - KB_HYBRID_ALPHA) * ключевые слова
+(обе части нормированы в [0, 1]). С моделью «снести перегородку» находит «демонтаж
+стены», а точные термины (СП, статьи ЖК) по-прежнему поднимаются ключевыми словами.
+
+Модель: sentence-transformers (KB_EMBED_MODEL, по умолчанию multilingual-e5-small) —
+опциональная зависимость (тянет torch), в requirements.txt не включена: синонимы
+ищутся только после `pip install sentence-transformers`. Без пакета или с
+KB_EMBED_MODEL=hashing — запасной энкодер на хэшированных символьных n-граммах:
+ловит словоформы («перегородку» / «перегородка»), но не синонимы.
+Вектор запроса для модели считается в потоке (asearch), цикл событий не ждёт CPU.
+Без NumPy слой отключается, KnowledgeBase работает по ключевым словам, как раньше.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # семантический слой опционален
+    np = None
+
+logger = logging.getLogger(__name__)
+
+KB_SEMANTIC_ENABLED = os.getenv("KB_SEMANTIC_ENABLED", "1") != "0"
+KB_EMBED_MODEL = os.getenv("KB_EMBED_MODEL", "intfloat/multilingual-e5-small")
+KB_INDEX_DIR = os.getenv("KB_INDEX_DIR", "kb_index")
+KB_CHUNK_SIZE = int(os.getenv("KB_CHUNK_SIZE", "700"))
+KB_CHUNK_OVERLAP = int(os.getenv("KB_CHUNK_OVERLAP", "150"))
+KB_HYBRID_ALPHA = float(os.getenv("KB_HYBRID_ALPHA", "0.7"))
+# Порог «семантически похоже» — свой для каждого энкодера; env переопределяет
+KB_SEMANTIC_MIN_SCORE = os.getenv("KB_SEMANTIC_MIN_SCORE", "")
+QUERY_CACHE_SIZE = 512
+HASH_DIM = 2048
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def semantic_available() -> bool:
+    return KB_SEMANTIC_ENABLED and np is not None
+
+
+# ── Энкодеры ──────────────────────────────────────────────────────────────────
+
+class HashingEncoder:
+    """Хэшированные символьные 3–5-граммы слов → нормированный вектор (без модели)."""
+
+    min_score = 0.25
+
+    def __init__(self, dim: int = HASH_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def encode(self, texts: Sequence[str], query: bool = False) -> "np.ndarray":
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            row = out[i]
+            for word in _WORD_RE.findall(text.lower()):
+                if len(word) < 3:
+                    continue
+                token = f"<{word}>"
+                for n in (3, 4, 5):
+                    for j in range(len(token) - n + 1):
+                        row[zlib.crc32(token[j:j + n].encode()) % self.dim] += 1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+
+class SentenceTransformerEncoder:
+    """Локальная модель sentence-transformers на CPU (e5: префиксы query:/passage:)."""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.name = model_name
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.e5 = "e5" in model_name.lower()
+        # У e5 косинусы «сжаты» в 0.7–0.9, у остальных моделей шкала шире
+        self.min_score = 0.80 if self.e5 else 0.45
+
+    def encode(self, texts: Sequence[str], query: bool = False) -> "np.ndarray":
+        if self.e5:
+            prefix = "query: " if query else "passage: "
+            texts = [prefix + t for t in texts]
+        vectors = self.model.encode(
+            list(texts), batch_size=32, normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False
+        )
+        return vectors.astype(np.float32, copy=False)
+
+
+_encoder = None
+
+
+def get_encoder():
+    """Один энкодер на процесс (модель грузится один раз для всех экземпляров KnowledgeBase)."""
+    global _encoder
+    if _encoder is None:
+        if KB_EMBED_MODEL == "hashing":
+            _encoder = HashingEncoder()
+        else:
+            try:
+                _encoder = SentenceTransformerEncoder(KB_EMBED_MODEL)
+            except Exception as e:
+                logger.warning(f"⚠️ База знаний: модель {KB_EMBED_MODEL} недоступна ({e}), "
+                               f"семантика на символьных n-граммах — синонимы не находятся "
+                               f"(нужен pip install sentence-transformers)")
+                _encoder = HashingEncoder()
+        if KB_SEMANTIC_MIN_SCORE:
+            _encoder.min_score = float(KB_SEMANTIC_MIN_SCORE)
+    return _encoder
+
+
+# ── Фрагменты ────────────────────────────────────────────────────────────────
+
+class Chunk:
+    __slots__ = ("filename", "text", "text_lower")
+
+    def __init__(self, filename: str, text: str):
+        self.filename = filename
+        self.text = text
+        self.text_lower = text.lower()
+
+
+def split_chunks(text: str, size: int = KB_CHUNK_SIZE, overlap: int = KB_CHUNK_OVERLAP) -> List[str]:
+    """Нарезка по абзацам до ~size символов; длинные абзацы — окнами с перекрытием."""
+    chunks: List[str] = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(current) + len(paragraph) + 2 <= size:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+            continue
+        if current:
+            chunks.append(current)
+            current = ""
+        if len(paragraph) <= size:
+            current = paragraph
+            continue
+        step = max(1, size - overlap)
+        for start in range(0, len(paragraph), step):
+            chunks.append(paragraph[start:start + size])
+            if start + size >= len(paragraph):
+                break
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# ── Индекс ───────────────────────────────────────────────────────────────────
+
+class SemanticIndex:
+    """Матрица векторов фрагментов (memmap) + гибридный поиск."""
+
+    def __init__(self, index_dir: str = KB_INDEX_DIR):
+        self.index_dir = index_dir
+        # (энкодер, фрагменты, матрица) меняются одним присваиванием: build идёт в потоке,
+        # search в цикле событий не должен увидеть новые фрагменты со старой матрицей
+        self._state: Optional[Tuple[object, List[Chunk], "np.ndarray"]] = None
+        self.fingerprint: Optional[str] = None
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    @property
+    def ready(self) -> bool:
+        return self._state is not None
+
+    @property
+    def chunks(self) -> List[Chunk]:
+        return self._state[1] if self._state else []
+
+    def build(self, documents: List[Dict[str, str]]) -> int:
+        """Синхронно (вызывать через asyncio.to_thread): нарезка, векторы, сохранение/загрузка с диска."""
+        t0 = time.monotonic()
+        encoder = get_encoder()
+        chunks = [
+            Chunk(doc["filename"], text)
+            for doc in documents
+            for text in split_chunks(doc["content"])
+        ]
+        digest = hashlib.sha1(f"{encoder.name}|{KB_CHUNK_SIZE}|{KB_CHUNK_OVERLAP}".encode())
+        for chunk in chunks:
+            digest.update(chunk.filename.encode())
+            digest.update(chunk.text.encode())
+        fingerprint = digest.hexdigest()[:16]
+
+        vectors_path = os.path.join(self.index_dir, "vectors.npy")
+        meta_path = os.path.join(self.index_dir, "meta.json")
+        cached = False
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            cached = meta.get("fingerprint") == fingerprint and os.path.exists(vectors_path)
+        except (OSError, ValueError):
+            pass
+
+        if not cached and chunks:
+            matrix = encoder.encode([c.text for c in chunks])
+            os.makedirs(self.index_dir, exist_ok=True)
+            # Временные файлы — свои у каждого процесса: дополнительные процессы webhook
+            # (SERVICES_ENABLED=0) индексируют ту же KB_INDEX_DIR одновременно
+            tmp = f"{vectors_path}.{os.getpid()}.tmp.npy"
+            np.save(tmp, matrix)
+            os.replace(tmp, vectors_path)
+            tmp = f"{meta_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": fingerprint, "model": encoder.name, "dim": int(matrix.shape[1]),
+                           "chunks": len(chunks)}, f, ensure_ascii=False)
+            os.replace(tmp, meta_path)
+
+        vectors = np.load(vectors_path, mmap_mode="r") if chunks else None
+        if vectors is not None and vectors.shape[0] != len(chunks):
+            raise RuntimeError(f"индекс {vectors_path} повреждён: {vectors.shape[0]} векторов на {len(chunks)} фрагментов")
+        self._state = (encoder, chunks, vectors) if vectors is not None else None
+        self.fingerprint = fingerprint
+        logger.info(f"🧠 База знаний: {len(chunks)} фрагментов, модель {encoder.name}, "
+                    f"{'с диска' if cached else 'пересчитано'} за {time.monotonic() - t0:.1f} с")
+        return len(chunks)
+
+    def _embed_query(self, encoder, query: str) -> "np.ndarray":
+        key = query.strip().lower()
+        vector = self._query_cache.get(key)
+        if vector is None:
+            vector = encoder.encode([query], query=True)[0]
+            self._remember(key, vector)
+        else:
+            self._query_cache.move_to_end(key)
+        return vector
+
+    def _remember(self, key: str, vector: "np.ndarray") -> None:
+        self._query_cache[key] = vector
+        if len(self._query_cache) > QUERY_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+
+    async def asearch(self, query: str, keywords: List[str], limit: int) -> List[Tuple[float, Chunk]]:
+        """search() из цикла событий: вектор запроса модели (не хэширующего энкодера) — в потоке."""
+        state = self._state
+        if state is not None and not isinstance(state[0], HashingEncoder):
+            key = query.strip().lower()
+            if key not in self._query_cache:
+                vectors = await asyncio.to_thread(state[0].encode, [query], True)
+                self._remember(key, vectors[0])
+        return self.search(query, keywords, limit)
+
+    def search(self, query: str, keywords: List[str], limit: int) -> List[Tuple[float, Chunk]]:
+        """Топ фрагментов по гибридному скору (пусто — ничего похожего)."""
+        state = self._state
+        if state is None or limit <= 0:
+            return []
+        encoder, chunks, vectors = state
+        min_score = encoder.min_score
+        cosine = np.asarray(vectors @ self._embed_query(encoder, query))
+        semantic = np.clip((cosine - min_score) / (1.0 - min_score), 0.0, 1.0)
+
+        keyword = np.fromiter(
+            (sum(chunk.text_lower.count(k) for k in keywords) for chunk in chunks),
+            dtype=np.float32, count=len(chunks),
+        )
+        top_keyword = keyword.max() if len(keyword) else 0.0
+        if top_keyword > 0:
+            keyword /= top_keyword
+
+        scores = KB_HYBRID_ALPHA * semantic + (1.0 - KB_HYBRID_ALPHA) * keyword
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), chunks[i]) for i in top if scores[i] > 0]
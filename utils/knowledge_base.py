@@ -1,11 +1,16 @@
 """
 RAG-система для работы с базой знаний
 """
+import asyncio
+import hashlib
 import os
 import re
 from typing import List, Dict, Optional
 import aiofiles
 
+from .answer_cache import answer_cache
+from .kb_semantic import SemanticIndex, semantic_available
+
 
 class KnowledgeBase:
     """RAG-система для поиска релевантной информации в базе знаний"""
@@ -14,6 +19,10 @@ class KnowledgeBase:
         self.docs_dir = docs_dir
         self.documents: List[Dict[str, str]] = []
         self.indexed = False
+        # Версия базы (хэш содержимого) — меняется при изменении документов
+        self.version: Optional[str] = None
+        # Семантический слой (эмбеддинги фрагментов); None — только ключевые слова
+        self.semantic: Optional[SemanticIndex] = SemanticIndex() if semantic_available() else None
     
     async def index_documents(self):
         """Асинхронная индексация всех .md файлов из папки docs"""
@@ -25,6 +34,7 @@ class KnowledgeBase:
         exclude_dirs = {'knowledge_base', '__pycache__', '.git', 'backups', 'migrations', 'mini_app', 'uploads'}
         
         document_count = 0
+        documents: List[Dict[str, str]] = []
         
         for root, dirs, files in os.walk(self.docs_dir):
             # Исключаем системные папки из обхода
@@ -40,7 +50,7 @@ class KnowledgeBase:
                             # Сохраняем относительный путь для лучшей идентификации
                             relative_path = os.path.relpath(filepath, self.docs_dir)
                             
-                            self.documents.append({
+                            documents.append({
                                 'filename': relative_path,
                                 'content': content,
                                 'path': filepath
@@ -50,8 +60,25 @@ class KnowledgeBase:
                     except Exception as e:
                         print(f"❌ Ошибка чтения {filename}: {e}")
         
+        # Переиндексация заменяет список целиком, а не дописывает дубли
+        documents.sort(key=lambda d: d['filename'])
+        self.documents = documents
+        digest = hashlib.sha1()
+        for doc in documents:
+            digest.update(doc['filename'].encode())
+            digest.update(doc['content'].encode())
+        self.version = digest.hexdigest()[:12]
         self.indexed = True
+        # Ответы консультанта, построенные на прежней версии базы, больше не выдаются
+        answer_cache.set_kb_version(self.version)
         print(f"✅ База знаний проиндексирована: {document_count} документов")
+
+        if self.semantic is not None:
+            try:
+                # Векторы считаются (или читаются с диска) в потоке, цикл событий не блокируется
+                await asyncio.to_thread(self.semantic.build, documents)
+            except Exception as e:
+                print(f"⚠️ Семантический индекс базы знаний недоступен: {e}")
         return document_count
     
     async def get_context(
@@ -81,6 +108,16 @@ class KnowledgeBase:
         query_lower = query.lower()
         keywords = self._extract_keywords(query_lower)
         
+        # Гибридный поиск по фрагментам: смысловая близость + ключевые слова
+        if self.semantic is not None and self.semantic.ready:
+            hits = await self.semantic.asearch(query, keywords, max_chunks)
+            if hits:
+                return self._format_context(
+                    (chunk.filename, self._extract_relevant_snippet(chunk.text, keywords, context_size))
+                    for _, chunk in hits
+                )
+            return "Информация по вашему запросу не найдена в базе знаний."
+
         # Оценка релевантности документов
         scored_docs = []
         for doc in self.documents:
@@ -95,17 +132,17 @@ class KnowledgeBase:
         if not scored_docs:
             return "Информация по вашему запросу не найдена в базе знаний."
         
-        context_parts = []
-        for i, (score, doc) in enumerate(scored_docs[:max_chunks]):
-            # Извлекаем релевантный фрагмент
-            snippet = self._extract_relevant_snippet(
-                doc['content'],
-                keywords,
-                context_size
-            )
-            context_parts.append(
-                f"📄 Из документа '{doc['filename']}':\n{snippet}"
-            )
+        return self._format_context(
+            (doc['filename'], self._extract_relevant_snippet(doc['content'], keywords, context_size))
+            for score, doc in scored_docs[:max_chunks]
+        )
+
+    def _format_context(self, snippets) -> str:
+        """Склейка фрагментов (имя документа, текст) в контекст для промпта"""
+        context_parts = [
+            f"📄 Из документа '{filename}':\n{snippet}"
+            for filename, snippet in snippets
+        ]
         
         full_context = "\n\n".join(context_parts)
         # Жесткая обрезка до 1500 символов суммарно для предотвращения ошибок лимита промпта
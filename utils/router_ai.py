@@ -4,8 +4,11 @@ import logging
 import aiohttp
 from typing import Optional, List, Dict, Any
 
+from monitoring.metrics import LLM_SECONDS, instrument_methods
+
 logger = logging.getLogger(__name__)
 
+@instrument_methods(LLM_SECONDS, label="operation", provider="routerai")
 class RouterAIClient:
     """RouterAI для текстов и анализа изображений (Gemini/Claude)"""
     def __init__(self, api_key: Optional[str] = None):
@@ -49,7 +52,11 @@ import os
 import aiohttp
 from typing import Optional, List, Dict
 
+from monitoring.metrics import LLM_SECONDS, instrument_methods
+from utils.answer_cache import answer_cache, current_session, prompt_version
+
 
+@instrument_methods(LLM_SECONDS, label="operation", provider="routerai")
 class RouterAIClient:
     """Клиент Router AI: логика ответов (GPT-4 nano / Kimi / Qwen)."""
     
@@ -220,14 +227,15 @@ router_ai = RouterAIClient()
         else:
             system_prompt = ""
         
-        # Формируем историю
+        # Формируем историю: только текущий разговор — от неё зависит, персональный ли ответ
         history_text = ""
-        if dialog_history and len(dialog_history) > 1:
+        dialog_history = current_session(dialog_history)
+        if len(dialog_history) > 1:
             recent = dialog_history[-6:-1]
             history_parts = []
             for h in recent:
                 name = "Клиент" if h['role'] == 'user' else "Антон"
-                history_parts.append(f"{name}: {h['text']}")
+                history_parts.append(f"{name}: {h.get('text') or h.get('message', '')}")
             history_text = "\n".join(history_parts)
         
         # Формируем историю для промпта (совместимость с Python 3.11)
@@ -235,12 +243,20 @@ router_ai = RouterAIClient()
         
         user_prompt = rag_context + "\n\n" + history_prefix + "---\n" + "НОВЫЙ ВОПРОС КЛИЕНТА: " + user_query + "\n\nОтвечай кратко (2-3 предложения), по делу, со ссылками на законы из контекста."
         
-        return await self.generate_response(
+        # Повторный вопрос — из кэша ответов (без истории текущего разговора и личных деталей)
+        cache_version = prompt_version("routerai", system_prompt)
+        cached = await answer_cache.lookup(user_query, rag_context, cache_version, history_used=bool(history_text))
+        if cached:
+            return cached
+        
+        response = await self.generate_response(
             user_prompt=user_prompt,
             system_prompt=system_prompt,
             temperature=0.2,
             max_tokens=400
         )
+        await answer_cache.store(user_query, rag_context, cache_version, response, history_used=bool(history_text))
+        return response
     
     def _build_anton_system_prompt(self) -> str:
         """
@@ -5,7 +5,11 @@ import os
 import aiohttp
 from typing import Optional, List, Dict
 
+from monitoring.metrics import LLM_SECONDS, instrument_methods
+from utils.answer_cache import answer_cache, current_session, prompt_version
 
+
+@instrument_methods(LLM_SECONDS, label="operation", provider="yandexgpt")
 class YandexGPTClient:
     """Клиент для работы с YandexGPT API с поддержкой резервного ключа"""
     
@@ -13,7 +17,8 @@ class YandexGPTClient:
         self.api_key = os.getenv("YANDEX_API_KEY")
         self.api_key_backup = os.getenv("YANDEX_API_KEY_BACKUP")  # Резервный ключ
         self.folder_id = os.getenv("FOLDER_ID")
-        self.endpoint = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+        # YANDEX_LLM_URL — переопределение хоста (локальный мок: scripts/ai_mock_server.py)
+        self.endpoint = os.getenv("YANDEX_LLM_URL", "https://llm.api.cloud.yandex.net").rstrip("/") + "/foundationModels/v1/completion"
         self.max_prompt_length = 3000  # Максимальная длина промпта в символах
         
         if not self.api_key or not self.folder_id:
@@ -129,12 +134,13 @@ class YandexGPTClient:
         """
         system_prompt = self._build_consultant_system_prompt()
         
-        # Формируем историю диалога
+        # Формируем историю диалога: только текущий разговор — от неё зависит, персональный ли ответ
         history_text = ""
-        if dialog_history and len(dialog_history) > 1:
+        dialog_history = current_session(dialog_history)
+        if len(dialog_history) > 1:
             recent_history = dialog_history[-6:-1]  # Последние 5 сообщений
             history_text = "\n".join([
-                f"{'Клиент' if h['role'] == 'user' else 'Антон'}: {h['text']}"
+                f"{'Клиент' if h['role'] == 'user' else 'Антон'}: {h.get('text') or h.get('message', '')}"
                 for h in recent_history
             ])
         
@@ -164,12 +170,20 @@ class YandexGPTClient:
         
         greeting = f"{user_name}, " if user_name else ""
         
-        return await self.generate_response(
+        # Повторный вопрос — из кэша ответов (без истории текущего разговора и личных деталей)
+        cache_version = prompt_version("yandexgpt", system_prompt)
+        cached = await answer_cache.lookup(user_query, rag_context, cache_version, history_used=bool(history_text))
+        if cached:
+            return cached
+        
+        response = await self.generate_response(
             user_prompt=user_prompt,
             system_prompt=system_prompt,
             temperature=0.2,
             max_tokens=400
         )
+        await answer_cache.store(user_query, rag_context, cache_version, response, history_used=bool(history_text))
+        return response
     
     def _build_consultant_system_prompt(self) -> str:
         """Формирует системный промпт для ИИ-консультанта Антона"""
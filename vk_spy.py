@@ -39,6 +39,9 @@ from dotenv import load_dotenv
 
 # Импортируем модуль автоматического поиска групп
 from services.scout_discovery import ScoutDiscovery
+from services.notifier import HttpTransport, Notifier, PRIORITY_HOT, PRIORITY_LOW
+from services.seen_store import SeenStore
+from monitoring.heartbeat import heartbeat
 
 load_dotenv()
 
@@ -105,8 +108,14 @@ VK_GROUPS: list[str] = [g.strip().lstrip("-") for g in _raw_groups.split(",") if
 # Интервал между циклами сканирования (секунды)
 SCAN_INTERVAL = int(os.getenv("VK_SCAN_INTERVAL", "1800"))  # 30 минут по умолчанию
 
-# Файл для хранения уже обработанных ID (чтобы не дублировать лиды)
+# Уже обработанные ID хранятся в services/seen_store (SQLite, TTL).
+# SEEN_FILE — старый JSON, переносится в хранилище при первом запуске.
 SEEN_FILE = Path("vk_spy_seen.json")
+VK_SEEN_USE_BLOOM = os.getenv("VK_SEEN_USE_BLOOM", "0") == "1"
+
+# Карточки уходят через общую очередь уведомлений (services/notifier): лимиты Telegram,
+# повтор после 429, неотправленное переживает перезапуск. Транспорт задаётся в main().
+notifier = Notifier(namespace="vk_spy")
 
 # ─── Ключевые слова ───────────────────────────────────────────────────────────
 
@@ -224,21 +233,15 @@ def detect_lead(text: str) -> Optional[str]:
 
 # ─── Хранилище просмотренных ID ───────────────────────────────────────────────
 
-def load_seen() -> set:
-    if SEEN_FILE.exists():
-        try:
-            return set(json.loads(SEEN_FILE.read_text(encoding="utf-8")))
-        except Exception:
-            pass
-    return set()
+def load_seen() -> SeenStore:
+    """SQLite-хранилище с TTL; при первом запуске переносит старый vk_spy_seen.json."""
+    seen = SeenStore(namespace="vk_spy", use_bloom=VK_SEEN_USE_BLOOM)
+    seen.import_legacy_json(SEEN_FILE)
+    return seen
 
-def save_seen(seen: set) -> None:
-    try:
-        # Храним только последние 10000 ID чтобы файл не рос бесконечно
-        trimmed = list(seen)[-10000:]
-        SEEN_FILE.write_text(json.dumps(trimmed), encoding="utf-8")
-    except Exception as e:
-        logger.warning("Не удалось сохранить seen: %s", e)
+def save_seen(seen: SeenStore) -> None:
+    # Пишутся только новые ключи; просроченные удаляются компакцией внутри flush()
+    seen.flush()
 
 
 # ─── VK API ───────────────────────────────────────────────────────────────────
@@ -377,28 +380,21 @@ async def send_lead_card(session: aiohttp.ClientSession, lead: dict) -> bool:
         ]
     }
 
-    payload: dict = {
-        "chat_id": LEADS_GROUP_CHAT_ID,
-        "text": msg,
-        "parse_mode": "HTML",
-        "disable_web_page_preview": True,
-        "reply_markup": keyboard,
-    }
-    if THREAD_ID_HOT_LEADS:
-        payload["message_thread_id"] = int(THREAD_ID_HOT_LEADS)
-
+    # Через очередь notifier: лимиты Telegram, горячие — вне очереди, тёплые при завале склеиваются в сводку
+    hot = lead_type == "hot"
     try:
-        async with session.post(
-            f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage",
-            json=payload,
-            timeout=aiohttp.ClientTimeout(total=15),
-        ) as resp:
-            if resp.status == 200:
-                return True
-            body = await resp.text()
-            logger.error("Telegram sendMessage error %s: %s", resp.status, body[:200])
+        await notifier.send(
+            LEADS_GROUP_CHAT_ID,
+            msg,
+            thread_id=int(THREAD_ID_HOT_LEADS) if THREAD_ID_HOT_LEADS else None,
+            reply_markup=keyboard,
+            disable_preview=True,
+            priority=PRIORITY_HOT if hot else PRIORITY_LOW,
+            digest=not hot,
+        )
+        return True
     except Exception as e:
-        logger.error("Telegram send exception: %s", e)
+        logger.error("Очередь уведомлений: %s", e)
     return False
 
 
@@ -492,7 +488,7 @@ async def process_callbacks(session: aiohttp.ClientSession, offset: int) -> int:
 
 # ─── Основной цикл сканирования ───────────────────────────────────────────────
 
-async def scan_group(session: aiohttp.ClientSession, group_id: str, seen: set) -> int:
+async def scan_group(session: aiohttp.ClientSession, group_id: str, seen: SeenStore) -> int:
     """Сканирует одну VK-группу. Возвращает количество новых лидов."""
     found = 0
     logger.info("🔍 Сканирую группу %s...", group_id)
@@ -554,7 +550,7 @@ async def scan_group(session: aiohttp.ClientSession, group_id: str, seen: set) -
     return found
 
 
-async def run_scan_cycle(session: aiohttp.ClientSession, seen: set) -> int:
+async def run_scan_cycle(session: aiohttp.ClientSession, seen: SeenStore) -> int:
     """Один полный цикл сканирования всех групп."""
     total = 0
     for group_id in VK_GROUPS:
@@ -627,10 +623,15 @@ async def main() -> None:
 
     cb_offset = 0   # offset для getUpdates (callback-кнопки)
     cycle = 0
+    current = {}
+    heartbeat.set_job_provider(lambda: dict(current))
+    await heartbeat.start()
     last_discovery_ts = 0
     discovery_interval = 86400  # 24 часа
 
     async with aiohttp.ClientSession() as session:
+        notifier.transport = HttpTransport(BOT_TOKEN, session)
+        await notifier.start()
         await send_startup_message(session)
 
         while True:
@@ -658,6 +659,7 @@ async def main() -> None:
                     logger.error("❌ Ошибка discovery: %s", e)
                 last_discovery_ts = now
 
+            current["scan_cycle"] = cycle
             try:
                 total_leads = await run_scan_cycle(session, seen)
                 elapsed = int(time.time() - start_ts)
@@ -667,6 +669,7 @@ async def main() -> None:
                 )
             except Exception as e:
                 logger.error("❌ Ошибка цикла #%d: %s", cycle, e)
+            current.pop("scan_cycle", None)
 
             # Обрабатываем нажатия кнопок между сканами
             logger.info("💤 Ожидание %d мин (слушаю кнопки)...", SCAN_INTERVAL // 60)
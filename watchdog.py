@@ -2,6 +2,11 @@
 Watchdog — система самовосстановления (Self-Healing).
 Автоматически перезапускает основной бот и шпиона при падении.
 Записывает ошибки в базу данных.
+
+Зависания (процесс жив, но цикл событий стоит) ловятся по heartbeat-файлам
+(monitoring/heartbeat.py): если процесс хоть раз прислал heartbeat и затем молчит
+дольше HEARTBEAT_TIMEOUT — он перезапускается. Сводный статус всех процессов
+пишется в WATCHDOG_STATUS_FILE; `python watchdog.py --status` печатает его.
 """
 import asyncio
 import subprocess
@@ -9,10 +14,19 @@ import sys
 import logging
 import os
 import signal
+import time
 import traceback
+import json
 from datetime import datetime
 import aiohttp
 
+from monitoring.heartbeat import HEARTBEAT_DIR, heartbeat_path, read_heartbeat, write_json_atomic
+
+HEARTBEAT_TIMEOUT = int(os.getenv("HEARTBEAT_TIMEOUT", "60"))
+HEARTBEAT_CHECK_INTERVAL = int(os.getenv("HEARTBEAT_CHECK_INTERVAL", "10"))
+HEARTBEAT_STARTUP_GRACE = int(os.getenv("HEARTBEAT_STARTUP_GRACE", "120"))
+WATCHDOG_STATUS_FILE = os.getenv("WATCHDOG_STATUS_FILE", os.path.join("logs", "watchdog_status.json"))
+
 def validate_env_variables():
     """Проверка .env на наличие заглушек и обязательных переменных."""
     critical_vars = {
@@ -118,14 +132,124 @@ async def notify_admin(message: str):
         logger.error(f"❌ Ошибка при отправке уведомления: {e}")
 
 async def log_to_db(level, module, message, stack_trace=None):
-    """Асинхронная запись лога в БД."""
+    """Запись лога в БД через пакетный приёмник: без INSERT/commit на каждую строку stderr."""
+    from monitoring.log_sink import log_sink
+    log_sink.submit(level, module, message, stack_trace)
+
+
+async def start_log_sink():
+    """Подключить БД и запустить флашер приёмника логов."""
+    from monitoring.log_sink import log_sink
     try:
         from database.db import db
         if not db.conn:
             await db.connect()
-        await db.add_system_log(level, module, message, stack_trace)
+        await log_sink.start(db)
     except Exception as e:
-        logger.error(f"Не удалось записать лог в БД: {e}")
+        logger.error(f"Не удалось запустить запись логов в БД: {e}")
+
+async def watch_heartbeat(name, config, process):
+    """
+    Следить за heartbeat процесса. Проверка включается только после первого
+    heartbeat текущего запуска: процессы без публикатора просто не контролируются.
+    """
+    started = time.monotonic()
+    seen = False
+    config["heartbeat"] = None
+    config["state"] = "starting"
+    while process.returncode is None:
+        await asyncio.sleep(HEARTBEAT_CHECK_INTERVAL)
+        if process.returncode is not None:
+            break
+        hb = read_heartbeat(name)
+        if hb and hb.get("pid") == process.pid:
+            config["heartbeat"] = hb
+            if not seen:
+                seen = True
+                logger.info(f"💓 {name}: heartbeat получен (pid {process.pid})")
+        if not seen:
+            if time.monotonic() - started > HEARTBEAT_STARTUP_GRACE:
+                config["state"] = "no_heartbeat"
+            continue
+
+        age = time.time() - config["heartbeat"].get("ts", 0)
+        if age <= HEARTBEAT_TIMEOUT:
+            config["state"] = "running"
+            continue
+
+        # Процесс жив, но цикл событий не пишет heartbeat — считаем зависшим
+        config["state"] = "stalled"
+        config["stall_restarts"] = config.get("stall_restarts", 0) + 1
+        hb = config["heartbeat"]
+        error_msg = (
+            f"Процесс {name} завис: heartbeat {age:.0f} с назад "
+            f"(лаг цикла {hb.get('loop_lag')} с, задачи: {hb.get('jobs') or '—'}). Перезапуск."
+        )
+        logger.error(f"🧊 {error_msg}")
+        await log_to_db("ERROR", "Watchdog", error_msg)
+        await notify_admin(f"🧊 {error_msg}")
+        try:
+            process.terminate()
+            await asyncio.wait_for(process.wait(), timeout=15)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ {name} не завершился по SIGTERM — kill")
+            process.kill()
+        except ProcessLookupError:
+            pass
+        break
+
+
+def build_status():
+    """Сводный статус: процессы watchdog + их последние heartbeat."""
+    now = time.time()
+    processes = {}
+    for name, config in PROCESSES.items():
+        process = running_subprocesses.get(name)
+        hb = config.get("heartbeat") or {}
+        processes[name] = {
+            "pid": process.pid if process and process.returncode is None else None,
+            "state": config.get("state", "stopped"),
+            "restart_count": config["restart_count"],
+            "stall_restarts": config.get("stall_restarts", 0),
+            "last_restart": config["last_restart"].isoformat() if config["last_restart"] else None,
+            "fatal_error": config["fatal_error"],
+            "heartbeat_age": round(now - hb["ts"], 1) if hb.get("ts") else None,
+            "loop_lag": hb.get("loop_lag"),
+            "max_loop_lag": hb.get("max_loop_lag"),
+            "queues": hb.get("queues", {}),
+            "jobs": hb.get("jobs", {}),
+        }
+    return {"updated_at": datetime.now().isoformat(timespec="seconds"), "processes": processes}
+
+
+async def write_status_loop():
+    """Периодически обновлять WATCHDOG_STATUS_FILE."""
+    os.makedirs(os.path.dirname(WATCHDOG_STATUS_FILE) or ".", exist_ok=True)
+    while True:
+        try:
+            write_json_atomic(WATCHDOG_STATUS_FILE, build_status())
+        except Exception as e:
+            logger.debug(f"Не удалось записать статус watchdog: {e}")
+        await asyncio.sleep(HEARTBEAT_CHECK_INTERVAL)
+
+
+def print_status():
+    """CLI: python watchdog.py --status"""
+    try:
+        with open(WATCHDOG_STATUS_FILE, encoding="utf-8") as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        print(f"Статус не найден: {WATCHDOG_STATUS_FILE} (watchdog не запущен?)")
+        return
+    print(f"Watchdog: обновлено {status['updated_at']}")
+    for name, info in status["processes"].items():
+        age = info["heartbeat_age"]
+        print(
+            f"  {name:<12} {info['state']:<13} pid={info['pid']} рестартов={info['restart_count']} "
+            f"(зависаний {info['stall_restarts']}) heartbeat={'—' if age is None else f'{age:.0f} с'} "
+            f"лаг={info['loop_lag']} очереди={info['queues']} задачи={info['jobs']}"
+        )
+
 
 async def run_managed_process(name, config):
     """Запуск и мониторинг процесса."""
@@ -134,13 +258,21 @@ async def run_managed_process(name, config):
         await log_to_db("INFO", "Watchdog", f"Запуск процесса {name}")
         
         try:
+            # Старый heartbeat предыдущего запуска не должен засчитываться новому процессу
+            try:
+                os.remove(heartbeat_path(name))
+            except OSError:
+                pass
+
             # Запускаем подпроцесс
             process = await asyncio.create_subprocess_exec(
                 *config["command"],
                 stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+                stderr=asyncio.subprocess.PIPE,
+                env={**os.environ, "HEARTBEAT_NAME": name, "HEARTBEAT_DIR": HEARTBEAT_DIR},
             )
             running_subprocesses[name] = process
+            heartbeat_task = asyncio.create_task(watch_heartbeat(name, config, process))
             
             # Читаем stdout для логирования всех print()
             async def log_stdout(stdout_stream):
@@ -178,6 +310,8 @@ async def run_managed_process(name, config):
             
             # Ждем завершения
             returncode = await process.wait()
+            heartbeat_task.cancel()
+            config["state"] = "stopped"
             
             error_msg = f"Процесс {name} завершился с кодом {returncode}"
             logger.warning(error_msg)
@@ -210,8 +344,11 @@ async def main():
         logger.error("🚨 Ошибка конфигурации: исправьте .env")
         sys.exit(1)
     
-    # Регистрация сигналов для корректного завершения
-    def handle_exit(sig, frame):
+    # Регистрация сигналов для корректного завершения: выход через цикл событий,
+    # чтобы перед ним дописать буфер log_sink в system_logs
+    stopping = asyncio.Event()
+
+    def handle_exit(sig, frame=None):
         logger.info(f"🛑 Получен сигнал {sig}. Завершение всех процессов...")
         for name, proc in running_subprocesses.items():
             try:
@@ -219,22 +356,46 @@ async def main():
                 logger.info(f"✅ Процесс {name} завершен.")
             except:
                 pass
-        sys.exit(0)
+        stopping.set()
 
-    signal.signal(signal.SIGINT, handle_exit)
-    signal.signal(signal.SIGTERM, handle_exit)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, handle_exit, sig)
+        except (NotImplementedError, RuntimeError):
+            signal.signal(sig, handle_exit)  # Windows
+
+    await start_log_sink()
+    status_task = asyncio.create_task(write_status_loop())
 
     # Запускаем процессы последовательно с паузой, чтобы избежать конфликта при создании таблиц
     tasks = []
-    for name, config in PROCESSES.items():
-        task = asyncio.create_task(run_managed_process(name, config))
-        tasks.append(task)
-        if name == "main_bot":
-            await asyncio.sleep(3)  # Пауза 3 секунды перед запуском Шпиона
-    
-    await asyncio.gather(*tasks)
+
+    async def run_all():
+        for name, config in PROCESSES.items():
+            tasks.append(asyncio.create_task(run_managed_process(name, config)))
+            if name == "main_bot":
+                await asyncio.sleep(3)  # Пауза 3 секунды перед запуском Шпиона
+        await asyncio.gather(*tasks)
+
+    runner = asyncio.create_task(run_all())
+    stopper = asyncio.create_task(stopping.wait())
+    try:
+        await asyncio.wait({runner, stopper}, return_when=asyncio.FIRST_COMPLETED)
+        if runner.done():
+            runner.result()
+    finally:
+        pending = [runner, stopper, status_task, *tasks]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        from monitoring.log_sink import log_sink
+        await log_sink.stop()
 
 if __name__ == "__main__":
+    if "--status" in sys.argv:
+        print_status()
+        sys.exit(0)
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
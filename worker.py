@@ -0,0 +1,39 @@
+"""
+worker.py — процесс-воркер ТЕРИОН (services/workers.py).
+
+Запускается из main.py при WORKER_MODE=process, вручную не нужен:
+    python worker.py scan    # hunt, discovery, гео-шпион, креативщик, lead_stream
+    python worker.py media   # Pillow и генерация картинок
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+parser = argparse.ArgumentParser(description="Процесс-воркер ТЕРИОН")
+parser.add_argument("role", choices=["scan", "media"])
+args = parser.parse_args()
+# До импорта services.workers: внутри воркера задачи выполняются на месте, а не уходят в очередь
+os.environ.setdefault("WORKER_ROLE", args.role)
+os.environ.setdefault("WORKER_NAME", f"{args.role}_{os.getpid()}")
+
+from services.workers import run_worker  # noqa: E402
+from monitoring.log_sink import log_sink  # noqa: E402
+
+logging.basicConfig(
+    level=logging.INFO,
+    format=f"%(asctime)s - [{os.environ['WORKER_NAME']}] %(name)s - %(levelname)s - %(message)s",
+)
+# Ошибки воркера — в system_logs, как у main.py
+logging.getLogger().addHandler(log_sink)
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run_worker(args.role))
+    except KeyboardInterrupt:
+        sys.exit(0)